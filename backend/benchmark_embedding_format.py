@@ -0,0 +1,48 @@
+"""Microbenchmark: pgvector serialization of 4096-dim embeddings
+
+Compares the previous per-chunk formatting (four separate str() joins) with
+services.embedding_format, which formats each value once from a float32
+buffer. Run from the backend directory:
+
+    python benchmark_embedding_format.py [--iterations N] [--precision P]
+"""
+import argparse
+import random
+import timeit
+from services.embedding_format import format_embedding_parts
+
+
+def legacy_format(embedding):
+    """Formatting as previously done in DocumentService._store_chunks_with_embeddings"""
+    full = '[' + ','.join(str(x) for x in embedding) + ']'
+    part1 = '[' + ','.join(str(x) for x in embedding[:1365]) + ']'
+    part2 = '[' + ','.join(str(x) for x in embedding[1365:2730]) + ']'
+    part3 = '[' + ','.join(str(x) for x in embedding[2730:]) + ']'
+    return full, part1, part2, part3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--precision", type=int, default=None)
+    args = parser.parse_args()
+
+    embedding = [random.uniform(-0.1, 0.1) for _ in range(4096)]
+
+    legacy = timeit.timeit(lambda: legacy_format(embedding), number=args.iterations)
+    vectorized = timeit.timeit(
+        lambda: format_embedding_parts(embedding, precision=args.precision),
+        number=args.iterations
+    )
+
+    legacy_size = sum(len(part) for part in legacy_format(embedding))
+    vectorized_size = sum(len(part) for part in format_embedding_parts(embedding, precision=args.precision))
+
+    print(f"Iterations:  {args.iterations} x 4096 dims (precision={args.precision or 'float32 full'})")
+    print(f"Legacy:      {legacy / args.iterations * 1000:.3f} ms/embedding, {legacy_size} chars")
+    print(f"Vectorized:  {vectorized / args.iterations * 1000:.3f} ms/embedding, {vectorized_size} chars")
+    print(f"Speedup:     {legacy / vectorized:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
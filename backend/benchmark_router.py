@@ -0,0 +1,285 @@
+"""Load benchmark: model router, streamed chat and document ingestion
+
+Starts fake_provider_server.py on a local port, points the providers at
+it and drives the real ModelRouterService and DocumentService code paths
+at a fixed concurrency, reporting throughput and p50/p95/p99 latency (and
+time to first token for streamed chat). The database is an in-memory
+stand-in, so the run needs no network, keys or Supabase and can gate CI.
+Key scheduling and admission limits come from the usual environment
+variables (KEY_MAX_CONCURRENCY, KEY_RATE_PER_SECOND, ADMISSION_MAX_CONCURRENT,
+...). Run from the backend directory:
+
+    python benchmark_router.py [--scenario router chat ingest] [--requests N] [--concurrency C]
+                               [--latency-ms 300] [--error-rate 0.01] [--rate-limit-rate 0.02]
+                               [--max-p95-ms 2000] [--min-rps 50] [--json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from unittest.mock import MagicMock, patch
+
+from fake_provider_server import FakeProviderServer, add_profile_arguments, profile_from_args
+
+SCENARIOS = ("router", "chat", "ingest")
+
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: List[float], first_tokens: List[float], failures: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds) of one scenario"""
+    total = len(latencies) + failures
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 1)
+
+    summary = {
+        "requests": total,
+        "failures": failures,
+        "error_rate": round(failures / total, 4) if total else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+    }
+    if first_tokens:
+        summary.update({
+            "ttft_p50_ms": ms(percentile(first_tokens, 50)),
+            "ttft_p95_ms": ms(percentile(first_tokens, 95)),
+            "ttft_p99_ms": ms(percentile(first_tokens, 99)),
+        })
+    return summary
+
+
+async def run_load(
+    operation: Callable[[int], Awaitable[Tuple[bool, Optional[float]]]],
+    requests: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """
+    Run an operation a number of times with a fixed number of workers
+
+    Args:
+        operation: Coroutine function taking the request index and returning
+                   (success, seconds to first token or None)
+        requests: Total operations to run
+        concurrency: Operations in flight at once
+
+    Returns:
+        Summary as returned by summarize()
+    """
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    failures = 0
+    next_index = iter(range(requests))
+
+    async def worker():
+        nonlocal failures
+        for index in next_index:
+            started = time.perf_counter()
+            try:
+                success, first_token = await operation(index)
+            except Exception:
+                success, first_token = False, None
+            if success:
+                latencies.append(time.perf_counter() - started)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            else:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return summarize(latencies, first_tokens, failures, time.perf_counter() - started)
+
+
+@contextmanager
+def point_providers_at(urls: Dict[str, str]) -> Iterator[None]:
+    """Send the provider singletons' requests to the given base URLs for the duration of the block"""
+    from services.providers.openrouter import get_openrouter_provider
+    from services.providers.huggingface import get_huggingface_provider
+    from services.providers.gemini import get_gemini_provider
+
+    targets = [
+        (get_openrouter_provider(), "BASE_URL", urls["OPENROUTER_BASE_URL"]),
+        (get_huggingface_provider(), "router_url", urls["HUGGINGFACE_ROUTER_URL"]),
+        (get_gemini_provider(), "BASE_URL", urls["GEMINI_BASE_URL"]),
+    ]
+    saved = [(provider, attribute, provider.__dict__.get(attribute)) for provider, attribute, _ in targets]
+    for provider, attribute, url in targets:
+        setattr(provider, attribute, url)
+    try:
+        yield
+    finally:
+        for provider, attribute, value in saved:
+            if value is None:
+                provider.__dict__.pop(attribute, None)  # Back to the class attribute
+            else:
+                setattr(provider, attribute, value)
+
+
+def build_router(supabase: MagicMock, keys: int, feature: str):
+    """ModelRouterService over an in-memory database holding fake shared keys"""
+    from services.model_router import ModelRouterService
+    from services.key_registry import get_key_registry
+
+    rows = [
+        {
+            "id": f"bench-key-{n}", "provider": "openrouter", "key_value": "bench", "priority": 100 - n,
+            "status": "active", "failure_count": 0, "success_count": 0
+        }
+        for n in range(max(1, keys))
+    ]
+    get_key_registry(supabase)._load = lambda name: [{**row, "feature": name} for row in rows]
+
+    router = ModelRouterService(supabase_client=supabase)
+
+    async def huggingface_key(provider: str, name: str) -> Dict[str, Any]:
+        return {"id": "bench-hf", "provider": "huggingface", "feature": name, "key_value": "bench", "priority": 0}
+
+    router.get_active_key = huggingface_key
+    return router
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """
+    Run the selected scenarios against a fresh fake provider server
+
+    Args:
+        args: Parsed command line options (see main())
+
+    Returns:
+        Summary per scenario
+    """
+    from services.providers.http_client import close_http_clients
+
+    run_id = uuid.uuid4().hex[:8]  # Keeps prompts unique so caches and coalescing don't short-circuit
+    results: Dict[str, Dict[str, Any]] = {}
+
+    async with FakeProviderServer(profile_from_args(args)) as server:
+        with point_providers_at(server.provider_urls()), \
+                patch.dict(os.environ, {"HUGGINGFACE_API_KEY": os.getenv("HUGGINGFACE_API_KEY") or "bench"}):
+            try:
+                supabase = MagicMock()
+                router = build_router(supabase, args.keys, args.feature)
+
+                async def route(index: int) -> Tuple[bool, Optional[float]]:
+                    result = await router.execute_with_fallback(
+                        provider="openrouter", feature=args.feature,
+                        prompt=f"benchmark {run_id} request {index}: summarize the causes of anemia",
+                        hedge=False
+                    )
+                    return bool(result.get("success")), None
+
+                async def chat(index: int) -> Tuple[bool, Optional[float]]:
+                    started = time.perf_counter()
+                    first_token: List[float] = []
+
+                    async def on_token(token: str) -> None:
+                        if not first_token:
+                            first_token.append(time.perf_counter() - started)
+
+                    result = await router.execute_with_fallback(
+                        provider="openrouter", feature=args.feature,
+                        prompt=f"benchmark {run_id} chat {index}: explain the Frank-Starling mechanism",
+                        on_token=on_token
+                    )
+                    return bool(result.get("success")), (first_token[0] if first_token else None)
+
+                async def ingest(index: int) -> Tuple[bool, Optional[float]]:
+                    from services.documents import DocumentService
+
+                    service = DocumentService(supabase)
+                    embed_chunks = service._embed_chunks
+                    embedded = 0
+
+                    async def counting_embed(chunks: List[str], api_key: Optional[str]):
+                        nonlocal embedded
+                        embeddings = await embed_chunks(chunks, api_key)
+                        embedded += sum(1 for embedding in embeddings if embedding)
+                        return embeddings
+
+                    service._embed_chunks = counting_embed
+                    chunks = [
+                        f"benchmark {run_id} document {index} chunk {n}: cardiac output equals stroke volume times heart rate"
+                        for n in range(args.chunks)
+                    ]
+                    await service._store_chunks_with_embeddings(f"bench-doc-{index}", chunks)
+                    return embedded == len(chunks), None
+
+                operations = {"router": route, "chat": chat, "ingest": ingest}
+                for scenario in args.scenario:
+                    requests = args.documents if scenario == "ingest" else args.requests
+                    results[scenario] = await run_load(operations[scenario], requests, args.concurrency)
+            finally:
+                await close_http_clients()
+
+    return results
+
+
+def check_gates(results: Dict[str, Dict[str, Any]], max_p95_ms: Optional[float], min_rps: Optional[float]) -> List[str]:
+    """Describe every scenario that misses a latency or throughput gate"""
+    violations = []
+    for scenario, summary in results.items():
+        if max_p95_ms is not None and (summary["p95_ms"] is None or summary["p95_ms"] > max_p95_ms):
+            violations.append(f"{scenario}: p95 {summary['p95_ms']} ms > {max_p95_ms} ms")
+        if min_rps is not None and summary["throughput_rps"] < min_rps:
+            violations.append(f"{scenario}: {summary['throughput_rps']} req/s < {min_rps} req/s")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per router/chat scenario")
+    parser.add_argument("--documents", type=int, default=20, help="documents for the ingest scenario")
+    parser.add_argument("--chunks", type=int, default=64, help="chunks per ingested document")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--keys", type=int, default=4, help="fake shared OpenRouter keys")
+    parser.add_argument("--feature", default="chat")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="fail if any scenario's p95 is higher")
+    parser.add_argument("--min-rps", type=float, default=None, help="fail if any scenario's throughput is lower")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--log-level", default="ERROR", help="log level of the services under test")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    results = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Concurrency {args.concurrency}, upstream latency {args.latency_ms:g} ms (sigma {args.latency_sigma:g}), "
+              f"errors {args.error_rate:.1%}, 429s {args.rate_limit_rate:.1%}")
+        for scenario, summary in results.items():
+            line = (f"{scenario:<7} {summary['requests']:>5} req  {summary['throughput_rps']:>8.2f} req/s  "
+                    f"p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  p99 {summary['p99_ms']} ms  "
+                    f"errors {summary['error_rate']:.1%}")
+            if "ttft_p50_ms" in summary:
+                line += f"  ttft p50 {summary['ttft_p50_ms']} ms  p95 {summary['ttft_p95_ms']} ms"
+            print(line)
+
+    violations = check_gates(results, args.max_p95_ms, args.min_rps)
+    for violation in violations:
+        print(f"FAIL {violation}", file=sys.stderr)
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+-- Persisted circuit breaker state for API keys
+-- Written periodically by the in-process breaker registry and used to
+-- restore open circuits after a restart
+
+ALTER TABLE api_keys
+ADD COLUMN IF NOT EXISTS circuit_state TEXT DEFAULT 'closed'
+    CHECK (circuit_state IN ('closed', 'open', 'half_open'));
+
+ALTER TABLE api_keys
+ADD COLUMN IF NOT EXISTS circuit_opened_at TIMESTAMPTZ;
+
+COMMENT ON COLUMN api_keys.circuit_state IS 'Circuit breaker state: closed, open or half_open';
+COMMENT ON COLUMN api_keys.circuit_opened_at IS 'When the circuit last opened (NULL while closed)';
@@ -0,0 +1,28 @@
+-- Durable document ingestion queue
+-- Uploads enqueue a job here; background workers claim jobs by priority,
+-- retry with backoff and resume from the last stored chunk index
+
+CREATE TABLE IF NOT EXISTS document_ingestion_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Workers pick the highest priority, oldest due job
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_claim
+    ON document_ingestion_jobs(status, priority DESC, next_attempt_at, created_at);
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_document_id ON document_ingestion_jobs(document_id);
+
+COMMENT ON TABLE document_ingestion_jobs IS 'Background document processing jobs (extraction, chunking, embeddings)';
+COMMENT ON COLUMN document_ingestion_jobs.priority IS 'Higher runs first; derived from the uploader''s plan';
+COMMENT ON COLUMN document_ingestion_jobs.locked_at IS 'Lease start; running jobs with an expired lease are reclaimed';
@@ -0,0 +1,7 @@
+-- Time to first token for streamed model calls
+-- Logged per attempt by the streaming chat endpoint
+
+ALTER TABLE model_usage_logs
+ADD COLUMN IF NOT EXISTS time_to_first_token_ms INTEGER;
+
+COMMENT ON COLUMN model_usage_logs.time_to_first_token_ms IS 'Milliseconds until the first streamed token (NULL for non-streaming calls)';
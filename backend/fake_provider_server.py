@@ -0,0 +1,348 @@
+"""Local stand-in for the OpenRouter, Hugging Face and Gemini HTTP APIs
+
+Answers chat completions (plain and streamed), embeddings and Gemini
+generateContent calls with synthetic content after a configurable
+latency, and injects 500s and 429s (with Retry-After) at configurable
+rates. Used by benchmark_router.py and the unit tests; nothing leaves
+localhost. Point the providers at it with
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8090/openrouter/api/v1
+    HUGGINGFACE_ROUTER_URL=http://127.0.0.1:8090/huggingface/v1
+    GEMINI_BASE_URL=http://127.0.0.1:8090/gemini/v1beta
+
+and run it standalone from the backend directory:
+
+    python fake_provider_server.py [--port 8090] [--latency-ms 300] [--error-rate 0.01] ...
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeProviderProfile:
+    """Latency, failure and payload settings of the fake providers"""
+
+    def __init__(
+        self,
+        latency_ms: float = 300.0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        stream_chunks: int = 20,
+        chunk_delay_ms: float = 15.0,
+        embedding_dim: int = 4096,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the profile
+
+        Args:
+            latency_ms: Median time to answer (time to first chunk when streaming)
+            latency_sigma: Spread of the lognormal latency distribution (0 = fixed)
+            error_rate: Fraction of requests answered with a 500
+            rate_limit_rate: Fraction of requests answered with a 429
+            retry_after: Retry-After seconds sent with a 429
+            stream_chunks: Content chunks per streamed answer
+            chunk_delay_ms: Delay between streamed chunks
+            embedding_dim: Dimension of returned embeddings
+            seed: Optional random seed for reproducible runs
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunks = max(1, stream_chunks)
+        self.chunk_delay_ms = chunk_delay_ms
+        self.embedding_dim = embedding_dim
+        self._random = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        """Draw a response latency in seconds"""
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return self._random.lognormvariate(math.log(self.latency_ms), self.latency_sigma) / 1000
+
+    def pick_outcome(self) -> str:
+        """Decide how to answer a request: 'ok', 'error' or 'rate_limited'"""
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return "ok"
+
+    def embedding(self, text: str) -> list:
+        """Deterministic unit vector for a text"""
+        seeded = random.Random(text)
+        vector = [seeded.uniform(-1.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+def _answer_words(prompt: str, count: int) -> list:
+    """Synthetic answer split into streaming chunks"""
+    words = (prompt.split() or ["ok"])[:8]
+    return [f"{words[i % len(words)]} " for i in range(count)]
+
+
+def _last_user_message(payload: Dict[str, Any]) -> str:
+    for message in reversed(payload.get("messages") or []):
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def create_fake_provider_app(profile: Optional[FakeProviderProfile] = None) -> FastAPI:
+    """
+    Build the fake provider application
+
+    Args:
+        profile: Behaviour of the fake providers (defaults to FakeProviderProfile())
+
+    Returns:
+        FastAPI app; request counts per provider and outcome are served at /stats
+    """
+    profile = profile or FakeProviderProfile()
+    app = FastAPI(title="Fake AI providers")
+    app.state.profile = profile
+    app.state.counts = Counter()
+
+    async def failure(provider: str) -> Optional[JSONResponse]:
+        # Failures answer after the same latency as successes
+        outcome = profile.pick_outcome()
+        app.state.counts[f"{provider}:{outcome}"] += 1
+        if outcome == "ok":
+            return None
+
+        await asyncio.sleep(profile.sample_latency())
+        if outcome == "rate_limited":
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit exceeded", "code": 429}},
+                headers={"Retry-After": f"{profile.retry_after:g}"}
+            )
+        return JSONResponse(status_code=500, content={"error": {"message": "Internal server error", "code": 500}})
+
+    def sse(events: AsyncIterator[str]) -> StreamingResponse:
+        return StreamingResponse(events, media_type="text/event-stream")
+
+    async def chat_completion(provider: str, request: Request):
+        payload = await request.json()
+        failed = await failure(provider)
+        if failed is not None:
+            return failed
+
+        model = payload.get("model", "fake-model")
+        prompt = _last_user_message(payload)
+        words = _answer_words(prompt, profile.stream_chunks)
+
+        if payload.get("stream"):
+            async def events():
+                await asyncio.sleep(profile.sample_latency())
+                for index, word in enumerate(words):
+                    if index:
+                        await asyncio.sleep(profile.chunk_delay_ms / 1000)
+                    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            return sse(events())
+
+        await asyncio.sleep(profile.sample_latency())
+        content = "".join(words).strip()
+        prompt_tokens = len(prompt) // 4 + 1
+        return {
+            "id": "fake-completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)
+            }
+        }
+
+    @app.post("/openrouter/api/v1/chat/completions")
+    async def openrouter_chat(request: Request):
+        return await chat_completion("openrouter", request)
+
+    @app.post("/huggingface/v1/chat/completions")
+    async def huggingface_chat(request: Request):
+        return await chat_completion("huggingface", request)
+
+    @app.post("/huggingface/v1/embeddings")
+    async def huggingface_embeddings(request: Request):
+        payload = await request.json()
+        failed = await failure("huggingface")
+        if failed is not None:
+            return failed
+
+        texts = payload.get("input")
+        if isinstance(texts, str):
+            texts = [texts]
+        await asyncio.sleep(profile.sample_latency())
+        return {
+            "object": "list",
+            "model": payload.get("model", "fake-embedding"),
+            "data": [
+                {"object": "embedding", "index": index, "embedding": profile.embedding(text)}
+                for index, text in enumerate(texts or [])
+            ]
+        }
+
+    @app.post("/gemini/v1beta/{model_path:path}")
+    async def gemini_generate(model_path: str, request: Request):
+        payload = await request.json()
+        failed = await failure("gemini")
+        if failed is not None:
+            return failed
+
+        parts = [part for content in payload.get("contents") or [] for part in content.get("parts") or []]
+        prompt = " ".join(part.get("text", "") for part in parts if isinstance(part, dict))
+        words = _answer_words(prompt, profile.stream_chunks)
+
+        def candidate(text: str) -> Dict[str, Any]:
+            return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+        if model_path.endswith(":streamGenerateContent"):
+            async def events():
+                await asyncio.sleep(profile.sample_latency())
+                for index, word in enumerate(words):
+                    if index:
+                        await asyncio.sleep(profile.chunk_delay_ms / 1000)
+                    yield f"data: {json.dumps(candidate(word))}\n\n"
+            return sse(events())
+
+        await asyncio.sleep(profile.sample_latency())
+        return {
+            **candidate("".join(words).strip()),
+            "usageMetadata": {"totalTokenCount": len(prompt) // 4 + 1 + len(words)}
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return dict(app.state.counts)
+
+    return app
+
+
+class FakeProviderServer:
+    """Runs the fake provider app on a local port inside the current event loop"""
+
+    def __init__(self, profile: Optional[FakeProviderProfile] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Initialize the server
+
+        Args:
+            profile: Behaviour of the fake providers
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+        """
+        self.app = create_fake_provider_app(profile)
+        self.host = host
+        self.port = port or self._free_port(host)
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _free_port(host: str) -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind((host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def provider_urls(self) -> Dict[str, str]:
+        """Base URL environment variables that point the providers at this server"""
+        return {
+            "OPENROUTER_BASE_URL": f"{self.base_url}/openrouter/api/v1",
+            "HUGGINGFACE_ROUTER_URL": f"{self.base_url}/huggingface/v1",
+            "GEMINI_BASE_URL": f"{self.base_url}/gemini/v1beta",
+        }
+
+    async def start(self) -> None:
+        config = uvicorn.Config(
+            self.app, host=self.host, port=self.port,
+            log_level="warning", access_log=False, lifespan="off"
+        )
+        self._server = uvicorn.Server(config)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()  # Raise the startup error
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            await self._task
+            self._server = None
+
+    async def __aenter__(self) -> "FakeProviderServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the FakeProviderProfile options to a command line parser"""
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="median upstream latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread (0 = fixed latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on a 429")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="chunks per streamed answer")
+    parser.add_argument("--chunk-delay-ms", type=float, default=15.0, help="delay between streamed chunks")
+    parser.add_argument("--embedding-dim", type=int, default=4096, help="embedding dimension")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+
+
+def profile_from_args(args: argparse.Namespace) -> FakeProviderProfile:
+    """Build a profile from parsed add_profile_arguments() options"""
+    return FakeProviderProfile(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        stream_chunks=args.stream_chunks,
+        chunk_delay_ms=args.chunk_delay_ms,
+        embedding_dim=args.embedding_dim,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeProviderServer(profile_from_args(args), host=args.host, port=args.port)
+    for name, url in server.provider_urls().items():
+        print(f"{name}={url}")
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,20 +8,32 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-import os
+import json
+import jwt
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
 import logging
 
 # Import services
 from services.auth import get_auth_service
-from services.chat import get_chat_service
-from services.rate_limiter import get_rate_limiter
-from services.admin import get_admin_service
-from services.model_usage_logger import get_model_usage_logger
+from services.chat import get_chat_service, ChatService
+from services.rate_limiter import get_rate_limiter, RateLimiter
+from services.admin import get_admin_service, AdminService
+from services.audit import get_audit_service, AuditService
+from services.model_usage_logger import get_model_usage_logger, ModelUsageLogger
 from services.commands import get_command_service
-from services.study_tools import get_study_tools_service
-from services.documents import get_document_service
+from services.study_tools import get_study_tools_service, StudyToolsService
+from services.documents import get_document_service, DocumentService
+from services.health_check_scheduler import get_health_check_scheduler, HealthCheckScheduler
+from services.usage_log_writer import get_usage_log_writer
+from services.request_coalescer import get_request_coalescer
+from services.admission_queue import get_admission_queue
+from services.db_executor import run_query, run_sync, get_db_executor_stats
+from services.service_registry import get_service_registry, provide
+from services.token_verifier import get_token_verifier
+from services.user_profiles import get_user_profiles, start_request_scope
+from middleware.admission import AdmissionRejectionMiddleware
+from middleware.request_deadline import RequestDeadlineMiddleware
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +46,13 @@ logger = logging.getLogger(__name__)
 # Initialize FastAPI app
 app = FastAPI(title="Medical AI Platform API", version="1.0.0")
 
+# Per-endpoint time budgets for AI calls; cancel handlers of disconnected clients
+app.add_middleware(RequestDeadlineMiddleware)
+
+# Answer 503 + Retry-After when AI calls are shed under saturation
+# (added before CORS so error responses still get CORS headers)
+app.add_middleware(AdmissionRejectionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -43,10 +62,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Supabase client
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+# Shared Supabase client and services (see services/service_registry.py)
+service_registry = get_service_registry()
+supabase: Client = service_registry.supabase
 
 
 # Startup event
@@ -56,9 +74,17 @@ async def startup_event():
     log_startup_banner()
     logger.info("Initializing services...")
     logger.info("Supabase connection established")
+    await service_registry.startup()
     logger.info("All services ready")
 
 
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled connections held by services"""
+    await service_registry.shutdown()
+
+
 # Dependency to get current user from token
 async def get_current_user(request: Request) -> Dict[str, Any]:
     """Extract and verify user from Authorization header"""
@@ -70,22 +96,26 @@ async def get_current_user(request: Request) -> Dict[str, Any]:
     token = auth_header.split(" ")[1]
     
     try:
-        # Verify token with Supabase using the service role client
-        # The get_user method verifies the JWT token and returns user info
-        user_response = supabase.auth.get_user(token)
+        # Signature and expiry are checked locally (cached until the token expires);
+        # tokens that can't be checked locally are verified by Supabase Auth
+        user = await get_token_verifier(supabase).verify(token)
         
-        if not user_response or not user_response.user:
+        if not user:
             logger.warning("Authentication failed: Invalid or expired token")
             raise HTTPException(status_code=401, detail="Invalid or expired token")
         
-        user_id = user_response.user.id
-        user_email = user_response.user.email
-        logger.debug(f"User authenticated: {user_id[:8]}... ({user_email})")
+        logger.debug(f"User authenticated: {user['id'][:8]}... ({user['email']})")
         
-        return {"id": user_id, "email": user_email}
+        # Rate limiting, plan and admin checks share one users row per request
+        start_request_scope()
+        
+        return user
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
+    except jwt.InvalidTokenError as e:
+        logger.warning(f"Authentication failed: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
     except Exception as e:
         logger.error(f"Authentication error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=401, detail="Authentication failed")
@@ -112,10 +142,9 @@ async def health_check():
 
 
 @app.get("/api/system/settings")
-async def get_system_settings():
+async def get_system_settings(admin_service: AdminService = Depends(provide(get_admin_service))):
     """Get public system settings"""
     try:
-        admin_service = get_admin_service(supabase)
         platform_name = await admin_service.get_system_flag("platform_name", "Vaidya AI")
         support_email = await admin_service.get_system_flag("support_email", "support@vaidya.ai")
         student_plan_price = await admin_service.get_system_flag("student_plan_price", "150")
@@ -147,11 +176,11 @@ async def get_system_settings():
 @app.get("/api/admin/audit-logs")
 async def get_audit_logs(
     limit: int = 100,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Get audit logs"""
     try:
-        admin_service = get_admin_service(supabase)
         logs = await admin_service.get_audit_logs(limit=limit)
         return {"logs": logs, "count": len(logs)}
     except Exception as e:
@@ -170,11 +199,11 @@ class UpdateSystemSettingsRequest(BaseModel):
 @app.post("/api/admin/settings")
 async def update_system_settings(
     request: UpdateSystemSettingsRequest,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Update system settings"""
     try:
-        admin_service = get_admin_service(supabase)
         await admin_service.set_system_flag(admin["id"], "platform_name", request.platform_name)
         
         if request.support_email:
@@ -215,11 +244,11 @@ class StudyToolRequest(BaseModel):
 @app.post("/api/study-tools/flashcards")
 async def generate_flashcards(
     request: StudyToolRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Generate flashcards for a topic"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.generate_flashcards(
             user_id=user["id"],
             topic=request.topic,
@@ -237,11 +266,11 @@ async def generate_flashcards(
 @app.post("/api/study-tools/mcqs")
 async def generate_mcqs(
     request: StudyToolRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Generate MCQs for a topic"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.generate_mcq(
             user_id=user["id"],
             topic=request.topic,
@@ -258,11 +287,11 @@ async def generate_mcqs(
 @app.post("/api/study-tools/highyield")
 async def generate_highyield(
     request: StudyToolRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Generate high-yield summary for a topic"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.generate_highyield(
             user_id=user["id"],
             topic=request.topic,
@@ -277,11 +306,11 @@ async def generate_highyield(
 @app.post("/api/study-tools/explain")
 async def generate_explanation(
     request: StudyToolRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Generate detailed explanation for a topic"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.generate_explanation(
             user_id=user["id"],
             topic=request.topic,
@@ -297,11 +326,11 @@ async def generate_explanation(
 @app.post("/api/study-tools/conceptmap")
 async def generate_conceptmap(
     request: StudyToolRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Generate concept map for a topic"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.generate_conceptmap(
             user_id=user["id"],
             topic=request.topic,
@@ -320,11 +349,11 @@ async def generate_conceptmap(
 @app.get("/api/admin/users")
 async def get_users(
     limit: int = 100,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Get all users"""
     try:
-        admin_service = get_admin_service(supabase)
         users = await admin_service.list_users(limit=limit)
         return {"users": users, "count": len(users)}
     except Exception as e:
@@ -340,11 +369,11 @@ class UpdateUserPlanRequest(BaseModel):
 async def update_user_plan(
     user_id: str,
     request: UpdateUserPlanRequest,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Update a user's plan"""
     try:
-        admin_service = get_admin_service(supabase)
         result = await admin_service.update_user_plan(
             admin_id=admin["id"],
             user_id=user_id,
@@ -362,11 +391,11 @@ async def update_user_plan(
 
 @app.get("/api/admin/api-keys")
 async def get_api_keys(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Get all API keys"""
     try:
-        admin_service = get_admin_service(supabase)
         keys = await admin_service.list_api_keys()
         return {"keys": keys, "count": len(keys)}
     except Exception as e:
@@ -385,11 +414,11 @@ class AddApiKeyRequest(BaseModel):
 @app.post("/api/admin/api-keys")
 async def add_api_key(
     request: AddApiKeyRequest,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Add a new API key"""
     try:
-        admin_service = get_admin_service(supabase)
         key = await admin_service.add_api_key(
             admin_id=admin["id"],
             provider=request.provider,
@@ -413,12 +442,12 @@ class UpdateApiKeyRequest(BaseModel):
 async def update_api_key(
     key_id: str,
     request: UpdateApiKeyRequest,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service)),
+    audit_service: AuditService = Depends(provide(get_audit_service))
 ):
     """Update an API key's status or priority"""
     try:
-        admin_service = get_admin_service(supabase)
-        
         # Get current key
         keys = await admin_service.list_api_keys()
         current_key = next((k for k in keys if k["id"] == key_id), None)
@@ -433,14 +462,16 @@ async def update_api_key(
             update_data["priority"] = request.priority
         
         # Perform update
-        response = supabase.table("api_keys").update(update_data).eq("id", key_id).execute()
+        response = await run_query(supabase.table("api_keys").update(update_data).eq("id", key_id))
         
         if not response.data:
             raise HTTPException(status_code=404, detail="API key not found")
         
+        # Drop cached keys so routing picks up the new status/priority
+        from services.key_registry import invalidate_key_registry
+        invalidate_key_registry(current_key.get("feature"))
+        
         # Log the action using audit service
-        from services.audit import get_audit_service
-        audit_service = get_audit_service(supabase)
         await audit_service.log_admin_action(
             admin_id=admin["id"],
             action_type="update_api_key",
@@ -460,11 +491,11 @@ async def update_api_key(
 @app.delete("/api/admin/api-keys/{key_id}")
 async def delete_api_key(
     key_id: str,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Delete an API key"""
     try:
-        admin_service = get_admin_service(supabase)
         await admin_service.delete_api_key(
             admin_id=admin["id"],
             key_id=key_id
@@ -481,11 +512,11 @@ async def delete_api_key(
 
 @app.get("/api/admin/features")
 async def get_features(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Get all feature statuses"""
     try:
-        admin_service = get_admin_service(supabase)
         features = await admin_service.get_feature_status()
         return features
     except Exception as e:
@@ -501,11 +532,11 @@ async def get_features(
 
 @app.get("/api/chat/sessions")
 async def get_chat_sessions(
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service))
 ):
     """Get user's chat sessions"""
     try:
-        chat_service = get_chat_service(supabase)
         sessions = await chat_service.get_user_sessions(user["id"])
         return sessions
     except Exception as e:
@@ -520,11 +551,11 @@ class CreateSessionRequest(BaseModel):
 @app.post("/api/chat/sessions", status_code=201)
 async def create_chat_session(
     request: CreateSessionRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service))
 ):
     """Create a new chat session"""
     try:
-        chat_service = get_chat_service(supabase)
         session = await chat_service.create_session(user["id"], request.title)
         return session
     except Exception as e:
@@ -535,11 +566,11 @@ async def create_chat_session(
 @app.get("/api/chat/sessions/{session_id}/messages")
 async def get_chat_messages(
     session_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service))
 ):
     """Get messages for a session"""
     try:
-        chat_service = get_chat_service(supabase)
         messages = await chat_service.get_chat_history(user["id"], session_id)
         return messages
     except Exception as e:
@@ -552,11 +583,11 @@ async def get_chat_messages(
 @app.delete("/api/chat/sessions/{session_id}")
 async def delete_chat_session(
     session_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service))
 ):
     """Delete a chat session"""
     try:
-        chat_service = get_chat_service(supabase)
         # Verify ownership before deletion (service should handle this or we do it here)
         # Ideally chat_service.delete_session(user_id, session_id)
         await chat_service.delete_session(user["id"], session_id)
@@ -576,15 +607,14 @@ class SendMessageRequest(BaseModel):
 async def send_chat_message(
     session_id: str,
     request: SendMessageRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service)),
+    rate_limiter: RateLimiter = Depends(provide(get_rate_limiter))
 ):
     """Send a message to a chat session"""
     try:
-        chat_service = get_chat_service(supabase)
-        
         # Check rate limit (if available)
         try:
-            rate_limiter = get_rate_limiter(supabase)
             has_capacity = await rate_limiter.check_rate_limit(user["id"], "chat")
             if not has_capacity:
                 logger.warning(f"Rate limit exceeded - User: {user['id'][:8]}..., Feature: chat")
@@ -611,6 +641,74 @@ async def send_chat_message(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class StreamMessageRequest(BaseModel):
+    message: str
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/api/chat/sessions/{session_id}/messages/stream")
+async def stream_chat_message(
+    session_id: str,
+    request: StreamMessageRequest,
+    user: Dict[str, Any] = Depends(get_current_user),
+    chat_service: ChatService = Depends(provide(get_chat_service)),
+    rate_limiter: RateLimiter = Depends(provide(get_rate_limiter))
+):
+    """
+    Send a message to a chat session and stream the answer as server-sent events
+    
+    Events: message (stored user message), token (text chunk), done (stored
+    assistant message and time to first token) and error.
+    """
+    
+    # Check rate limit (if available)
+    try:
+        has_capacity = await rate_limiter.check_rate_limit(user["id"], "chat")
+        if not has_capacity:
+            logger.warning(f"Rate limit exceeded - User: {user['id'][:8]}..., Feature: chat")
+            raise HTTPException(status_code=429, detail="Rate limit exceeded. Please upgrade your plan.")
+    except HTTPException:
+        raise
+    except Exception as rl_error:
+        # If rate limiter fails, we still allow the message for now
+        logger.warning(f"Rate limiter check failed: {str(rl_error)}")
+    
+    events = chat_service.stream_message(
+        user_id=user["id"],
+        session_id=session_id,
+        message=request.message
+    )
+    
+    # Store the user message before responding so session errors get a proper status code
+    try:
+        first_event = await events.__anext__()
+    except Exception as e:
+        if "not found" in str(e).lower() or "belong to user" in str(e).lower():
+            raise HTTPException(status_code=404, detail=str(e))
+        logger.error(f"Failed to send chat message: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_stream():
+        # Disconnecting clients cancel this generator, which cancels the model request
+        try:
+            yield _sse_event(first_event["event"], first_event["data"])
+            async for event in events:
+                yield _sse_event(event["event"], event["data"])
+        finally:
+            await events.aclose()
+    
+    logger.info(f"Chat message streaming - User: {user['id'][:8]}..., Session: {session_id[:8]}...")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================================================
 # STUDY TOOL SESSION ENDPOINTS
 # ============================================================================
@@ -618,11 +716,11 @@ async def send_chat_message(
 @app.get("/api/study-tools/sessions")
 async def get_study_tool_sessions(
     feature: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Get user's study tool sessions, optionally filtered by feature"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         sessions = await study_tools_service.get_user_sessions(user["id"], feature)
         return sessions
     except Exception as e:
@@ -634,11 +732,11 @@ async def get_study_tool_sessions(
 async def create_study_tool_session(
     request: CreateSessionRequest,
     feature: str = "mcq",
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Create a new study tool session"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         session = await study_tools_service.create_session(user["id"], feature, request.title)
         return session
     except Exception as e:
@@ -649,11 +747,11 @@ async def create_study_tool_session(
 @app.get("/api/study-tools/sessions/{session_id}/materials")
 async def get_session_materials_history(
     session_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Get materials for a study tool session"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         materials = await study_tools_service.get_session_materials(session_id, user["id"])
         return materials
     except Exception as e:
@@ -668,11 +766,11 @@ async def get_session_materials_history(
 @app.delete("/api/study-tools/sessions/all")
 async def delete_all_study_tool_sessions(
     feature: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Delete all study tool sessions for a user, optionally filtered by feature"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         result = await study_tools_service.delete_all_sessions(user["id"], feature)
         return result
     except Exception as e:
@@ -683,11 +781,11 @@ async def delete_all_study_tool_sessions(
 @app.delete("/api/study-tools/sessions/{session_id}")
 async def delete_study_tool_session(
     session_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    study_tools_service: StudyToolsService = Depends(provide(get_study_tools_service))
 ):
     """Delete a study tool session"""
     try:
-        study_tools_service = get_study_tools_service(supabase)
         await study_tools_service.delete_session(session_id, user["id"])
         return {"message": "Session deleted successfully"}
     except Exception as e:
@@ -707,7 +805,8 @@ async def get_model_usage_stats(
     end_date: Optional[str] = None,
     provider: Optional[str] = None,
     feature: Optional[str] = None,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    usage_logger: ModelUsageLogger = Depends(provide(get_model_usage_logger))
 ):
     """
     Get model usage statistics
@@ -719,8 +818,6 @@ async def get_model_usage_stats(
     - feature: Filter by feature
     """
     try:
-        usage_logger = get_model_usage_logger(supabase)
-        
         stats = await usage_logger.get_usage_stats(
             start_date=start_date,
             end_date=end_date,
@@ -728,6 +825,21 @@ async def get_model_usage_stats(
             feature=feature
         )
         
+        # Write-behind counters (rows still buffered are not in the stats above yet)
+        usage_log_writer = get_usage_log_writer()
+        if usage_log_writer is not None:
+            stats["write_behind"] = usage_log_writer.get_stats()
+        
+        # Identical in-flight requests answered by a shared upstream call
+        stats["coalescing"] = get_request_coalescer().get_stats()
+        # Admission queue depth and per-class wait times
+        stats["admission"] = get_admission_queue().get_stats()
+        # Database calls running or waiting for a thread
+        stats["database"] = get_db_executor_stats()
+        # Tokens verified locally, from cache or by Supabase Auth
+        stats["auth"] = get_token_verifier(supabase).get_stats()
+        stats["user_profiles"] = get_user_profiles(supabase).get_stats()
+        
         return stats
     except Exception as e:
         logger.error(f"Failed to get model usage stats: {str(e)}")
@@ -739,7 +851,8 @@ async def get_model_usage_logs(
     limit: int = 100,
     provider: Optional[str] = None,
     feature: Optional[str] = None,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    usage_logger: ModelUsageLogger = Depends(provide(get_model_usage_logger))
 ):
     """
     Get recent model usage logs
@@ -750,8 +863,6 @@ async def get_model_usage_logs(
     - feature: Filter by feature
     """
     try:
-        usage_logger = get_model_usage_logger(supabase)
-        
         logs = await usage_logger.get_recent_logs(
             limit=limit,
             provider=provider,
@@ -768,7 +879,8 @@ async def get_model_usage_logs(
 async def get_fallback_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    usage_logger: ModelUsageLogger = Depends(provide(get_model_usage_logger))
 ):
     """
     Get detailed fallback report
@@ -778,8 +890,6 @@ async def get_fallback_report(
     - end_date: End date (ISO format)
     """
     try:
-        usage_logger = get_model_usage_logger(supabase)
-        
         report = await usage_logger.get_fallback_report(
             start_date=start_date,
             end_date=end_date
@@ -797,19 +907,26 @@ async def get_fallback_report(
 
 @app.get("/api/admin/health/check-all")
 async def run_health_checks(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    scheduler: HealthCheckScheduler = Depends(provide(get_health_check_scheduler))
 ):
     """
     Run health checks on all providers (paid APIs + Hugging Face)
     
-    Returns health status for all API keys and fallback models
+    Returns health status for all API keys and fallback models, plus the
+    routing score inputs per key and feature
     """
     try:
-        from services.health_check_scheduler import get_health_check_scheduler
+        from services.provider_scoring import get_provider_scorer
+        from services.key_scheduler import get_key_scheduler
         
-        scheduler = get_health_check_scheduler(supabase)
         results = await scheduler.run_health_checks()
         
+        # Inputs behind the latest routing decisions (weights, EWMA latency/error rate, rankings)
+        results["routing"] = get_provider_scorer(supabase).get_snapshot()
+        # Keys busy, queued or parked after an upstream 429
+        results["key_scheduler"] = get_key_scheduler(supabase).get_stats()
+        
         return results
     except Exception as e:
         logger.error(f"Failed to run health checks: {str(e)}")
@@ -818,7 +935,8 @@ async def run_health_checks(
 
 @app.get("/api/admin/health/huggingface")
 async def check_huggingface_health(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    scheduler: HealthCheckScheduler = Depends(provide(get_health_check_scheduler))
 ):
     """
     Check health of Hugging Face fallback models
@@ -826,10 +944,8 @@ async def check_huggingface_health(
     Returns health status for all Hugging Face models
     """
     try:
-        from services.health_check_scheduler import get_health_check_scheduler
         from datetime import datetime
         
-        scheduler = get_health_check_scheduler(supabase)
         results = await scheduler.check_huggingface_models()
         
         return {
@@ -846,7 +962,8 @@ async def check_huggingface_health(
 
 @app.get("/api/admin/health/paid-apis")
 async def check_paid_apis_health(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    scheduler: HealthCheckScheduler = Depends(provide(get_health_check_scheduler))
 ):
     """
     Check health of paid API keys
@@ -854,10 +971,8 @@ async def check_paid_apis_health(
     Returns health status for all active paid API keys
     """
     try:
-        from services.health_check_scheduler import get_health_check_scheduler
         from datetime import datetime
         
-        scheduler = get_health_check_scheduler(supabase)
         results = await scheduler.check_paid_api_keys()
         
         return {
@@ -880,7 +995,10 @@ async def check_paid_apis_health(
 async def upload_document(
     file: UploadFile = File(...),
     feature: str = Form("chat"),
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    rate_limiter: RateLimiter = Depends(provide(get_rate_limiter)),
+    document_service: DocumentService = Depends(provide(get_document_service)),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """
     Upload a document (PDF or image)
@@ -892,9 +1010,6 @@ async def upload_document(
     try:
         logger.info(f"Document upload started - User: {user['id'][:8]}..., Feature: {feature}, File: {file.filename}")
         
-        # Check rate limit for document uploads
-        rate_limiter = get_rate_limiter(supabase)
-        
         # Check feature-specific upload limit
         limit_key = f"{feature}_uploads_per_day"
         has_capacity = await rate_limiter.check_feature_limit(user["id"], limit_key)
@@ -913,8 +1028,7 @@ async def upload_document(
             raise HTTPException(status_code=400, detail="Invalid file type. Only PDF and images are supported.")
         
         # Get user's plan and role to determine upload size limit
-        user_result = supabase.table("users").select("plan, role").eq("id", user["id"]).execute()
-        user_data = user_result.data[0] if user_result.data else {}
+        user_data = await get_user_profiles(supabase).get(user["id"]) or {}
         user_plan = user_data.get("plan", "free")
         user_role = user_data.get("role")
         
@@ -924,7 +1038,6 @@ async def upload_document(
             max_size_bytes = max_size_mb * 1024 * 1024
         else:
             # Get plan-specific upload size limit (default to 10MB)
-            admin_service = get_admin_service(supabase)
             max_size_mb_str = await admin_service.get_system_flag(f"document_upload_size_mb_{user_plan}", "10")
             max_size_mb = int(max_size_mb_str) if max_size_mb_str.isdigit() else 10
             max_size_mb = max(1, min(50, max_size_mb))  # Enforce 1-50 MB range
@@ -941,7 +1054,6 @@ async def upload_document(
             )
         
         # Upload document
-        document_service = get_document_service(supabase)
         document = await document_service.upload_document(
             user_id=user["id"],
             file_content=file_content,
@@ -966,11 +1078,11 @@ async def upload_document(
 @app.get("/api/documents")
 async def get_documents(
     feature: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    document_service: DocumentService = Depends(provide(get_document_service))
 ):
     """Get user's documents, optionally filtered by feature"""
     try:
-        document_service = get_document_service(supabase)
         documents = await document_service.get_user_documents(user["id"], feature)
         return {"documents": documents, "count": len(documents)}
     except Exception as e:
@@ -982,29 +1094,28 @@ async def get_documents(
 async def delete_document(
     document_id: str,
     user: Dict[str, Any] = Depends(get_current_user),
-    force: bool = False
+    force: bool = False,
+    document_service: DocumentService = Depends(provide(get_document_service))
 ):
     """Delete a document"""
     try:
-        document_service = get_document_service(supabase)
-        
         # If force=true, bypass user check (for admin cleanup)
         if force:
             logger.warning(f"Force deleting document {document_id}")
             # Get document without user filter
-            doc_result = supabase.table("documents").select("*").eq("id", document_id).execute()
+            doc_result = await run_query(supabase.table("documents").select("*").eq("id", document_id))
             if doc_result.data and len(doc_result.data) > 0:
                 document = doc_result.data[0]
                 # Delete storage
                 try:
                     if document.get("storage_path"):
-                        supabase.storage.from_("documents").remove([document["storage_path"]])
+                        await run_sync(supabase.storage.from_("documents").remove, [document["storage_path"]])
                 except Exception as e:
                     logger.warning(f"Storage deletion failed: {str(e)}")
                 # Delete chunks
-                supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
+                await run_query(supabase.table("document_chunks").delete().eq("document_id", document_id))
                 # Delete document
-                supabase.table("documents").delete().eq("id", document_id).execute()
+                await run_query(supabase.table("documents").delete().eq("id", document_id))
                 return {"message": "Document force deleted successfully"}
             else:
                 raise HTTPException(status_code=404, detail="Document not found")
@@ -1022,11 +1133,11 @@ async def search_documents(
     query: str,
     feature: Optional[str] = None,
     top_k: int = 5,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    document_service: DocumentService = Depends(provide(get_document_service))
 ):
     """Search documents for relevant chunks"""
     try:
-        document_service = get_document_service(supabase)
         results = await document_service.search_documents(
             user_id=user["id"],
             query=query,
@@ -1047,7 +1158,7 @@ async def get_document_diagnostics(
     """Get diagnostic information about a document"""
     try:
         # Get document info
-        doc_result = supabase.table("documents").select("*").eq("id", document_id).eq("user_id", user["id"]).execute()
+        doc_result = await run_query(supabase.table("documents").select("*").eq("id", document_id).eq("user_id", user["id"]))
         
         if not doc_result.data:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -1055,7 +1166,7 @@ async def get_document_diagnostics(
         document = doc_result.data[0]
         
         # Get chunks info
-        chunks_result = supabase.table("document_chunks").select("id, chunk_index, embedding").eq("document_id", document_id).execute()
+        chunks_result = await run_query(supabase.table("document_chunks").select("id, chunk_index, embedding").eq("document_id", document_id))
         
         chunks_info = {
             "total_chunks": len(chunks_result.data or []),
@@ -1095,11 +1206,11 @@ class RateLimitsRequest(BaseModel):
 
 @app.get("/api/admin/rate-limits")
 async def get_rate_limits(
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Get rate limits for all plans"""
     try:
-        admin_service = get_admin_service(supabase)
         plans = ["free", "student", "pro"]
         
         all_limits = {}
@@ -1136,11 +1247,11 @@ async def get_rate_limits(
 @app.post("/api/admin/rate-limits")
 async def update_rate_limits(
     request: RateLimitsRequest,
-    admin: Dict[str, Any] = Depends(verify_admin)
+    admin: Dict[str, Any] = Depends(verify_admin),
+    admin_service: AdminService = Depends(provide(get_admin_service))
 ):
     """Update rate limits for a plan"""
     try:
-        admin_service = get_admin_service(supabase)
         plan = request.plan
         limits = request.limits
         
@@ -1203,6 +1314,9 @@ async def get_rag_stats(
     """Get RAG usage statistics"""
     try:
         from datetime import timedelta
+        from services.embedding_cache import get_embedding_cache
+        
+        embedding_cache = get_embedding_cache()
         
         # Calculate time range
         time_ranges = {
@@ -1219,7 +1333,7 @@ async def get_rag_stats(
         if feature and feature != "all":
             query = query.eq("feature", feature)
         
-        result = query.execute()
+        result = await run_query(query)
         logs = result.data or []
         
         # Calculate stats
@@ -1244,13 +1358,65 @@ async def get_rag_stats(
             "successful_queries": successful_queries,
             "avg_grounding_score": avg_grounding_score,
             "by_feature": by_feature,
-            "recent_logs": recent_logs
+            "recent_logs": recent_logs,
+            "embedding_cache": await run_sync(embedding_cache.get_stats) if embedding_cache else None
         }
     except Exception as e:
         logger.error(f"Failed to get RAG stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/cache/responses")
+async def get_response_cache_stats(
+    admin: Dict[str, Any] = Depends(verify_admin)
+):
+    """Get study-tool response cache statistics"""
+    from services.response_cache import get_response_cache
+    
+    response_cache = get_response_cache()
+    return {
+        "enabled": response_cache is not None,
+        "stats": await run_sync(response_cache.get_stats) if response_cache else None
+    }
+
+
+@app.delete("/api/admin/cache/responses")
+async def purge_response_cache(
+    tool: Optional[str] = None,
+    expired_only: bool = False,
+    admin: Dict[str, Any] = Depends(verify_admin),
+    audit_service: AuditService = Depends(provide(get_audit_service))
+):
+    """
+    Purge cached study-tool responses
+    
+    Query parameters:
+    - tool: Only purge one study tool (flashcard, mcq, highyield, explain, map)
+    - expired_only: Only purge entries older than the TTL
+    """
+    try:
+        from services.response_cache import get_response_cache
+        
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return {"message": "Response cache is disabled", "purged": 0}
+        
+        purged = await response_cache.purge(tool=tool, expired_only=expired_only)
+        
+        await audit_service.log_admin_action(
+            admin_id=admin["id"],
+            action_type="purge_response_cache",
+            target_type="response_cache",
+            target_id=tool or "all",
+            details={"expired_only": expired_only, "purged": purged}
+        )
+        
+        return {"message": "Response cache purged", "purged": purged}
+    except Exception as e:
+        logger.error(f"Failed to purge response cache: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================================
 # DOCUMENT ENDPOINTS (kept for backward compatibility, but simplified)
 # ============================================================================
@@ -1260,7 +1426,7 @@ async def get_rag_stats(
 # STUDY PLANNER ENDPOINTS
 # ============================================================================
 
-from services.enhanced_study_planner import get_enhanced_study_planner_service
+from services.enhanced_study_planner import get_enhanced_study_planner_service, EnhancedStudyPlannerService
 
 
 class CreatePlanEntryRequest(BaseModel):
@@ -1281,11 +1447,11 @@ class CreatePlanEntryRequest(BaseModel):
 @app.post("/api/planner/entries", status_code=201)
 async def create_plan_entry(
     request: CreatePlanEntryRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Create a new study plan entry"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entry = await planner_service.create_plan_entry(
             user_id=user["id"],
             subject=request.subject,
@@ -1313,11 +1479,11 @@ async def get_plan_entries(
     end_date: Optional[str] = None,
     status: Optional[str] = None,
     study_type: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get study plan entries with optional filters"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entries = await planner_service.get_plan_entries(
             user_id=user["id"],
             start_date=start_date,
@@ -1334,11 +1500,11 @@ async def get_plan_entries(
 @app.get("/api/planner/entries/daily/{target_date}")
 async def get_daily_entries(
     target_date: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get all entries for a specific day"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entries = await planner_service.get_daily_entries(user["id"], target_date)
         return {"entries": entries, "count": len(entries), "date": target_date}
     except Exception as e:
@@ -1349,11 +1515,11 @@ async def get_daily_entries(
 @app.get("/api/planner/entries/weekly/{week_start}")
 async def get_weekly_entries(
     week_start: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get all entries for a week"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entries = await planner_service.get_weekly_entries(user["id"], week_start)
         return {"entries": entries, "count": len(entries), "week_start": week_start}
     except Exception as e:
@@ -1365,11 +1531,11 @@ async def get_weekly_entries(
 async def get_monthly_entries(
     year: int,
     month: int,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get all entries for a month"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entries = await planner_service.get_monthly_entries(user["id"], year, month)
         return {"entries": entries, "count": len(entries), "year": year, "month": month}
     except Exception as e:
@@ -1396,11 +1562,11 @@ class UpdatePlanEntryRequest(BaseModel):
 async def update_plan_entry(
     entry_id: str,
     request: UpdatePlanEntryRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Update a study plan entry"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         updates = {k: v for k, v in request.dict().items() if v is not None}
         entry = await planner_service.update_plan_entry(user["id"], entry_id, updates)
         return entry
@@ -1419,11 +1585,11 @@ class CompletePlanEntryRequest(BaseModel):
 async def complete_plan_entry(
     entry_id: str,
     user: Dict[str, Any] = Depends(get_current_user),
-    request: Optional[CompletePlanEntryRequest] = None
+    request: Optional[CompletePlanEntryRequest] = None,
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Mark a study plan entry as completed"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entry = await planner_service.complete_entry(
             user_id=user["id"],
             entry_id=entry_id,
@@ -1439,11 +1605,11 @@ async def complete_plan_entry(
 @app.post("/api/planner/entries/{entry_id}/start")
 async def start_plan_entry(
     entry_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Mark a study plan entry as in progress"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         entry = await planner_service.start_entry(user["id"], entry_id)
         return entry
     except Exception as e:
@@ -1453,11 +1619,11 @@ async def start_plan_entry(
 @app.delete("/api/planner/entries/{entry_id}")
 async def delete_plan_entry(
     entry_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Delete a study plan entry"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         await planner_service.delete_plan_entry(user["id"], entry_id)
         return {"message": "Entry deleted successfully"}
     except Exception as e:
@@ -1481,11 +1647,11 @@ class CreateGoalRequest(BaseModel):
 @app.post("/api/planner/goals", status_code=201)
 async def create_goal(
     request: CreateGoalRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Create a new study goal"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         goal = await planner_service.create_goal(
             user_id=user["id"],
             title=request.title,
@@ -1507,11 +1673,11 @@ async def create_goal(
 @app.get("/api/planner/goals")
 async def get_goals(
     status: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get study goals"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         goals = await planner_service.get_goals(user["id"], status)
         return {"goals": goals, "count": len(goals)}
     except Exception as e:
@@ -1522,11 +1688,11 @@ async def get_goals(
 @app.delete("/api/planner/goals/{goal_id}")
 async def delete_goal(
     goal_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Delete a study goal"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         await planner_service.delete_goal(user["id"], goal_id)
         return {"message": "Goal deleted successfully"}
     except Exception as e:
@@ -1538,11 +1704,11 @@ async def delete_goal(
 @app.get("/api/planner/performance/summary")
 async def get_performance_summary(
     days: int = 30,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get performance summary"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         summary = await planner_service.get_performance_summary(user["id"], days)
         return summary
     except Exception as e:
@@ -1554,11 +1720,11 @@ async def get_performance_summary(
 async def get_performance_metrics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get detailed performance metrics"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         metrics = await planner_service.get_performance_metrics(user["id"], start_date, end_date)
         return {"metrics": metrics, "count": len(metrics)}
     except Exception as e:
@@ -1569,11 +1735,11 @@ async def get_performance_metrics(
 @app.get("/api/planner/performance/subjects")
 async def get_subject_breakdown(
     days: int = 30,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get study time breakdown by subject"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         breakdown = await planner_service.get_subject_breakdown(user["id"], days)
         return {"subjects": breakdown}
     except Exception as e:
@@ -1584,11 +1750,11 @@ async def get_subject_breakdown(
 # Streak Endpoints
 @app.get("/api/planner/streak")
 async def get_streak(
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get current streak data"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         streak = await planner_service.get_streak(user["id"])
         return streak
     except Exception as e:
@@ -1599,11 +1765,11 @@ async def get_streak(
 # AI Recommendations Endpoints
 @app.get("/api/planner/recommendations")
 async def get_recommendations(
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get AI-powered study recommendations"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         recommendations = await planner_service.generate_recommendations(user["id"])
         return {"recommendations": recommendations}
     except Exception as e:
@@ -1614,11 +1780,11 @@ async def get_recommendations(
 # Daily Brief Endpoint
 @app.get("/api/planner/daily-brief")
 async def get_daily_brief(
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    planner_service: EnhancedStudyPlannerService = Depends(provide(get_enhanced_study_planner_service))
 ):
     """Get daily study brief"""
     try:
-        planner_service = get_enhanced_study_planner_service(supabase)
         brief = await planner_service.get_daily_brief(user["id"])
         return brief
     except Exception as e:
@@ -1631,7 +1797,7 @@ async def get_daily_brief(
 # CLINICAL REASONING ENGINE ENDPOINTS
 # ============================================================================
 
-from services.clinical_reasoning_engine import get_clinical_reasoning_engine
+from services.clinical_reasoning_engine import get_clinical_reasoning_engine, ClinicalReasoningEngine
 
 
 
@@ -1664,7 +1830,8 @@ class OSCEInteractionRequest(BaseModel):
 @app.post("/api/clinical/cases", status_code=201)
 async def create_clinical_case(
     request: CreateClinicalCaseRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """
     Generate a new clinical reasoning case
@@ -1673,7 +1840,6 @@ async def create_clinical_case(
     for clinical reasoning practice.
     """
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         case = await engine.generate_clinical_case(
             user_id=user["id"],
             specialty=request.specialty,
@@ -1708,7 +1874,7 @@ async def get_clinical_cases(
         if specialty:
             query = query.eq("specialty", specialty)
         
-        response = query.execute()
+        response = await run_query(query)
         return {"cases": response.data or [], "count": len(response.data or [])}
     except Exception as e:
         logger.error(f"Failed to get clinical cases: {str(e)}")
@@ -1718,11 +1884,11 @@ async def get_clinical_cases(
 @app.get("/api/clinical/cases/{case_id}")
 async def get_clinical_case(
     case_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """Get a specific clinical case with current stage data"""
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         case_data = await engine.get_case_stage(case_id, user["id"])
         return case_data
     except Exception as e:
@@ -1734,7 +1900,8 @@ async def get_clinical_case(
 async def submit_reasoning_step(
     case_id: str,
     request: SubmitReasoningStepRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """
     Submit a clinical reasoning step for evaluation
@@ -1743,7 +1910,6 @@ async def submit_reasoning_step(
     May advance the case to the next stage based on performance.
     """
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         result = await engine.submit_reasoning_step(
             case_id=case_id,
             user_id=user["id"],
@@ -1760,17 +1926,19 @@ async def submit_reasoning_step(
 @app.post("/api/clinical/cases/{case_id}/advance")
 async def advance_case_stage(
     case_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """Advance the case to the next stage"""
     try:
         # Get current case
-        response = supabase.table("clinical_cases")\
-            .select("current_stage, stages")\
-            .eq("id", case_id)\
-            .eq("user_id", user["id"])\
-            .single()\
-            .execute()
+        response = await run_query(
+            supabase.table("clinical_cases")
+            .select("current_stage, stages")
+            .eq("id", case_id)
+            .eq("user_id", user["id"])
+            .single()
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Case not found")
@@ -1782,12 +1950,12 @@ async def advance_case_stage(
             raise HTTPException(status_code=400, detail="Case already at final stage")
         
         # Advance stage
-        supabase.table("clinical_cases")\
-            .update({"current_stage": current_stage + 1})\
-            .eq("id", case_id)\
-            .execute()
+        await run_query(
+            supabase.table("clinical_cases")
+            .update({"current_stage": current_stage + 1})
+            .eq("id", case_id)
+        )
         
-        engine = get_clinical_reasoning_engine(supabase)
         return await engine.get_case_stage(case_id, user["id"])
     except HTTPException:
         raise
@@ -1799,11 +1967,11 @@ async def advance_case_stage(
 @app.post("/api/clinical/cases/{case_id}/complete")
 async def complete_clinical_case(
     case_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """Complete a clinical case and get final feedback"""
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         result = await engine.complete_case(case_id, user["id"])
         return result
     except Exception as e:
@@ -1816,7 +1984,8 @@ async def complete_clinical_case(
 @app.post("/api/clinical/osce", status_code=201)
 async def create_osce_scenario(
     request: CreateOSCERequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """
     Create a new OSCE examination scenario
@@ -1825,7 +1994,6 @@ async def create_osce_scenario(
     and examiner interactions.
     """
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         scenario = await engine.create_osce_scenario(
             user_id=user["id"],
             scenario_type=request.scenario_type,
@@ -1860,7 +2028,7 @@ async def get_osce_scenarios(
         if scenario_type:
             query = query.eq("scenario_type", scenario_type)
         
-        response = query.execute()
+        response = await run_query(query)
         return {"scenarios": response.data or [], "count": len(response.data or [])}
     except Exception as e:
         logger.error(f"Failed to get OSCE scenarios: {str(e)}")
@@ -1874,12 +2042,13 @@ async def get_osce_scenario(
 ):
     """Get a specific OSCE scenario"""
     try:
-        response = supabase.table("osce_scenarios")\
-            .select("*")\
-            .eq("id", scenario_id)\
-            .eq("user_id", user["id"])\
-            .single()\
-            .execute()
+        response = await run_query(
+            supabase.table("osce_scenarios")
+            .select("*")
+            .eq("id", scenario_id)
+            .eq("user_id", user["id"])
+            .single()
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Scenario not found")
@@ -1912,7 +2081,8 @@ async def get_osce_scenario(
 async def osce_interact(
     scenario_id: str,
     request: OSCEInteractionRequest,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """
     Interact with OSCE scenario (patient/examiner)
@@ -1921,7 +2091,6 @@ async def osce_interact(
     with examiner assessment.
     """
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         response = await engine.osce_interaction(
             scenario_id=scenario_id,
             user_id=user["id"],
@@ -1941,12 +2110,13 @@ async def complete_osce_scenario(
     """Complete an OSCE scenario and get performance feedback"""
     try:
         # Get scenario with full data
-        response = supabase.table("osce_scenarios")\
-            .select("*")\
-            .eq("id", scenario_id)\
-            .eq("user_id", user["id"])\
-            .single()\
-            .execute()
+        response = await run_query(
+            supabase.table("osce_scenarios")
+            .select("*")
+            .eq("id", scenario_id)
+            .eq("user_id", user["id"])
+            .single()
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Scenario not found")
@@ -2005,14 +2175,15 @@ async def complete_osce_scenario(
         from datetime import datetime, timezone
         time_completed = datetime.now(timezone.utc).isoformat()
         
-        supabase.table("osce_scenarios")\
+        await run_query(
+            supabase.table("osce_scenarios")
             .update({
                 "status": "completed",
                 "time_completed": time_completed,
                 "checklist_score": score
-            })\
-            .eq("id", scenario_id)\
-            .execute()
+            })
+            .eq("id", scenario_id)
+        )
         
         # Generate performance summary
         performance_grade = "Excellent" if score >= 85 else "Good" if score >= 70 else "Satisfactory" if score >= 60 else "Needs Improvement"
@@ -2051,11 +2222,11 @@ async def complete_osce_scenario(
 
 @app.get("/api/clinical/performance")
 async def get_clinical_performance(
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    engine: ClinicalReasoningEngine = Depends(provide(get_clinical_reasoning_engine))
 ):
     """Get user's clinical performance summary"""
     try:
-        engine = get_clinical_reasoning_engine(supabase)
         performance = await engine.get_performance_summary(user["id"])
         return performance
     except Exception as e:
@@ -2075,27 +2246,30 @@ async def get_clinical_history(
         start_date = (datetime.now() - timedelta(days=days)).isoformat()
         
         # Get cases
-        cases_response = supabase.table("clinical_cases")\
-            .select("id, specialty, difficulty, status, created_at")\
-            .eq("user_id", user["id"])\
-            .gte("created_at", start_date)\
-            .order("created_at", desc=True)\
-            .execute()
+        cases_response = await run_query(
+            supabase.table("clinical_cases")
+            .select("id, specialty, difficulty, status, created_at")
+            .eq("user_id", user["id"])
+            .gte("created_at", start_date)
+            .order("created_at", desc=True)
+        )
         
         # Get OSCE scenarios
-        osce_response = supabase.table("osce_scenarios")\
-            .select("id, scenario_type, difficulty, status, checklist_score, created_at")\
-            .eq("user_id", user["id"])\
-            .gte("created_at", start_date)\
-            .order("created_at", desc=True)\
-            .execute()
+        osce_response = await run_query(
+            supabase.table("osce_scenarios")
+            .select("id, scenario_type, difficulty, status, checklist_score, created_at")
+            .eq("user_id", user["id"])
+            .gte("created_at", start_date)
+            .order("created_at", desc=True)
+        )
         
         # Get reasoning steps
-        steps_response = supabase.table("clinical_reasoning_steps")\
-            .select("step_type, score, created_at")\
-            .eq("user_id", user["id"])\
-            .gte("created_at", start_date)\
-            .execute()
+        steps_response = await run_query(
+            supabase.table("clinical_reasoning_steps")
+            .select("step_type, score, created_at")
+            .eq("user_id", user["id"])
+            .gte("created_at", start_date)
+        )
         
         return {
             "cases": cases_response.data or [],
@@ -2119,14 +2293,15 @@ if __name__ == "__main__":
 # MEDICAL IMAGES ENDPOINTS
 # ============================================================================
 
-from services.medical_images import get_medical_image_service
+from services.medical_images import get_medical_image_service, MedicalImageService
 
 
 @app.post("/api/medical-images", status_code=201)
 async def upload_medical_image(
     file: UploadFile = File(...),
     category: Optional[str] = Form(None),
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """
     Upload a medical image for AI analysis
@@ -2152,7 +2327,6 @@ async def upload_medical_image(
             raise HTTPException(status_code=400, detail="File too large. Maximum size is 50MB.")
         
         # Upload medical image
-        medical_image_service = get_medical_image_service(supabase)
         medical_image = await medical_image_service.upload_medical_image(
             user_id=user["id"],
             file_content=file_content,
@@ -2175,11 +2349,11 @@ async def upload_medical_image(
 async def get_medical_images(
     category: Optional[str] = None,
     limit: int = 50,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """Get user's medical images, optionally filtered by category"""
     try:
-        medical_image_service = get_medical_image_service(supabase)
         images = await medical_image_service.get_user_medical_images(user["id"], category, limit)
         return {"images": images, "count": len(images)}
     except Exception as e:
@@ -2190,11 +2364,11 @@ async def get_medical_images(
 @app.get("/api/medical-images/{image_id}")
 async def get_medical_image(
     image_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """Get a specific medical image with analysis"""
     try:
-        medical_image_service = get_medical_image_service(supabase)
         image = await medical_image_service.get_medical_image(user["id"], image_id)
         
         if not image:
@@ -2211,11 +2385,11 @@ async def get_medical_image(
 @app.delete("/api/medical-images/{image_id}")
 async def delete_medical_image(
     image_id: str,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """Delete a medical image"""
     try:
-        medical_image_service = get_medical_image_service(supabase)
         await medical_image_service.delete_medical_image(user["id"], image_id)
         return {"message": "Medical image deleted successfully"}
     except Exception as e:
@@ -2227,11 +2401,11 @@ async def delete_medical_image(
 async def search_medical_images(
     query: str,
     top_k: int = 10,
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """Search medical images by text query"""
     try:
-        medical_image_service = get_medical_image_service(supabase)
         results = await medical_image_service.query_medical_images(user["id"], query, top_k)
         return {"results": results, "count": len(results)}
     except Exception as e:
@@ -2243,7 +2417,8 @@ async def search_medical_images(
 async def analyze_medical_image(
     image: UploadFile = File(...),
     context: Optional[str] = Form(None),
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user),
+    medical_image_service: MedicalImageService = Depends(provide(get_medical_image_service))
 ):
     """
     Analyze a medical image with AI and save to session history
@@ -2265,9 +2440,6 @@ async def analyze_medical_image(
         if len(file_content) > 10 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB.")
         
-        # Get medical image service
-        medical_image_service = get_medical_image_service(supabase)
-        
         # Analyze the image
         analysis = await medical_image_service.analyze_image(
             user_id=user["id"],
@@ -2291,7 +2463,7 @@ async def analyze_medical_image(
         }
         
         try:
-            stored_session = supabase.table("image_analysis_sessions").insert(session_data).execute()
+            stored_session = await run_query(supabase.table("image_analysis_sessions").insert(session_data))
             if stored_session.data and len(stored_session.data) > 0:
                 # Add the session ID to the returned analysis so frontend can select it
                 analysis["session_id"] = stored_session.data[0]["id"]
@@ -2318,11 +2490,12 @@ async def get_image_analysis_sessions(
 ):
     """Get user's image analysis history"""
     try:
-        response = supabase.table("image_analysis_sessions")\
-            .select("id, image_filename, created_at, updated_at")\
-            .eq("user_id", user["id"])\
-            .order("created_at", desc=True)\
-            .execute()
+        response = await run_query(
+            supabase.table("image_analysis_sessions")
+            .select("id, image_filename, created_at, updated_at")
+            .eq("user_id", user["id"])
+            .order("created_at", desc=True)
+        )
         
         # Format for SessionSidebar compatibility
         sessions = []
@@ -2346,12 +2519,13 @@ async def get_image_analysis_session(
 ):
     """Get a specific image analysis session"""
     try:
-        response = supabase.table("image_analysis_sessions")\
-            .select("*")\
-            .eq("id", session_id)\
-            .eq("user_id", user["id"])\
-            .single()\
-            .execute()
+        response = await run_query(
+            supabase.table("image_analysis_sessions")
+            .select("*")
+            .eq("id", session_id)
+            .eq("user_id", user["id"])
+            .single()
+        )
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -2369,11 +2543,12 @@ async def delete_image_analysis_session(
 ):
     """Delete an image analysis session"""
     try:
-        supabase.table("image_analysis_sessions")\
-            .delete()\
-            .eq("id", session_id)\
-            .eq("user_id", user["id"])\
-            .execute()
+        await run_query(
+            supabase.table("image_analysis_sessions")
+            .delete()
+            .eq("id", session_id)
+            .eq("user_id", user["id"])
+        )
         return {"message": "Session deleted successfully"}
     except Exception as e:
         logger.error(f"Failed to delete image analysis session: {str(e)}")
@@ -2386,10 +2561,11 @@ async def delete_all_image_analysis_sessions(
 ):
     """Delete all image analysis sessions for a user"""
     try:
-        supabase.table("image_analysis_sessions")\
-            .delete()\
-            .eq("user_id", user["id"])\
-            .execute()
+        await run_query(
+            supabase.table("image_analysis_sessions")
+            .delete()
+            .eq("user_id", user["id"])
+        )
         return {"message": "All sessions deleted successfully"}
     except Exception as e:
         logger.error(f"Failed to delete all image analysis sessions: {str(e)}")
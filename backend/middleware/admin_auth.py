@@ -8,8 +8,11 @@ import os
 from typing import Optional
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +31,7 @@ class AdminAuthMiddleware:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def verify_admin_access(self, user_id: str, token: Optional[str] = None) -> bool:
         """
@@ -59,13 +58,13 @@ class AdminAuthMiddleware:
                     return True
             
             # Get user email and role
-            user_response = self.supabase.table("users").select("email, role").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_response.data or len(user_response.data) == 0:
+            if not profile:
                 return False
             
-            user_email = user_response.data[0]["email"]
-            user_role = user_response.data[0].get("role")
+            user_email = profile["email"]
+            user_role = profile.get("role")
             
             # Check SUPER_ADMIN_EMAIL environment variable (Requirement 2.4)
             super_admin_email = os.getenv("SUPER_ADMIN_EMAIL")
@@ -73,10 +72,11 @@ class AdminAuthMiddleware:
                 return True
             
             # Check admin_allowlist table (Requirement 2.2)
-            allowlist_response = self.supabase.table("admin_allowlist")\
-                .select("role")\
-                .eq("email", user_email)\
-                .execute()
+            allowlist_response = await run_query(
+                self.supabase.table("admin_allowlist")
+                .select("role")
+                .eq("email", user_email)
+            )
             
             if allowlist_response.data and len(allowlist_response.data) > 0:
                 allowlist_role = allowlist_response.data[0]["role"]
@@ -0,0 +1,67 @@
+"""
+Admission Rejection Middleware
+
+Turns error responses of requests whose AI calls were shed by the
+admission queue into 503 Service Unavailable with a Retry-After header.
+Services report failed AI calls as generic errors, so the rejection is
+recorded on the request context (see services/admission_queue.py) and
+translated here.
+"""
+import json
+import math
+import logging
+from services.admission_queue import track_request_rejection
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejectionMiddleware:
+    """ASGI middleware answering 503 + Retry-After for shed AI requests"""
+
+    def __init__(self, app):
+        """
+        Initialize admission rejection middleware
+
+        Args:
+            app: Wrapped ASGI application
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rejection = track_request_rejection()
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal replaced
+
+            if message["type"] == "http.response.start" and message["status"] >= 500 and rejection:
+                replaced = True
+                retry_after = str(max(1, math.ceil(rejection["retry_after"])))
+                body = json.dumps({
+                    "detail": "Service is busy, please retry shortly",
+                    "retry_after": int(retry_after)
+                }).encode("utf-8")
+
+                logger.info(f"Answering 503 for shed AI request: {scope.get('path')} (retry after {retry_after}s)")
+                await send({
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode("latin-1")),
+                        (b"retry-after", retry_after.encode("latin-1"))
+                    ]
+                })
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            if replaced:
+                return  # Drop the original error body
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
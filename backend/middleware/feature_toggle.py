@@ -4,12 +4,13 @@ Feature Toggle Middleware
 Checks feature status before processing feature-specific requests and enforces feature toggles.
 Requirements: 16.3
 """
-import os
 import logging
 from typing import Optional
 from fastapi import Request, HTTPException, status
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.system_flags import get_system_flags
 
 # Load environment variables
 load_dotenv()
@@ -49,11 +50,7 @@ class FeatureToggleMiddleware:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def get_feature_status(self, feature: str) -> bool:
         """
@@ -69,19 +66,13 @@ class FeatureToggleMiddleware:
             # Create flag name
             flag_name = f"feature_{feature}_enabled"
             
-            # Query system_flags table
-            result = self.supabase.table("system_flags") \
-                .select("flag_value") \
-                .eq("flag_name", flag_name) \
-                .execute()
+            # Read from the in-memory flag snapshot (no query per request)
+            flag_value = await get_system_flags(self.supabase).get_value(flag_name)
             
-            if not result.data:
+            if flag_value is None:
                 # Feature flag doesn't exist, default to enabled
                 return True
             
-            # Parse flag value
-            flag_value = result.data[0]["flag_value"]
-            
             # Convert string to boolean
             return flag_value.lower() == "true"
         except Exception as e:
@@ -5,12 +5,17 @@ Checks maintenance status before processing requests and enforces maintenance mo
 Requirements: 12.5, 12.6
 """
 import os
+import ast
 import logging
 from typing import Optional
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
+from services.user_profiles import get_user_profiles
+from services.system_flags import get_system_flags
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +23,44 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 
+_NOT_IN_MAINTENANCE = {
+    "in_maintenance": False,
+    "level": None,
+    "reason": None,
+}
+
+
+def parse_maintenance_flag(flag_value: Optional[str]) -> dict:
+    """
+    Parse the maintenance_mode flag value
+    
+    Args:
+        flag_value: Stored flag value (a dict literal), or None if the flag doesn't exist
+        
+    Returns:
+        Dict with maintenance status information
+    """
+    if flag_value is None:
+        # No maintenance flag exists
+        return _NOT_IN_MAINTENANCE
+    
+    try:
+        parsed = ast.literal_eval(flag_value)
+        
+        # Check if maintenance is active
+        if not parsed.get("is_active", False):
+            return _NOT_IN_MAINTENANCE
+        
+        return {
+            "in_maintenance": True,
+            "level": parsed.get("level"),
+            "reason": parsed.get("reason"),
+        }
+    except Exception as e:
+        logger.error(f"Failed to parse maintenance flag: {str(e)}")
+        return _NOT_IN_MAINTENANCE
+
+
 class MaintenanceMiddleware:
     """Middleware for checking and enforcing maintenance mode"""
     
@@ -43,69 +86,22 @@ class MaintenanceMiddleware:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def get_maintenance_status(self) -> dict:
         """
-        Get current maintenance status from database
+        Get current maintenance status from the in-memory flag snapshot
         
         Returns:
             Dict with maintenance status information
         """
         try:
-            # Query system_flags table
-            flag_name = "maintenance_mode"
-            result = self.supabase.table("system_flags") \
-                .select("flag_value, updated_at") \
-                .eq("flag_name", flag_name) \
-                .execute()
-            
-            if not result.data:
-                # No maintenance flag exists
-                return {
-                    "in_maintenance": False,
-                    "level": None,
-                    "reason": None,
-                }
-            
-            # Parse flag value
-            import ast
-            try:
-                flag_value = ast.literal_eval(result.data[0]["flag_value"])
-                
-                # Check if maintenance is active
-                is_active = flag_value.get("is_active", False)
-                
-                if not is_active:
-                    return {
-                        "in_maintenance": False,
-                        "level": None,
-                        "reason": None,
-                    }
-                
-                return {
-                    "in_maintenance": True,
-                    "level": flag_value.get("level"),
-                    "reason": flag_value.get("reason"),
-                }
-            except Exception as e:
-                logger.error(f"Failed to parse maintenance flag: {str(e)}")
-                return {
-                    "in_maintenance": False,
-                    "level": None,
-                    "reason": None,
-                }
+            # Parsed once per flag change, not per request
+            status = await get_system_flags(self.supabase).get_parsed("maintenance_mode", parse_maintenance_flag)
+            return dict(status)
         except Exception as e:
             logger.error(f"Failed to get maintenance status: {str(e)}")
-            return {
-                "in_maintenance": False,
-                "level": None,
-                "reason": None,
-            }
+            return dict(_NOT_IN_MAINTENANCE)
     
     async def is_admin_user(self, user_id: str) -> bool:
         """
@@ -119,13 +115,13 @@ class MaintenanceMiddleware:
         """
         try:
             # Get user email and role
-            user_response = self.supabase.table("users").select("email, role").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_response.data or len(user_response.data) == 0:
+            if not profile:
                 return False
             
-            user_email = user_response.data[0]["email"]
-            user_role = user_response.data[0].get("role")
+            user_email = profile["email"]
+            user_role = profile.get("role")
             
             # Check SUPER_ADMIN_EMAIL environment variable
             super_admin_email = os.getenv("SUPER_ADMIN_EMAIL")
@@ -133,10 +129,11 @@ class MaintenanceMiddleware:
                 return True
             
             # Check admin_allowlist table
-            allowlist_response = self.supabase.table("admin_allowlist")\
-                .select("role")\
-                .eq("email", user_email)\
-                .execute()
+            allowlist_response = await run_query(
+                self.supabase.table("admin_allowlist")
+                .select("role")
+                .eq("email", user_email)
+            )
             
             if allowlist_response.data and len(allowlist_response.data) > 0:
                 allowlist_role = allowlist_response.data[0]["role"]
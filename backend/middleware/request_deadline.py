@@ -0,0 +1,116 @@
+"""
+Request Deadline Middleware
+
+Sets the time budget of AI endpoints (see services/request_deadline.py)
+and cancels the request handler when the client disconnects before the
+response has started, so abandoned requests release their queue slots
+and stop calling upstream providers. Streaming responses already stop on
+disconnect by themselves.
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from services.request_deadline import request_deadline
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+def _parse_deadlines(value: str) -> Dict[str, float]:
+    """Parse '/prefix=seconds,/prefix=seconds' into a dict, skipping malformed entries"""
+    deadlines = {}
+    for item in value.split(","):
+        prefix, _, seconds = item.partition("=")
+        try:
+            deadlines[prefix.strip()] = float(seconds)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring malformed request deadline '{item.strip()}'")
+    return deadlines
+
+
+class RequestDeadlineMiddleware:
+    """ASGI middleware for per-endpoint deadlines and disconnect cancellation"""
+
+    # Budget in seconds per route prefix (longest matching prefix wins)
+    # Override with REQUEST_DEADLINES=/api/chat=60,/api/study-tools=120
+    DEADLINE_ROUTES = {
+        "/api/chat": 120,
+        "/api/study-tools": 90,
+        "/api/clinical": 90,
+        "/api/image": 90,
+        "/api/planner": 60,
+    }
+
+    def __init__(self, app, deadlines: Optional[Dict[str, float]] = None):
+        """
+        Initialize request deadline middleware
+
+        Args:
+            app: Wrapped ASGI application
+            deadlines: Budget per route prefix (defaults to DEADLINE_ROUTES plus REQUEST_DEADLINES)
+        """
+        self.app = app
+        if deadlines is None:
+            deadlines = {**self.DEADLINE_ROUTES, **_parse_deadlines(os.getenv("REQUEST_DEADLINES", ""))}
+        self.deadlines = deadlines
+
+    def get_deadline(self, path: str) -> Optional[float]:
+        """
+        Get the budget for a request path
+
+        Args:
+            path: Request path
+
+        Returns:
+            Budget in seconds, or None if the route has no deadline
+        """
+        matches = [prefix for prefix in self.deadlines if path.startswith(prefix)]
+        return self.deadlines[max(matches, key=len)] if matches else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue = asyncio.Queue()
+        response_started = False
+        disconnected = False
+
+        async def queued_receive():
+            return await messages.get()
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        with request_deadline(self.get_deadline(scope["path"])):
+            handler = asyncio.ensure_future(self.app(scope, queued_receive, tracking_send))
+
+        async def watch_disconnect():
+            # Sole reader of the client's messages; the handler reads them from the queue
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not response_started and not handler.done():
+                        disconnected = True
+                        logger.info(f"Client disconnected, cancelling {scope['method']} {scope['path']}")
+                        handler.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
@@ -4,13 +4,17 @@ Handles administrative operations for user management and API key management
 
 Requirements: 13.1, 13.3, 13.4, 13.5, 14.2, 14.4, 14.6, 14.7
 """
-import os
 from typing import Optional, Dict, Any, List
 from datetime import date, datetime
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 from services.audit import get_audit_service
 from services.encryption import get_encryption_service
+from services.key_registry import invalidate_key_registry
+from services.db_executor import run_query
+from services.system_flags import get_system_flags
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
@@ -29,11 +33,7 @@ class AdminService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
         
         self.audit_service = get_audit_service(supabase_client)
         self.encryption_service = get_encryption_service()
@@ -76,7 +76,7 @@ class AdminService:
             # Order by created_at descending and limit results
             query = query.order("created_at", desc=True).limit(limit)
             
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data if response.data else []
         except Exception as e:
@@ -111,7 +111,7 @@ class AdminService:
                 raise Exception(f"Invalid plan: {new_plan}. Must be one of {valid_plans}")
             
             # Get current plan for audit log
-            user_response = self.supabase.table("users").select("plan").eq("id", user_id).execute()
+            user_response = await run_query(self.supabase.table("users").select("plan").eq("id", user_id))
             
             if not user_response.data or len(user_response.data) == 0:
                 raise Exception("User not found")
@@ -119,14 +119,17 @@ class AdminService:
             old_plan = user_response.data[0]["plan"]
             
             # Update user plan
-            update_response = self.supabase.table("users")\
-                .update({"plan": new_plan})\
-                .eq("id", user_id)\
-                .execute()
+            update_response = await run_query(
+                self.supabase.table("users")
+                .update({"plan": new_plan})
+                .eq("id", user_id)
+            )
             
             if not update_response.data or len(update_response.data) == 0:
                 raise Exception("Failed to update user plan")
             
+            get_user_profiles(self.supabase).invalidate(user_id)
+            
             # Log admin action
             await self.audit_service.log_admin_action(
                 admin_id=admin_id,
@@ -168,11 +171,12 @@ class AdminService:
             today = date.today()
             
             # Get current usage for audit log
-            usage_response = self.supabase.table("usage_counters")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .eq("date", str(today))\
-                .execute()
+            usage_response = await run_query(
+                self.supabase.table("usage_counters")
+                .select("*")
+                .eq("user_id", user_id)
+                .eq("date", str(today))
+            )
             
             old_usage = usage_response.data[0] if usage_response.data else None
             
@@ -188,11 +192,12 @@ class AdminService:
             
             if old_usage:
                 # Update existing counter
-                update_response = self.supabase.table("usage_counters")\
-                    .update(reset_data)\
-                    .eq("user_id", user_id)\
-                    .eq("date", str(today))\
-                    .execute()
+                update_response = await run_query(
+                    self.supabase.table("usage_counters")
+                    .update(reset_data)
+                    .eq("user_id", user_id)
+                    .eq("date", str(today))
+                )
                 
                 result = update_response.data[0] if update_response.data else None
             else:
@@ -200,9 +205,10 @@ class AdminService:
                 reset_data["user_id"] = user_id
                 reset_data["date"] = str(today)
                 
-                insert_response = self.supabase.table("usage_counters")\
-                    .insert(reset_data)\
-                    .execute()
+                insert_response = await run_query(
+                    self.supabase.table("usage_counters")
+                    .insert(reset_data)
+                )
                 
                 result = insert_response.data[0] if insert_response.data else None
             
@@ -251,7 +257,7 @@ class AdminService:
         """
         try:
             # Get current disabled status for audit log
-            user_response = self.supabase.table("users").select("disabled").eq("id", user_id).execute()
+            user_response = await run_query(self.supabase.table("users").select("disabled").eq("id", user_id))
             
             if not user_response.data or len(user_response.data) == 0:
                 raise Exception("User not found")
@@ -259,14 +265,17 @@ class AdminService:
             old_disabled = user_response.data[0]["disabled"]
             
             # Update user disabled status
-            update_response = self.supabase.table("users")\
-                .update({"disabled": disabled})\
-                .eq("id", user_id)\
-                .execute()
+            update_response = await run_query(
+                self.supabase.table("users")
+                .update({"disabled": disabled})
+                .eq("id", user_id)
+            )
             
             if not update_response.data or len(update_response.data) == 0:
                 raise Exception("Failed to update user disabled status")
             
+            get_user_profiles(self.supabase).invalidate(user_id)
+            
             # Log admin action
             action_type = "disable_user" if disabled else "enable_user"
             await self.audit_service.log_admin_action(
@@ -335,15 +344,19 @@ class AdminService:
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            insert_response = self.supabase.table("api_keys")\
-                .insert(key_data)\
-                .execute()
+            insert_response = await run_query(
+                self.supabase.table("api_keys")
+                .insert(key_data)
+            )
             
             if not insert_response.data or len(insert_response.data) == 0:
                 raise Exception("Failed to insert API key")
             
             created_key = insert_response.data[0]
             
+            # New key must be visible to routing immediately
+            invalidate_key_registry(feature)
+            
             # Log admin action
             await self.audit_service.log_admin_action(
                 admin_id=admin_id,
@@ -375,11 +388,12 @@ class AdminService:
         Requirements: 14.2
         """
         try:
-            response = self.supabase.table("api_keys")\
-                .select("*")\
-                .order("priority", desc=True)\
-                .order("created_at", desc=True)\
-                .execute()
+            response = await run_query(
+                self.supabase.table("api_keys")
+                .select("*")
+                .order("priority", desc=True)
+                .order("created_at", desc=True)
+            )
             
             return response.data if response.data else []
         except Exception as e:
@@ -416,10 +430,11 @@ class AdminService:
                 raise Exception(f"Invalid status: {status}. Must be one of {valid_statuses}")
             
             # Get current status for audit log
-            key_response = self.supabase.table("api_keys")\
-                .select("status, priority, provider, feature")\
-                .eq("id", key_id)\
-                .execute()
+            key_response = await run_query(
+                self.supabase.table("api_keys")
+                .select("status, priority, provider, feature")
+                .eq("id", key_id)
+            )
             
             if not key_response.data or len(key_response.data) == 0:
                 raise Exception("API key not found")
@@ -440,14 +455,17 @@ class AdminService:
                 update_data["priority"] = priority
             
             # Update key status and/or priority
-            update_response = self.supabase.table("api_keys")\
-                .update(update_data)\
-                .eq("id", key_id)\
-                .execute()
+            update_response = await run_query(
+                self.supabase.table("api_keys")
+                .update(update_data)
+                .eq("id", key_id)
+            )
             
             if not update_response.data or len(update_response.data) == 0:
                 raise Exception("Failed to update API key")
             
+            invalidate_key_registry(feature)
+            
             # Build audit details
             audit_details = {
                 "provider": provider,
@@ -495,10 +513,11 @@ class AdminService:
         """
         try:
             # Get key info for audit log before deletion
-            key_response = self.supabase.table("api_keys")\
-                .select("provider, feature, status")\
-                .eq("id", key_id)\
-                .execute()
+            key_response = await run_query(
+                self.supabase.table("api_keys")
+                .select("provider, feature, status")
+                .eq("id", key_id)
+            )
             
             if not key_response.data or len(key_response.data) == 0:
                 raise Exception("API key not found")
@@ -506,10 +525,13 @@ class AdminService:
             key_info = key_response.data[0]
             
             # Delete the key
-            delete_response = self.supabase.table("api_keys")\
-                .delete()\
-                .eq("id", key_id)\
-                .execute()
+            delete_response = await run_query(
+                self.supabase.table("api_keys")
+                .delete()
+                .eq("id", key_id)
+            )
+            
+            invalidate_key_registry(key_info["feature"])
             
             # Log admin action
             await self.audit_service.log_admin_action(
@@ -610,31 +632,37 @@ class AdminService:
             flag_name = f"feature_{feature}_enabled"
             
             # Check if flag exists
-            existing_flag = self.supabase.table("system_flags") \
-                .select("id") \
-                .eq("flag_name", flag_name) \
-                .execute()
+            existing_flag = await run_query(
+                self.supabase.table("system_flags")
+                .select("id")
+                .eq("flag_name", flag_name)
+            )
             
             if existing_flag.data:
                 # Update existing flag
-                self.supabase.table("system_flags") \
+                await run_query(
+                    self.supabase.table("system_flags")
                     .update({
                         "flag_value": str(enabled),
                         "updated_at": datetime.now().isoformat(),
                         "updated_by": admin_id
-                    }) \
-                    .eq("flag_name", flag_name) \
-                    .execute()
+                    })
+                    .eq("flag_name", flag_name)
+                )
             else:
                 # Insert new flag
-                self.supabase.table("system_flags") \
+                await run_query(
+                    self.supabase.table("system_flags")
                     .insert({
                         "flag_name": flag_name,
                         "flag_value": str(enabled),
                         "updated_by": admin_id,
                         "updated_at": datetime.now().isoformat()
-                    }) \
-                    .execute()
+                    })
+                )
+            
+            # Apply to this process's flag snapshot without waiting for the poll
+            get_system_flags(self.supabase).set_flag(flag_name, str(enabled))
             
             # Log the action (Requirement 16.4)
             await self.audit_service.log_admin_action(
@@ -667,10 +695,11 @@ class AdminService:
         """
         try:
             # Get all feature flags
-            flags_result = self.supabase.table("system_flags") \
-                .select("flag_name, flag_value") \
-                .like("flag_name", "feature_%_enabled") \
-                .execute()
+            flags_result = await run_query(
+                self.supabase.table("system_flags")
+                .select("flag_name, flag_value")
+                .like("flag_name", "feature_%_enabled")
+            )
             
             feature_status = {}
             
@@ -699,10 +728,11 @@ class AdminService:
         Get a system flag value
         """
         try:
-            result = self.supabase.table("system_flags") \
-                .select("flag_value") \
-                .eq("flag_name", flag_name) \
-                .execute()
+            result = await run_query(
+                self.supabase.table("system_flags")
+                .select("flag_value")
+                .eq("flag_name", flag_name)
+            )
             
             if result.data:
                 return result.data[0]["flag_value"]
@@ -716,31 +746,37 @@ class AdminService:
         """
         try:
             # Check if flag exists
-            existing_flag = self.supabase.table("system_flags") \
-                .select("id") \
-                .eq("flag_name", flag_name) \
-                .execute()
+            existing_flag = await run_query(
+                self.supabase.table("system_flags")
+                .select("id")
+                .eq("flag_name", flag_name)
+            )
             
             if existing_flag.data:
                 # Update existing flag
-                self.supabase.table("system_flags") \
+                await run_query(
+                    self.supabase.table("system_flags")
                     .update({
                         "flag_value": flag_value,
                         "updated_at": datetime.now().isoformat(),
                         "updated_by": admin_id
-                    }) \
-                    .eq("flag_name", flag_name) \
-                    .execute()
+                    })
+                    .eq("flag_name", flag_name)
+                )
             else:
                 # Insert new flag
-                self.supabase.table("system_flags") \
+                await run_query(
+                    self.supabase.table("system_flags")
                     .insert({
                         "flag_name": flag_name,
                         "flag_value": flag_value,
                         "updated_by": admin_id,
                         "updated_at": datetime.now().isoformat()
-                    }) \
-                    .execute()
+                    })
+                )
+            
+            # Apply to this process's flag snapshot without waiting for the poll
+            get_system_flags(self.supabase).set_flag(flag_name, flag_value)
             
             # Log the action
             await self.audit_service.log_admin_action(
@@ -790,7 +826,7 @@ class AdminService:
             # Order by created_at descending and limit results
             query = query.order("created_at", desc=True).limit(limit)
             
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data if response.data else []
         except Exception as e:
@@ -812,6 +848,6 @@ def get_admin_service(supabase_client: Optional[Client] = None) -> AdminService:
         AdminService instance
     """
     global _admin_service_instance
-    if _admin_service_instance is None or supabase_client is not None:
+    if _admin_service_instance is None or (supabase_client is not None and supabase_client is not _admin_service_instance.supabase):
         _admin_service_instance = AdminService(supabase_client)
     return _admin_service_instance
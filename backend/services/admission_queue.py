@@ -0,0 +1,339 @@
+"""
+Admission Queue
+Plan- and feature-aware priority admission for AI requests
+
+Caps the number of AI requests in flight upstream. When that capacity is
+saturated, requests wait in a priority queue: higher plan tiers (ranked by
+their PLAN_LIMITS daily token allowance) go first, and within a plan
+interactive features (chat, clinical cases, OSCE, images) go before bulk
+generation. The queue depth is bounded and every priority class has a
+maximum wait; a request that would wait longer is rejected immediately so
+the API can answer 503 with a Retry-After instead of hanging.
+"""
+import os
+import math
+import heapq
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.rate_limiter import PLAN_LIMITS
+from services.latency_tracker import LatencyTracker
+from services.request_deadline import bound_by_budget
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Queue configuration (ADMISSION_MAX_CONCURRENT=0 disables admission control)
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "200"))
+# Default maximum wait per kind of feature, in seconds
+ADMISSION_INTERACTIVE_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT_SECONDS", "10"))
+ADMISSION_BULK_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_BULK_MAX_WAIT_SECONDS", "20"))
+# Per-class overrides, e.g. ADMISSION_MAX_WAIT=interactive:free=5,bulk:free=3
+ADMISSION_MAX_WAIT = os.getenv("ADMISSION_MAX_WAIT", "")
+# Plan assumed when the caller's plan is unknown
+ADMISSION_DEFAULT_PLAN = os.getenv("ADMISSION_DEFAULT_PLAN", "free")
+
+# Features a user is actively waiting on
+INTERACTIVE_FEATURES = {"chat", "clinical", "osce", "image"}
+
+
+def _plan_ranks() -> Dict[str, int]:
+    """Rank plans by daily token allowance: 0 for the largest, plans with equal allowances share a rank"""
+    allowances = sorted({limits["daily_tokens"] for limits in PLAN_LIMITS.values()}, reverse=True)
+    return {plan: allowances.index(limits["daily_tokens"]) for plan, limits in PLAN_LIMITS.items()}
+
+
+PLAN_RANKS = _plan_ranks()
+
+
+def _parse_waits(value: str) -> Dict[str, float]:
+    """Parse 'class=seconds,class=seconds' into a dict, skipping malformed entries"""
+    waits = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        try:
+            waits[name.strip()] = float(seconds)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring malformed admission setting '{item.strip()}'")
+    return waits
+
+
+# Plan of the user behind the current request (set when the plan is looked up)
+_request_plan: ContextVar[Optional[str]] = ContextVar("admission_request_plan", default=None)
+# Rejection record of the current HTTP request (see AdmissionRejectionMiddleware)
+_request_rejection: ContextVar[Optional[Dict[str, Any]]] = ContextVar("admission_request_rejection", default=None)
+
+
+def set_request_plan(plan: Optional[str]) -> None:
+    """Remember the plan of the user the current request is served for"""
+    _request_plan.set(plan)
+
+
+def get_request_plan() -> Optional[str]:
+    """Plan set for the current request, if any"""
+    return _request_plan.get()
+
+
+def track_request_rejection() -> Dict[str, Any]:
+    """Start recording admission rejections for the current HTTP request"""
+    record: Dict[str, Any] = {}
+    _request_rejection.set(record)
+    return record
+
+
+def note_request_rejection(retry_after: float) -> None:
+    """Record that the current HTTP request was shed by the admission queue"""
+    record = _request_rejection.get()
+    if record is not None:
+        record["retry_after"] = max(retry_after, record.get("retry_after", 0))
+
+
+class PriorityClass:
+    """Priority of a request: lower value is served first"""
+
+    __slots__ = ("name", "priority", "max_wait")
+
+    def __init__(self, name: str, priority: int, max_wait: float):
+        self.name = name
+        self.priority = priority
+        self.max_wait = max_wait
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within its class's wait budget"""
+
+    def __init__(self, priority_class: str, retry_after: float, reason: str):
+        super().__init__(f"Service is busy ({reason}), please retry in {retry_after:.0f}s")
+        self.priority_class = priority_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("future", "priority_class", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority_class: PriorityClass):
+        self.future = future
+        self.priority_class = priority_class
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionQueue:
+    """Bounded priority queue in front of upstream AI requests"""
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_depth: int = ADMISSION_MAX_QUEUE_DEPTH,
+        max_waits: Optional[Dict[str, float]] = None
+    ):
+        """
+        Initialize the admission queue
+
+        Args:
+            max_concurrent: AI requests allowed in flight (0 disables the queue)
+            max_depth: Requests allowed to wait at once
+            max_waits: Maximum wait per class name (overrides the per-kind defaults)
+        """
+        self.max_concurrent = max_concurrent
+        self.max_depth = max_depth
+        self.max_waits = _parse_waits(ADMISSION_MAX_WAIT) if max_waits is None else max_waits
+
+        self.in_flight = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        # Moving average of how long an admitted request holds its slot
+        self._service_seconds = 2.0
+
+        self._admitted: Dict[str, int] = {}
+        self._rejected: Dict[str, int] = {}
+        self._waits = LatencyTracker()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def classify(self, plan: Optional[str], feature: str) -> PriorityClass:
+        """
+        Get the priority class of a request
+
+        Args:
+            plan: User's plan (unknown plans are treated as ADMISSION_DEFAULT_PLAN)
+            feature: Feature name
+
+        Returns:
+            PriorityClass for the plan and feature
+        """
+        if plan not in PLAN_RANKS:
+            plan = ADMISSION_DEFAULT_PLAN if ADMISSION_DEFAULT_PLAN in PLAN_RANKS else max(PLAN_RANKS, key=PLAN_RANKS.get)
+
+        interactive = feature in INTERACTIVE_FEATURES
+        name = f"{'interactive' if interactive else 'bulk'}:{plan}"
+        default_wait = ADMISSION_INTERACTIVE_MAX_WAIT_SECONDS if interactive else ADMISSION_BULK_MAX_WAIT_SECONDS
+
+        return PriorityClass(
+            name=name,
+            priority=PLAN_RANKS[plan] * 2 + (0 if interactive else 1),
+            max_wait=self.max_waits.get(name, default_wait)
+        )
+
+    def _estimated_wait(self, priority: int) -> float:
+        """Seconds until a new request of this priority would be admitted"""
+        ahead = sum(
+            1 for p, _, waiter in self._heap
+            if p <= priority and not waiter.future.done()
+        )
+        return (ahead + 1) * self._service_seconds / self.max_concurrent
+
+    def _reject(self, priority_class: PriorityClass, retry_after: float, reason: str) -> AdmissionRejected:
+        self._rejected[priority_class.name] = self._rejected.get(priority_class.name, 0) + 1
+        logger.warning(f"Admission rejected for class '{priority_class.name}': {reason}")
+        return AdmissionRejected(priority_class.name, max(1.0, math.ceil(retry_after)), reason)
+
+    async def acquire(self, priority_class: PriorityClass) -> None:
+        """
+        Wait for an upstream slot
+
+        Waits at most the class's maximum wait, or the remaining request
+        budget if that is shorter.
+
+        Args:
+            priority_class: Class from classify()
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait would exceed the class's budget
+        """
+        if not self.enabled:
+            return
+        max_wait = bound_by_budget(priority_class.max_wait)
+
+        if self.in_flight < self.max_concurrent and not self._queued:
+            self.in_flight += 1
+            self._admit(priority_class, 0.0)
+            return
+
+        estimate = self._estimated_wait(priority_class.priority)
+        if estimate > max_wait:
+            raise self._reject(priority_class, estimate, "expected wait exceeds budget")
+
+        if self._queued >= self.max_depth:
+            self._evict_below(priority_class)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority_class)
+        heapq.heappush(self._heap, (priority_class.priority, next(self._sequence), waiter))
+        self._queued += 1
+
+        granted = False
+        try:
+            await asyncio.wait_for(waiter.future, timeout=max_wait)
+            granted = True
+        except asyncio.TimeoutError:
+            raise self._reject(priority_class, max_wait, "timed out in queue")
+        finally:
+            if not waiter.future.done() or waiter.future.cancelled():
+                self._queued -= 1
+            elif not granted and waiter.future.exception() is None:
+                # The slot was handed over just as we gave up: pass it on
+                self.release(0.0)
+
+        self._admit(priority_class, time.monotonic() - waiter.enqueued_at)
+
+    def _evict_below(self, priority_class: PriorityClass) -> None:
+        """Make room in a full queue by rejecting its lowest-priority waiter, if it ranks below this class"""
+        live = [(p, seq, w) for p, seq, w in self._heap if not w.future.done()]
+        worst = max(live, key=lambda entry: (entry[0], entry[1]), default=None)
+
+        if worst is None or worst[0] <= priority_class.priority:
+            raise self._reject(priority_class, self._estimated_wait(priority_class.priority), "queue full")
+
+        victim = worst[2]
+        self._queued -= 1
+        victim.future.set_exception(
+            self._reject(victim.priority_class, self._estimated_wait(victim.priority_class.priority), "displaced by higher priority")
+        )
+
+    def _admit(self, priority_class: PriorityClass, waited: float) -> None:
+        self._admitted[priority_class.name] = self._admitted.get(priority_class.name, 0) + 1
+        self._waits.record(priority_class.name, int(waited * 1000))
+
+    def release(self, held_seconds: float) -> None:
+        """
+        Free a slot taken by acquire(), handing it to the highest-priority waiter
+
+        Args:
+            held_seconds: How long the slot was held (feeds the wait estimate)
+        """
+        if not self.enabled:
+            return
+
+        if held_seconds > 0:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+
+        while self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue
+            try:
+                waiter.future.set_result(True)
+            except RuntimeError:
+                continue  # Waiter from an event loop that has gone away
+            self._queued -= 1
+            return  # The slot passes straight to the waiter
+
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth and wait-time metrics
+
+        Returns:
+            Dict with capacity, in-flight and queued requests, and per class the
+            admitted/rejected counts, current depth and p50/p95/p99 wait (ms)
+        """
+        depth: Dict[str, int] = {}
+        for _, _, waiter in self._heap:
+            if not waiter.future.done():
+                depth[waiter.priority_class.name] = depth.get(waiter.priority_class.name, 0) + 1
+
+        classes = set(self._admitted) | set(self._rejected) | set(depth)
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "max_queue_depth": self.max_depth,
+            "in_flight": self.in_flight,
+            "queue_depth": self._queued,
+            "avg_service_seconds": round(self._service_seconds, 2),
+            "classes": {
+                name: {
+                    "queued": depth.get(name, 0),
+                    "admitted": self._admitted.get(name, 0),
+                    "rejected": self._rejected.get(name, 0),
+                    "wait_p50_ms": self._waits.percentile(name, 50),
+                    "wait_p95_ms": self._waits.percentile(name, 95),
+                    "wait_p99_ms": self._waits.percentile(name, 99)
+                }
+                for name in sorted(classes)
+            }
+        }
+
+
+# Singleton instance
+_admission_queue: Optional[AdmissionQueue] = None
+
+
+def get_admission_queue() -> AdmissionQueue:
+    """Get or create singleton admission queue instance"""
+    global _admission_queue
+
+    if _admission_queue is None:
+        _admission_queue = AdmissionQueue()
+
+    return _admission_queue
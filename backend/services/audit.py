@@ -4,11 +4,12 @@ Logs admin actions for compliance and security tracking
 
 Requirements: 19.1, 19.2, 19.3, 19.4, 19.5
 """
-import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
 
 # Load environment variables
 load_dotenv()
@@ -27,11 +28,7 @@ class AuditService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def log_admin_action(
         self,
@@ -69,7 +66,7 @@ class AuditService:
                 "details": details
             }
             
-            response = self.supabase.table("audit_logs").insert(log_data).execute()
+            response = await run_query(self.supabase.table("audit_logs").insert(log_data))
             
             if not response.data or len(response.data) == 0:
                 raise Exception("Failed to create audit log entry")
@@ -119,7 +116,7 @@ class AuditService:
             # Order by created_at descending and limit results
             query = query.order("created_at", desc=True).limit(limit)
             
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data if response.data else []
         except Exception as e:
@@ -141,6 +138,6 @@ def get_audit_service(supabase_client: Optional[Client] = None) -> AuditService:
         AuditService instance
     """
     global _audit_service_instance
-    if _audit_service_instance is None or supabase_client is not None:
+    if _audit_service_instance is None or (supabase_client is not None and supabase_client is not _audit_service_instance.supabase):
         _audit_service_instance = AuditService(supabase_client)
     return _audit_service_instance
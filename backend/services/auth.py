@@ -5,9 +5,12 @@ Requirements: 1.1, 1.2, 1.3, 2.2, 2.4, 27.1, 27.3, 27.5
 """
 import os
 from typing import Optional, Dict, Any
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 from services.encryption import encrypt_key, decrypt_key
+from services.db_executor import run_query, run_sync
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
@@ -26,11 +29,7 @@ class AuthService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def authenticate_user(self, email: str, password: str) -> Dict[str, Any]:
         """
@@ -49,7 +48,7 @@ class AuthService:
         Requirements: 1.1
         """
         try:
-            response = self.supabase.auth.sign_in_with_password({
+            response = await run_sync(self.supabase.auth.sign_in_with_password, {
                 "email": email,
                 "password": password
             })
@@ -80,7 +79,7 @@ class AuthService:
         """
         try:
             # Create auth user
-            auth_response = self.supabase.auth.sign_up({
+            auth_response = await run_sync(self.supabase.auth.sign_up, {
                 "email": email,
                 "password": password
             })
@@ -101,7 +100,7 @@ class AuthService:
             }
             
             # Insert user record into users table
-            self.supabase.table("users").insert(user_data).execute()
+            await run_query(self.supabase.table("users").insert(user_data))
             
             return {
                 "user": auth_response.user,
@@ -124,12 +123,12 @@ class AuthService:
         Requirements: 1.3
         """
         try:
-            response = self.supabase.table("users").select("plan").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not response.data or len(response.data) == 0:
+            if not profile:
                 raise Exception("User not found")
             
-            return response.data[0]["plan"]
+            return profile["plan"]
         except Exception as e:
             raise Exception(f"Failed to get user plan: {str(e)}")
     
@@ -149,13 +148,13 @@ class AuthService:
         """
         try:
             # Get user email
-            user_response = self.supabase.table("users").select("email, role").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_response.data or len(user_response.data) == 0:
+            if not profile:
                 return None
             
-            user_email = user_response.data[0]["email"]
-            user_role = user_response.data[0].get("role")
+            user_email = profile["email"]
+            user_role = profile.get("role")
             
             # Emergency admin check via SUPER_ADMIN_EMAIL (Requirement 2.4)
             super_admin_email = os.getenv("SUPER_ADMIN_EMAIL")
@@ -163,7 +162,7 @@ class AuthService:
                 return "super_admin"
             
             # Check admin_allowlist table (Requirement 2.2)
-            allowlist_response = self.supabase.table("admin_allowlist").select("role").eq("email", user_email).execute()
+            allowlist_response = await run_query(self.supabase.table("admin_allowlist").select("role").eq("email", user_email))
             
             if allowlist_response.data and len(allowlist_response.data) > 0:
                 allowlist_role = allowlist_response.data[0]["role"]
@@ -207,9 +206,9 @@ class AuthService:
             encrypted_key = encrypt_key(key)
             
             # Update user record with encrypted personal API key
-            self.supabase.table("users").update({
+            await run_query(self.supabase.table("users").update({
                 "personal_api_key": encrypted_key
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
             
             return {
                 "success": True,
@@ -235,7 +234,7 @@ class AuthService:
         """
         try:
             # Get user record
-            response = self.supabase.table("users").select("personal_api_key").eq("id", user_id).execute()
+            response = await run_query(self.supabase.table("users").select("personal_api_key").eq("id", user_id))
             
             if not response.data or len(response.data) == 0:
                 raise Exception("User not found")
@@ -270,9 +269,9 @@ class AuthService:
         """
         try:
             # Update user record to remove personal API key
-            self.supabase.table("users").update({
+            await run_query(self.supabase.table("users").update({
                 "personal_api_key": None
-            }).eq("id", user_id).execute()
+            }).eq("id", user_id))
             
             return {
                 "success": True,
@@ -297,6 +296,6 @@ def get_auth_service(supabase_client: Optional[Client] = None) -> AuthService:
         AuthService instance
     """
     global _auth_service_instance
-    if _auth_service_instance is None or supabase_client is not None:
+    if _auth_service_instance is None or (supabase_client is not None and supabase_client is not _auth_service_instance.supabase):
         _auth_service_instance = AuthService(supabase_client)
     return _auth_service_instance
@@ -3,15 +3,41 @@ Chat Service
 Handles chat session management and message persistence
 Requirements: 3.2, 3.4, 9.1
 """
-import os
-from typing import Optional, Dict, Any, List
+import time
+import asyncio
+import logging
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 from services.rate_limiter import get_rate_limiter
+from services.db_executor import run_query
 
 # Load environment variables
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+CHAT_SYSTEM_PROMPT = """You are VaidyaAI, a specialized medical education AI tutor designed for MBBS students and medical professionals. Your role is to:
+
+1. Provide accurate, evidence-based medical information aligned with current clinical guidelines
+2. Help students understand complex medical concepts by bridging basic science with clinical application
+3. Support preparation for medical licensing exams (USMLE, NEET-PG, etc.)
+4. Emphasize clinical reasoning and diagnostic thinking
+5. Use standard medical terminology with clear explanations when needed
+6. Ground responses in evidence-based medicine and current best practices
+7. When context from documents is provided, use it to ground your responses and cite sources appropriately
+
+Focus on:
+- Clinical relevance and real-world application
+- Pathophysiology and mechanisms of disease
+- Diagnostic approaches and clinical decision-making
+- Evidence-based treatment and management
+- Key information for medical exams and clinical practice
+- Patient safety and ethical considerations
+
+Always prioritize accuracy, clarity, and clinical applicability in your responses."""
 
 
 class ChatService:
@@ -27,11 +53,7 @@ class ChatService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def create_session(self, user_id: str, title: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -55,7 +77,7 @@ class ChatService:
                 "title": title
             }
             
-            response = self.supabase.table("chat_sessions").insert(session_data).execute()
+            response = await run_query(self.supabase.table("chat_sessions").insert(session_data))
             
             if not response.data or len(response.data) == 0:
                 raise Exception("Failed to create chat session")
@@ -80,11 +102,12 @@ class ChatService:
         Requirements: 3.2
         """
         try:
-            response = self.supabase.table("chat_sessions")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .order("updated_at", desc=True)\
-                .execute()
+            response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("*")
+                .eq("user_id", user_id)
+                .order("updated_at", desc=True)
+            )
             
             return response.data if response.data else []
         except Exception as e:
@@ -103,24 +126,98 @@ class ChatService:
         """
         try:
             # First verify ownership
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Session not found or does not belong to user")
             
             # Delete messages first (if no cascade delete on DB)
-            self.supabase.table("messages").delete().eq("session_id", session_id).execute()
+            await run_query(self.supabase.table("messages").delete().eq("session_id", session_id))
             
             # Delete session
-            self.supabase.table("chat_sessions").delete().eq("id", session_id).execute()
+            await run_query(self.supabase.table("chat_sessions").delete().eq("id", session_id))
             
         except Exception as e:
             raise Exception(f"Failed to delete session: {str(e)}")
     
+    async def _build_prompt(self, user_id: str, message: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Build the model prompt, adding context from the user's documents (RAG)
+        
+        Args:
+            user_id: User's unique identifier
+            message: User's message
+            
+        Returns:
+            Tuple of (prompt, citations dict or None)
+            
+        Requirements: 8.1, 8.3
+        """
+        from services.documents import get_document_service
+        
+        # Check if user has documents for RAG (Requirements 8.1, 8.3)
+        doc_service = get_document_service(self.supabase)
+        user_documents = await doc_service.get_user_documents(user_id)
+        
+        # Filter for completed documents only
+        completed_docs = [doc for doc in user_documents if doc.get('processing_status') == 'completed']
+        
+        # Prepare prompt with RAG context if documents exist
+        final_prompt = message
+        citations = None
+        
+        if completed_docs:
+            # Perform semantic search to find relevant document chunks
+            search_results = await doc_service.search_documents(
+                user_id=user_id,
+                query=message,
+                feature="chat",
+                top_k=3  # Get top 3 most relevant chunks
+            )
+            
+            if search_results:
+                # Build context from search results
+                context_parts = []
+                citation_list = []
+                
+                for idx, result in enumerate(search_results, 1):
+                    # Handle different response formats
+                    doc_filename = result.get('documents', {}).get('filename') if isinstance(result.get('documents'), dict) else result.get('document_filename', 'Unknown')
+                    chunk_text = result.get('content') or result.get('chunk_text', '')
+                    
+                    context_parts.append(
+                        f"[Source {idx}: {doc_filename}]\n{chunk_text}"
+                    )
+                    citation_list.append({
+                        "source_number": idx,
+                        "document_id": result.get('document_id'),
+                        "document_filename": doc_filename,
+                        "chunk_index": result.get('chunk_index', 0),
+                        "similarity_score": result.get('similarity_score', result.get('similarity', 0))
+                    })
+                
+                # Combine context with user query
+                context_text = "\n\n".join(context_parts)
+                citations = citation_list
+                final_prompt = f"""Based on the following context from the user's documents, please answer their question. Include citations to the sources when relevant.
+
+Context:
+{context_text}
+
+User Question: {message}
+
+Please provide a comprehensive answer based on the context above, and cite your sources using [Source N] notation."""
+                
+                # Store citations for the response
+                citations = {"sources": citation_list}
+        
+        return final_prompt, citations
+    
     async def send_message(
         self, 
         user_id: str, 
@@ -154,11 +251,12 @@ class ChatService:
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Session not found or does not belong to user")
@@ -172,7 +270,7 @@ class ChatService:
                 "citations": None
             }
             
-            user_message_response = self.supabase.table("messages").insert(user_message_data).execute()
+            user_message_response = await run_query(self.supabase.table("messages").insert(user_message_data))
             
             if not user_message_response.data or len(user_message_response.data) == 0:
                 raise Exception("Failed to store user message")
@@ -180,82 +278,30 @@ class ChatService:
             # If not generating response, return user message
             if not generate_response:
                 # Update session's updated_at timestamp
-                self.supabase.table("chat_sessions")\
-                    .update({"updated_at": datetime.now(timezone.utc).isoformat()})\
-                    .eq("id", session_id)\
-                    .execute()
+                await run_query(
+                    self.supabase.table("chat_sessions")
+                    .update({"updated_at": datetime.now(timezone.utc).isoformat()})
+                    .eq("id", session_id)
+                )
                 
                 return user_message_response.data[0]
             
             # Get conversation history for context
-            messages_response = self.supabase.table("messages")\
-                .select("role, content")\
-                .eq("session_id", session_id)\
-                .order("created_at", desc=False)\
-                .limit(20)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("role, content")
+                .eq("session_id", session_id)
+                .order("created_at", desc=False)
+                .limit(20)
+            )
             
             # Not a command, generate regular AI response using model router (Requirement 21.1)
             from services.model_router import get_model_router_service
-            from services.documents import get_document_service
             
             router = get_model_router_service(self.supabase)
             
-            # Check if user has documents for RAG (Requirements 8.1, 8.3)
-            doc_service = get_document_service(self.supabase)
-            user_documents = await doc_service.get_user_documents(user_id)
-            
-            # Filter for completed documents only
-            completed_docs = [doc for doc in user_documents if doc.get('processing_status') == 'completed']
-            
-            # Prepare prompt with RAG context if documents exist
-            final_prompt = message
-            citations = None
-            
-            if completed_docs:
-                # Perform semantic search to find relevant document chunks
-                search_results = await doc_service.search_documents(
-                    user_id=user_id,
-                    query=message,
-                    feature="chat",
-                    top_k=3  # Get top 3 most relevant chunks
-                )
-                
-                if search_results:
-                    # Build context from search results
-                    context_parts = []
-                    citation_list = []
-                    
-                    for idx, result in enumerate(search_results, 1):
-                        # Handle different response formats
-                        doc_filename = result.get('documents', {}).get('filename') if isinstance(result.get('documents'), dict) else result.get('document_filename', 'Unknown')
-                        chunk_text = result.get('content') or result.get('chunk_text', '')
-                        
-                        context_parts.append(
-                            f"[Source {idx}: {doc_filename}]\n{chunk_text}"
-                        )
-                        citation_list.append({
-                            "source_number": idx,
-                            "document_id": result.get('document_id'),
-                            "document_filename": doc_filename,
-                            "chunk_index": result.get('chunk_index', 0),
-                            "similarity_score": result.get('similarity_score', result.get('similarity', 0))
-                        })
-                    
-                    # Combine context with user query
-                    context_text = "\n\n".join(context_parts)
-                    citations = citation_list
-                    final_prompt = f"""Based on the following context from the user's documents, please answer their question. Include citations to the sources when relevant.
-
-Context:
-{context_text}
-
-User Question: {message}
-
-Please provide a comprehensive answer based on the context above, and cite your sources using [Source N] notation."""
-                    
-                    # Store citations for the response
-                    citations = {"sources": citation_list}
+            # Add RAG context from the user's documents (Requirements 8.1, 8.3)
+            final_prompt, citations = await self._build_prompt(user_id, message)
             
             # Select provider for chat feature
             provider = await router.select_provider("chat")
@@ -265,25 +311,7 @@ Please provide a comprehensive answer based on the context above, and cite your
                 provider=provider,
                 feature="chat",
                 prompt=final_prompt,
-                system_prompt="""You are VaidyaAI, a specialized medical education AI tutor designed for MBBS students and medical professionals. Your role is to:
-
-1. Provide accurate, evidence-based medical information aligned with current clinical guidelines
-2. Help students understand complex medical concepts by bridging basic science with clinical application
-3. Support preparation for medical licensing exams (USMLE, NEET-PG, etc.)
-4. Emphasize clinical reasoning and diagnostic thinking
-5. Use standard medical terminology with clear explanations when needed
-6. Ground responses in evidence-based medicine and current best practices
-7. When context from documents is provided, use it to ground your responses and cite sources appropriately
-
-Focus on:
-- Clinical relevance and real-world application
-- Pathophysiology and mechanisms of disease
-- Diagnostic approaches and clinical decision-making
-- Evidence-based treatment and management
-- Key information for medical exams and clinical practice
-- Patient safety and ethical considerations
-
-Always prioritize accuracy, clarity, and clinical applicability in your responses."""
+                system_prompt=CHAT_SYSTEM_PROMPT
             )
             
             if not isinstance(ai_result, dict) or not ai_result.get("success", False):
@@ -300,16 +328,17 @@ Always prioritize accuracy, clarity, and clinical applicability in your response
                 "citations": citations  # Include citations from RAG
             }
             
-            ai_message_response = self.supabase.table("messages").insert(ai_message_data).execute()
+            ai_message_response = await run_query(self.supabase.table("messages").insert(ai_message_data))
             
             if not ai_message_response.data or len(ai_message_response.data) == 0:
                 raise Exception("Failed to store AI message")
             
             # Update session's updated_at timestamp
-            self.supabase.table("chat_sessions")\
-                .update({"updated_at": datetime.now(timezone.utc).isoformat()})\
-                .eq("id", session_id)\
-                .execute()
+            await run_query(
+                self.supabase.table("chat_sessions")
+                .update({"updated_at": datetime.now(timezone.utc).isoformat()})
+                .eq("id", session_id)
+            )
             
             # Track usage after successful message storage (Requirement 9.1)
             rate_limiter = get_rate_limiter(self.supabase)
@@ -324,6 +353,137 @@ Always prioritize accuracy, clarity, and clinical applicability in your response
         except Exception as e:
             raise Exception(f"Failed to send message: {str(e)}")
     
+    async def stream_message(
+        self,
+        user_id: str,
+        session_id: str,
+        message: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Send a message and stream the AI response as it is generated
+        
+        The request runs through the model router with fallback; another key
+        is only tried before the first token was sent. The assembled answer
+        and its citations are stored once the stream finishes. Closing the
+        iterator (e.g. the client disconnected) cancels the model request.
+        
+        Args:
+            user_id: User's unique identifier
+            session_id: Chat session identifier
+            message: Message content
+            
+        Yields:
+            Event dicts with "event" and "data":
+                - message: the stored user message
+                - token: {"content": text chunk}
+                - done: {"message": stored assistant message, "ttft_ms": time to first token}
+                - error: {"error": error message}
+            
+        Raises:
+            Exception: If the session doesn't belong to the user or the user message can't be stored
+            
+        Requirements: 3.2, 3.3, 3.4, 9.1, 21.1
+        """
+        from services.model_router import get_model_router_service
+        
+        start_time = time.time()
+        
+        # Verify session belongs to user
+        session_response = await run_query(
+            self.supabase.table("chat_sessions")
+            .select("id")
+            .eq("id", session_id)
+            .eq("user_id", user_id)
+        )
+        
+        if not session_response.data or len(session_response.data) == 0:
+            raise Exception("Session not found or does not belong to user")
+        
+        user_message_response = await run_query(self.supabase.table("messages").insert({
+            "session_id": session_id,
+            "role": "user",
+            "content": message,
+            "tokens_used": None,
+            "citations": None
+        }))
+        
+        if not user_message_response.data or len(user_message_response.data) == 0:
+            raise Exception("Failed to store user message")
+        
+        yield {"event": "message", "data": user_message_response.data[0]}
+        
+        router = get_model_router_service(self.supabase)
+        tokens: asyncio.Queue = asyncio.Queue()
+        request = None
+        
+        try:
+            final_prompt, citations = await self._build_prompt(user_id, message)
+            provider = await router.select_provider("chat")
+            
+            request = asyncio.create_task(router.execute_with_fallback(
+                provider=provider,
+                feature="chat",
+                prompt=final_prompt,
+                system_prompt=CHAT_SYSTEM_PROMPT,
+                on_token=tokens.put
+            ))
+            # Wake the reader when the request ends (tokens are always queued before that)
+            request.add_done_callback(lambda _: tokens.put_nowait(None))
+            
+            parts = []
+            ttft_ms = None
+            while True:
+                text = await tokens.get()
+                if text is None:
+                    break
+                if ttft_ms is None:
+                    ttft_ms = int((time.time() - start_time) * 1000)
+                    logger.info(f"Chat stream first token after {ttft_ms}ms - Session: {session_id[:8]}...")
+                parts.append(text)
+                yield {"event": "token", "data": {"content": text}}
+            
+            ai_result = request.result()
+            if not isinstance(ai_result, dict) or not ai_result.get("success", False):
+                error_msg = ai_result.get("error", "Unknown error") if isinstance(ai_result, dict) else str(ai_result)
+                raise Exception(f"AI response generation failed: {error_msg}")
+            
+            content = "".join(parts)
+            tokens_used = ai_result.get("tokens_used", 0)
+            
+            # Store AI response message with citations if available (Requirement 8.3)
+            ai_message_response = await run_query(self.supabase.table("messages").insert({
+                "session_id": session_id,
+                "role": "assistant",
+                "content": content,
+                "tokens_used": tokens_used,
+                "citations": citations
+            }))
+            
+            if not ai_message_response.data or len(ai_message_response.data) == 0:
+                raise Exception("Failed to store AI message")
+            
+            await run_query(
+                self.supabase.table("chat_sessions")
+                .update({"updated_at": datetime.now(timezone.utc).isoformat()})
+                .eq("id", session_id)
+            )
+            
+            # Track usage after successful message storage (Requirement 9.1)
+            rate_limiter = get_rate_limiter(self.supabase)
+            await rate_limiter.increment_usage(
+                user_id=user_id,
+                tokens=tokens_used,
+                feature="chat"
+            )
+            
+            yield {"event": "done", "data": {"message": ai_message_response.data[0], "ttft_ms": ttft_ms}}
+        except Exception as e:
+            logger.error(f"Chat stream failed - Session: {session_id[:8]}...: {str(e)}")
+            yield {"event": "error", "data": {"error": str(e)}}
+        finally:
+            if request is not None and not request.done():
+                request.cancel()
+    
     async def get_chat_history(self, user_id: str, session_id: str) -> List[Dict[str, Any]]:
         """
         Get chat history for a specific session
@@ -342,21 +502,23 @@ Always prioritize accuracy, clarity, and clinical applicability in your response
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Session not found or does not belong to user")
             
             # Get messages ordered by creation time
-            response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .order("created_at", desc=False)\
-                .execute()
+            response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .order("created_at", desc=False)
+            )
             
             return response.data if response.data else []
         except Exception as e:
@@ -378,6 +540,6 @@ def get_chat_service(supabase_client: Optional[Client] = None) -> ChatService:
         ChatService instance
     """
     global _chat_service_instance
-    if _chat_service_instance is None or supabase_client is not None:
+    if _chat_service_instance is None or (supabase_client is not None and supabase_client is not _chat_service_instance.supabase):
         _chat_service_instance = ChatService(supabase_client)
     return _chat_service_instance
@@ -0,0 +1,103 @@
+"""
+Text Chunking
+Incremental overlapping chunker for document ingestion
+
+TextChunker accepts text piece by piece (e.g. one PDF page at a time) and
+emits chunks as soon as they are final, keeping only the unconsumed tail
+in memory. Feeding a text in any number of pieces yields exactly the same
+chunks as feeding it at once, so chunk indexes stay stable when a document
+is reprocessed.
+"""
+from typing import List
+
+
+class TextChunker:
+    """Splits a stream of text into overlapping chunks, preferring sentence/line breaks"""
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200, min_length: int = 50):
+        """
+        Initialize the chunker
+
+        Args:
+            chunk_size: Maximum characters per chunk
+            overlap: Characters shared between consecutive chunks
+            min_length: Chunks of this length or shorter are dropped
+        """
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.min_length = min_length
+        self._buffer = ""   # Text from absolute position _offset onwards
+        self._offset = 0
+        self._start = 0     # Absolute start of the next chunk
+        self._started = False
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add text and return the chunks that are now complete
+
+        Args:
+            text: Next piece of text
+
+        Returns:
+            Completed chunks (possibly empty)
+        """
+        if not self._started:
+            # The chunked text is stripped, so drop leading whitespace
+            text = text.lstrip()
+            if not text:
+                return []
+            self._started = True
+
+        self._buffer += text
+        return self._drain(final=False)
+
+    def finish(self) -> List[str]:
+        """
+        Signal the end of the text and return the remaining chunks
+
+        Returns:
+            Remaining chunks
+        """
+        self._buffer = self._buffer.rstrip()
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[str]:
+        """Emit every chunk whose boundaries can no longer change"""
+        chunks = []
+
+        while True:
+            if final:
+                text_length = self._offset + len(self._buffer)
+                if self._start >= text_length:
+                    break
+                is_last_window = self._start + self.chunk_size >= text_length
+            else:
+                # Trailing whitespace may still be stripped at the end, so only
+                # cut once non-whitespace text exists past this window
+                known_length = self._offset + len(self._buffer.rstrip())
+                if self._start + self.chunk_size >= known_length:
+                    break
+                is_last_window = False
+
+            relative_start = self._start - self._offset
+            end = self._start + self.chunk_size
+            chunk = self._buffer[relative_start:relative_start + self.chunk_size]
+
+            # Try to break at sentence boundary
+            if not is_last_window:
+                break_point = max(chunk.rfind('.'), chunk.rfind('\n'))
+
+                if break_point > self.chunk_size * 0.5:  # Only break if we're past halfway
+                    chunk = chunk[:break_point + 1]
+                    end = self._start + break_point + 1
+
+            chunks.append(chunk.strip())
+            self._start = end - self.overlap
+
+        # Forget text that no future chunk can include
+        consumed = min(self._start - self._offset, len(self._buffer))
+        if consumed > 0:
+            self._buffer = self._buffer[consumed:]
+            self._offset += consumed
+
+        return [c for c in chunks if len(c.strip()) > self.min_length]  # Filter out tiny chunks
@@ -0,0 +1,441 @@
+"""
+Circuit Breaker
+In-memory per-key circuit breakers for API key health
+
+Each API key has a breaker that keeps the outcomes of its most recent calls
+in a fixed-size ring buffer. When the failure rate over the window crosses
+the threshold the breaker opens and routing skips the key without trying
+it. After a cool-down the breaker goes half-open and lets a single real
+request through as a recovery probe: success closes it, failure reopens it.
+
+Outcomes and failure counts are recorded in memory only; a background task
+persists changed breakers to api_keys periodically (and on shutdown), so no
+request waits on a health write.
+"""
+import os
+import time
+import asyncio
+import threading
+import weakref
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from services.db_executor import run_sync
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Breaker configuration
+CIRCUIT_WINDOW_SIZE = int(os.getenv("CIRCUIT_WINDOW_SIZE", "20"))
+# Calls in the window before the failure rate is trusted
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+# Seconds an open breaker waits before letting a recovery probe through
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "60"))
+# A probe that hasn't reported back within this time no longer blocks the next one
+CIRCUIT_PROBE_TIMEOUT_SECONDS = float(os.getenv("CIRCUIT_PROBE_TIMEOUT_SECONDS", "120"))
+CIRCUIT_PERSIST_INTERVAL_SECONDS = float(os.getenv("CIRCUIT_PERSIST_INTERVAL_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """Parse a timestamp column into an aware datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00")) if isinstance(value, str) else value
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a ring buffer of recent outcomes"""
+
+    def __init__(self, key_id: str, window_size: int = CIRCUIT_WINDOW_SIZE):
+        """
+        Initialize a closed breaker
+
+        Args:
+            key_id: API key ID
+            window_size: Number of recent outcomes kept
+        """
+        self.key_id = key_id
+        self.window_size = max(1, window_size)
+        self._outcomes: List[bool] = [True] * self.window_size
+        self._next = 0
+        self.calls = 0
+        self.failures = 0
+
+        self.state = CLOSED
+        self.opened_at = 0.0       # time.monotonic() when the breaker last opened
+        self.opened_at_wall: Optional[str] = None
+        self.probe_started = 0.0   # time.monotonic() of the outstanding probe, 0 if none
+
+        self.last_success_time: Optional[str] = None
+        self.last_failure_time: Optional[str] = None
+        self.pending_failures = 0  # failure_count increments not yet persisted
+        self.dirty = False
+
+    def seed(self, row: Dict[str, Any]) -> None:
+        """
+        Restore state from a persisted api_keys row (first time a key is seen)
+
+        Args:
+            row: api_keys row with circuit and health columns
+        """
+        state = row.get("circuit_state")
+        opened = _parse_time(row.get("circuit_opened_at")) or _parse_time(row.get("last_failure_time"))
+
+        if state is None:
+            # Rows persisted before breakers existed: derive from the health counters
+            attempts = row.get("recent_attempts") or 0
+            failures = row.get("recent_failures") or 0
+            if attempts >= CIRCUIT_MIN_CALLS and failures / attempts > CIRCUIT_FAILURE_RATE:
+                state = OPEN
+
+        if state in (OPEN, HALF_OPEN):
+            age = (datetime.now(timezone.utc) - opened).total_seconds() if opened else 0.0
+            self.state = OPEN
+            self.opened_at = time.monotonic() - max(0.0, age)
+            self.opened_at_wall = opened.isoformat() if opened else _utc_now()
+
+        self.last_success_time = row.get("last_success_time")
+        self.last_failure_time = row.get("last_failure_time")
+
+    def is_available(self) -> bool:
+        """
+        Check whether allow_request() would let a request through, without
+        changing state (used when listing candidate keys)
+
+        Returns:
+            True if the key is closed or may be probed now
+        """
+        now = time.monotonic()
+
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at < CIRCUIT_OPEN_SECONDS:
+            return False
+        return not (self.probe_started and now - self.probe_started < CIRCUIT_PROBE_TIMEOUT_SECONDS)
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may use this key (call right before the attempt)
+
+        An open breaker whose cool-down has passed turns half-open and
+        grants one probe; other callers are refused until it reports back.
+
+        Returns:
+            True if the key may be tried
+        """
+        now = time.monotonic()
+
+        if self.state == CLOSED:
+            return True
+
+        if self.state == OPEN:
+            if now - self.opened_at < CIRCUIT_OPEN_SECONDS:
+                return False
+            self.state = HALF_OPEN
+            self.dirty = True
+            logger.info(f"Circuit for key {self.key_id} is half-open, probing recovery")
+
+        if self.probe_started and now - self.probe_started < CIRCUIT_PROBE_TIMEOUT_SECONDS:
+            return False
+
+        self.probe_started = now
+        return True
+
+    def release_probe(self) -> None:
+        """Hand back a probe granted by allow_request() that was never attempted or finished"""
+        if self.state == HALF_OPEN:
+            self.probe_started = 0.0
+
+    def record(self, success: bool) -> None:
+        """
+        Record the outcome of a call
+
+        Args:
+            success: Whether the call succeeded
+        """
+        if success:
+            self.last_success_time = _utc_now()
+        else:
+            self.last_failure_time = _utc_now()
+        self.dirty = True
+
+        if self.state == HALF_OPEN:
+            self.probe_started = 0.0
+            if success:
+                self._reset_window()
+                self.state = CLOSED
+                self.opened_at_wall = None
+                logger.info(f"Circuit for key {self.key_id} closed after a successful probe")
+            else:
+                self._open()
+            return
+
+        # Overwrite the oldest outcome once the window is full
+        if self.calls == self.window_size:
+            if not self._outcomes[self._next]:
+                self.failures -= 1
+        else:
+            self.calls += 1
+        self._outcomes[self._next] = success
+        self._next = (self._next + 1) % self.window_size
+        if not success:
+            self.failures += 1
+
+        if self.state == CLOSED and self.calls >= CIRCUIT_MIN_CALLS and self.failure_rate() > CIRCUIT_FAILURE_RATE:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.opened_at_wall = _utc_now()
+        logger.warning(
+            f"Circuit for key {self.key_id} opened "
+            f"({self.failures}/{self.calls} recent calls failed), retrying in {CIRCUIT_OPEN_SECONDS:.0f}s"
+        )
+
+    def _reset_window(self) -> None:
+        self._outcomes = [True] * self.window_size
+        self._next = 0
+        self.calls = 0
+        self.failures = 0
+
+    def reset(self) -> None:
+        """Close the breaker and forget recent outcomes"""
+        self._reset_window()
+        self.state = CLOSED
+        self.opened_at_wall = None
+        self.probe_started = 0.0
+        self.dirty = True
+
+    def failure_rate(self) -> float:
+        """Failure rate over the window (0 with no calls)"""
+        return self.failures / self.calls if self.calls else 0.0
+
+    def health_score(self) -> float:
+        """Success rate over the window (1.0 with no calls)"""
+        return 1.0 - self.failure_rate()
+
+    def health_status(self) -> str:
+        """
+        Map the breaker state to the api_keys health_status values
+
+        Returns:
+            'healthy', 'recovering' or 'degraded'
+        """
+        if self.state == OPEN:
+            return "degraded"
+        if self.state == HALF_OPEN or self.failure_rate() > 0.2:
+            return "recovering"
+        return "healthy"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Health and circuit columns to persist for this key"""
+        return {
+            "recent_attempts": self.calls,
+            "recent_successes": self.calls - self.failures,
+            "recent_failures": self.failures,
+            "health_status": self.health_status(),
+            "health_score": self.health_score(),
+            "last_success_time": self.last_success_time,
+            "last_failure_time": self.last_failure_time,
+            "circuit_state": self.state,
+            "circuit_opened_at": self.opened_at_wall
+        }
+
+
+class CircuitBreakerRegistry:
+    """Breakers for all keys, with periodic background persistence"""
+
+    def __init__(self, supabase_client: Client):
+        """
+        Initialize the registry
+
+        Args:
+            supabase_client: Supabase client used to persist breaker state
+        """
+        self.supabase = supabase_client
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, key_id: str, row: Optional[Dict[str, Any]] = None) -> CircuitBreaker:
+        """
+        Get the breaker for a key, creating it on first use
+
+        Args:
+            key_id: API key ID
+            row: Optional api_keys row to restore persisted state from when the breaker is created
+
+        Returns:
+            CircuitBreaker instance
+        """
+        breaker = self._breakers.get(key_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key_id)
+                if breaker is None:
+                    breaker = CircuitBreaker(key_id)
+                    if row:
+                        breaker.seed(row)
+                    self._breakers[key_id] = breaker
+        return breaker
+
+    def allow_request(self, key_id: str) -> bool:
+        """Check whether a key may be tried (see CircuitBreaker.allow_request)"""
+        return self.get(key_id).allow_request()
+
+    def record(self, key_id: str, success: bool) -> CircuitBreaker:
+        """
+        Record a call outcome for a key
+
+        Args:
+            key_id: API key ID
+            success: Whether the call succeeded
+
+        Returns:
+            The key's breaker
+        """
+        breaker = self.get(key_id)
+        with self._lock:
+            breaker.record(success)
+        return breaker
+
+    def record_failure(self, key_id: str) -> None:
+        """
+        Count a failure towards the key's persisted failure_count
+
+        Args:
+            key_id: API key ID
+        """
+        breaker = self.get(key_id)
+        with self._lock:
+            breaker.pending_failures += 1
+
+    def reset(self, key_id: str) -> None:
+        """Close a key's breaker (e.g. after an admin reset)"""
+        breaker = self.get(key_id)
+        with self._lock:
+            breaker.reset()
+            breaker.dirty = False
+
+    async def persist(self) -> int:
+        """
+        Write changed breakers to api_keys
+
+        Returns:
+            Number of keys written
+        """
+        with self._lock:
+            pending = []
+            for breaker in self._breakers.values():
+                if not breaker.dirty and not breaker.pending_failures:
+                    continue
+                pending.append((breaker.key_id, breaker.snapshot() if breaker.dirty else {}, breaker.pending_failures))
+                breaker.dirty = False
+                breaker.pending_failures = 0
+
+        written = 0
+        for key_id, update, failures in pending:
+            try:
+                await run_sync(self._write, key_id, update, failures)
+                written += 1
+            except Exception as e:
+                logger.error(f"Failed to persist circuit state for key {key_id}: {str(e)}")
+                # Keep the failure increments for the next round
+                self.get(key_id).pending_failures += failures
+
+        return written
+
+    def _write(self, key_id: str, update: Dict[str, Any], failures: int) -> None:
+        if failures:
+            response = self.supabase.table("api_keys") \
+                .select("failure_count") \
+                .eq("id", key_id) \
+                .execute()
+            if not response.data:
+                return
+            update = {**update, "failure_count": (response.data[0].get("failure_count") or 0) + failures}
+
+        self.supabase.table("api_keys") \
+            .update(update) \
+            .eq("id", key_id) \
+            .execute()
+
+    async def _persist_loop(self) -> None:
+        while True:
+            await asyncio.sleep(CIRCUIT_PERSIST_INTERVAL_SECONDS)
+            try:
+                await self.persist()
+            except Exception as e:
+                logger.error(f"Circuit breaker persistence failed: {str(e)}")
+
+    async def start(self) -> None:
+        """Start periodic persistence"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self) -> None:
+        """Stop periodic persistence and write any remaining changes"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.persist()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the state of every known breaker
+
+        Returns:
+            Dict of key_id -> state, failure rate and window size
+        """
+        with self._lock:
+            return {
+                key_id: {
+                    "state": breaker.state,
+                    "failure_rate": round(breaker.failure_rate(), 4),
+                    "calls": breaker.calls
+                }
+                for key_id, breaker in self._breakers.items()
+            }
+
+
+# One registry per Supabase client, released together with the client
+_circuit_registries: "weakref.WeakKeyDictionary[Client, CircuitBreakerRegistry]" = weakref.WeakKeyDictionary()
+_circuit_registries_lock = threading.Lock()
+
+
+def get_circuit_breaker_registry(supabase_client: Client) -> CircuitBreakerRegistry:
+    """
+    Get or create the circuit breaker registry bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        CircuitBreakerRegistry instance
+    """
+    registry = _circuit_registries.get(supabase_client)
+    if registry is None:
+        with _circuit_registries_lock:
+            registry = _circuit_registries.get(supabase_client)
+            if registry is None:
+                registry = CircuitBreakerRegistry(supabase_client)
+                _circuit_registries[supabase_client] = registry
+    return registry
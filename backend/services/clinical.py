@@ -3,12 +3,13 @@ Clinical Reasoning Service
 Handles clinical case generation, progressive presentation, and performance evaluation
 Requirements: 5.1, 5.3, 5.5
 """
-import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 import json
+from services.db_executor import run_query
 
 # Load environment variables
 load_dotenv()
@@ -27,11 +28,7 @@ class ClinicalService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def create_clinical_case(
         self, 
@@ -174,7 +171,7 @@ Make the case realistic, educational, and clinically relevant for medical studen
                     "title": f"Clinical Case: {case_data['chief_complaint'][:50]}..."
                 }
                 
-                session_response = self.supabase.table("chat_sessions").insert(session_data).execute()
+                session_response = await run_query(self.supabase.table("chat_sessions").insert(session_data))
                 
                 if not session_response.data or len(session_response.data) == 0:
                     raise Exception("Failed to create clinical case session")
@@ -189,7 +186,7 @@ Make the case realistic, educational, and clinically relevant for medical studen
                     "tokens_used": result["tokens_used"]
                 }
                 
-                self.supabase.table("messages").insert(case_message).execute()
+                await run_query(self.supabase.table("messages").insert(case_message))
                 
                 # Return case with session_id
                 case_record["case_id"] = session_id
@@ -234,23 +231,25 @@ Make the case realistic, educational, and clinically relevant for medical studen
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Clinical case not found or does not belong to user")
             
             # Get case data from first system message
-            messages_response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .eq("role", "system")\
-                .order("created_at", desc=False)\
-                .limit(1)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .eq("role", "system")
+                .order("created_at", desc=False)
+                .limit(1)
+            )
             
             if not messages_response.data or len(messages_response.data) == 0:
                 raise Exception("Clinical case data not found")
@@ -307,23 +306,25 @@ Make the case realistic, educational, and clinically relevant for medical studen
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Clinical case not found or does not belong to user")
             
             # Get case data from first system message
-            messages_response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .eq("role", "system")\
-                .order("created_at", desc=False)\
-                .limit(1)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .eq("role", "system")
+                .order("created_at", desc=False)
+                .limit(1)
+            )
             
             if not messages_response.data or len(messages_response.data) == 0:
                 raise Exception("Clinical case data not found")
@@ -336,10 +337,11 @@ Make the case realistic, educational, and clinically relevant for medical studen
             case_data["current_stage"] = current_stage + 1
             
             # Update case data
-            self.supabase.table("messages")\
-                .update({"content": json.dumps(case_data)})\
-                .eq("id", message_id)\
-                .execute()
+            await run_query(
+                self.supabase.table("messages")
+                .update({"content": json.dumps(case_data)})
+                .eq("id", message_id)
+            )
             
             # Return updated presentation
             return await self.present_case_progressively(session_id, user_id)
@@ -382,13 +384,14 @@ Make the case realistic, educational, and clinically relevant for medical studen
             from services.model_router import get_model_router_service
             
             # Get case data
-            messages_response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .eq("role", "system")\
-                .order("created_at", desc=False)\
-                .limit(1)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .eq("role", "system")
+                .order("created_at", desc=False)
+                .limit(1)
+            )
             
             if not messages_response.data or len(messages_response.data) == 0:
                 raise Exception("Clinical case data not found")
@@ -477,10 +480,11 @@ Format as JSON:
                 }
                 case_data["performance_data"] = performance_data
                 
-                self.supabase.table("messages")\
-                    .update({"content": json.dumps(case_data)})\
-                    .eq("id", message_id)\
-                    .execute()
+                await run_query(
+                    self.supabase.table("messages")
+                    .update({"content": json.dumps(case_data)})
+                    .eq("id", message_id)
+                )
                 
                 return evaluation_data
                 
@@ -657,7 +661,7 @@ Make it realistic, clinically relevant, and appropriate for MBBS students."""
                     "title": f"OSCE: {scenario_data['scenario_type']} - {scenario_data['patient_info'].get('presenting_complaint', 'Scenario')[:50]}"
                 }
                 
-                session_response = self.supabase.table("chat_sessions").insert(session_data).execute()
+                session_response = await run_query(self.supabase.table("chat_sessions").insert(session_data))
                 
                 if not session_response.data or len(session_response.data) == 0:
                     raise Exception("Failed to create OSCE scenario session")
@@ -672,7 +676,7 @@ Make it realistic, clinically relevant, and appropriate for MBBS students."""
                     "tokens_used": result["tokens_used"]
                 }
                 
-                self.supabase.table("messages").insert(scenario_message).execute()
+                await run_query(self.supabase.table("messages").insert(scenario_message))
                 
                 # Return scenario with session_id
                 scenario_record["scenario_id"] = session_id
@@ -720,13 +724,14 @@ Make it realistic, clinically relevant, and appropriate for MBBS students."""
             from services.model_router import get_model_router_service
             
             # Get scenario data
-            messages_response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .eq("role", "system")\
-                .order("created_at", desc=False)\
-                .limit(1)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .eq("role", "system")
+                .order("created_at", desc=False)
+                .limit(1)
+            )
             
             if not messages_response.data or len(messages_response.data) == 0:
                 raise Exception("OSCE scenario data not found")
@@ -816,10 +821,11 @@ Be realistic - patients respond naturally with appropriate emotions and body lan
                 scenario_data["performance_data"] = performance_data
                 
                 # Update scenario data in database
-                self.supabase.table("messages")\
-                    .update({"content": json.dumps(scenario_data)})\
-                    .eq("id", message_id)\
-                    .execute()
+                await run_query(
+                    self.supabase.table("messages")
+                    .update({"content": json.dumps(scenario_data)})
+                    .eq("id", message_id)
+                )
                 
                 # Store user action and response as messages
                 user_message = {
@@ -828,7 +834,7 @@ Be realistic - patients respond naturally with appropriate emotions and body lan
                     "content": user_action,
                     "tokens_used": None
                 }
-                self.supabase.table("messages").insert(user_message).execute()
+                await run_query(self.supabase.table("messages").insert(user_message))
                 
                 assistant_message = {
                     "session_id": session_id,
@@ -836,7 +842,7 @@ Be realistic - patients respond naturally with appropriate emotions and body lan
                     "content": interaction_data.get("patient_response", ""),
                     "tokens_used": result["tokens_used"]
                 }
-                self.supabase.table("messages").insert(assistant_message).execute()
+                await run_query(self.supabase.table("messages").insert(assistant_message))
                 
                 return interaction_data
                 
@@ -871,23 +877,25 @@ Be realistic - patients respond naturally with appropriate emotions and body lan
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("chat_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("chat_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("OSCE scenario not found or does not belong to user")
             
             # Get scenario data
-            messages_response = self.supabase.table("messages")\
-                .select("*")\
-                .eq("session_id", session_id)\
-                .eq("role", "system")\
-                .order("created_at", desc=False)\
-                .limit(1)\
-                .execute()
+            messages_response = await run_query(
+                self.supabase.table("messages")
+                .select("*")
+                .eq("session_id", session_id)
+                .eq("role", "system")
+                .order("created_at", desc=False)
+                .limit(1)
+            )
             
             if not messages_response.data or len(messages_response.data) == 0:
                 raise Exception("OSCE scenario data not found")
@@ -937,6 +945,6 @@ def get_clinical_service(supabase_client: Optional[Client] = None) -> ClinicalSe
         ClinicalService instance
     """
     global _clinical_service_instance
-    if _clinical_service_instance is None or supabase_client is not None:
+    if _clinical_service_instance is None or (supabase_client is not None and supabase_client is not _clinical_service_instance.supabase):
         _clinical_service_instance = ClinicalService(supabase_client)
     return _clinical_service_instance
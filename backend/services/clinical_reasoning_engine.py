@@ -2,14 +2,15 @@
 Clinical Reasoning Engine Service
 Production-grade service for clinical case management, OSCE simulations, and performance evaluation
 """
-import os
 import json
 import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 from enum import Enum
+from services.db_executor import run_query
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -68,11 +69,7 @@ class ClinicalReasoningEngine:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     # =========================================================================
     # CASE GENERATION
@@ -133,7 +130,7 @@ class ClinicalReasoningEngine:
             "time_started": datetime.now(timezone.utc).isoformat()
         }
         
-        response = self.supabase.table("clinical_cases").insert(case_record).execute()
+        response = await run_query(self.supabase.table("clinical_cases").insert(case_record))
         
         if not response.data:
             raise Exception("Failed to create clinical case")
@@ -627,12 +624,13 @@ Always respond with valid JSON only. No markdown formatting or explanation text.
     
     async def get_case_stage(self, case_id: str, user_id: str) -> Dict[str, Any]:
         """Get current stage information for a case"""
-        response = self.supabase.table("clinical_cases")\
-            .select("*")\
-            .eq("id", case_id)\
-            .eq("user_id", user_id)\
-            .single()\
-            .execute()
+        response = await run_query(
+            self.supabase.table("clinical_cases")
+            .select("*")
+            .eq("id", case_id)
+            .eq("user_id", user_id)
+            .single()
+        )
         
         if not response.data:
             raise Exception("Case not found")
@@ -695,12 +693,13 @@ Always respond with valid JSON only. No markdown formatting or explanation text.
         from services.model_router import get_model_router_service
         
         # Get case data
-        case_response = self.supabase.table("clinical_cases")\
-            .select("*")\
-            .eq("id", case_id)\
-            .eq("user_id", user_id)\
-            .single()\
-            .execute()
+        case_response = await run_query(
+            self.supabase.table("clinical_cases")
+            .select("*")
+            .eq("id", case_id)
+            .eq("user_id", user_id)
+            .single()
+        )
         
         if not case_response.data:
             raise Exception("Case not found")
@@ -709,10 +708,11 @@ Always respond with valid JSON only. No markdown formatting or explanation text.
         current_stage = case.get("current_stage", 0)
         
         # Count existing steps
-        steps_response = self.supabase.table("clinical_reasoning_steps")\
-            .select("id")\
-            .eq("case_id", case_id)\
-            .execute()
+        steps_response = await run_query(
+            self.supabase.table("clinical_reasoning_steps")
+            .select("id")
+            .eq("case_id", case_id)
+        )
         
         step_number = len(steps_response.data) + 1
         
@@ -734,16 +734,17 @@ Always respond with valid JSON only. No markdown formatting or explanation text.
             "score": evaluation.get("score", 0)
         }
         
-        self.supabase.table("clinical_reasoning_steps").insert(step_record).execute()
+        await run_query(self.supabase.table("clinical_reasoning_steps").insert(step_record))
         
         # Check if should advance stage
         should_advance = evaluation.get("advance_stage", False)
         if should_advance:
             new_stage = current_stage + 1
-            self.supabase.table("clinical_cases")\
-                .update({"current_stage": new_stage})\
-                .eq("id", case_id)\
-                .execute()
+            await run_query(
+                self.supabase.table("clinical_cases")
+                .update({"current_stage": new_stage})
+                .eq("id", case_id)
+            )
         
         return {
             "evaluation": evaluation,
@@ -919,7 +920,7 @@ Required JSON structure:
             "time_started": datetime.now(timezone.utc).isoformat()
         }
         
-        response = self.supabase.table("osce_scenarios").insert(scenario_record).execute()
+        response = await run_query(self.supabase.table("osce_scenarios").insert(scenario_record))
         
         if not response.data:
             raise Exception("Failed to create OSCE scenario")
@@ -1114,12 +1115,13 @@ CRITICAL JSON RULES:
         from services.model_router import get_model_router_service
         
         # Get scenario
-        response = self.supabase.table("osce_scenarios")\
-            .select("*")\
-            .eq("id", scenario_id)\
-            .eq("user_id", user_id)\
-            .single()\
-            .execute()
+        response = await run_query(
+            self.supabase.table("osce_scenarios")
+            .select("*")
+            .eq("id", scenario_id)
+            .eq("user_id", user_id)
+            .single()
+        )
         
         if not response.data:
             raise Exception("Scenario not found")
@@ -1276,10 +1278,11 @@ Example: If student says "Hello I am Dr Smith", respond with:
             "examiner_notes": examiner_notes  # Store but don't return
         })
         
-        self.supabase.table("osce_scenarios")\
-            .update({"interaction_history": interaction_history})\
-            .eq("id", scenario_id)\
-            .execute()
+        await run_query(
+            self.supabase.table("osce_scenarios")
+            .update({"interaction_history": interaction_history})
+            .eq("id", scenario_id)
+        )
         
         # Return only patient-facing information
         feedback_value = None
@@ -1306,40 +1309,44 @@ Example: If student says "Hello I am Dr Smith", respond with:
     
     async def _ensure_performance_record(self, user_id: str):
         """Ensure user has a performance record"""
-        response = self.supabase.table("clinical_performance")\
-            .select("id")\
-            .eq("user_id", user_id)\
-            .execute()
+        response = await run_query(
+            self.supabase.table("clinical_performance")
+            .select("id")
+            .eq("user_id", user_id)
+        )
         
         if not response.data:
-            self.supabase.table("clinical_performance").insert({
+            await run_query(self.supabase.table("clinical_performance").insert({
                 "user_id": user_id
-            }).execute()
+            }))
     
     async def get_performance_summary(self, user_id: str) -> Dict[str, Any]:
         """Get user's clinical performance summary"""
         # Get performance record
-        perf_response = self.supabase.table("clinical_performance")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .single()\
-            .execute()
+        perf_response = await run_query(
+            self.supabase.table("clinical_performance")
+            .select("*")
+            .eq("user_id", user_id)
+            .single()
+        )
         
         # Get recent cases
-        cases_response = self.supabase.table("clinical_cases")\
-            .select("id, specialty, difficulty, status, created_at")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .limit(10)\
-            .execute()
+        cases_response = await run_query(
+            self.supabase.table("clinical_cases")
+            .select("id, specialty, difficulty, status, created_at")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(10)
+        )
         
         # Get recent OSCE
-        osce_response = self.supabase.table("osce_scenarios")\
-            .select("id, scenario_type, difficulty, status, created_at")\
-            .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
-            .limit(10)\
-            .execute()
+        osce_response = await run_query(
+            self.supabase.table("osce_scenarios")
+            .select("id, scenario_type, difficulty, status, created_at")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(10)
+        )
         
         return {
             "performance": perf_response.data if perf_response.data else {},
@@ -1351,11 +1358,12 @@ Example: If student says "Hello I am Dr Smith", respond with:
     async def _generate_recommendations(self, user_id: str) -> List[str]:
         """Generate study recommendations based on performance"""
         # Get weak areas from steps with low scores
-        steps_response = self.supabase.table("clinical_reasoning_steps")\
-            .select("step_type, score")\
-            .eq("user_id", user_id)\
-            .lt("score", 60)\
-            .execute()
+        steps_response = await run_query(
+            self.supabase.table("clinical_reasoning_steps")
+            .select("step_type, score")
+            .eq("user_id", user_id)
+            .lt("score", 60)
+        )
         
         weak_areas = set()
         for step in (steps_response.data or []):
@@ -1377,11 +1385,12 @@ Example: If student says "Hello I am Dr Smith", respond with:
     async def complete_case(self, case_id: str, user_id: str) -> Dict[str, Any]:
         """Complete a case and calculate final score"""
         # Get all steps for this case
-        steps_response = self.supabase.table("clinical_reasoning_steps")\
-            .select("*")\
-            .eq("case_id", case_id)\
-            .eq("user_id", user_id)\
-            .execute()
+        steps_response = await run_query(
+            self.supabase.table("clinical_reasoning_steps")
+            .select("*")
+            .eq("case_id", case_id)
+            .eq("user_id", user_id)
+        )
         
         steps = steps_response.data or []
         
@@ -1392,25 +1401,27 @@ Example: If student says "Hello I am Dr Smith", respond with:
             avg_score = 0
         
         # Update case status
-        self.supabase.table("clinical_cases")\
+        await run_query(
+            self.supabase.table("clinical_cases")
             .update({
                 "status": "completed",
                 "time_completed": datetime.now(timezone.utc).isoformat()
-            })\
-            .eq("id", case_id)\
-            .execute()
+            })
+            .eq("id", case_id)
+        )
         
         # Get case with answers for feedback
-        case_response = self.supabase.table("clinical_cases")\
-            .select("*")\
-            .eq("id", case_id)\
-            .single()\
-            .execute()
+        case_response = await run_query(
+            self.supabase.table("clinical_cases")
+            .select("*")
+            .eq("id", case_id)
+            .single()
+        )
         
         case = case_response.data
         
         # Update performance record
-        self.supabase.rpc("increment_cases_completed", {"p_user_id": user_id}).execute()
+        await run_query(self.supabase.rpc("increment_cases_completed", {"p_user_id": user_id}))
         
         return {
             "final_score": round(avg_score, 1),
@@ -1427,6 +1438,6 @@ _engine_instance = None
 
 def get_clinical_reasoning_engine(supabase_client: Optional[Client] = None) -> ClinicalReasoningEngine:
     global _engine_instance
-    if _engine_instance is None or supabase_client is not None:
+    if _engine_instance is None or (supabase_client is not None and supabase_client is not _engine_instance.supabase):
         _engine_instance = ClinicalReasoningEngine(supabase_client)
     return _engine_instance
@@ -0,0 +1,124 @@
+"""
+Database Executor
+Runs blocking Supabase calls off the API event loop
+
+supabase-py's client is synchronous: every `.execute()`, storage and auth
+call is a blocking HTTP round trip. Called directly from an async handler
+it freezes every other request on the worker for its duration. Services
+build queries with the usual query-builder API and await run_query(),
+which executes them on a bounded thread pool; other blocking client calls
+go through run_sync(). The pool size bounds concurrent database calls per
+process, excess calls wait in the pool's queue.
+"""
+import os
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Threads for database calls (upper bound on concurrent PostgREST requests per process)
+DB_THREAD_POOL_SIZE = int(os.getenv("DB_THREAD_POOL_SIZE", "20"))
+
+# Singleton pool, created on first use
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Calls submitted and not yet finished (running or queued)
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Get or create the database thread pool"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, DB_THREAD_POOL_SIZE),
+                    thread_name_prefix="db"
+                )
+                logger.info(f"Started database thread pool with {max(1, DB_THREAD_POOL_SIZE)} threads")
+
+    return _executor
+
+
+def shutdown_db_executor() -> None:
+    """Stop the database pool after running calls finish (called on application shutdown)"""
+    global _executor
+
+    with _executor_lock:
+        executor, _executor = _executor, None
+
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("Stopped database thread pool")
+
+
+def _finished(_future: Future) -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight -= 1
+
+
+async def run_sync(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking Supabase call (storage, auth, a sync helper) on the database pool
+
+    The caller's context variables are visible to the call. Cancelling the
+    awaiting task drops the call if it hasn't started yet.
+
+    Args:
+        func: Blocking callable
+        *args: Positional arguments
+        **kwargs: Keyword arguments
+
+    Returns:
+        The callable's result (exceptions are raised to the caller)
+    """
+    global _in_flight
+    future = get_db_executor().submit(contextvars.copy_context().run, partial(func, *args, **kwargs))
+
+    with _in_flight_lock:
+        _in_flight += 1
+    future.add_done_callback(_finished)
+
+    return await asyncio.wrap_future(future)
+
+
+async def run_query(query: Any) -> Any:
+    """
+    Execute a PostgREST query builder without blocking the event loop
+
+    Usage: `result = await run_query(self.supabase.table("users").select("*").eq("id", user_id))`
+
+    Args:
+        query: Query builder (anything with a blocking execute())
+
+    Returns:
+        The APIResponse returned by execute()
+    """
+    return await run_sync(query.execute)
+
+
+def get_db_executor_stats() -> Dict[str, Any]:
+    """
+    Get database pool usage
+
+    Returns:
+        Dict with pool size and calls in flight (running plus queued)
+    """
+    return {
+        "pool_size": max(1, DB_THREAD_POOL_SIZE),
+        "in_flight": _in_flight,
+        "queued": max(0, _in_flight - max(1, DB_THREAD_POOL_SIZE))
+    }
@@ -0,0 +1,343 @@
+"""
+Document Extraction
+CPU-bound PDF parsing and Tesseract OCR, run off the API event loop
+
+PyPDF2 parsing, pdf2image rendering and pytesseract OCR hold the CPU for
+seconds per page. The worker functions in this module are plain top-level
+functions so they can run in a ProcessPoolExecutor; the async helpers
+submit them, stream results page by page from page ranges that run in
+parallel, enforce the page limit and cancel pages that haven't started
+when the caller stops, is cancelled or a range exceeds the deadline.
+"""
+import os
+import io
+import asyncio
+import logging
+import platform
+import sys
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Worker processes for extraction; 0 runs extraction in the default thread pool
+EXTRACTION_MAX_WORKERS = int(os.getenv("EXTRACTION_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages beyond this limit are not OCR'd (0 = no limit)
+EXTRACTION_MAX_PAGES = int(os.getenv("EXTRACTION_MAX_PAGES", "200"))
+# Pages beyond this limit of the text layer are not parsed (0 = no limit)
+PDF_TEXT_MAX_PAGES = int(os.getenv("PDF_TEXT_MAX_PAGES", "0"))
+# Pages rendered and OCR'd per pool task
+OCR_PAGES_PER_TASK = int(os.getenv("OCR_PAGES_PER_TASK", "2"))
+# Pages of text layer parsed per pool task when streaming
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "10"))
+# Page ranges extracted ahead of the consumer when streaming (bounds memory)
+EXTRACTION_PREFETCH_TASKS = int(os.getenv("EXTRACTION_PREFETCH_TASKS", str(max(1, EXTRACTION_MAX_WORKERS))))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# Upper bound for extracting one page range (seconds)
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "600"))
+
+TESSERACT_WINDOWS_PATHS = [
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    r"C:\Tesseract-OCR\tesseract.exe",
+]
+
+POPPLER_WINDOWS_PATHS = [
+    r"C:\Program Files\poppler\Library\bin",
+    r"C:\poppler\Library\bin",
+    r"C:\ProgramData\chocolatey\lib\poppler\tools\poppler-26.02.0\bin",
+]
+
+
+# ============================================================================
+# WORKER FUNCTIONS (run inside pool processes)
+# ============================================================================
+
+def _configure_tesseract() -> None:
+    """Point pytesseract at a local Tesseract install on Windows"""
+    if platform.system() != 'Windows':
+        return
+
+    import pytesseract
+    for path in TESSERACT_WINDOWS_PATHS:
+        if os.path.exists(path):
+            pytesseract.pytesseract.tesseract_cmd = path
+            break
+
+
+def _find_poppler_path() -> Optional[str]:
+    """Find poppler binaries on Windows (pdf2image finds them on PATH elsewhere)"""
+    if platform.system() != 'Windows':
+        return None
+
+    for path in POPPLER_WINDOWS_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def parse_pdf_page_range(file_content: bytes, first_page: int, last_page: int) -> Tuple[List[str], int]:
+    """
+    Extract the text layer of a range of PDF pages
+
+    Args:
+        file_content: PDF bytes
+        first_page: First page to read (1-based)
+        last_page: Last page to read (inclusive)
+
+    Returns:
+        Tuple of (text per page in the range, total pages in the document)
+    """
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    total_pages = len(reader.pages)
+    pages = []
+
+    for page_num in range(first_page - 1, min(last_page, total_pages)):
+        try:
+            pages.append(reader.pages[page_num].extract_text() or "")
+        except Exception as page_error:
+            logger.warning(f"Failed to extract text from page {page_num}: {str(page_error)}")
+            pages.append("")
+
+    return pages, total_pages
+
+
+def ocr_pdf_pages(file_content: bytes, first_page: int, last_page: int, dpi: int = OCR_DPI) -> List[str]:
+    """
+    Render a range of PDF pages and OCR them
+
+    Args:
+        file_content: PDF bytes
+        first_page: First page to OCR (1-based)
+        last_page: Last page to OCR (inclusive)
+        dpi: Render resolution
+
+    Returns:
+        OCR text per page in the range
+    """
+    import pytesseract
+    from pdf2image import convert_from_bytes
+
+    _configure_tesseract()
+
+    kwargs = {"dpi": dpi, "first_page": first_page, "last_page": last_page}
+    poppler_path = _find_poppler_path()
+    if poppler_path:
+        kwargs["poppler_path"] = poppler_path
+
+    texts = []
+    for offset, image in enumerate(convert_from_bytes(file_content, **kwargs)):
+        try:
+            texts.append(pytesseract.image_to_string(image))
+        except Exception as page_error:
+            logger.warning(f"OCR failed for page {first_page + offset}: {str(page_error)}")
+            texts.append("")
+
+    return texts
+
+
+def ocr_image(file_content: bytes) -> str:
+    """
+    OCR a single uploaded image
+
+    Args:
+        file_content: Image bytes
+
+    Returns:
+        Extracted text
+    """
+    import pytesseract
+    from PIL import Image
+
+    _configure_tesseract()
+
+    image = Image.open(io.BytesIO(file_content))
+
+    # Convert to RGB if needed for better OCR results
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return pytesseract.image_to_string(image, config='--psm 3')
+
+
+# ============================================================================
+# EXECUTOR AND ASYNC HELPERS
+# ============================================================================
+
+# Singleton pool, created on first use
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_executor() -> Optional[Executor]:
+    """Get or create the extraction process pool (None means the default thread pool)"""
+    global _executor
+
+    if EXTRACTION_MAX_WORKERS <= 0:
+        return None
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXTRACTION_MAX_WORKERS)
+        logger.info(f"Started document extraction pool with {EXTRACTION_MAX_WORKERS} workers")
+
+    return _executor
+
+
+def shutdown_extraction_executor() -> None:
+    """Stop the extraction pool, dropping work that hasn't started (called on application shutdown)"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.info("Stopped document extraction pool")
+
+
+async def run_extraction(func: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run an extraction worker function off the event loop
+
+    Cancelling the awaiting task cancels the work if it hasn't started.
+
+    Args:
+        func: Top-level worker function
+        *args: Arguments (must be picklable)
+
+    Returns:
+        The worker function's result
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_extraction_executor(), partial(func, *args))
+
+
+async def _iter_page_ranges(
+    func: Callable[..., Any],
+    file_content: bytes,
+    first_page: int,
+    last_page: int,
+    step: int,
+    *extra_args: Any
+) -> AsyncIterator[Any]:
+    """
+    Run a worker over consecutive page ranges, yielding results in page order
+
+    At most EXTRACTION_PREFETCH_TASKS ranges are submitted ahead of the
+    consumer, so a slow consumer applies backpressure instead of letting
+    extracted text pile up. Ranges still outstanding when the iterator is
+    closed or cancelled are cancelled.
+
+    Args:
+        func: Worker taking (file_content, first_page, last_page, *extra_args)
+        file_content: Document bytes
+        first_page: First page (1-based)
+        last_page: Last page (inclusive)
+        step: Pages per task
+        *extra_args: Extra worker arguments
+
+    Yields:
+        Worker results, one per range
+    """
+    step = max(1, step)
+    ranges = deque((first, min(first + step - 1, last_page)) for first in range(first_page, last_page + 1, step))
+    pending: deque = deque()
+
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < max(1, EXTRACTION_PREFETCH_TASKS):
+                first, last = ranges.popleft()
+                pending.append(asyncio.ensure_future(run_extraction(func, file_content, first, last, *extra_args)))
+
+            yield await asyncio.wait_for(pending.popleft(), timeout=EXTRACTION_TIMEOUT_SECONDS)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def iter_pdf_pages(file_content: bytes, max_pages: int = PDF_TEXT_MAX_PAGES) -> AsyncIterator[Tuple[int, str, int]]:
+    """
+    Stream the PDF text layer page by page
+
+    Args:
+        file_content: PDF bytes
+        max_pages: Maximum number of pages to read (0 = all pages)
+
+    Yields:
+        Tuples of (page number, page text, pages that will be read)
+    """
+    step = max(1, PDF_PAGES_PER_TASK)
+    if max_pages <= 0:
+        max_pages = sys.maxsize
+
+    first_texts, total_pages = await asyncio.wait_for(
+        run_extraction(parse_pdf_page_range, file_content, 1, min(step, max_pages)),
+        timeout=EXTRACTION_TIMEOUT_SECONDS
+    )
+
+    page_count = min(total_pages, max_pages)
+    if page_count < total_pages:
+        logger.warning(f"PDF extraction limited to the first {page_count} of {total_pages} pages")
+
+    page_number = 0
+    for text in first_texts:
+        page_number += 1
+        yield page_number, text, page_count
+
+    ranges = _iter_page_ranges(parse_pdf_page_range, file_content, page_number + 1, page_count, step)
+    try:
+        async for texts, _ in ranges:
+            for text in texts:
+                page_number += 1
+                yield page_number, text, page_count
+    finally:
+        await ranges.aclose()
+
+
+async def iter_ocr_pages(file_content: bytes, total_pages: int, max_pages: int = EXTRACTION_MAX_PAGES) -> AsyncIterator[Tuple[int, str, int]]:
+    """
+    Stream OCR text page by page, with page ranges processed in parallel
+
+    Args:
+        file_content: PDF bytes
+        total_pages: Number of pages in the document
+        max_pages: Maximum number of pages to OCR (0 = all pages)
+
+    Yields:
+        Tuples of (page number, OCR text, pages that will be OCR'd)
+    """
+    if max_pages <= 0:
+        max_pages = total_pages
+    page_count = min(total_pages, max_pages)
+    if page_count < total_pages:
+        logger.warning(f"OCR limited to the first {page_count} of {total_pages} pages")
+
+    page_number = 0
+    ranges = _iter_page_ranges(ocr_pdf_pages, file_content, 1, page_count, OCR_PAGES_PER_TASK, OCR_DPI)
+    try:
+        async for texts in ranges:
+            for text in texts:
+                page_number += 1
+                yield page_number, text, page_count
+    finally:
+        await ranges.aclose()
+
+
+async def extract_image_text(file_content: bytes) -> str:
+    """
+    OCR an uploaded image in the extraction pool
+
+    Args:
+        file_content: Image bytes
+
+    Returns:
+        Extracted text
+    """
+    return await asyncio.wait_for(
+        run_extraction(ocr_image, file_content),
+        timeout=EXTRACTION_TIMEOUT_SECONDS
+    )
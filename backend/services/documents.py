@@ -4,18 +4,36 @@ Handles PDF/image upload, processing, embedding generation, and RAG
 """
 import os
 import uuid
+import asyncio
+import time
 import hashlib
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from supabase import Client
 import logging
-import PyPDF2
-import io
-from PIL import Image
-import pytesseract
+from services.embedding_format import format_embedding_parts, format_vector
+from services import document_extraction
+from services.chunking import TextChunker
+from services.db_executor import run_query, run_sync
+from services.user_profiles import get_user_profiles
 
 logger = logging.getLogger(__name__)
 
+# Chunks sent per embeddings request and batches kept in flight during ingestion
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+# Rows per document_chunks insert and minimum seconds between progress writes
+CHUNK_INSERT_BATCH_SIZE = int(os.getenv("CHUNK_INSERT_BATCH_SIZE", "100"))
+PROGRESS_UPDATE_INTERVAL_SECONDS = float(os.getenv("PROGRESS_UPDATE_INTERVAL_SECONDS", "2"))
+
+# Leading PDF pages inspected to decide whether a PDF needs OCR
+PDF_TYPE_DETECTION_PAGES = int(os.getenv("PDF_TYPE_DETECTION_PAGES", "10"))
+
+# Strong references to fallback processing tasks so they aren't garbage collected
+_background_tasks: set = set()
+
 
 class DocumentService:
     """Service for document upload, processing, and RAG"""
@@ -25,6 +43,7 @@ class DocumentService:
         self.storage_bucket = "documents"
         self.hf_provider = None
         self.embedding_dimension = None  # Will be detected dynamically
+        self._last_progress_write: Dict[str, float] = {}
         self._init_hf_provider()
     
     def _init_hf_provider(self):
@@ -83,7 +102,8 @@ class DocumentService:
             
             # Upload to Supabase Storage
             try:
-                self.supabase.storage.from_(self.storage_bucket).upload(
+                await run_sync(
+                    self.supabase.storage.from_(self.storage_bucket).upload,
                     storage_filename,
                     file_content,
                     {"content-type": file_type}
@@ -103,14 +123,16 @@ class DocumentService:
                 
                 # If bucket doesn't exist, create it with 50MB limit
                 try:
-                    self.supabase.storage.create_bucket(
-                        self.storage_bucket, 
+                    await run_sync(
+                        self.supabase.storage.create_bucket,
+                        self.storage_bucket,
                         {
                             "public": False,
                             "file_size_limit": 52428800  # 50MB in bytes
                         }
                     )
-                    self.supabase.storage.from_(self.storage_bucket).upload(
+                    await run_sync(
+                        self.supabase.storage.from_(self.storage_bucket).upload,
                         storage_filename,
                         file_content,
                         {"content-type": file_type}
@@ -135,15 +157,22 @@ class DocumentService:
                 "created_at": datetime.now().isoformat()
             }
             
-            result = self.supabase.table("documents").insert(document_data).execute()
+            result = await run_query(self.supabase.table("documents").insert(document_data))
             
             if not result.data:
                 raise Exception("Failed to create document record")
             
             document = result.data[0]
             
-            # Start async processing
-            await self._process_document_async(document["id"], file_content, file_type)
+            # Hand processing to the background ingestion queue and return immediately
+            try:
+                from services.ingestion_queue import get_ingestion_queue
+                await get_ingestion_queue(self.supabase).enqueue(document["id"], user_id)
+            except Exception as queue_error:
+                logger.error(f"Failed to enqueue document {document['id']}, processing in background task: {str(queue_error)}")
+                task = asyncio.create_task(self._process_document_async(document["id"], file_content, file_type))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
             
             return document
             
@@ -155,12 +184,11 @@ class DocumentService:
         """Get document retention days based on user's plan"""
         try:
             # Get user's plan and role
-            user_result = self.supabase.table("users").select("plan, role").eq("id", user_id).execute()
+            user_data = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_result.data:
+            if not user_data:
                 return 14  # Default
             
-            user_data = user_result.data[0]
             plan = user_data.get("plan", "free")
             role = user_data.get("role")
             
@@ -170,7 +198,7 @@ class DocumentService:
             
             # Get retention days for this plan
             flag_name = f"document_retention_{plan}"
-            result = self.supabase.table("system_flags").select("flag_value").eq("flag_name", flag_name).execute()
+            result = await run_query(self.supabase.table("system_flags").select("flag_value").eq("flag_name", flag_name))
             
             if result.data:
                 return int(result.data[0]["flag_value"])
@@ -204,205 +232,221 @@ class DocumentService:
     async def _process_document_async(self, document_id: str, file_content: bytes, file_type: str):
         """
         Process document: extract text, chunk, generate embeddings
-        This should ideally run in a background task/queue
+        Marks the document failed instead of raising (used when processing inline)
         """
         try:
-            # Update status to processing
-            self.supabase.table("documents").update({
-                "processing_status": "processing",
-                "processing_progress": 10,
-                "processing_stage": "Extracting text..."
-            }).eq("id", document_id).execute()
-            
-            # Extract text based on file type
-            if file_type == "application/pdf":
-                text = await self._extract_pdf_text(file_content)
-            elif file_type.startswith("image/"):
-                text = await self._extract_image_text(file_content)
-            else:
-                raise Exception(f"Unsupported file type: {file_type}")
-            
-            if not text or len(text.strip()) < 10:
-                # For image-based PDFs or documents with minimal text, 
-                # still mark as completed with a note
-                logger.warning(f"Document {document_id} has minimal extractable text")
-                text = "Document uploaded. Limited text extraction available."
-            
-            # Update progress
-            self.supabase.table("documents").update({
-                "processing_progress": 30,
-                "processing_stage": "Chunking text..."
-            }).eq("id", document_id).execute()
-            
-            # Chunk text
-            chunks = self._chunk_text(text)
-            
-            # Update progress
-            self.supabase.table("documents").update({
-                "processing_progress": 50,
-                "processing_stage": f"Generating embeddings (0/{len(chunks)})..."
-            }).eq("id", document_id).execute()
-            
-            # Generate embeddings and store chunks
-            await self._store_chunks_with_embeddings(document_id, chunks)
-            
-            # Update status to completed
-            self.supabase.table("documents").update({
-                "processing_status": "completed",
-                "processing_progress": 100,
-                "processing_stage": "Completed",
-                "processed_at": datetime.now().isoformat()
-            }).eq("id", document_id).execute()
-            
-            logger.info(f"Document {document_id} processed successfully")
-            
+            await self.process_document(document_id, file_content, file_type)
         except Exception as e:
             logger.error(f"Document processing failed: {str(e)}")
-            self.supabase.table("documents").update({
-                "processing_status": "failed",
-                "processing_progress": 0,
-                "processing_stage": "Failed",
-                "error_message": str(e)
-            }).eq("id", document_id).execute()
+            await run_sync(self.mark_document_failed, document_id, str(e))
     
-    async def _extract_pdf_text(self, file_content: bytes) -> str:
-        """Extract text from PDF - handles both text-based and image-based PDFs"""
+    async def process_document(self, document_id: str, file_content: bytes, file_type: str, start_index: int = 0):
+        """
+        Process document: extract text, chunk, generate embeddings
+        
+        Args:
+            document_id: Document ID
+            file_content: File bytes
+            file_type: MIME type
+            start_index: Chunk index to resume from (chunks before it are already stored)
+        
+        Raises:
+            Exception: If any stage fails (the caller decides whether to retry)
+        """
+        # Update status to processing
+        await run_query(self.supabase.table("documents").update({
+            "processing_status": "processing",
+            "processing_progress": 10,
+            "processing_stage": "Extracting text..."
+        }).eq("id", document_id))
+        
+        if file_type != "application/pdf" and not file_type.startswith("image/"):
+            raise Exception(f"Unsupported file type: {file_type}")
+        
+        # Pages are extracted, chunked and embedded as a pipeline: chunks are
+        # embedded while later pages are still being extracted
+        segments = self._iter_document_text(file_content, file_type)
+        await self._store_chunk_stream(document_id, self._iter_chunks(segments), start_index=start_index)
+        
+        # Update status to completed
+        await run_query(self.supabase.table("documents").update({
+            "processing_status": "completed",
+            "processing_progress": 100,
+            "processing_stage": "Completed",
+            "processed_at": datetime.now().isoformat()
+        }).eq("id", document_id))
+        
+        logger.info(f"Document {document_id} processed successfully")
+    
+    async def process_stored_document(self, document_id: str):
+        """
+        Process a document whose file is already in storage, resuming after stored chunks
+        
+        Used by the ingestion queue workers.
+        
+        Args:
+            document_id: Document ID
+        
+        Raises:
+            Exception: If the document is missing or processing fails
+        """
+        doc_result = await run_query(self.supabase.table("documents").select("id, storage_path, file_type").eq("id", document_id))
+        
+        if not doc_result.data:
+            raise Exception(f"Document {document_id} not found")
+        
+        document = doc_result.data[0]
+        file_content = await run_sync(self.supabase.storage.from_(self.storage_bucket).download, document["storage_path"])
+        start_index = await run_sync(self.get_resume_index, document_id)
+        
+        await self.process_document(
+            document_id,
+            file_content,
+            document.get("file_type") or "application/pdf",
+            start_index=start_index
+        )
+    
+    def mark_document_failed(self, document_id: str, error: str):
+        """Mark a document as failed with the given error message"""
+        self.supabase.table("documents").update({
+            "processing_status": "failed",
+            "processing_progress": 0,
+            "processing_stage": "Failed",
+            "error_message": error
+        }).eq("id", document_id).execute()
+    
+    async def _iter_document_text(self, file_content: bytes, file_type: str) -> AsyncIterator[Tuple[str, float]]:
+        """
+        Stream a document's text in extraction order
+        
+        Args:
+            file_content: File bytes
+            file_type: MIME type (PDF or image)
+        
+        Yields:
+            Tuples of (text segment, fraction of the document extracted so far)
+        """
+        if file_type == "application/pdf":
+            async for segment in self._iter_pdf_text(file_content):
+                yield segment
+        elif file_type.startswith("image/"):
+            yield await self._extract_image_text(file_content), 1.0
+        else:
+            raise Exception(f"Unsupported file type: {file_type}")
+    
+    async def _iter_pdf_text(self, file_content: bytes) -> AsyncIterator[Tuple[str, float]]:
+        """
+        Stream text from a PDF page by page - handles both text-based and image-based PDFs
+        
+        The first PDF_TYPE_DETECTION_PAGES pages decide whether the PDF is
+        image-based (too little text layer); if so, pages are OCR'd instead.
+        
+        Yields:
+            Tuples of (text segment, fraction of pages processed)
+        """
+        yielded = False
+        pages = document_extraction.iter_pdf_pages(file_content)
+        
         try:
-            pdf_file = io.BytesIO(file_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            total_pages = len(pdf_reader.pages)
-            pages_with_text = 0
-            
-            # First pass: Try to extract text from all pages
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text and len(page_text.strip()) > 20:  # Meaningful text threshold
-                        text += page_text + "\n\n"
-                        pages_with_text += 1
-                except Exception as page_error:
-                    logger.warning(f"Failed to extract text from page {page_num}: {str(page_error)}")
-                    continue
-            
-            extracted_text = text.strip()
-            
-            # Check if we got meaningful text from most pages
-            text_coverage = pages_with_text / total_pages if total_pages > 0 else 0
-            
-            if text_coverage < 0.3 or len(extracted_text) < 100:
+            # First pass: read enough pages to tell text-based from image-based PDFs
+            sample = []
+            page_count = 0
+            async for _, page_text, page_count in pages:
+                sample.append(page_text)
+                if len(sample) >= PDF_TYPE_DETECTION_PAGES:
+                    break
+            
+            meaningful = [t for t in sample if t and len(t.strip()) > 20]  # Meaningful text threshold
+            sample_text = "".join(t + "\n\n" for t in meaningful).strip()
+            text_coverage = len(meaningful) / len(sample) if sample else 0
+            
+            if text_coverage < 0.3 or len(sample_text) < 100:
                 # This appears to be an image-based PDF
                 logger.warning(f"PDF appears to be image-based (text coverage: {text_coverage:.1%}). Attempting OCR...")
+                await pages.aclose()
                 
-                # Try OCR on the PDF
-                try:
-                    ocr_text = await self._extract_pdf_with_ocr(file_content)
-                    if ocr_text and len(ocr_text.strip()) > 50:
-                        logger.info(f"OCR extraction successful, extracted {len(ocr_text)} characters")
-                        return ocr_text
-                    else:
-                        logger.warning("OCR extraction yielded minimal text")
-                except Exception as ocr_error:
-                    logger.warning(f"OCR extraction failed: {str(ocr_error)}")
-                
-                # If OCR fails or yields nothing, return what we have with a note
-                if extracted_text:
-                    return extracted_text + "\n\n[Note: This PDF may contain images. Some content might not be fully extracted.]"
-                else:
-                    return "PDF uploaded successfully. This appears to be an image-based PDF. Text extraction is limited. You can still use this document for reference."
-            
-            return extracted_text
+                async for segment in self._iter_pdf_ocr_text(file_content, page_count, sample_text):
+                    yielded = True
+                    yield segment
+                return
+            
+            for page_text in meaningful:
+                yielded = True
+                yield page_text + "\n\n", len(sample) / page_count
+            
+            async for page_number, page_text, _ in pages:
+                if page_text and len(page_text.strip()) > 20:
+                    yield page_text + "\n\n", page_number / page_count
         except Exception as e:
             logger.error(f"PDF text extraction failed: {str(e)}")
-            return "PDF uploaded successfully. Text extraction encountered an issue, but the document is stored and can be referenced."
+            if not yielded:
+                yield "PDF uploaded successfully. Text extraction encountered an issue, but the document is stored and can be referenced.", 1.0
+        finally:
+            await pages.aclose()
     
-    async def _extract_pdf_with_ocr(self, file_content: bytes) -> str:
-        """Extract text from image-based PDF using OCR"""
+    async def _iter_pdf_ocr_text(self, file_content: bytes, page_count: int, text_layer: str) -> AsyncIterator[Tuple[str, float]]:
+        """
+        Stream OCR text for an image-based PDF (page ranges run in parallel)
+        
+        Args:
+            file_content: PDF bytes
+            page_count: Number of pages in the PDF
+            text_layer: Text layer found while detecting the PDF type (used if OCR yields nothing)
+        
+        Yields:
+            Tuples of (text segment, fraction of pages processed)
+        """
+        # Hold segments back until OCR has produced meaningful text, so a
+        # near-empty OCR result can still be replaced by the fallback text
+        held = []
+        ocr_length = 0
+        pages = document_extraction.iter_ocr_pages(file_content, page_count)
+        
         try:
-            # Set tesseract path for Windows if needed
-            import platform
-            if platform.system() == 'Windows':
-                possible_tesseract_paths = [
-                    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-                    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-                    r"C:\Tesseract-OCR\tesseract.exe",
-                ]
-                for path in possible_tesseract_paths:
-                    if os.path.exists(path):
-                        pytesseract.pytesseract.tesseract_cmd = path
-                        logger.info(f"Found tesseract at: {path}")
-                        break
-            
-            # Try to use pdf2image if available
-            try:
-                from pdf2image import convert_from_bytes
-                
-                # Set poppler path for Windows
-                poppler_path = None
-                if platform.system() == 'Windows':
-                    # Common Windows poppler locations
-                    possible_paths = [
-                        r"C:\Program Files\poppler\Library\bin",
-                        r"C:\poppler\Library\bin",
-                        r"C:\ProgramData\chocolatey\lib\poppler\tools\poppler-26.02.0\bin",
-                    ]
-                    for path in possible_paths:
-                        if os.path.exists(path):
-                            poppler_path = path
-                            logger.info(f"Found poppler at: {poppler_path}")
-                            break
+            async for page_number, page_text, ocr_pages in pages:
+                if not page_text or len(page_text.strip()) <= 10:
+                    continue
                 
-                # Convert PDF pages to images
-                if poppler_path:
-                    images = convert_from_bytes(file_content, dpi=200, poppler_path=poppler_path)
-                else:
-                    images = convert_from_bytes(file_content, dpi=200)
+                segment = (f"\n\n--- Page {page_number} ---\n\n{page_text}", page_number / ocr_pages)
+                ocr_length += len(page_text.strip())
                 
-                ocr_text = ""
-                for i, image in enumerate(images):
-                    try:
-                        page_text = pytesseract.image_to_string(image)
-                        if page_text and len(page_text.strip()) > 10:
-                            ocr_text += f"\n\n--- Page {i+1} ---\n\n{page_text}"
-                    except Exception as page_error:
-                        logger.warning(f"OCR failed for page {i+1}: {str(page_error)}")
-                        continue
+                if held is None:
+                    yield segment
+                    continue
                 
-                return ocr_text.strip()
-            except ImportError:
-                logger.warning("pdf2image not available for OCR. Install with: pip install pdf2image")
-                return ""
+                held.append(segment)
+                if ocr_length > 50:
+                    for held_segment in held:
+                        yield held_segment
+                    held = None
+        except ImportError:
+            logger.warning("pdf2image not available for OCR. Install with: pip install pdf2image")
         except Exception as e:
-            logger.error(f"PDF OCR extraction failed: {str(e)}")
-            return ""
+            logger.warning(f"OCR extraction failed: {str(e)}")
+        finally:
+            await pages.aclose()
+        
+        if held is None:
+            logger.info(f"OCR extraction successful, extracted {ocr_length} characters")
+            return
+        
+        logger.warning("OCR extraction yielded minimal text")
+        
+        # If OCR fails or yields nothing, return what we have with a note
+        if text_layer:
+            yield text_layer + "\n\n[Note: This PDF may contain images. Some content might not be fully extracted.]", 1.0
+        else:
+            yield "PDF uploaded successfully. This appears to be an image-based PDF. Text extraction is limited. You can still use this document for reference.", 1.0
+    
+    async def _extract_pdf_text(self, file_content: bytes) -> str:
+        """Extract text from PDF - handles both text-based and image-based PDFs"""
+        segments = [segment async for segment, _ in self._iter_pdf_text(file_content)]
+        return "".join(segments).strip()
     
     async def _extract_image_text(self, file_content: bytes) -> str:
         """Extract text from image using OCR"""
         try:
-            # Set tesseract path for Windows if needed
-            import platform
-            if platform.system() == 'Windows':
-                possible_tesseract_paths = [
-                    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-                    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-                    r"C:\Tesseract-OCR\tesseract.exe",
-                ]
-                for path in possible_tesseract_paths:
-                    if os.path.exists(path):
-                        pytesseract.pytesseract.tesseract_cmd = path
-                        logger.info(f"Found tesseract at: {path}")
-                        break
-            
-            image = Image.open(io.BytesIO(file_content))
-            
-            # Preprocess image for better OCR results
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Perform OCR
-            text = pytesseract.image_to_string(image, config='--psm 3')
+            text = await document_extraction.extract_image_text(file_content)
             extracted_text = text.strip()
             
             if not extracted_text or len(extracted_text) < 10:
@@ -420,143 +464,370 @@ class DocumentService:
     
     def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        text_length = len(text)
-        
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            
-            # Try to break at sentence boundary
-            if end < text_length:
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                break_point = max(last_period, last_newline)
-                
-                if break_point > chunk_size * 0.5:  # Only break if we're past halfway
-                    chunk = chunk[:break_point + 1]
-                    end = start + break_point + 1
-            
-            chunks.append(chunk.strip())
-            start = end - overlap
+        chunker = TextChunker(chunk_size=chunk_size, overlap=overlap)
+        return chunker.feed(text) + chunker.finish()
+    
+    async def _iter_chunks(self, segments: AsyncIterator[Tuple[str, float]]) -> AsyncIterator[Tuple[str, float]]:
+        """
+        Chunk streamed text incrementally, carrying overlap across page boundaries
         
-        return [c for c in chunks if len(c.strip()) > 50]  # Filter out tiny chunks
+        Args:
+            segments: Text segments with extraction progress
+        
+        Yields:
+            Tuples of (chunk, fraction of the document extracted when it was produced)
+        """
+        chunker = TextChunker()
+        text_length = 0
+        fraction = 0.0
+        
+        async for segment, fraction in segments:
+            text_length += len(segment.strip())
+            for chunk in chunker.feed(segment):
+                yield chunk, fraction
+        
+        if text_length < 10:
+            # For image-based PDFs or documents with minimal text, 
+            # still mark as completed with a note
+            logger.warning("Document has minimal extractable text")
+            chunker = TextChunker()
+            chunker.feed("Document uploaded. Limited text extraction available.")
+        
+        for chunk in chunker.finish():
+            yield chunk, 1.0
     
-    async def _store_chunks_with_embeddings(self, document_id: str, chunks: List[str]):
-        """Store text chunks with embeddings"""
+    async def _embed_chunks(self, chunks: List[str], api_key: Optional[str]) -> List[Optional[List[float]]]:
+        """
+        Embed a batch of chunks in one request
+        
+        A batch that fails as a whole is retried chunk by chunk so one bad
+        chunk doesn't drop the embeddings of its neighbours.
+        
+        Args:
+            chunks: Chunks to embed
+            api_key: HuggingFace API key
+        
+        Returns:
+            List aligned with chunks; None where no embedding was generated
+        """
+        if not self.hf_provider:
+            logger.warning(f"HuggingFace provider not available, storing {len(chunks)} chunks without embeddings")
+            return [None] * len(chunks)
+        
         try:
-            embeddings_generated = 0
-            embeddings_failed = 0
-            total_chunks = len(chunks)
-            
+            # Don't prepend instruction for documents/passages
+            result = await self.hf_provider.generate_embeddings(
+                chunks,
+                api_key=api_key,
+                prepend_instruction=False
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        if result["success"]:
+            return result["embeddings"]
+        
+        logger.warning(f"Batch embedding failed for {len(chunks)} chunks, retrying individually: {result.get('error')}")
+        
+        embeddings: List[Optional[List[float]]] = []
+        for i, chunk in enumerate(chunks):
+            embedding = None
+            try:
+                single = await self.hf_provider.generate_embedding(
+                    chunk,
+                    api_key=api_key,
+                    prepend_instruction=False
+                )
+                if single["success"]:
+                    embedding = single["embedding"]
+                else:
+                    logger.error(f"Failed to generate embedding for chunk {i}: {single.get('error')}")
+            except Exception as e:
+                logger.error(f"Exception generating embedding for chunk {i}: {str(e)}")
+            embeddings.append(embedding)
+        
+        return embeddings
+    
+    async def _store_chunks_with_embeddings(self, document_id: str, chunks: List[str], start_index: int = 0):
+        """
+        Store text chunks with embeddings
+        
+        Args:
+            document_id: Document ID
+            chunks: All text chunks of the document, in order
+            start_index: First chunk to store; earlier chunks were stored by a previous attempt
+        """
+        async def chunk_stream():
             for i, chunk in enumerate(chunks):
-                # Update progress every 5 chunks or on last chunk
-                if i % 5 == 0 or i == total_chunks - 1:
-                    progress = 50 + int((i / total_chunks) * 45)  # 50-95%
-                    self.supabase.table("documents").update({
-                        "processing_progress": progress,
-                        "processing_stage": f"Generating embeddings ({i+1}/{total_chunks})..."
-                    }).eq("id", document_id).execute()
+                yield chunk, (i + 1) / len(chunks)
+        
+        await self._store_chunk_stream(document_id, chunk_stream(), start_index=start_index, total_chunks=len(chunks))
+    
+    async def _store_chunk_stream(
+        self,
+        document_id: str,
+        chunk_stream: AsyncIterator[Tuple[str, float]],
+        start_index: int = 0,
+        total_chunks: Optional[int] = None
+    ):
+        """
+        Embed and store chunks as they are produced
+        
+        Chunks are grouped into batches of EMBEDDING_BATCH_SIZE with up to
+        EMBEDDING_MAX_CONCURRENCY batches in flight; when that many are in
+        flight the producer waits, which bounds memory and applies
+        backpressure to extraction. Rows are inserted strictly in chunk order
+        (in batches of CHUNK_INSERT_BATCH_SIZE), so the highest stored
+        chunk_index is always a safe resume point.
+        
+        Args:
+            document_id: Document ID
+            chunk_stream: Chunks in order, with extraction progress
+            start_index: First chunk to store; earlier chunks were stored by a previous attempt
+            total_chunks: Number of chunks if known up front (for progress)
+        """
+        api_key = os.getenv("HUGGINGFACE_API_KEY")
+        batch_size = max(1, EMBEDDING_BATCH_SIZE)
+        insert_size = max(1, CHUNK_INSERT_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(max(1, EMBEDDING_MAX_CONCURRENCY))
+        
+        in_flight: deque = deque()  # (first chunk index, chunks, task) in chunk order
+        batch: List[str] = []
+        batch_start = start_index
+        rows: List[Dict[str, Any]] = []
+        chunk_count = 0
+        embedded = 0
+        embeddings_generated = 0
+        fraction = 0.0
+        
+        if start_index:
+            logger.info(f"Resuming document {document_id} from chunk {start_index}")
+        
+        async def dispatch():
+            nonlocal batch, batch_start
+            # A slot is held until its batch is collected, so finished batches waiting
+            # behind a slow one still count; free slots by collecting the head
+            while semaphore.locked():
+                await asyncio.wait([in_flight[0][2]])
+                await collect(wait_all=False)
+            await semaphore.acquire()
+            in_flight.append((batch_start, batch, asyncio.create_task(self._embed_chunks(batch, api_key))))
+            batch_start += len(batch)
+            batch = []
+        
+        async def insert(batch_rows: List[Dict[str, Any]]):
+            first = batch_rows[0]["chunk_index"]
+            try:
+                await run_query(self.supabase.table("document_chunks").insert(batch_rows))
+            except Exception as insert_error:
+                logger.error(f"Failed to insert chunks {first}-{first + len(batch_rows) - 1}: {str(insert_error)}")
+                raise
+        
+        async def collect(wait_all: bool):
+            # Turn finished batches into rows, in chunk order, and insert full row batches
+            nonlocal rows, embedded, embeddings_generated
+            while in_flight and (wait_all or in_flight[0][2].done()):
+                first, chunks, task = in_flight.popleft()
+                try:
+                    embeddings = await task
+                finally:
+                    semaphore.release()
                 
-                # Generate embedding if HuggingFace provider is available
-                embedding = None
-                if self.hf_provider:
-                    try:
-                        # Get API key from environment (same as test script)
-                        import os
-                        api_key = os.getenv("HUGGINGFACE_API_KEY")
-                        
-                        # Don't prepend instruction for documents/passages
-                        result = await self.hf_provider.generate_embedding(
-                            chunk, 
-                            api_key=api_key,
-                            prepend_instruction=False
-                        )
-                        if result["success"]:
-                            embedding = result["embedding"]
-                            embeddings_generated += 1
-                            
-                            # Detect and store dimension on first successful embedding
-                            if self.embedding_dimension is None and embedding:
-                                self.embedding_dimension = len(embedding)
-                                logger.info(f"Detected embedding dimension: {self.embedding_dimension}")
-                            
-                            if i == 0:  # Log first embedding details
-                                logger.info(f"Generated embedding for chunk {i}, dimension: {len(embedding) if embedding else 0}")
-                        else:
-                            embeddings_failed += 1
-                            logger.error(f"Failed to generate embedding for chunk {i}: {result.get('error')}")
-                    except Exception as e:
-                        embeddings_failed += 1
-                        logger.error(f"Exception generating embedding for chunk {i}: {str(e)}")
-                else:
-                    logger.warning(f"HuggingFace provider not available for chunk {i}")
+                generated = sum(1 for embedding in embeddings if embedding)
+                first_embedding = next((embedding for embedding in embeddings if embedding), None)
+                if first_embedding and self.embedding_dimension is None:
+                    # Detect and store dimension on first successful embedding
+                    self.embedding_dimension = len(first_embedding)
+                    logger.info(f"Detected embedding dimension: {self.embedding_dimension}")
                 
-                # Format embedding as PostgreSQL vector string
-                embedding_str = None
-                embedding_part1_str = None
-                embedding_part2_str = None
-                embedding_part3_str = None
+                embedded += len(chunks)
+                embeddings_generated += generated
                 
-                if embedding:
-                    # Validate embedding dimension
-                    expected_dim = 4096
-                    actual_dim = len(embedding)
-                    
-                    if actual_dim != expected_dim:
-                        logger.error(f"Embedding dimension mismatch: expected {expected_dim}, got {actual_dim}")
-                        logger.error("This usually means the embedding model changed or API credits are depleted")
-                        # Don't store incompatible embeddings
-                        embedding = None
-                        embedding_str = None
-                    else:
-                        # Convert list to PostgreSQL vector format: [1,2,3]
-                        embedding_str = '[' + ','.join(str(x) for x in embedding) + ']'
-                        
-                        # Split into three parts for indexing (pgvector limit is 2000 dims)
-                        # Part 1: 1-1365, Part 2: 1366-2730, Part 3: 2731-4096
-                        part1 = embedding[:1365]
-                        part2 = embedding[1365:2730]
-                        part3 = embedding[2730:]
-                        embedding_part1_str = '[' + ','.join(str(x) for x in part1) + ']'
-                        embedding_part2_str = '[' + ','.join(str(x) for x in part2) + ']'
-                        embedding_part3_str = '[' + ','.join(str(x) for x in part3) + ']'
+                # Formatting 4096-dim vectors is CPU bound; keep it off the event loop
+                rows.extend(await asyncio.to_thread(self._build_chunk_rows, document_id, chunks, embeddings, first))
                 
-                chunk_data = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "content": chunk,
-                    "embedding": embedding_str,
-                    "embedding_part1": embedding_part1_str,
-                    "embedding_part2": embedding_part2_str,
-                    "embedding_part3": embedding_part3_str,
-                    "created_at": datetime.now().isoformat()
-                }
+                while len(rows) >= insert_size:
+                    await insert(rows[:insert_size])
+                    rows = rows[insert_size:]
                 
-                try:
-                    self.supabase.table("document_chunks").insert(chunk_data).execute()
-                except Exception as insert_error:
-                    logger.error(f"Failed to insert chunk {i}: {str(insert_error)}")
-                    raise
+                if total_chunks:
+                    done = start_index + embedded
+                    await run_sync(
+                        self._update_progress,
+                        document_id,
+                        50 + int((done / total_chunks) * 45),  # 50-95%
+                        f"Generating embeddings ({done}/{total_chunks})..."
+                    )
+                else:
+                    await run_sync(
+                        self._update_progress,
+                        document_id,
+                        10 + int(fraction * 85),  # 10-95%, follows extraction
+                        f"Extracting and embedding ({start_index + embedded} chunks)..."
+                    )
+        
+        try:
+            async for chunk, fraction in chunk_stream:
+                index = chunk_count
+                chunk_count += 1
+                if index < start_index:
+                    continue
+                
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    await dispatch()
+                await collect(wait_all=False)
+            
+            if batch:
+                await dispatch()
+            await collect(wait_all=True)
+            
+            if rows:
+                await insert(rows)
             
             # Final progress update
-            self.supabase.table("documents").update({
-                "processing_progress": 95,
-                "processing_stage": "Finalizing..."
-            }).eq("id", document_id).execute()
+            await run_sync(self._update_progress, document_id, 95, "Finalizing...", force=True)
+            
+            stored = max(0, chunk_count - start_index)
+            logger.info(f"Stored {stored} chunks for document {document_id}. Embeddings: {embeddings_generated} generated, {stored - embeddings_generated if self.hf_provider else 0} failed")
             
-            logger.info(f"Stored {len(chunks)} chunks for document {document_id}. Embeddings: {embeddings_generated} generated, {embeddings_failed} failed")
+            if start_index:
+                embeddings_generated += await run_sync(self._count_embedded_chunks, document_id, start_index)
             
             # Update document with embedding stats
-            self.supabase.table("documents").update({
-                "total_chunks": len(chunks),
+            await run_query(self.supabase.table("documents").update({
+                "total_chunks": chunk_count,
                 "chunks_with_embeddings": embeddings_generated
-            }).eq("id", document_id).execute()
+            }).eq("id", document_id))
             
         except Exception as e:
+            for _, _, task in in_flight:
+                task.cancel()
             logger.error(f"Failed to store chunks: {str(e)}", exc_info=True)
             raise
+        finally:
+            self._last_progress_write.pop(document_id, None)
+    
+    def _build_chunk_rows(
+        self,
+        document_id: str,
+        chunks: List[str],
+        embeddings: List[Optional[List[float]]],
+        start_index: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Build document_chunks rows with embeddings formatted as pgvector literals
+        
+        Args:
+            document_id: Document ID
+            chunks: Text chunks in order
+            embeddings: Embeddings aligned with chunks (None where missing)
+            start_index: chunk_index of the first chunk
+        
+        Returns:
+            List of rows ready to insert
+        """
+        rows = []
+        expected_dim = 4096
+        
+        for i, chunk in enumerate(chunks):
+            embedding = embeddings[i]
+            
+            embedding_str = None
+            embedding_part1_str = None
+            embedding_part2_str = None
+            embedding_part3_str = None
+            
+            if embedding:
+                # Validate embedding dimension
+                actual_dim = len(embedding)
+                
+                if actual_dim != expected_dim:
+                    logger.error(f"Embedding dimension mismatch: expected {expected_dim}, got {actual_dim}")
+                    logger.error("This usually means the embedding model changed or API credits are depleted")
+                    # Don't store incompatible embeddings
+                else:
+                    # Full vector plus three parts for indexing (pgvector limit is 2000 dims)
+                    embedding_str, embedding_part1_str, embedding_part2_str, embedding_part3_str = \
+                        format_embedding_parts(embedding)
+            
+            rows.append({
+                "document_id": document_id,
+                "chunk_index": start_index + i,
+                "content": chunk,
+                "embedding": embedding_str,
+                "embedding_part1": embedding_part1_str,
+                "embedding_part2": embedding_part2_str,
+                "embedding_part3": embedding_part3_str,
+                "created_at": datetime.now().isoformat()
+            })
+        
+        return rows
+    
+    def get_resume_index(self, document_id: str) -> int:
+        """
+        Get the chunk index processing should resume from
+        
+        Args:
+            document_id: Document ID
+        
+        Returns:
+            One past the highest stored chunk_index (0 if nothing is stored)
+        """
+        result = self.supabase.table("document_chunks")\
+            .select("chunk_index")\
+            .eq("document_id", document_id)\
+            .order("chunk_index", desc=True)\
+            .limit(1)\
+            .execute()
+        
+        if result.data:
+            return int(result.data[0]["chunk_index"]) + 1
+        return 0
+    
+    def _count_embedded_chunks(self, document_id: str, before_index: int) -> int:
+        """Count stored chunks with embeddings below a chunk index (from earlier attempts)"""
+        try:
+            result = self.supabase.table("document_chunks")\
+                .select("id", count="exact")\
+                .eq("document_id", document_id)\
+                .lt("chunk_index", before_index)\
+                .not_.is_("embedding", "null")\
+                .execute()
+            return result.count or 0
+        except Exception as e:
+            logger.warning(f"Failed to count embedded chunks for document {document_id}: {str(e)}")
+            return 0
+    
+    def _update_progress(self, document_id: str, progress: int, stage: str, force: bool = False):
+        """
+        Write processing progress, throttled by wall-clock time
+        
+        Updates within PROGRESS_UPDATE_INTERVAL_SECONDS of the previous write
+        for the same document are skipped unless forced. Progress is
+        best-effort, so write errors are logged and ignored.
+        
+        Args:
+            document_id: Document ID
+            progress: Progress percentage
+            stage: Human readable processing stage
+            force: Write even if the interval hasn't elapsed
+        """
+        now = time.monotonic()
+        last_write = self._last_progress_write.get(document_id)
+        
+        if not force and last_write is not None and now - last_write < PROGRESS_UPDATE_INTERVAL_SECONDS:
+            return
+        
+        self._last_progress_write[document_id] = now
+        
+        try:
+            self.supabase.table("documents").update({
+                "processing_progress": progress,
+                "processing_stage": stage
+            }).eq("id", document_id).execute()
+        except Exception as e:
+            logger.warning(f"Failed to update progress for document {document_id}: {str(e)}")
     
     async def get_user_documents(self, user_id: str, feature: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get user's documents, optionally filtered by feature"""
@@ -566,7 +837,7 @@ class DocumentService:
             if feature:
                 query = query.eq("feature", feature)
             
-            result = query.execute()
+            result = await run_query(query)
             return result.data or []
             
         except Exception as e:
@@ -579,13 +850,13 @@ class DocumentService:
             logger.info(f"Attempting to delete document {document_id} for user {user_id}")
             
             # Get document with better error handling
-            doc_result = self.supabase.table("documents").select("*").eq("id", document_id).eq("user_id", user_id).execute()
+            doc_result = await run_query(self.supabase.table("documents").select("*").eq("id", document_id).eq("user_id", user_id))
             
             logger.info(f"Query result: {len(doc_result.data) if doc_result.data else 0} documents found")
             
             if not doc_result.data or len(doc_result.data) == 0:
                 # Check if document exists but belongs to different user
-                any_doc = self.supabase.table("documents").select("id, user_id").eq("id", document_id).execute()
+                any_doc = await run_query(self.supabase.table("documents").select("id, user_id").eq("id", document_id))
                 if any_doc.data and len(any_doc.data) > 0:
                     actual_user_id = any_doc.data[0].get("user_id")
                     logger.error(f"Access denied: Document {document_id} belongs to user {actual_user_id}, requested by user {user_id}")
@@ -594,7 +865,7 @@ class DocumentService:
                     logger.info(f"Document {document_id} not found in database (already deleted or never existed)")
                     # Try to clean up orphaned chunks silently
                     try:
-                        chunks_deleted = self.supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
+                        chunks_deleted = await run_query(self.supabase.table("document_chunks").delete().eq("document_id", document_id))
                         if chunks_deleted.data:
                             logger.info(f"Cleaned up {len(chunks_deleted.data)} orphaned chunks for {document_id}")
                     except Exception as cleanup_err:
@@ -610,21 +881,21 @@ class DocumentService:
             try:
                 storage_path = document.get("storage_path")
                 if storage_path:
-                    self.supabase.storage.from_(self.storage_bucket).remove([storage_path])
+                    await run_sync(self.supabase.storage.from_(self.storage_bucket).remove, [storage_path])
                     logger.info(f"Deleted storage file: {storage_path}")
             except Exception as e:
                 logger.warning(f"Failed to delete from storage: {str(e)}")
             
             # Delete chunks
             try:
-                chunks_result = self.supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
+                chunks_result = await run_query(self.supabase.table("document_chunks").delete().eq("document_id", document_id))
                 logger.info(f"Deleted chunks for document {document_id}")
             except Exception as e:
                 logger.warning(f"Failed to delete chunks: {str(e)}")
             
             # Delete document record
             try:
-                self.supabase.table("documents").delete().eq("id", document_id).execute()
+                await run_query(self.supabase.table("documents").delete().eq("id", document_id))
                 logger.info(f"Deleted document record {document_id}")
             except Exception as e:
                 logger.error(f"Failed to delete document record: {str(e)}")
@@ -667,7 +938,7 @@ class DocumentService:
             if document_id:
                 docs_query = docs_query.eq("id", document_id)
             
-            docs_result = docs_query.execute()
+            docs_result = await run_query(docs_query)
             
             if not docs_result.data:
                 logger.warning(f"No documents found for user {user_id}, feature: {feature}")
@@ -709,18 +980,18 @@ class DocumentService:
                         logger.info(f"Generated query embedding, dimension: {len(query_embedding)}")
                         
                         # Format as PostgreSQL vector string
-                        query_embedding_str = '[' + ','.join(str(x) for x in query_embedding) + ']'
+                        query_embedding_str = format_vector(query_embedding)
                         
                         # Use pgvector similarity search
                         try:
-                            chunks_result = self.supabase.rpc(
+                            chunks_result = await run_query(self.supabase.rpc(
                                 'match_document_chunks',
                                 {
                                     'query_embedding': query_embedding_str,
                                     'match_count': top_k,
                                     'filter_doc_ids': doc_ids
                                 }
-                            ).execute()
+                            ))
                             
                             if chunks_result.data and len(chunks_result.data) > 0:
                                 logger.info(f"Vector search returned {len(chunks_result.data)} results")
@@ -740,7 +1011,7 @@ class DocumentService:
             
             # Fallback to simple text search
             logger.info(f"Performing text search for query: {query[:50]}...")
-            chunks_result = self.supabase.table("document_chunks").select("*, documents(filename)").in_("document_id", doc_ids).ilike("content", f"%{query}%").limit(top_k).execute()
+            chunks_result = await run_query(self.supabase.table("document_chunks").select("*, documents(filename)").in_("document_id", doc_ids).ilike("content", f"%{query}%").limit(top_k))
             
             # Log RAG usage for monitoring
             results = chunks_result.data or []
@@ -766,7 +1037,7 @@ class DocumentService:
                 "results_count": results_count
             }
             
-            self.supabase.table("rag_usage_logs").insert(log_data).execute()
+            await run_query(self.supabase.table("rag_usage_logs").insert(log_data))
         except Exception as e:
             logger.error(f"Failed to log RAG usage: {str(e)}")
     
@@ -774,7 +1045,7 @@ class DocumentService:
         """Delete expired documents (run as scheduled job)"""
         try:
             now = datetime.now().isoformat()
-            expired = self.supabase.table("documents").select("*").lt("expires_at", now).execute()
+            expired = await run_query(self.supabase.table("documents").select("*").lt("expires_at", now))
             
             for doc in expired.data or []:
                 await self.delete_document(doc["user_id"], doc["id"])
@@ -785,6 +1056,13 @@ class DocumentService:
             logger.error(f"Cleanup failed: {str(e)}")
 
 
+# Singleton instance
+_document_service = None
+
+
 def get_document_service(supabase: Client) -> DocumentService:
-    """Factory function to get document service instance"""
-    return DocumentService(supabase)
+    """Get or create the document service instance bound to a Supabase client"""
+    global _document_service
+    if _document_service is None or _document_service.supabase is not supabase:
+        _document_service = DocumentService(supabase)
+    return _document_service
@@ -0,0 +1,159 @@
+"""
+Embedding Cache
+Content-hash cache for Hugging Face embeddings
+
+Entries are keyed by (model, instruction flag, sha256 of text), so the same
+lecture PDF uploaded by different users and repeated RAG queries reuse one
+embedding. Lookups go through an in-memory LRU tier first and then an
+optional on-disk SQLite tier (memory-mapped reads) that survives restarts;
+see TwoTierCache for how the disk tier is kept off the event loop.
+"""
+import os
+import hashlib
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from services.two_tier_cache import TwoTierCache
+
+load_dotenv()
+
+
+# Cache configuration
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2000"))
+# SQLite file for the disk tier; leave empty for memory-only caching
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MMAP_BYTES = int(os.getenv("EMBEDDING_CACHE_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+
+class EmbeddingCache(TwoTierCache):
+    """Two-tier (LRU memory + SQLite disk) cache of embeddings by content hash"""
+
+    table = "embeddings"
+    columns = (("model", "TEXT"), ("dimension", "INTEGER"), ("vector", "BLOB"), ("created_at", "REAL"))
+    label = "Embedding cache"
+
+    def __init__(self, memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE, db_path: Optional[str] = EMBEDDING_CACHE_PATH):
+        """
+        Initialize the embedding cache
+
+        Args:
+            memory_size: Maximum embeddings kept in the memory tier
+            db_path: SQLite file for the disk tier, or None/empty to disable it
+        """
+        super().__init__(memory_size, db_path, mmap_bytes=EMBEDDING_CACHE_MMAP_BYTES)
+
+    @staticmethod
+    def make_key(model: str, prepend_instruction: bool, text: str) -> str:
+        """
+        Build the cache key for a text
+
+        Args:
+            model: Embedding model name
+            prepend_instruction: Whether the query instruction is applied
+            text: Text being embedded
+
+        Returns:
+            Cache key string
+        """
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{int(bool(prepend_instruction))}:{digest}"
+
+    async def get(self, model: str, prepend_instruction: bool, text: str) -> Optional[List[float]]:
+        """
+        Look up a cached embedding
+
+        Args:
+            model: Embedding model name
+            prepend_instruction: Whether the query instruction is applied
+            text: Text being embedded
+
+        Returns:
+            Embedding, or None on a miss
+        """
+        return (await self.get_many(model, prepend_instruction, [text]))[0]
+
+    async def get_many(self, model: str, prepend_instruction: bool, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings for several texts (one disk read for all memory misses)
+
+        Args:
+            model: Embedding model name
+            prepend_instruction: Whether the query instruction is applied
+            texts: Texts being embedded
+
+        Returns:
+            Embeddings in text order, None for misses
+        """
+        keys = [self.make_key(model, prepend_instruction, text) for text in texts]
+        embeddings: List[Optional[List[float]]] = [None] * len(keys)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    embeddings[i] = embedding
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        rows = await self._read_disk(list(missing))
+
+        with self._lock:
+            for key, row in rows.items():
+                embedding = np.frombuffer(row[3], dtype=np.float32).tolist()
+                self._remember(key, embedding)
+                for i in missing.pop(key):
+                    embeddings[i] = embedding
+                    self.disk_hits += 1
+
+            self.misses += sum(len(indexes) for indexes in missing.values())
+        return embeddings
+
+    def put(self, model: str, prepend_instruction: bool, text: str, embedding: List[float]) -> None:
+        """
+        Store an embedding in both tiers (the disk write is batched on the cache thread)
+
+        Args:
+            model: Embedding model name
+            prepend_instruction: Whether the query instruction is applied
+            text: Text that was embedded
+            embedding: Embedding values
+        """
+        key = self.make_key(model, prepend_instruction, text)
+
+        with self._lock:
+            self._remember(key, embedding)
+
+        if self._executor is not None:
+            vector = np.asarray(embedding, dtype=np.float32).tobytes()
+            self._queue_write((key, model, len(embedding), vector, time.time()))
+
+
+# Singleton instance
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Get or create singleton embedding cache (None when caching is disabled)"""
+    global _embedding_cache
+
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+
+    return _embedding_cache
+
+
+def shutdown_embedding_cache() -> None:
+    """Commit pending disk writes and stop the cache thread (called on application shutdown)"""
+    global _embedding_cache
+
+    cache, _embedding_cache = _embedding_cache, None
+    if cache is not None:
+        cache.close()
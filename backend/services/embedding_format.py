@@ -0,0 +1,90 @@
+"""
+Embedding Serialization
+Fast conversion of embeddings to pgvector text literals
+
+Embeddings are stored as the full vector plus three partial vectors used
+for indexing (pgvector indexes are limited to 2000 dimensions). The values
+are formatted once from a float32 NumPy buffer and the partial vectors are
+sliced from the same formatted values instead of being formatted again.
+"""
+import os
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Dimensions per partial vector: 1-1365, 1366-2730, 2731-4096
+EMBEDDING_PART_SIZE = 1365
+
+# Significant digits that round-trip any float32 value
+FLOAT32_DIGITS = 9
+
+# Significant digits written per value; unset keeps full float32 precision
+_precision = os.getenv("EMBEDDING_TEXT_PRECISION")
+EMBEDDING_TEXT_PRECISION: Optional[int] = int(_precision) if _precision else None
+
+
+def _format_values(embedding: Sequence[float], precision: Optional[int]) -> List[str]:
+    """
+    Format every value of an embedding exactly once
+
+    Args:
+        embedding: Embedding values (list or array)
+        precision: Significant digits, or None for full float32 precision
+
+    Returns:
+        List of formatted values as strings
+    """
+    # Round-trip through float32 once; pgvector stores float4 anyway
+    values = np.asarray(embedding, dtype=np.float32).ravel().tolist()
+
+    # 9 significant digits are enough to restore any float32 exactly
+    template = f"%.{precision or FLOAT32_DIGITS}g"
+
+    return list(map(template.__mod__, values))
+
+
+def format_vector(embedding: Sequence[float], precision: Optional[int] = EMBEDDING_TEXT_PRECISION) -> str:
+    """
+    Format an embedding as a pgvector literal: [1,2,3]
+
+    Args:
+        embedding: Embedding values (list or array)
+        precision: Significant digits, or None for full float32 precision
+
+    Returns:
+        pgvector text literal
+    """
+    return '[' + ','.join(_format_values(embedding, precision)) + ']'
+
+
+def format_embedding_parts(
+    embedding: Sequence[float],
+    precision: Optional[int] = EMBEDDING_TEXT_PRECISION,
+    part_size: int = EMBEDDING_PART_SIZE
+) -> Tuple[str, str, str, str]:
+    """
+    Format an embedding and its three partial vectors as pgvector literals
+
+    The full vector is assembled from the three formatted parts, so each
+    value is converted to text only once.
+
+    Args:
+        embedding: Embedding values (list or array)
+        precision: Significant digits, or None for full float32 precision
+        part_size: Dimensions in the first and second parts
+
+    Returns:
+        Tuple of (full, part1, part2, part3) pgvector literals
+    """
+    tokens = _format_values(embedding, precision)
+
+    part1 = ','.join(tokens[:part_size])
+    part2 = ','.join(tokens[part_size:2 * part_size])
+    part3 = ','.join(tokens[2 * part_size:])
+
+    full = '[' + ','.join(part for part in (part1, part2, part3) if part) + ']'
+
+    return full, '[' + part1 + ']', '[' + part2 + ']', '[' + part3 + ']'
@@ -8,6 +8,7 @@ from typing import List, Dict, Any, Optional
 from supabase import Client
 import logging
 import json
+from services.db_executor import run_query
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +57,7 @@ class EnhancedStudyPlannerService:
                 "recurrence_pattern": recurrence_pattern
             }
             
-            response = self.supabase.table("study_plan_entries").insert(entry_data).execute()
+            response = await run_query(self.supabase.table("study_plan_entries").insert(entry_data))
             
             if not response.data:
                 raise Exception("Failed to create study plan entry")
@@ -93,7 +94,7 @@ class EnhancedStudyPlannerService:
                 query = query.eq("study_type", study_type)
             
             query = query.order("scheduled_date").order("start_time")
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data or []
             
@@ -146,12 +147,12 @@ class EnhancedStudyPlannerService:
         """Update a study plan entry"""
         try:
             # Verify ownership
-            existing = self.supabase.table("study_plan_entries").select("*").eq("id", entry_id).eq("user_id", user_id).execute()
+            existing = await run_query(self.supabase.table("study_plan_entries").select("*").eq("id", entry_id).eq("user_id", user_id))
             
             if not existing.data:
                 raise Exception("Entry not found or access denied")
             
-            response = self.supabase.table("study_plan_entries").update(updates).eq("id", entry_id).execute()
+            response = await run_query(self.supabase.table("study_plan_entries").update(updates).eq("id", entry_id))
             
             if not response.data:
                 raise Exception("Failed to update entry")
@@ -227,7 +228,7 @@ class EnhancedStudyPlannerService:
     async def delete_plan_entry(self, user_id: str, entry_id: str) -> bool:
         """Delete a study plan entry"""
         try:
-            response = self.supabase.table("study_plan_entries").delete().eq("id", entry_id).eq("user_id", user_id).execute()
+            response = await run_query(self.supabase.table("study_plan_entries").delete().eq("id", entry_id).eq("user_id", user_id))
             return True
         except Exception as e:
             logger.error(f"Failed to delete plan entry: {str(e)}")
@@ -245,7 +246,7 @@ class EnhancedStudyPlannerService:
         """Reschedule a study plan entry to a new date/time"""
         try:
             # Get original entry
-            existing = self.supabase.table("study_plan_entries").select("*").eq("id", entry_id).eq("user_id", user_id).execute()
+            existing = await run_query(self.supabase.table("study_plan_entries").select("*").eq("id", entry_id).eq("user_id", user_id))
             
             if not existing.data:
                 raise Exception("Entry not found or access denied")
@@ -299,7 +300,7 @@ class EnhancedStudyPlannerService:
                 "end_date": end_date
             }
             
-            response = self.supabase.table("study_goals").insert(goal_data).execute()
+            response = await run_query(self.supabase.table("study_goals").insert(goal_data))
             
             if not response.data:
                 raise Exception("Failed to create goal")
@@ -323,7 +324,7 @@ class EnhancedStudyPlannerService:
                 query = query.eq("status", status)
             
             query = query.order("end_date", desc=False)
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data or []
             
@@ -334,7 +335,7 @@ class EnhancedStudyPlannerService:
     async def update_goal(self, user_id: str, goal_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update a study goal"""
         try:
-            response = self.supabase.table("study_goals").update(updates).eq("id", goal_id).eq("user_id", user_id).execute()
+            response = await run_query(self.supabase.table("study_goals").update(updates).eq("id", goal_id).eq("user_id", user_id))
             
             if not response.data:
                 raise Exception("Goal not found or access denied")
@@ -347,7 +348,7 @@ class EnhancedStudyPlannerService:
     async def delete_goal(self, user_id: str, goal_id: str) -> bool:
         """Delete a study goal"""
         try:
-            self.supabase.table("study_goals").delete().eq("id", goal_id).eq("user_id", user_id).execute()
+            await run_query(self.supabase.table("study_goals").delete().eq("id", goal_id).eq("user_id", user_id))
             return True
         except Exception as e:
             logger.error(f"Failed to delete goal: {str(e)}")
@@ -373,7 +374,7 @@ class EnhancedStudyPlannerService:
                 query = query.lte("metric_date", end_date)
             
             query = query.order("metric_date", desc=True)
-            response = query.execute()
+            response = await run_query(query)
             
             return response.data or []
             
@@ -473,7 +474,7 @@ class EnhancedStudyPlannerService:
     async def get_streak(self, user_id: str) -> Dict[str, Any]:
         """Get user's current streak data"""
         try:
-            response = self.supabase.table("study_streaks").select("*").eq("user_id", user_id).execute()
+            response = await run_query(self.supabase.table("study_streaks").select("*").eq("user_id", user_id))
             
             if response.data:
                 return response.data[0]
@@ -487,7 +488,7 @@ class EnhancedStudyPlannerService:
                 "days_studied_this_month": 0
             }
             
-            create_response = self.supabase.table("study_streaks").insert(new_streak).execute()
+            create_response = await run_query(self.supabase.table("study_streaks").insert(new_streak))
             return create_response.data[0] if create_response.data else new_streak
             
         except Exception as e:
@@ -523,7 +524,7 @@ class EnhancedStudyPlannerService:
                 "days_studied_this_month": min(streak.get("days_studied_this_month", 0) + 1, 31)
             }
             
-            response = self.supabase.table("study_streaks").update(updates).eq("user_id", user_id).execute()
+            response = await run_query(self.supabase.table("study_streaks").update(updates).eq("user_id", user_id))
             return response.data[0] if response.data else streak
             
         except Exception as e:
@@ -677,7 +678,7 @@ class EnhancedStudyPlannerService:
         try:
             today = date.today().isoformat()
             
-            response = self.supabase.table("performance_metrics").select("*").eq("user_id", user_id).eq("metric_date", today).execute()
+            response = await run_query(self.supabase.table("performance_metrics").select("*").eq("user_id", user_id).eq("metric_date", today))
             
             # Calculate duration
             duration = 0
@@ -703,7 +704,7 @@ class EnhancedStudyPlannerService:
                     new_accuracy = completed_entry["accuracy_percentage"]
                     updates["average_accuracy"] = ((old_avg * old_count) + new_accuracy) / (old_count + 1)
                 
-                self.supabase.table("performance_metrics").update(updates).eq("id", metrics["id"]).execute()
+                await run_query(self.supabase.table("performance_metrics").update(updates).eq("id", metrics["id"]))
             else:
                 new_metrics = {
                     "user_id": user_id,
@@ -714,7 +715,7 @@ class EnhancedStudyPlannerService:
                     "average_accuracy": completed_entry.get("accuracy_percentage"),
                     "topics_covered": [completed_entry.get("subject")] if completed_entry.get("subject") else []
                 }
-                self.supabase.table("performance_metrics").insert(new_metrics).execute()
+                await run_query(self.supabase.table("performance_metrics").insert(new_metrics))
                 
         except Exception as e:
             logger.error(f"Failed to update performance metrics: {str(e)}")
@@ -744,7 +745,7 @@ class EnhancedStudyPlannerService:
                     "recurrence_pattern": pattern,
                     "parent_entry_id": parent_entry["id"]
                 }
-                self.supabase.table("study_plan_entries").insert(entry_data).execute()
+                await run_query(self.supabase.table("study_plan_entries").insert(entry_data))
         except Exception as e:
             logger.error(f"Failed to create recurring entries: {str(e)}")
 
@@ -5,9 +5,11 @@ Requirements: Provider monitoring, fallback readiness
 """
 import asyncio
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone
 from supabase import Client
+from services.key_registry import invalidate_key_registry
+from services.db_executor import run_query
 import os
 from dotenv import load_dotenv
 
@@ -40,10 +42,11 @@ class HealthCheckScheduler:
         
         try:
             # Get all active API keys
-            response = self.supabase.table("api_keys")\
-                .select("*")\
-                .eq("status", "active")\
-                .execute()
+            response = await run_query(
+                self.supabase.table("api_keys")
+                .select("*")
+                .eq("status", "active")
+            )
             
             keys = response.data if response.data else []
             
@@ -97,19 +100,23 @@ class HealthCheckScheduler:
                             current_failures = key_data.get("failure_count", 0)
                             new_failures = current_failures + 1
                             
-                            self.supabase.table("api_keys")\
-                                .update({"failure_count": new_failures})\
-                                .eq("id", key_id)\
-                                .execute()
+                            await run_query(
+                                self.supabase.table("api_keys")
+                                .update({"failure_count": new_failures})
+                                .eq("id", key_id)
+                            )
                             
                             # Mark as degraded if threshold exceeded
                             if new_failures >= 3:
                                 logger.warning(f"Key {key_id} marked as degraded after {new_failures} failures")
                                 
-                                self.supabase.table("api_keys")\
-                                    .update({"status": "degraded"})\
-                                    .eq("id", key_id)\
-                                    .execute()
+                                await run_query(
+                                    self.supabase.table("api_keys")
+                                    .update({"status": "degraded"})
+                                    .eq("id", key_id)
+                                )
+                                
+                                invalidate_key_registry(feature)
                                 
                                 # Send notification
                                 try:
@@ -123,10 +130,11 @@ class HealthCheckScheduler:
                                     logger.error(f"Failed to send notification: {str(notif_error)}")
                         else:
                             # Reset failure count on success
-                            self.supabase.table("api_keys")\
-                                .update({"failure_count": 0})\
-                                .eq("id", key_id)\
-                                .execute()
+                            await run_query(
+                                self.supabase.table("api_keys")
+                                .update({"failure_count": 0})
+                                .eq("id", key_id)
+                            )
                     
                 except Exception as e:
                     logger.error(f"Health check failed for key {key_id}: {str(e)}")
@@ -250,13 +258,13 @@ class HealthCheckScheduler:
         
         # Store results in database (optional)
         try:
-            self.supabase.table("health_check_logs").insert({
+            await run_query(self.supabase.table("health_check_logs").insert({
                 "timestamp": summary["timestamp"],
                 "total_checks": total_checks,
                 "successful": successful_checks,
                 "failed": failed_checks,
                 "results": summary
-            }).execute()
+            }))
         except Exception as e:
             logger.warning(f"Failed to store health check results: {str(e)}")
         
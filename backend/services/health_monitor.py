@@ -8,6 +8,9 @@ from datetime import datetime
 from typing import Dict, Optional, Any
 from supabase import Client
 from services.notifications import get_notification_service
+from services.key_registry import invalidate_key_registry
+from services.circuit_breaker import get_circuit_breaker_registry
+from services.db_executor import run_query
 
 
 # Failure threshold before marking key as degraded
@@ -166,10 +169,11 @@ class HealthMonitorService:
             Dict with updated failure information
         """
         # Get current failure count
-        result = self.supabase.table("api_keys") \
-            .select("failure_count") \
-            .eq("id", key_id) \
-            .execute()
+        result = await run_query(
+            self.supabase.table("api_keys")
+            .select("failure_count")
+            .eq("id", key_id)
+        )
         
         if not result.data:
             raise ValueError(f"API key not found: {key_id}")
@@ -178,10 +182,14 @@ class HealthMonitorService:
         new_failure_count = current_failures + 1
         
         # Update failure count
-        self.supabase.table("api_keys") \
-            .update({"failure_count": new_failure_count}) \
-            .eq("id", key_id) \
-            .execute()
+        await run_query(
+            self.supabase.table("api_keys")
+            .update({"failure_count": new_failure_count})
+            .eq("id", key_id)
+        )
+        
+        # Failed checks count towards the key's circuit like failed requests
+        get_circuit_breaker_registry(self.supabase).record(key_id, False)
         
         # Log health check failure
         health_record = {
@@ -193,9 +201,10 @@ class HealthMonitorService:
             "quota_remaining": None
         }
         
-        self.supabase.table("provider_health") \
-            .insert(health_record) \
-            .execute()
+        await run_query(
+            self.supabase.table("provider_health")
+            .insert(health_record)
+        )
         
         # Send notification about API key failure (Requirement 18.1)
         try:
@@ -232,14 +241,17 @@ class HealthMonitorService:
             Dict with updated key information
         """
         # Update key status to degraded
-        result = self.supabase.table("api_keys") \
-            .update({"status": "degraded"}) \
-            .eq("id", key_id) \
-            .execute()
+        result = await run_query(
+            self.supabase.table("api_keys")
+            .update({"status": "degraded"})
+            .eq("id", key_id)
+        )
         
         if not result.data:
             raise ValueError(f"API key not found: {key_id}")
         
+        invalidate_key_registry()
+        
         return {
             "key_id": key_id,
             "status": "degraded",
@@ -262,12 +274,13 @@ class HealthMonitorService:
             Dict with provider status information
         """
         # Get all keys for this provider/feature
-        keys_result = self.supabase.table("api_keys") \
-            .select("id, status, failure_count, priority") \
-            .eq("provider", provider) \
-            .eq("feature", feature) \
-            .order("priority", desc=True) \
-            .execute()
+        keys_result = await run_query(
+            self.supabase.table("api_keys")
+            .select("id, status, failure_count, priority")
+            .eq("provider", provider)
+            .eq("feature", feature)
+            .order("priority", desc=True)
+        )
         
         if not keys_result.data:
             return {
@@ -294,12 +307,13 @@ class HealthMonitorService:
             overall_status = "failed"
         
         # Get recent health checks
-        recent_checks = self.supabase.table("provider_health") \
-            .select("*") \
-            .in_("api_key_id", [k["id"] for k in keys_result.data]) \
-            .order("checked_at", desc=True) \
-            .limit(10) \
-            .execute()
+        recent_checks = await run_query(
+            self.supabase.table("provider_health")
+            .select("*")
+            .in_("api_key_id", [k["id"] for k in keys_result.data])
+            .order("checked_at", desc=True)
+            .limit(10)
+        )
         
         return {
             "provider": provider,
@@ -342,9 +356,10 @@ class HealthMonitorService:
             "quota_remaining": quota_remaining
         }
         
-        result = self.supabase.table("provider_health") \
-            .insert(health_record) \
-            .execute()
+        result = await run_query(
+            self.supabase.table("provider_health")
+            .insert(health_record)
+        )
         
         return result.data[0] if result.data else health_record
 
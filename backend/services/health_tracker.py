@@ -7,6 +7,10 @@ import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 from supabase import Client
+from services.key_registry import get_key_registry
+from services.circuit_breaker import get_circuit_breaker_registry
+from services.provider_scoring import get_provider_scorer
+from services.db_executor import run_query, run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -87,49 +91,45 @@ class HealthTrackerService:
             feature: Feature name (chat, mcq, etc.)
             
         Returns:
-            List of keys with health info, sorted by priority DESC
+            List of keys with health info and routing score inputs, best
+            routing score first (see ProviderScorer.rank)
         """
         try:
-            # Query ALL providers for this feature
-            response = self.supabase.table("api_keys") \
-                .select("*") \
-                .eq("feature", feature) \
-                .eq("status", "active") \
-                .order("priority", desc=True) \
-                .execute()
+            # Active keys for ALL providers, served from the in-process registry
+            active_keys = await run_sync(get_key_registry(self.supabase).get_active_keys, feature)
             
-            if not response.data:
+            if not active_keys:
                 logger.warning(f"No active keys found for feature: {feature}")
                 return []
             
-            # Calculate health for each key
+            # Skip keys whose circuit is open and cooling down. Listing doesn't take
+            # the half-open probe: the router claims it right before trying the key
+            breakers = get_circuit_breaker_registry(self.supabase)
             healthy_keys = []
-            for key in response.data:
-                health = self.calculate_health(key)
+            for key in active_keys:
+                breaker = breakers.get(key["id"], key)
+                if not breaker.is_available():
+                    continue
                 
-                # Only include healthy or recovering keys
-                if health in ['healthy', 'recovering']:
-                    from services.encryption import decrypt_key
-                    
-                    try:
-                        decrypted_key = decrypt_key(key["key_value"])
-                        
-                        healthy_keys.append({
-                            "id": key["id"],
-                            "provider": key["provider"],
-                            "feature": key["feature"],
-                            "key_value": decrypted_key,
-                            "priority": key["priority"],
-                            "status": key["status"],
-                            "health_status": health,
-                            "health_score": self.health_score(key),
-                            "recent_attempts": key.get("recent_attempts", 0),
-                            "recent_successes": key.get("recent_successes", 0),
-                            "recent_failures": key.get("recent_failures", 0)
-                        })
-                    except Exception as decrypt_error:
-                        logger.error(f"Failed to decrypt key {key['id']}: {decrypt_error}")
-                        continue
+                # Until this process has seen calls, fall back to the persisted stats
+                has_window = breaker.calls > 0
+                healthy_keys.append({
+                    "id": key["id"],
+                    "provider": key["provider"],
+                    "feature": key["feature"],
+                    "key_value": key["key_value"],  # Already decrypted by the registry
+                    "priority": key["priority"],
+                    "status": key["status"],
+                    "health_status": breaker.health_status() if has_window else self.calculate_health(key),
+                    "health_score": breaker.health_score() if has_window else self.health_score(key),
+                    "circuit_state": breaker.state,
+                    "recent_attempts": breaker.calls if has_window else key.get("recent_attempts", 0),
+                    "recent_successes": breaker.calls - breaker.failures if has_window else key.get("recent_successes", 0),
+                    "recent_failures": breaker.failures if has_window else key.get("recent_failures", 0)
+                })
+            
+            # Rank by priority, observed latency/error rate and cost, weighted per feature
+            healthy_keys = get_provider_scorer(self.supabase).rank(healthy_keys, feature)
             
             logger.info(
                 f"Found {len(healthy_keys)} healthy keys for feature '{feature}' "
@@ -145,23 +145,27 @@ class HealthTrackerService:
     async def select_best_provider(
         self,
         feature: str,
-        session_preference: Optional[str] = None
+        session_preference: Optional[str] = None,
+        healthy_keys: Optional[List[Dict[str, Any]]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Select best API provider considering:
         1. Session cache preference
         2. Global health status
-        3. Priority ranking
+        3. Routing score (priority, latency, error rate and cost)
         
         Args:
             feature: Feature name
             session_preference: Optional provider name from session cache
+            healthy_keys: Optional result of get_all_healthy_keys_for_feature
+                          already fetched by the caller
             
         Returns:
             Best key dict or None if no keys available
         """
         # Get ALL healthy keys for this feature (all providers)
-        healthy_keys = await self.get_all_healthy_keys_for_feature(feature)
+        if healthy_keys is None:
+            healthy_keys = await self.get_all_healthy_keys_for_feature(feature)
         
         if not healthy_keys:
             logger.error(f"No healthy keys available for feature: {feature}")
@@ -188,12 +192,13 @@ class HealthTrackerService:
                     return preferred[0]
         
         # No preference or preference not healthy
-        # Select highest priority healthy key
+        # Select the best ranked healthy key
         if healthy_keys:
-            best_key = healthy_keys[0]  # Already sorted by priority
+            best_key = healthy_keys[0]  # Already sorted by routing score
             logger.info(
                 f"Selected provider '{best_key['provider']}' for feature '{feature}' "
-                f"(priority: {best_key['priority']}, health: {best_key['health_score']:.2f})"
+                f"(priority: {best_key['priority']}, health: {best_key['health_score']:.2f}, "
+                f"score: {best_key.get('routing_score', 1.0):.2f})"
             )
             return best_key
         
@@ -208,61 +213,22 @@ class HealthTrackerService:
         """
         Update health tracking stats for an API key
         
+        Outcomes go to the key's in-memory circuit breaker; the breaker
+        registry persists them to api_keys in the background.
+        
         Args:
             key_id: API key ID
             success: Whether the call succeeded
             response_time_ms: Optional response time in milliseconds
         """
         try:
-            # Get current stats
-            response = self.supabase.table("api_keys") \
-                .select("recent_attempts, recent_successes, recent_failures") \
-                .eq("id", key_id) \
-                .execute()
-            
-            if not response.data:
-                logger.warning(f"Key {key_id} not found for health update")
-                return
-            
-            current = response.data[0]
-            attempts = current.get("recent_attempts", 0) + 1
-            successes = current.get("recent_successes", 0) + (1 if success else 0)
-            failures = current.get("recent_failures", 0) + (0 if success else 1)
-            
-            # Calculate health status
-            failure_rate = failures / attempts if attempts > 0 else 0
-            if failure_rate > 0.5:
-                health_status = 'degraded'
-            elif failure_rate > 0.2:
-                health_status = 'recovering'
-            else:
-                health_status = 'healthy'
-            
-            health_score = successes / attempts if attempts > 0 else 1.0
+            breaker = get_circuit_breaker_registry(self.supabase).record(key_id, success)
+            get_provider_scorer(self.supabase).record(key_id, success, response_time_ms)
             
-            # Update stats
-            update_data = {
-                "recent_attempts": attempts,
-                "recent_successes": successes,
-                "recent_failures": failures,
-                "health_status": health_status,
-                "health_score": health_score
-            }
-            
-            if success:
-                update_data["last_success_time"] = datetime.utcnow().isoformat()
-            else:
-                update_data["last_failure_time"] = datetime.utcnow().isoformat()
-            
-            self.supabase.table("api_keys") \
-                .update(update_data) \
-                .eq("id", key_id) \
-                .execute()
-            
-            logger.info(
+            logger.debug(
                 f"Updated health for key {key_id}: "
-                f"attempts={attempts}, successes={successes}, failures={failures}, "
-                f"health={health_status}, score={health_score:.2f}"
+                f"window={breaker.calls}, failures={breaker.failures}, "
+                f"circuit={breaker.state}, score={breaker.health_score():.2f}"
             )
             
         except Exception as e:
@@ -275,17 +241,26 @@ class HealthTrackerService:
         Args:
             key_id: API key ID
         """
+        reset_data = {
+            "recent_attempts": 0,
+            "recent_successes": 0,
+            "recent_failures": 0,
+            "health_status": "healthy",
+            "health_score": 1.0,
+            "circuit_state": "closed",
+            "circuit_opened_at": None
+        }
+        
         try:
-            self.supabase.table("api_keys") \
-                .update({
-                    "recent_attempts": 0,
-                    "recent_successes": 0,
-                    "recent_failures": 0,
-                    "health_status": "healthy",
-                    "health_score": 1.0
-                }) \
-                .eq("id", key_id) \
-                .execute()
+            await run_query(
+                self.supabase.table("api_keys")
+                .update(reset_data)
+                .eq("id", key_id)
+            )
+            
+            get_key_registry(self.supabase).record_health(key_id, reset_data)
+            get_circuit_breaker_registry(self.supabase).reset(key_id)
+            get_provider_scorer(self.supabase).reset(key_id)
             
             logger.info(f"Reset health stats for key {key_id}")
             
@@ -301,7 +276,7 @@ def get_health_tracker_service(supabase_client: Client) -> HealthTrackerService:
     """Get or create singleton health tracker service instance"""
     global _health_tracker_service
     
-    if _health_tracker_service is None or supabase_client is not None:
+    if _health_tracker_service is None or (supabase_client is not None and supabase_client is not _health_tracker_service.supabase):
         _health_tracker_service = HealthTrackerService(supabase_client)
     
     return _health_tracker_service
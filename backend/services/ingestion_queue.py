@@ -0,0 +1,432 @@
+"""
+Ingestion Queue
+Durable background queue for document processing
+
+Uploads insert a row into document_ingestion_jobs and return immediately.
+A pool of worker tasks claims due jobs by priority (derived from the
+uploader's plan), processes them through DocumentService, retries failures
+with exponential backoff and resumes after the last stored chunk. Running
+jobs hold a lease that is renewed while they work; jobs whose lease expires
+(e.g. the process restarted mid-way) are put back on the queue.
+"""
+import os
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from services.documents import get_document_service
+from services.db_executor import run_query, run_sync
+from services.user_profiles import get_user_profiles
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Queue configuration
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+INGESTION_RETRY_BASE_SECONDS = float(os.getenv("INGESTION_RETRY_BASE_SECONDS", "30"))
+INGESTION_RETRY_MAX_SECONDS = float(os.getenv("INGESTION_RETRY_MAX_SECONDS", "900"))
+INGESTION_POLL_INTERVAL_SECONDS = float(os.getenv("INGESTION_POLL_INTERVAL_SECONDS", "5"))
+INGESTION_LEASE_SECONDS = float(os.getenv("INGESTION_LEASE_SECONDS", "300"))
+
+# Higher priority jobs are claimed first
+PLAN_PRIORITIES = {
+    "free": 0,
+    "student": 1,
+    "pro": 2
+}
+ADMIN_PRIORITY = 3
+ADMIN_ROLES = ["super_admin", "admin", "ops"]
+
+JOBS_TABLE = "document_ingestion_jobs"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class IngestionQueue:
+    """Table-backed document ingestion queue with a worker pool"""
+
+    def __init__(self, supabase_client: Client, worker_count: Optional[int] = None):
+        """
+        Initialize the ingestion queue
+
+        Args:
+            supabase_client: Supabase client instance
+            worker_count: Number of concurrent workers (defaults to INGESTION_WORKERS)
+        """
+        self.supabase = supabase_client
+        self.worker_count = worker_count if worker_count is not None else INGESTION_WORKERS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_running = False
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def get_priority(self, user_id: str) -> int:
+        """
+        Get the queue priority for a user's uploads
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            Priority (higher runs first)
+        """
+        try:
+            user = await get_user_profiles(self.supabase).get(user_id)
+            if not user:
+                return PLAN_PRIORITIES["free"]
+
+            if user.get("role") in ADMIN_ROLES:
+                return ADMIN_PRIORITY
+
+            return PLAN_PRIORITIES.get(user.get("plan") or "free", PLAN_PRIORITIES["free"])
+        except Exception as e:
+            logger.warning(f"Failed to get ingestion priority for user {user_id}: {str(e)}")
+            return PLAN_PRIORITIES["free"]
+
+    async def enqueue(self, document_id: str, user_id: str, priority: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Queue a document for background processing
+
+        Args:
+            document_id: Document ID (file already in storage)
+            user_id: Uploading user's ID
+            priority: Explicit priority, otherwise derived from the user's plan
+
+        Returns:
+            Created job row
+        """
+        if priority is None:
+            priority = await self.get_priority(user_id)
+
+        now = _now().isoformat()
+        result = await run_query(self.supabase.table(JOBS_TABLE).insert({
+            "document_id": document_id,
+            "user_id": user_id,
+            "status": "queued",
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": INGESTION_MAX_ATTEMPTS,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now
+        }))
+
+        if not result.data:
+            raise Exception("Failed to create ingestion job")
+
+        await run_query(self.supabase.table("documents").update({
+            "processing_status": "pending",
+            "processing_progress": 0,
+            "processing_stage": "Queued"
+        }).eq("id", document_id))
+
+        logger.info(f"Queued document {document_id} for processing (priority {priority})")
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return result.data[0]
+
+    def claim_next_job(self) -> Optional[Dict[str, Any]]:
+        """
+        Claim the highest priority due job
+
+        Claiming is a conditional update on status, so two workers (or two
+        processes) never run the same job. Jobs that already used up their
+        attempts are failed instead of claimed.
+
+        Returns:
+            Claimed job row, or None if no job is due
+        """
+        now = _now().isoformat()
+
+        candidates = self.supabase.table(JOBS_TABLE)\
+            .select("*")\
+            .eq("status", "queued")\
+            .lte("next_attempt_at", now)\
+            .order("priority", desc=True)\
+            .order("created_at")\
+            .limit(5)\
+            .execute()
+
+        for job in candidates.data or []:
+            if self._attempts_exhausted(job):
+                self._fail_exhausted_job(job, "queued")
+                continue
+
+            claimed = self.supabase.table(JOBS_TABLE)\
+                .update({
+                    "status": "running",
+                    "locked_by": self.worker_id,
+                    "locked_at": now,
+                    "attempts": (job.get("attempts") or 0) + 1,
+                    "updated_at": now
+                })\
+                .eq("id", job["id"])\
+                .eq("status", "queued")\
+                .execute()
+
+            if claimed.data:
+                return claimed.data[0]
+
+        return None
+
+    def requeue_expired_jobs(self) -> int:
+        """
+        Put running jobs whose lease expired back on the queue
+
+        A document that crashes or kills its worker never reaches
+        _handle_failure, so a job whose lease expired on its last attempt
+        is failed here rather than requeued.
+
+        Returns:
+            Number of jobs requeued
+        """
+        cutoff = (_now() - timedelta(seconds=INGESTION_LEASE_SECONDS)).isoformat()
+
+        expired = self.supabase.table(JOBS_TABLE)\
+            .select("*")\
+            .eq("status", "running")\
+            .lt("locked_at", cutoff)\
+            .execute()
+
+        requeued = 0
+        for job in expired.data or []:
+            if self._attempts_exhausted(job):
+                self._fail_exhausted_job(job, "running")
+                continue
+
+            result = self.supabase.table(JOBS_TABLE)\
+                .update({
+                    "status": "queued",
+                    "locked_by": None,
+                    "locked_at": None,
+                    "updated_at": _now().isoformat()
+                })\
+                .eq("id", job["id"])\
+                .eq("status", "running")\
+                .lt("locked_at", cutoff)\
+                .execute()
+            requeued += len(result.data or [])
+
+        if requeued:
+            logger.warning(f"Requeued {requeued} ingestion jobs with expired leases")
+        return requeued
+
+    @staticmethod
+    def _attempts_exhausted(job: Dict[str, Any]) -> bool:
+        return (job.get("attempts") or 0) >= (job.get("max_attempts") or INGESTION_MAX_ATTEMPTS)
+
+    def _fail_exhausted_job(self, job: Dict[str, Any], status: str) -> None:
+        """Fail a job (and its document) that used up its attempts without reporting a failure"""
+        attempts = job.get("attempts") or 0
+        error = f"Processing stopped unexpectedly on each of {attempts} attempts (worker crashed or timed out)"
+        if job.get("last_error"):
+            error = f"{error}; last error: {job['last_error']}"
+
+        failed = self.supabase.table(JOBS_TABLE)\
+            .update({
+                "status": "failed",
+                "locked_by": None,
+                "locked_at": None,
+                "last_error": error,
+                "updated_at": _now().isoformat()
+            })\
+            .eq("id", job["id"])\
+            .eq("status", status)\
+            .execute()
+
+        if failed.data:
+            logger.error(f"Ingestion job {job['id']} for document {job['document_id']} failed: {error}")
+            get_document_service(self.supabase).mark_document_failed(job["document_id"], error)
+
+    def get_retry_delay(self, attempts: int) -> float:
+        """
+        Backoff before the next attempt
+
+        Args:
+            attempts: Attempts made so far (>= 1)
+
+        Returns:
+            Delay in seconds
+        """
+        return min(INGESTION_RETRY_MAX_SECONDS, INGESTION_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+    async def process_job(self, job: Dict[str, Any]) -> bool:
+        """
+        Process a claimed job, scheduling a retry or failing it on error
+
+        Args:
+            job: Claimed job row
+
+        Returns:
+            True if the document was processed successfully
+        """
+        document_id = job["document_id"]
+        document_service = get_document_service(self.supabase)
+        heartbeat = asyncio.create_task(self._renew_lease(job["id"]))
+
+        try:
+            await document_service.process_stored_document(document_id)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without counting the attempt
+            await run_sync(self._release_job, job)
+            raise
+        except Exception as e:
+            await run_sync(self._handle_failure, job, str(e), document_service)
+            return False
+        finally:
+            heartbeat.cancel()
+
+        await run_query(self.supabase.table(JOBS_TABLE).update({
+            "status": "completed",
+            "locked_by": None,
+            "locked_at": None,
+            "last_error": None,
+            "updated_at": _now().isoformat()
+        }).eq("id", job["id"]))
+
+        return True
+
+    def _handle_failure(self, job: Dict[str, Any], error: str, document_service) -> None:
+        """Schedule a retry with backoff, or fail the job and document after the last attempt"""
+        attempts = job.get("attempts") or 1
+        max_attempts = job.get("max_attempts") or INGESTION_MAX_ATTEMPTS
+        document_id = job["document_id"]
+
+        if attempts < max_attempts:
+            delay = self.get_retry_delay(attempts)
+            logger.warning(
+                f"Processing document {document_id} failed (attempt {attempts}/{max_attempts}), "
+                f"retrying in {delay:.0f}s: {error}"
+            )
+
+            self.supabase.table(JOBS_TABLE).update({
+                "status": "queued",
+                "locked_by": None,
+                "locked_at": None,
+                "last_error": error,
+                "next_attempt_at": (_now() + timedelta(seconds=delay)).isoformat(),
+                "updated_at": _now().isoformat()
+            }).eq("id", job["id"]).execute()
+
+            self.supabase.table("documents").update({
+                "processing_status": "pending",
+                "processing_stage": f"Retrying (attempt {attempts + 1}/{max_attempts})..."
+            }).eq("id", document_id).execute()
+            return
+
+        logger.error(f"Processing document {document_id} failed after {attempts} attempts: {error}")
+
+        self.supabase.table(JOBS_TABLE).update({
+            "status": "failed",
+            "locked_by": None,
+            "locked_at": None,
+            "last_error": error,
+            "updated_at": _now().isoformat()
+        }).eq("id", job["id"]).execute()
+
+        document_service.mark_document_failed(document_id, error)
+
+    def _release_job(self, job: Dict[str, Any]) -> None:
+        """Return an interrupted job to the queue"""
+        try:
+            self.supabase.table(JOBS_TABLE).update({
+                "status": "queued",
+                "attempts": max(0, (job.get("attempts") or 1) - 1),
+                "locked_by": None,
+                "locked_at": None,
+                "updated_at": _now().isoformat()
+            }).eq("id", job["id"]).execute()
+        except Exception as e:
+            logger.warning(f"Failed to release ingestion job {job['id']}: {str(e)}")
+
+    async def _renew_lease(self, job_id: str) -> None:
+        """Keep a running job's lease fresh while it is processed"""
+        while True:
+            await asyncio.sleep(INGESTION_LEASE_SECONDS / 3)
+            try:
+                await run_query(self.supabase.table(JOBS_TABLE).update({
+                    "locked_at": _now().isoformat()
+                }).eq("id", job_id).eq("status", "running"))
+            except Exception as e:
+                logger.warning(f"Failed to renew lease for ingestion job {job_id}: {str(e)}")
+
+    async def _worker_loop(self, index: int) -> None:
+        """Claim and process jobs until stopped"""
+        while self.is_running:
+            try:
+                job = await run_sync(self.claim_next_job)
+            except Exception as e:
+                logger.error(f"Ingestion worker {index} failed to claim a job: {str(e)}")
+                job = None
+
+            if job:
+                try:
+                    await self.process_job(job)
+                except Exception as e:
+                    # The lease expires and the reaper requeues the job; keep the worker alive
+                    logger.error(f"Ingestion worker {index} failed to finish job {job['id']}: {str(e)}")
+                continue
+
+            # Idle: wait for an enqueue or the next poll
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=INGESTION_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _lease_reaper_loop(self) -> None:
+        """Periodically requeue jobs abandoned by crashed workers"""
+        while self.is_running:
+            try:
+                await run_sync(self.requeue_expired_jobs)
+            except Exception as e:
+                logger.error(f"Failed to requeue expired ingestion jobs: {str(e)}")
+            await asyncio.sleep(INGESTION_LEASE_SECONDS / 2)
+
+    async def start(self) -> None:
+        """Start the worker pool"""
+        if self.is_running or self.worker_count <= 0:
+            return
+
+        self.is_running = True
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker_loop(i)) for i in range(self.worker_count)]
+        self._tasks.append(asyncio.create_task(self._lease_reaper_loop()))
+
+        logger.info(f"Started document ingestion queue with {self.worker_count} workers")
+
+    async def stop(self) -> None:
+        """Stop the worker pool; in-flight jobs are returned to the queue"""
+        if not self.is_running:
+            return
+
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        logger.info("Stopped document ingestion queue")
+
+
+# Singleton instance
+_ingestion_queue: Optional[IngestionQueue] = None
+
+
+def get_ingestion_queue(supabase_client: Client) -> IngestionQueue:
+    """Get or create singleton ingestion queue instance"""
+    global _ingestion_queue
+
+    if _ingestion_queue is None:
+        _ingestion_queue = IngestionQueue(supabase_client)
+
+    return _ingestion_queue
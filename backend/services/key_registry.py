@@ -0,0 +1,189 @@
+"""
+Key Registry
+In-process cache of decrypted API keys and their health stats, per feature
+
+Routing reads active keys from here instead of querying and decrypting
+api_keys on every AI call. Entries expire after a TTL and are invalidated
+explicitly whenever a key is added, updated or deleted.
+"""
+import os
+import time
+import threading
+import weakref
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from supabase import Client
+from services.encryption import decrypt_key
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds a feature's key list is served from memory before api_keys is re-read
+KEY_REGISTRY_TTL_SECONDS = float(os.getenv("KEY_REGISTRY_TTL_SECONDS", "30"))
+
+# Health columns kept current in memory by the health tracker
+HEALTH_FIELDS = (
+    "recent_attempts",
+    "recent_successes",
+    "recent_failures",
+    "health_status",
+    "health_score",
+    "last_success_time",
+    "last_failure_time",
+    "failure_count"
+)
+
+
+class KeyRegistry:
+    """Per-feature cache of active API keys with decrypted key values"""
+
+    def __init__(self, supabase_client: Client, ttl_seconds: Optional[float] = None):
+        """
+        Initialize the key registry
+
+        Args:
+            supabase_client: Supabase client used to load api_keys
+            ttl_seconds: Optional TTL override (defaults to KEY_REGISTRY_TTL_SECONDS)
+        """
+        self.supabase = supabase_client
+        self.ttl_seconds = KEY_REGISTRY_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def get_active_keys(self, feature: str) -> List[Dict[str, Any]]:
+        """
+        Get all active keys for a feature, sorted by priority DESC
+
+        Served from memory while the cached entry is younger than the TTL,
+        otherwise reloaded with a single api_keys query. Load errors are
+        raised to the caller and nothing is cached.
+
+        Args:
+            feature: Feature name (chat, mcq, etc.)
+
+        Returns:
+            List of api_keys rows with key_value decrypted. Callers must treat
+            the rows as read-only.
+        """
+        entry = self._entries.get(feature)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            return list(entry[1])
+
+        keys = self._load(feature)
+
+        with self._lock:
+            self._entries[feature] = (time.monotonic(), keys)
+
+        return list(keys)
+
+    def _load(self, feature: str) -> List[Dict[str, Any]]:
+        """
+        Load and decrypt active keys for a feature from the database
+
+        Args:
+            feature: Feature name
+
+        Returns:
+            List of rows with decrypted key_value (undecryptable keys skipped)
+        """
+        response = self.supabase.table("api_keys") \
+            .select("*") \
+            .eq("feature", feature) \
+            .eq("status", "active") \
+            .order("priority", desc=True) \
+            .execute()
+
+        keys = []
+        for row in response.data or []:
+            try:
+                decrypted_key = decrypt_key(row["key_value"])
+            except Exception as decrypt_error:
+                logger.error(f"Failed to decrypt key {row.get('id')}: {decrypt_error}")
+                continue
+
+            keys.append({**row, "key_value": decrypted_key})
+
+        logger.info(f"Key registry loaded {len(keys)} active keys for feature '{feature}'")
+
+        return keys
+
+    def record_health(self, key_id: str, stats: Dict[str, Any]) -> None:
+        """
+        Apply freshly written health stats to the cached copy of a key
+
+        Rows are replaced rather than mutated so concurrent readers never
+        see a half-updated dict.
+
+        Args:
+            key_id: API key ID
+            stats: Updated health columns (see HEALTH_FIELDS)
+        """
+        update = {k: v for k, v in stats.items() if k in HEALTH_FIELDS}
+        if not update:
+            return
+
+        with self._lock:
+            for feature, (loaded_at, keys) in self._entries.items():
+                for index, row in enumerate(keys):
+                    if row.get("id") == key_id:
+                        new_keys = list(keys)
+                        new_keys[index] = {**row, **update}
+                        self._entries[feature] = (loaded_at, new_keys)
+                        break
+
+    def invalidate(self, feature: Optional[str] = None) -> None:
+        """
+        Drop cached keys so the next lookup reloads from the database
+
+        Args:
+            feature: Feature to invalidate, or None for all features
+        """
+        with self._lock:
+            if feature is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(feature, None)
+
+
+# One registry per Supabase client, released together with the client
+_key_registries: "weakref.WeakKeyDictionary[Client, KeyRegistry]" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def get_key_registry(supabase_client: Client) -> KeyRegistry:
+    """
+    Get or create the key registry bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        KeyRegistry instance
+    """
+    registry = _key_registries.get(supabase_client)
+    if registry is None:
+        with _registries_lock:
+            registry = _key_registries.get(supabase_client)
+            if registry is None:
+                registry = KeyRegistry(supabase_client)
+                _key_registries[supabase_client] = registry
+    return registry
+
+
+def invalidate_key_registry(feature: Optional[str] = None) -> None:
+    """
+    Invalidate cached keys in every registry
+
+    Called after any write that changes which keys are active, their
+    priority or their key value.
+
+    Args:
+        feature: Feature to invalidate, or None for all features
+    """
+    with _registries_lock:
+        registries = list(_key_registries.values())
+
+    for registry in registries:
+        registry.invalidate(feature)
+
+    logger.info(f"Invalidated key registry (feature: {feature or 'all'})")
@@ -0,0 +1,270 @@
+"""
+Key Scheduler
+Per-key admission control for shared provider API keys
+
+Each shared key gets a concurrency limit and a token-bucket request rate,
+so a traffic spike queues briefly for a free slot instead of flooding one
+key with parallel requests. When a provider answers 429 the key is parked
+for its Retry-After period rather than counted as failed; requests skip a
+parked key (or wait for it, if it comes back within their queueing budget).
+"""
+import os
+import time
+import asyncio
+import threading
+import weakref
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from services.request_deadline import bound_by_budget
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Scheduler configuration (0 = unlimited; set these to the providers' per-key quotas)
+KEY_MAX_CONCURRENCY = int(os.getenv("KEY_MAX_CONCURRENCY", "0"))
+# Sustained requests per second per key (0 disables rate limiting) and burst size
+KEY_RATE_PER_SECOND = float(os.getenv("KEY_RATE_PER_SECOND", "0"))
+KEY_BURST = int(os.getenv("KEY_BURST", "4"))
+# Longest a request waits for a slot on one key before moving to the next key
+KEY_QUEUE_TIMEOUT_SECONDS = float(os.getenv("KEY_QUEUE_TIMEOUT_SECONDS", "2"))
+# Parking time for a 429 without Retry-After, and the upper bound for any parking
+KEY_PARK_DEFAULT_SECONDS = float(os.getenv("KEY_PARK_DEFAULT_SECONDS", "10"))
+KEY_PARK_MAX_SECONDS = float(os.getenv("KEY_PARK_MAX_SECONDS", "300"))
+
+
+class _KeyState:
+    """Slots, bucket and parking for one key"""
+
+    __slots__ = ("active", "waiters", "tokens", "refilled_at", "parked_until")
+
+    def __init__(self, burst: int):
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.parked_until = 0.0
+
+
+class KeyScheduler:
+    """Concurrency slots, token buckets and 429 parking for shared API keys"""
+
+    def __init__(
+        self,
+        max_concurrency: int = KEY_MAX_CONCURRENCY,
+        rate_per_second: float = KEY_RATE_PER_SECOND,
+        burst: int = KEY_BURST,
+        queue_timeout: float = KEY_QUEUE_TIMEOUT_SECONDS
+    ):
+        """
+        Initialize the scheduler
+
+        Args:
+            max_concurrency: Requests in flight per key (0 = unlimited)
+            rate_per_second: Sustained request rate per key (0 disables the bucket)
+            burst: Requests a key may start back to back
+            queue_timeout: Default seconds acquire() waits for a slot
+        """
+        self.max_concurrency = max(0, max_concurrency)
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.queue_timeout = queue_timeout
+        self._keys: Dict[str, _KeyState] = {}
+
+        self.acquired = 0
+        self.queued = 0
+        self.rejected = 0
+        self.parked = 0
+
+    def _state(self, key_id: str) -> _KeyState:
+        state = self._keys.get(key_id)
+        if state is None:
+            state = self._keys[key_id] = _KeyState(self.burst)
+        return state
+
+    def parked_for(self, key_id: str) -> float:
+        """Seconds until a parked key may be used again (0 if not parked)"""
+        state = self._keys.get(key_id)
+        return max(0.0, state.parked_until - time.monotonic()) if state else 0.0
+
+    def park(self, key_id: str, retry_after: Optional[float] = None) -> float:
+        """
+        Take a key out of rotation after the provider rate limited it
+
+        Args:
+            key_id: API key ID
+            retry_after: Seconds from the Retry-After header, if any
+
+        Returns:
+            Seconds the key is parked for
+        """
+        seconds = KEY_PARK_DEFAULT_SECONDS if retry_after is None else retry_after
+        seconds = min(max(seconds, 0.0), KEY_PARK_MAX_SECONDS)
+
+        state = self._state(key_id)
+        state.parked_until = max(state.parked_until, time.monotonic() + seconds)
+        self.parked += 1
+
+        logger.warning(f"Key {key_id} rate limited upstream, parked for {seconds:.1f}s")
+        return seconds
+
+    async def acquire(self, key_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a slot on a key
+
+        Waits out parking, then a concurrency slot (first come, first
+        served), then a token from the key's bucket, all within the timeout
+        and the remaining request budget.
+
+        Args:
+            key_id: API key ID
+            timeout: Seconds to wait at most (defaults to the queue timeout)
+
+        Returns:
+            True if a slot was taken (release() it when done), False if the
+            key stays unavailable for longer than the timeout
+        """
+        deadline = time.monotonic() + bound_by_budget(self.queue_timeout if timeout is None else timeout)
+        state = self._state(key_id)
+
+        parked = state.parked_until - time.monotonic()
+        if parked > 0:
+            if time.monotonic() + parked > deadline:
+                self.rejected += 1
+                return False
+            await asyncio.sleep(parked)
+
+        if self.max_concurrency == 0 or (state.active < self.max_concurrency and not state.waiters):
+            state.active += 1
+        elif not await self._wait_for_slot(state, deadline):
+            self.rejected += 1
+            return False
+
+        wait = self._take_token(state)
+        if wait > 0:
+            if time.monotonic() + wait > deadline:
+                state.tokens += 1  # Give back the reservation
+                self.release(key_id)
+                self.rejected += 1
+                return False
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while waiting for the token: don't leak the slot or the token
+                state.tokens += 1
+                self.release(key_id)
+                raise
+
+        self.acquired += 1
+        return True
+
+    async def _wait_for_slot(self, state: _KeyState, deadline: float) -> bool:
+        """Queue for a concurrency slot handed over by release()"""
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self.queued += 1
+
+        granted = False
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+            granted = True
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if waiter in state.waiters:
+                state.waiters.remove(waiter)
+            elif not granted and waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._hand_over(state)
+
+    def _take_token(self, state: _KeyState) -> float:
+        """Reserve a token and return how long to wait for it (0 = available now)"""
+        if self.rate_per_second <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        state.tokens = min(float(self.burst), state.tokens + (now - state.refilled_at) * self.rate_per_second)
+        state.refilled_at = now
+        state.tokens -= 1
+
+        return 0.0 if state.tokens >= 0 else -state.tokens / self.rate_per_second
+
+    def release(self, key_id: str) -> None:
+        """
+        Free a slot taken by acquire(), handing it to the next queued request
+
+        Args:
+            key_id: API key ID
+        """
+        state = self._keys.get(key_id)
+        if state is not None:
+            self._hand_over(state)
+
+    def _hand_over(self, state: _KeyState) -> None:
+        """Give a freed slot to the oldest live waiter, or return it to the pool"""
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if waiter.done():
+                continue
+            try:
+                waiter.set_result(True)
+            except RuntimeError:
+                continue  # Waiter from an event loop that has gone away
+            return  # The slot passes straight to the waiter
+
+        state.active = max(0, state.active - 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get scheduler counters and per-key state
+
+        Returns:
+            Dict with totals and, per key, active/queued requests and parking time
+        """
+        now = time.monotonic()
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": self.rate_per_second,
+            "acquired": self.acquired,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "parked": self.parked,
+            "keys": {
+                key_id: {
+                    "active": state.active,
+                    "waiting": len(state.waiters),
+                    "parked_for_seconds": round(max(0.0, state.parked_until - now), 1)
+                }
+                for key_id, state in self._keys.items()
+                if state.active or state.waiters or state.parked_until > now
+            }
+        }
+
+
+# One scheduler per Supabase client (key IDs belong to that database)
+_key_schedulers: "weakref.WeakKeyDictionary[Client, KeyScheduler]" = weakref.WeakKeyDictionary()
+_key_schedulers_lock = threading.Lock()
+
+
+def get_key_scheduler(supabase_client: Client) -> KeyScheduler:
+    """
+    Get or create the key scheduler bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        KeyScheduler instance
+    """
+    scheduler = _key_schedulers.get(supabase_client)
+    if scheduler is None:
+        with _key_schedulers_lock:
+            scheduler = _key_schedulers.get(supabase_client)
+            if scheduler is None:
+                scheduler = KeyScheduler()
+                _key_schedulers[supabase_client] = scheduler
+    return scheduler
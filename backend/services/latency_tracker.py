@@ -0,0 +1,97 @@
+"""
+Latency Tracker
+Rolling per-feature response time samples for routing decisions
+
+Used by the model router to derive the hedging threshold (observed p95)
+for latency-sensitive features.
+"""
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+# Number of recent successful calls kept per feature
+LATENCY_WINDOW_SIZE = 200
+
+
+class LatencyTracker:
+    """Keeps a bounded window of recent successful response times per feature"""
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE):
+        """
+        Initialize the latency tracker
+
+        Args:
+            window_size: Maximum samples retained per feature
+        """
+        self.window_size = window_size
+        self._samples: Dict[str, Deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, feature: str, response_time_ms: int) -> None:
+        """
+        Record the response time of a successful call
+
+        Args:
+            feature: Feature name
+            response_time_ms: Response time in milliseconds
+        """
+        with self._lock:
+            samples = self._samples.get(feature)
+            if samples is None:
+                samples = deque(maxlen=self.window_size)
+                self._samples[feature] = samples
+            samples.append(response_time_ms)
+
+    def sample_count(self, feature: str) -> int:
+        """Number of samples currently held for a feature"""
+        samples = self._samples.get(feature)
+        return len(samples) if samples else 0
+
+    def percentile(self, feature: str, pct: float) -> Optional[int]:
+        """
+        Get a response time percentile for a feature (nearest-rank)
+
+        Args:
+            feature: Feature name
+            pct: Percentile between 0 and 100
+
+        Returns:
+            Response time in milliseconds, or None if no samples yet
+        """
+        with self._lock:
+            samples = self._samples.get(feature)
+            if not samples:
+                return None
+            ordered = sorted(samples)
+
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def reset(self, feature: Optional[str] = None) -> None:
+        """
+        Discard samples
+
+        Args:
+            feature: Feature to reset, or None for all features
+        """
+        with self._lock:
+            if feature is None:
+                self._samples.clear()
+            else:
+                self._samples.pop(feature, None)
+
+
+# Singleton instance
+_latency_tracker: Optional[LatencyTracker] = None
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """Get or create singleton latency tracker instance"""
+    global _latency_tracker
+
+    if _latency_tracker is None:
+        _latency_tracker = LatencyTracker()
+
+    return _latency_tracker
@@ -9,6 +9,8 @@ from datetime import datetime
 from typing import Dict, Optional, Any
 from supabase import Client
 from services.notifications import get_notification_service
+from services.db_executor import run_query
+from services.system_flags import get_system_flags
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +39,11 @@ class MaintenanceService:
         Requirements: 12.1, 12.2, 12.3
         """
         # Get all keys for this feature
-        keys_result = self.supabase.table("api_keys") \
-            .select("id, status, provider") \
-            .eq("feature", feature) \
-            .execute()
+        keys_result = await run_query(
+            self.supabase.table("api_keys")
+            .select("id, status, provider")
+            .eq("feature", feature)
+        )
         
         if not keys_result.data:
             # No keys configured for this feature
@@ -118,31 +121,36 @@ class MaintenanceService:
         flag_value = maintenance_data
         
         # Check if flag exists
-        existing_flag = self.supabase.table("system_flags") \
-            .select("id") \
-            .eq("flag_name", flag_name) \
-            .execute()
+        existing_flag = await run_query(
+            self.supabase.table("system_flags")
+            .select("id")
+            .eq("flag_name", flag_name)
+        )
         
         if existing_flag.data:
             # Update existing flag
-            self.supabase.table("system_flags") \
+            await run_query(
+                self.supabase.table("system_flags")
                 .update({
                     "flag_value": str(flag_value),
                     "updated_at": datetime.now().isoformat(),
                     "updated_by": triggered_by
-                }) \
-                .eq("flag_name", flag_name) \
-                .execute()
+                })
+                .eq("flag_name", flag_name)
+            )
         else:
             # Insert new flag
-            self.supabase.table("system_flags") \
+            await run_query(
+                self.supabase.table("system_flags")
                 .insert({
                     "flag_name": flag_name,
                     "flag_value": str(flag_value),
                     "updated_by": triggered_by,
                     "updated_at": datetime.now().isoformat()
-                }) \
-                .execute()
+                })
+            )
+        
+        get_system_flags(self.supabase).set_flag(flag_name, str(flag_value))
         
         logger.info(f"Entered {level} maintenance mode: {reason}")
         
@@ -195,10 +203,11 @@ class MaintenanceService:
         flag_name = "maintenance_mode"
         
         # Get current flag value
-        flag_result = self.supabase.table("system_flags") \
-            .select("flag_value") \
-            .eq("flag_name", flag_name) \
-            .execute()
+        flag_result = await run_query(
+            self.supabase.table("system_flags")
+            .select("flag_value")
+            .eq("flag_name", flag_name)
+        )
         
         if flag_result.data:
             # Parse and update the flag value
@@ -208,14 +217,16 @@ class MaintenanceService:
             flag_value["exited_at"] = datetime.now().isoformat()
             flag_value["exited_by"] = exited_by
             
-            self.supabase.table("system_flags") \
+            await run_query(
+                self.supabase.table("system_flags")
                 .update({
                     "flag_value": str(flag_value),
                     "updated_at": datetime.now().isoformat(),
                     "updated_by": exited_by
-                }) \
-                .eq("flag_name", flag_name) \
-                .execute()
+                })
+                .eq("flag_name", flag_name)
+            )
+            get_system_flags(self.supabase).set_flag(flag_name, str(flag_value))
         
         logger.info("Exited maintenance mode")
         
@@ -252,10 +263,11 @@ class MaintenanceService:
         """
         # Query system_flags table
         flag_name = "maintenance_mode"
-        result = self.supabase.table("system_flags") \
-            .select("flag_value, updated_at") \
-            .eq("flag_name", flag_name) \
-            .execute()
+        result = await run_query(
+            self.supabase.table("system_flags")
+            .select("flag_value, updated_at")
+            .eq("flag_name", flag_name)
+        )
         
         if not result.data:
             # No maintenance flag exists
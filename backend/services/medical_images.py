@@ -12,6 +12,7 @@ from supabase import Client
 import logging
 import io
 from PIL import Image
+from services.db_executor import run_query, run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -78,7 +79,8 @@ class MedicalImageService:
             
             # Upload to Supabase Storage
             try:
-                self.supabase.storage.from_(self.storage_bucket).upload(
+                await run_sync(
+                    self.supabase.storage.from_(self.storage_bucket).upload,
                     storage_filename,
                     file_content,
                     {"content-type": file_type}
@@ -87,8 +89,9 @@ class MedicalImageService:
                 logger.error(f"Storage upload failed: {str(storage_error)}")
                 # If bucket doesn't exist, create it
                 try:
-                    self.supabase.storage.create_bucket(self.storage_bucket, {"public": False})
-                    self.supabase.storage.from_(self.storage_bucket).upload(
+                    await run_sync(self.supabase.storage.create_bucket, self.storage_bucket, {"public": False})
+                    await run_sync(
+                        self.supabase.storage.from_(self.storage_bucket).upload,
                         storage_filename,
                         file_content,
                         {"content-type": file_type}
@@ -111,7 +114,7 @@ class MedicalImageService:
                 "created_at": datetime.now().isoformat()
             }
             
-            result = self.supabase.table("medical_images").insert(image_data).execute()
+            result = await run_query(self.supabase.table("medical_images").insert(image_data))
             
             if not result.data:
                 raise Exception("Failed to create medical image record")
@@ -133,9 +136,9 @@ class MedicalImageService:
         """
         try:
             # Update status to analyzing
-            self.supabase.table("medical_images").update({
+            await run_query(self.supabase.table("medical_images").update({
                 "analysis_status": "analyzing"
-            }).eq("id", image_id).execute()
+            }).eq("id", image_id))
             
             if not self.vision_provider:
                 raise Exception("Vision provider not available")
@@ -170,7 +173,7 @@ Provide a structured medical analysis."""
                 structured_analysis = self._parse_analysis(analysis_text)
                 
                 # Update medical image with analysis
-                self.supabase.table("medical_images").update({
+                await run_query(self.supabase.table("medical_images").update({
                     "analysis_status": "completed",
                     "analysis_text": analysis_text,
                     "image_type": structured_analysis.get("image_type"),
@@ -178,7 +181,7 @@ Provide a structured medical analysis."""
                     "findings": structured_analysis.get("findings"),
                     "clinical_impression": structured_analysis.get("clinical_impression"),
                     "analyzed_at": datetime.now().isoformat()
-                }).eq("id", image_id).execute()
+                }).eq("id", image_id))
                 
                 logger.info(f"Medical image {image_id} analyzed successfully")
             else:
@@ -186,10 +189,10 @@ Provide a structured medical analysis."""
             
         except Exception as e:
             logger.error(f"Medical image analysis failed: {str(e)}")
-            self.supabase.table("medical_images").update({
+            await run_query(self.supabase.table("medical_images").update({
                 "analysis_status": "failed",
                 "error_message": str(e)
-            }).eq("id", image_id).execute()
+            }).eq("id", image_id))
     
     def _parse_analysis(self, analysis_text: str) -> Dict[str, Any]:
         """Parse structured data from analysis text"""
@@ -248,7 +251,7 @@ Provide a structured medical analysis."""
             if category:
                 query = query.eq("category", category)
             
-            result = query.execute()
+            result = await run_query(query)
             return result.data or []
             
         except Exception as e:
@@ -258,7 +261,7 @@ Provide a structured medical analysis."""
     async def get_medical_image(self, user_id: str, image_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific medical image"""
         try:
-            result = self.supabase.table("medical_images").select("*").eq("id", image_id).eq("user_id", user_id).execute()
+            result = await run_query(self.supabase.table("medical_images").select("*").eq("id", image_id).eq("user_id", user_id))
             
             if result.data and len(result.data) > 0:
                 return result.data[0]
@@ -272,7 +275,7 @@ Provide a structured medical analysis."""
         """Delete a medical image"""
         try:
             # Get image
-            image_result = self.supabase.table("medical_images").select("*").eq("id", image_id).eq("user_id", user_id).execute()
+            image_result = await run_query(self.supabase.table("medical_images").select("*").eq("id", image_id).eq("user_id", user_id))
             
             if not image_result.data or len(image_result.data) == 0:
                 raise Exception("Medical image not found")
@@ -283,12 +286,12 @@ Provide a structured medical analysis."""
             try:
                 storage_path = image.get("storage_path")
                 if storage_path:
-                    self.supabase.storage.from_(self.storage_bucket).remove([storage_path])
+                    await run_sync(self.supabase.storage.from_(self.storage_bucket).remove, [storage_path])
             except Exception as e:
                 logger.warning(f"Failed to delete from storage: {str(e)}")
             
             # Delete record
-            self.supabase.table("medical_images").delete().eq("id", image_id).execute()
+            await run_query(self.supabase.table("medical_images").delete().eq("id", image_id))
             
             logger.info(f"Medical image {image_id} deleted successfully")
             
@@ -308,13 +311,13 @@ Provide a structured medical analysis."""
         """
         try:
             # Text search in analysis fields
-            result = self.supabase.table("medical_images").select("*").eq("user_id", user_id).or_(
+            result = await run_query(self.supabase.table("medical_images").select("*").eq("user_id", user_id).or_(
                 f"analysis_text.ilike.%{query}%,"
                 f"findings.ilike.%{query}%,"
                 f"clinical_impression.ilike.%{query}%,"
                 f"image_type.ilike.%{query}%,"
                 f"body_region.ilike.%{query}%"
-            ).limit(top_k).execute()
+            ).limit(top_k))
             
             return result.data or []
             
@@ -459,6 +462,13 @@ Use bullet points, bold text for emphasis, and clear section headers. Be thoroug
             raise
 
 
+# Singleton instance
+_medical_image_service = None
+
+
 def get_medical_image_service(supabase: Client) -> MedicalImageService:
-    """Factory function to get medical image service instance"""
-    return MedicalImageService(supabase)
+    """Get or create the medical image service instance bound to a Supabase client"""
+    global _medical_image_service
+    if _medical_image_service is None or _medical_image_service.supabase is not supabase:
+        _medical_image_service = MedicalImageService(supabase)
+    return _medical_image_service
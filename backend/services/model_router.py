@@ -4,18 +4,42 @@ Handles provider selection, API key management, and request routing with fallbac
 Requirements: 10.4, 10.6, 21.1, 18.2
 """
 import os
-from typing import Optional, Dict, Any, List
-from supabase import Client, create_client
+import time
+import asyncio
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 import logging
 from services.encryption import decrypt_key
 from services.notifications import get_notification_service
+from services.latency_tracker import get_latency_tracker
+from services.circuit_breaker import get_circuit_breaker_registry
+from services.request_coalescer import ROUTER_COALESCE_REQUESTS, get_request_coalescer, make_request_key
+from services.key_scheduler import get_key_scheduler
+from services.admission_queue import AdmissionRejected, get_admission_queue, get_request_plan, note_request_rejection
+from services.request_deadline import request_deadline, get_remaining_budget, has_budget_for_attempt
+from services.db_executor import run_query
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Hedged requests (opt-in per feature): if the first key has not answered
+# within the feature's observed latency percentile, the same request is
+# started on the next healthy key and the first successful answer wins.
+HEDGE_FEATURES = {
+    f.strip() for f in os.getenv("ROUTER_HEDGE_FEATURES", "").split(",") if f.strip()
+}
+HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "95"))
+# Samples needed before the observed percentile is trusted
+HEDGE_MIN_SAMPLES = 20
+# Threshold used until enough samples exist, and the lower bound afterwards
+HEDGE_DEFAULT_DELAY_MS = int(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY_MS", "8000"))
+HEDGE_MIN_DELAY_MS = int(os.getenv("ROUTER_HEDGE_MIN_DELAY_MS", "500"))
+
 
 class ModelRouterService:
     """
@@ -37,11 +61,7 @@ class ModelRouterService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def select_provider(self, feature: str) -> str:
         """
@@ -59,13 +79,14 @@ class ModelRouterService:
         """
         try:
             # Query for active keys for this feature
-            response = self.supabase.table("api_keys") \
-                .select("provider") \
-                .eq("feature", feature) \
-                .eq("status", "active") \
-                .order("priority", desc=True) \
-                .limit(1) \
-                .execute()
+            response = await run_query(
+                self.supabase.table("api_keys")
+                .select("provider")
+                .eq("feature", feature)
+                .eq("status", "active")
+                .order("priority", desc=True)
+                .limit(1)
+            )
             
             if response.data and len(response.data) > 0:
                 provider = response.data[0]["provider"]
@@ -107,14 +128,15 @@ class ModelRouterService:
             # Query api_keys table for active keys matching provider and feature
             # Skip degraded keys (Requirement 11.4)
             # Order by priority descending (highest priority first)
-            response = self.supabase.table("api_keys") \
-                .select("*") \
-                .eq("provider", provider) \
-                .eq("feature", feature) \
-                .eq("status", "active") \
-                .order("priority", desc=True) \
-                .limit(1) \
-                .execute()
+            response = await run_query(
+                self.supabase.table("api_keys")
+                .select("*")
+                .eq("provider", provider)
+                .eq("feature", feature)
+                .eq("status", "active")
+                .order("priority", desc=True)
+                .limit(1)
+            )
             
             if not response.data or len(response.data) == 0:
                 logger.warning(f"No active API key found for provider '{provider}', feature '{feature}'")
@@ -177,13 +199,14 @@ class ModelRouterService:
             # Query api_keys table for all active keys matching provider and feature
             # Skip degraded keys (Requirement 11.4)
             # Order by priority descending (highest priority first)
-            response = self.supabase.table("api_keys") \
-                .select("*") \
-                .eq("provider", provider) \
-                .eq("feature", feature) \
-                .eq("status", "active") \
-                .order("priority", desc=True) \
-                .execute()
+            response = await run_query(
+                self.supabase.table("api_keys")
+                .select("*")
+                .eq("provider", provider)
+                .eq("feature", feature)
+                .eq("status", "active")
+                .order("priority", desc=True)
+            )
             
             if not response.data or len(response.data) == 0:
                 logger.warning(f"No active API keys found for provider '{provider}', feature '{feature}'")
@@ -234,10 +257,11 @@ class ModelRouterService:
         """
         try:
             # Query users table for personal API key
-            response = self.supabase.table("users") \
-                .select("personal_api_key") \
-                .eq("id", user_id) \
-                .execute()
+            response = await run_query(
+                self.supabase.table("users")
+                .select("personal_api_key")
+                .eq("id", user_id)
+            )
             
             if not response.data or len(response.data) == 0:
                 return None
@@ -270,10 +294,11 @@ class ModelRouterService:
         try:
             from datetime import datetime
             
-            self.supabase.table("api_keys") \
-                .update({"last_used_at": datetime.utcnow().isoformat()}) \
-                .eq("id", key_id) \
-                .execute()
+            await run_query(
+                self.supabase.table("api_keys")
+                .update({"last_used_at": datetime.utcnow().isoformat()})
+                .eq("id", key_id)
+            )
                 
         except Exception as e:
             # Don't fail the request if timestamp update fails
@@ -283,7 +308,9 @@ class ModelRouterService:
         """
         Record a failure for an API key
         
-        Increments the failure_count for the key.
+        Increments the failure_count for the key. The increment is kept in
+        memory and written by the circuit breaker registry's background
+        persistence, so failover doesn't wait on a read and a write.
         
         Args:
             key_id: API key ID
@@ -292,30 +319,442 @@ class ModelRouterService:
         Requirements: 21.2, 21.3
         """
         try:
-            # Get current failure count
-            response = self.supabase.table("api_keys") \
-                .select("failure_count") \
-                .eq("id", key_id) \
-                .execute()
+            get_circuit_breaker_registry(self.supabase).record_failure(key_id)
             
-            if response.data and len(response.data) > 0:
-                current_count = response.data[0].get("failure_count", 0)
-                new_count = current_count + 1
-                
-                # Update failure count
-                self.supabase.table("api_keys") \
-                    .update({"failure_count": new_count}) \
-                    .eq("id", key_id) \
-                    .execute()
-                
-                logger.warning(
-                    f"Recorded failure for key {key_id}. "
-                    f"Failure count: {new_count}. Error: {error}"
-                )
+            logger.warning(f"Recorded failure for key {key_id}. Error: {error}")
                 
         except Exception as e:
             logger.error(f"Failed to record failure for key {key_id}: {str(e)}")
     
+    async def _acquire_key(self, key_id: str) -> bool:
+        """
+        Claim a key right before calling it
+        
+        Takes the circuit breaker's recovery probe if the key is half-open,
+        then a scheduler slot. A probe that can't be used is handed back.
+        
+        Args:
+            key_id: API key ID
+            
+        Returns:
+            True if the key may be called (release it with _release_key)
+        """
+        breaker = get_circuit_breaker_registry(self.supabase).get(key_id)
+        if not breaker.allow_request():
+            return False
+        
+        try:
+            acquired = await get_key_scheduler(self.supabase).acquire(key_id)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        
+        if not acquired:
+            breaker.release_probe()
+        return acquired
+    
+    def _release_key(self, key_id: str, outcome_recorded: bool) -> None:
+        """
+        Free a key claimed by _acquire_key
+        
+        Args:
+            key_id: API key ID
+            outcome_recorded: Whether the call's outcome goes to the breaker;
+                if not (cancelled, rate limited), a held probe is handed back
+        """
+        get_key_scheduler(self.supabase).release(key_id)
+        if not outcome_recorded:
+            get_circuit_breaker_registry(self.supabase).get(key_id).release_probe()
+    
+    @staticmethod
+    def _summarize_error(error_msg: Any) -> Any:
+        """
+        Shorten a provider error message for logs and failure records
+        
+        HTML error pages are reduced to their status, long messages truncated.
+        
+        Args:
+            error_msg: Raw error message from the provider result
+            
+        Returns:
+            Cleaned-up error message
+        """
+        if isinstance(error_msg, str) and (error_msg.startswith('<!DOCTYPE') or '<html' in error_msg[:100]):
+            # Extract just the key info from HTML error
+            if '504' in error_msg:
+                return "Gateway Timeout (504)"
+            elif '502' in error_msg:
+                return "Bad Gateway (502)"
+            elif '503' in error_msg:
+                return "Service Unavailable (503)"
+            return "API returned HTML error page"
+        
+        if isinstance(error_msg, str) and len(error_msg) > 200:
+            # Truncate long error messages
+            return error_msg[:200] + "..."
+        
+        return error_msg
+    
+    async def _call_key(
+        self,
+        key: Dict[str, Any],
+        feature: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        image_data: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Send a request using one shared key, routed to the key's provider
+        
+        Args:
+            key: Key dict (id, provider, key_value, ...)
+            feature: Feature name
+            prompt: User prompt/message
+            system_prompt: Optional system prompt
+            image_data: Optional base64-encoded image data
+            
+        Returns:
+            Provider result dict
+        """
+        if key["provider"] == "huggingface":
+            # Use HuggingFace provider directly
+            from services.providers.huggingface import get_huggingface_provider
+            provider_instance = get_huggingface_provider()
+            
+            # Call HuggingFace with DB key
+            return await provider_instance.call_huggingface(
+                api_key=key["key_value"],
+                feature=feature,
+                prompt=prompt,
+                system_prompt=system_prompt,
+                max_tokens=4096,
+                temperature=0.9,
+                image_data=image_data
+            )
+        
+        # Use OpenRouter for all other providers
+        from services.providers.openrouter import get_openrouter_provider
+        provider_instance = get_openrouter_provider()
+        
+        return await provider_instance.call_openrouter(
+            api_key=key["key_value"],
+            provider=key["provider"],  # Use actual provider
+            feature=feature,
+            prompt=prompt,
+            system_prompt=system_prompt,
+            image_data=image_data
+        )
+    
+    async def _stream_openrouter(
+        self,
+        api_key: str,
+        provider: str,
+        feature: str,
+        prompt: str,
+        system_prompt: Optional[str],
+        on_token: Callable[[str], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """
+        Stream a completion through OpenRouter, forwarding text as it arrives
+        
+        Args:
+            api_key: OpenRouter API key
+            provider: Provider name (gemini, openai, anthropic)
+            feature: Feature name
+            prompt: User prompt/message
+            system_prompt: Optional system prompt
+            on_token: Awaited with each text chunk
+            
+        Returns:
+            Provider result dict, plus:
+                - ttft_ms: Time to the first chunk (None if nothing arrived)
+                - stream_interrupted: True if the stream failed after text was forwarded
+        """
+        from services.providers.openrouter import get_openrouter_provider
+        provider_instance = get_openrouter_provider()
+        model = provider_instance.get_model_id(provider, feature)
+        
+        start_time = time.time()
+        ttft_ms = None
+        parts: List[str] = []
+        
+        try:
+            async for text in provider_instance.call_openrouter_streaming(
+                api_key=api_key,
+                provider=provider,
+                feature=feature,
+                prompt=prompt,
+                system_prompt=system_prompt,
+                raise_errors=True
+            ):
+                if ttft_ms is None:
+                    ttft_ms = int((time.time() - start_time) * 1000)
+                parts.append(text)
+                await on_token(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error_msg = str(e)
+            return {
+                "success": False,
+                "error": error_msg,
+                "tokens_used": 0,
+                "model": model,
+                "is_token_limit_error": not parts and "token" in error_msg.lower() and (
+                    "limit" in error_msg.lower() or "context" in error_msg.lower()
+                ),
+                "stream_interrupted": bool(parts),
+                "ttft_ms": ttft_ms,
+                "rate_limited": getattr(e, "status_code", None) == 429,
+                "retry_after": getattr(e, "retry_after", None)
+            }
+        
+        content = "".join(parts)
+        if not content:
+            return {
+                "success": False,
+                "error": "No response generated by OpenRouter",
+                "tokens_used": 0,
+                "model": model,
+                "ttft_ms": ttft_ms
+            }
+        
+        return {
+            "success": True,
+            "content": content,
+            # Streamed responses carry no usage block; estimate like the providers do
+            "tokens_used": len(prompt) // 4 + len(content) // 4,
+            "model": model,
+            "ttft_ms": ttft_ms
+        }
+    
+    async def _stream_key(
+        self,
+        key: Dict[str, Any],
+        feature: str,
+        prompt: str,
+        system_prompt: Optional[str],
+        image_data: Optional[str],
+        on_token: Callable[[str], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """
+        Send a streaming request using one shared key
+        
+        Keys or requests that can't stream (Hugging Face, images) are called
+        normally and their whole answer is forwarded as a single chunk.
+        
+        Args:
+            key: Key dict (id, provider, key_value, ...)
+            feature: Feature name
+            prompt: User prompt/message
+            system_prompt: Optional system prompt
+            image_data: Optional base64-encoded image data
+            on_token: Awaited with each text chunk
+            
+        Returns:
+            Provider result dict (see _stream_openrouter)
+        """
+        if key["provider"] != "huggingface" and not image_data:
+            return await self._stream_openrouter(
+                api_key=key["key_value"],
+                provider=key["provider"],
+                feature=feature,
+                prompt=prompt,
+                system_prompt=system_prompt,
+                on_token=on_token
+            )
+        
+        result = await self._call_key(key, feature, prompt, system_prompt, image_data)
+        if result["success"]:
+            await on_token(result["content"])
+        return result
+    
+    def should_hedge(self, feature: str, hedge: Optional[bool] = None) -> bool:
+        """
+        Decide whether a request for a feature should be hedged
+        
+        Args:
+            feature: Feature name
+            hedge: Explicit per-call choice; None uses ROUTER_HEDGE_FEATURES
+            
+        Returns:
+            True if hedging is enabled for this request
+        """
+        if hedge is not None:
+            return hedge
+        return feature in HEDGE_FEATURES
+    
+    def get_hedge_delay_ms(self, feature: str) -> int:
+        """
+        Get how long to wait on the first key before starting a hedge
+        
+        Uses the observed HEDGE_PERCENTILE latency of the feature once
+        HEDGE_MIN_SAMPLES successful calls are known, else the default.
+        
+        Args:
+            feature: Feature name
+            
+        Returns:
+            Delay in milliseconds
+        """
+        tracker = get_latency_tracker()
+        
+        if tracker.sample_count(feature) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_MS
+        
+        observed = tracker.percentile(feature, HEDGE_PERCENTILE)
+        return max(observed or HEDGE_DEFAULT_DELAY_MS, HEDGE_MIN_DELAY_MS)
+    
+    async def _execute_hedged(
+        self,
+        primary: Dict[str, Any],
+        backup: Dict[str, Any],
+        delay_ms: int,
+        feature: str,
+        prompt: str,
+        system_prompt: Optional[str],
+        image_data: Optional[str],
+        user_id: Optional[str],
+        starting_attempt: int,
+        usage_logger: Any,
+        health_tracker: Any
+    ) -> Dict[str, Any]:
+        """
+        Race the primary key against a delayed backup key
+        
+        The backup request only starts if the primary has not answered
+        within delay_ms. The first successful answer wins and the other
+        request is cancelled. Every completed attempt is logged and fed
+        into health tracking; cancelled attempts are not counted as failures.
+        
+        Args:
+            primary: First key to try
+            backup: Key to hedge with
+            delay_ms: Delay before the backup request starts
+            feature: Feature name
+            prompt: User prompt/message
+            system_prompt: Optional system prompt
+            image_data: Optional base64-encoded image data
+            user_id: Optional user ID for usage logging
+            starting_attempt: Attempts already made (user key)
+            usage_logger: ModelUsageLogger instance
+            health_tracker: HealthTrackerService instance
+            
+        Returns:
+            Dict containing:
+                - result: Winning result, or the last failed result
+                - key: Key the result came from
+                - attempt: Index of that key in the hedged pair (0 or 1)
+                - keys_tried: Number of keys whose request was started
+                - hedged: Whether the backup request was started
+                - token_limit: Whether any attempt hit a token limit
+        """
+        scheduler = get_key_scheduler(self.supabase)
+        
+        async def run(key: Dict[str, Any]):
+            if not await self._acquire_key(key["id"]):
+                result = {"success": False, "error": "No free slot on key", "tokens_used": 0, "key_unavailable": True}
+                return key, result, 0
+            start_time = time.time()
+            result = None
+            try:
+                result = await self._call_key(key, feature, prompt, system_prompt, image_data)
+            except Exception as e:
+                result = {"success": False, "error": f"Unexpected error: {str(e)}", "tokens_used": 0}
+            finally:
+                # A cancelled hedge loser never reports to the breaker
+                self._release_key(key["id"], outcome_recorded=result is not None and not result.get("rate_limited"))
+            return key, result, int((time.time() - start_time) * 1000)
+        
+        tasks = {asyncio.create_task(run(primary))}
+        done, _ = await asyncio.wait(tasks, timeout=delay_ms / 1000)
+        
+        hedged = not done
+        if hedged:
+            logger.info(
+                f"Key {primary['id']} has not answered within {delay_ms}ms for feature '{feature}', "
+                f"hedging with key {backup['id']} (provider: {backup['provider']})"
+            )
+            tasks.add(asyncio.create_task(run(backup)))
+        
+        outcome = None
+        token_limit = False
+        pending = tasks
+        
+        try:
+            while pending and not (outcome and outcome["result"]["success"]):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    key, result, response_time = task.result()
+                    index = 0 if key is primary else 1
+                    actual_attempt = starting_attempt + index + 1
+                    
+                    if result.get("key_unavailable"):
+                        # Never called: the key stayed busy or parked past the queueing budget
+                        logger.info(f"Key {key['id']} has no free slot, not hedging with it")
+                        outcome = outcome or {"result": result, "key": key, "attempt": index}
+                        continue
+                    
+                    # A 429 parks the key instead of counting against its health
+                    if not result.get("rate_limited"):
+                        await health_tracker.update_key_health(
+                            key_id=key["id"],
+                            success=result["success"],
+                            response_time_ms=response_time
+                        )
+                    
+                    await usage_logger.log_model_call(
+                        user_id=user_id,
+                        provider=key["provider"],
+                        model=result.get("model", "unknown"),
+                        feature=feature,
+                        success=result["success"],
+                        tokens_used=result.get("tokens_used", 0),
+                        error=result.get("error"),
+                        key_id=key["id"],
+                        was_fallback=(index > 0 or starting_attempt > 0),
+                        attempt_number=actual_attempt,
+                        response_time_ms=response_time
+                    )
+                    
+                    if result["success"]:
+                        get_latency_tracker().record(feature, response_time)
+                        # Both attempts can finish together; account for each, keep the first win
+                        if not (outcome and outcome["result"]["success"]):
+                            outcome = {"result": result, "key": key, "attempt": index}
+                        continue
+                    
+                    log_error_msg = self._summarize_error(result.get("error", "Unknown error"))
+                    logger.warning(f"Key {key['id']} failed on attempt {actual_attempt}: {log_error_msg}")
+                    if result.get("rate_limited"):
+                        scheduler.park(key["id"], result.get("retry_after"))
+                    else:
+                        await self.record_failure(key["id"], log_error_msg)
+                    
+                    token_limit = token_limit or result.get("is_token_limit_error", False)
+                    if not (outcome and outcome["result"]["success"]):
+                        outcome = {"result": result, "key": key, "attempt": index}
+        finally:
+            # Cancel the slower request (or both, if we were cancelled ourselves)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        if pending and outcome and outcome["result"]["success"]:
+            logger.info(
+                f"Hedged request for feature '{feature}' won by key {outcome['key']['id']}, "
+                f"cancelled the slower request"
+            )
+        
+        outcome.update({
+            "keys_tried": len(tasks),
+            "hedged": hedged,
+            "token_limit": token_limit
+        })
+        return outcome
+    
     async def execute_with_fallback(
         self,
         provider: str,
@@ -325,7 +764,10 @@ class ModelRouterService:
         max_retries: int = 3,
         user_id: Optional[str] = None,
         image_data: Optional[str] = None,
-        session_preference: Optional[str] = None
+        session_preference: Optional[str] = None,
+        hedge: Optional[bool] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None,
+        timeout: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Execute a request with automatic fallback to next available key on failure
@@ -335,6 +777,20 @@ class ModelRouterService:
         Falls back to Hugging Face medical models if all paid API keys fail.
         Records failures for each failed key and logs all attempts.
         User-supplied keys have priority over shared keys.
+        When hedging is enabled, a slow first shared key is raced against
+        the next healthy key (see _execute_hedged).
+        When on_token is given the answer is streamed: fallback to the next
+        key only happens before the first chunk was forwarded, a stream that
+        breaks later fails the request (hedging is not used).
+        Identical non-streamed requests that are in flight at the same time
+        share one upstream call (see RequestCoalescer); personal keys are
+        only shared between requests of the same user.
+        Upstream calls pass through the admission queue: under saturation
+        they wait by plan and feature priority, or are shed with
+        overloaded=True and a retry_after hint (see AdmissionQueue).
+        The whole chain (queueing, every attempt and the Hugging Face
+        fallback) runs within the request deadline (see request_deadline);
+        when it runs out the request stops with deadline_exceeded=True.
         
         Args:
             provider: Provider name (gemini, openai, etc.) - may be overridden by health selection
@@ -345,6 +801,9 @@ class ModelRouterService:
             user_id: Optional user ID to check for personal API key
             image_data: Optional base64-encoded image data for vision models
             session_preference: Optional provider preference from session cache
+            hedge: Optional override for hedging; None uses ROUTER_HEDGE_FEATURES
+            on_token: Optional coroutine awaited with each streamed text chunk
+            timeout: Optional budget in seconds (can only tighten the request deadline)
             
         Returns:
             Dict containing:
@@ -357,23 +816,149 @@ class ModelRouterService:
                 - used_user_key: bool indicating if user's personal key was used
                 - used_fallback_model: bool indicating if Hugging Face fallback was used
                 - provider_used: Actual provider used (may differ from input)
+                - hedged: bool indicating if a hedge request was started (hedged path only)
+                - ttft_ms: Time to first token of the successful attempt (streaming only)
+                - stream_interrupted: bool, the stream failed after text was forwarded (streaming only)
+                - coalesced: bool, the result was shared from an identical in-flight request
+                - overloaded: bool, the request was shed by the admission queue
+                - retry_after: Seconds to wait before retrying (overloaded only)
+                - deadline_exceeded: bool, the request ran out of time budget
                 
         Requirements: 21.2, 21.3, 27.2, 27.7
         """
-        from services.model_usage_logger import get_model_usage_logger
-        from services.health_tracker import get_health_tracker_service
-        import time
-        
-        usage_logger = get_model_usage_logger(self.supabase)
-        health_tracker = get_health_tracker_service(self.supabase)
-        
         # Check if user has a personal API key (Requirement 27.2)
         user_key = None
         if user_id:
             user_key = await self.get_user_api_key(user_id)
         
-        # Get all active keys for this provider and feature
-        keys = await self.get_all_active_keys(provider, feature)
+        admission = get_admission_queue()
+        priority_class = admission.classify(await self._get_request_plan(user_id), feature)
+        
+        async def call() -> Dict[str, Any]:
+            try:
+                await admission.acquire(priority_class)
+            except AdmissionRejected as e:
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "tokens_used": 0,
+                    "overloaded": True,
+                    "retry_after": e.retry_after,
+                    "attempts": 0,
+                    "used_user_key": False,
+                    "used_fallback_model": False
+                }
+            
+            start_time = time.monotonic()
+            try:
+                return await self._execute_with_fallback(
+                    provider=provider,
+                    feature=feature,
+                    prompt=prompt,
+                    system_prompt=system_prompt,
+                    max_retries=max_retries,
+                    user_id=user_id,
+                    user_key=user_key,
+                    image_data=image_data,
+                    session_preference=session_preference,
+                    hedge=hedge,
+                    on_token=on_token
+                )
+            finally:
+                admission.release(time.monotonic() - start_time)
+        
+        async def run() -> Dict[str, Any]:
+            # Streams are delivered to one caller, so only plain requests are shared
+            if on_token is not None or not ROUTER_COALESCE_REQUESTS:
+                return await call()
+            
+            request_key = make_request_key(
+                feature,
+                provider,
+                system_prompt,
+                prompt,
+                image_data,
+                user_id if user_key else None
+            )
+            return await get_request_coalescer().run(request_key, call)
+        
+        with request_deadline(timeout):
+            remaining = get_remaining_budget()
+            if remaining is None:
+                result = await run()
+            else:
+                # Cancels the attempt in progress (and any further attempts) when the budget runs out
+                try:
+                    result = await asyncio.wait_for(run(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Request deadline exceeded for feature '{feature}', abandoning remaining attempts")
+                    result = self._deadline_exceeded_result(attempts=0)
+        
+        if isinstance(result, dict) and result.get("overloaded"):
+            # Lets the API answer 503 with Retry-After (see AdmissionRejectionMiddleware)
+            note_request_rejection(result["retry_after"])
+        return result
+    
+    def _deadline_exceeded_result(self, attempts: int) -> Dict[str, Any]:
+        """Result for a request whose time budget ran out"""
+        return {
+            "success": False,
+            "error": "Request deadline exceeded",
+            "tokens_used": 0,
+            "deadline_exceeded": True,
+            "attempts": attempts,
+            "used_user_key": False,
+            "used_fallback_model": False
+        }
+    
+    async def _get_request_plan(self, user_id: Optional[str]) -> Optional[str]:
+        """
+        Get the plan that sets a request's admission priority
+        
+        Uses the plan recorded for the current request by the rate limiter,
+        otherwise looks up the user's plan.
+        
+        Args:
+            user_id: Optional user ID
+            
+        Returns:
+            Plan name, "admin" for admin roles, or None if unknown
+        """
+        plan = get_request_plan()
+        if plan is not None or not user_id:
+            return plan
+        
+        try:
+            profile = await get_user_profiles(self.supabase).get(user_id)
+            if profile:
+                if profile.get("role") in ["super_admin", "admin", "ops"]:
+                    return "admin"
+                return profile.get("plan")
+        except Exception as e:
+            logger.warning(f"Failed to look up plan for admission priority: {str(e)}")
+        return None
+    
+    async def _execute_with_fallback(
+        self,
+        provider: str,
+        feature: str,
+        prompt: str,
+        system_prompt: Optional[str],
+        max_retries: int,
+        user_id: Optional[str],
+        user_key: Optional[str],
+        image_data: Optional[str],
+        session_preference: Optional[str],
+        hedge: Optional[bool],
+        on_token: Optional[Callable[[str], Awaitable[None]]]
+    ) -> Dict[str, Any]:
+        """Run one request through the key fallback chain (see execute_with_fallback)"""
+        from services.model_usage_logger import get_model_usage_logger
+        from services.health_tracker import get_health_tracker_service
+        
+        usage_logger = get_model_usage_logger(self.supabase)
+        health_tracker = get_health_tracker_service(self.supabase)
+        scheduler = get_key_scheduler(self.supabase)
         
         # If user has a personal key, try it first (Requirement 27.2)
         if user_key:
@@ -390,14 +975,26 @@ class ModelRouterService:
                 provider_instance = get_openrouter_provider()
                 
                 # Call OpenRouter with user's key
-                result = await provider_instance.call_openrouter(
-                    api_key=user_key,
-                    provider=provider,
-                    feature=feature,
-                    prompt=prompt,
-                    system_prompt=system_prompt,
-                    image_data=image_data
-                )
+                if on_token is not None and not image_data:
+                    result = await self._stream_openrouter(
+                        api_key=user_key,
+                        provider=provider,
+                        feature=feature,
+                        prompt=prompt,
+                        system_prompt=system_prompt,
+                        on_token=on_token
+                    )
+                else:
+                    result = await provider_instance.call_openrouter(
+                        api_key=user_key,
+                        provider=provider,
+                        feature=feature,
+                        prompt=prompt,
+                        system_prompt=system_prompt,
+                        image_data=image_data
+                    )
+                    if result["success"] and on_token is not None:
+                        await on_token(result["content"])
                 
                 response_time = int((time.time() - start_time) * 1000)
                 
@@ -413,7 +1010,8 @@ class ModelRouterService:
                     key_id=f"user_{user_id}",
                     was_fallback=False,
                     attempt_number=1,
-                    response_time_ms=response_time
+                    response_time_ms=response_time,
+                    time_to_first_token_ms=result.get("ttft_ms")
                 )
                 
                 if result["success"]:
@@ -428,6 +1026,14 @@ class ModelRouterService:
                     result["used_user_key"] = True
                     result["used_fallback_model"] = False
                     
+                    return result
+                elif result.get("stream_interrupted"):
+                    # Text already reached the client; another key can't continue it
+                    logger.warning(f"Stream from user's personal API key broke off: {result.get('error')}")
+                    result["key_id"] = f"user_{user_id}"
+                    result["attempts"] = 1
+                    result["used_user_key"] = True
+                    result["used_fallback_model"] = False
                     return result
                 else:
                     # User's key failed, log and fall back to shared keys (Requirement 27.7)
@@ -461,7 +1067,7 @@ class ModelRouterService:
                 # Continue to shared keys below
         
         # If no user key or user key failed, use health-based multi-provider selection
-        # Get ALL healthy keys across ALL providers for this feature
+        # Get ALL healthy keys across ALL providers for this feature (served from the key registry)
         keys = await health_tracker.get_all_healthy_keys_for_feature(feature)
         
         if not keys:
@@ -470,6 +1076,7 @@ class ModelRouterService:
             # Try Hugging Face as fallback
             return await self._try_huggingface_fallback(
                 feature=feature,
+                on_token=on_token,
                 prompt=prompt,
                 system_prompt=system_prompt,
                 user_id=user_id,
@@ -479,13 +1086,15 @@ class ModelRouterService:
         # Select best provider based on health and session preference
         best_key = await health_tracker.select_best_provider(
             feature=feature,
-            session_preference=session_preference
+            session_preference=session_preference,
+            healthy_keys=keys
         )
         
         if not best_key:
             logger.warning(f"No best key selected for feature '{feature}'. Trying Hugging Face fallback...")
             return await self._try_huggingface_fallback(
                 feature=feature,
+                on_token=on_token,
                 prompt=prompt,
                 system_prompt=system_prompt,
                 user_id=user_id,
@@ -512,11 +1121,64 @@ class ModelRouterService:
             f"User key tried: {user_key is not None}"
         )
         
+        # Race the first two keys if hedging is enabled for this request
+        start_index = 0
+        if max_attempts > 1 and on_token is None and self.should_hedge(feature, hedge):
+            hedged = await self._execute_hedged(
+                primary=keys[0],
+                backup=keys[1],
+                delay_ms=self.get_hedge_delay_ms(feature),
+                feature=feature,
+                prompt=prompt,
+                system_prompt=system_prompt,
+                image_data=image_data,
+                user_id=user_id,
+                starting_attempt=starting_attempt,
+                usage_logger=usage_logger,
+                health_tracker=health_tracker
+            )
+            result = hedged["result"]
+            actual_attempt = starting_attempt + hedged["attempt"] + 1
+            
+            if result["success"]:
+                result["key_id"] = hedged["key"]["id"]
+                result["attempts"] = actual_attempt
+                result["used_user_key"] = False
+                result["used_fallback_model"] = False
+                result["provider_used"] = hedged["key"]["provider"]
+                result["hedged"] = hedged["hedged"]
+                return result
+            
+            if hedged["token_limit"]:
+                return await self._try_huggingface_fallback(
+                    feature=feature,
+                    on_token=on_token,
+                    prompt=prompt,
+                    system_prompt=system_prompt,
+                    user_id=user_id,
+                    attempt_number=starting_attempt + hedged["keys_tried"],
+                    reason="token_limit_exceeded"
+                )
+            
+            start_index = hedged["keys_tried"]
+            if start_index >= max_attempts:
+                logger.warning(
+                    f"All paid API keys failed for provider '{provider}', feature '{feature}'. "
+                    f"Trying Hugging Face fallback..."
+                )
+                return await self._try_huggingface_fallback(
+                    feature=feature,
+                    on_token=on_token,
+                    prompt=prompt,
+                    system_prompt=system_prompt,
+                    user_id=user_id,
+                    attempt_number=starting_attempt + start_index
+                )
+        
         # Try each key in priority order
-        for attempt in range(max_attempts):
+        for attempt in range(start_index, max_attempts):
             key = keys[attempt]
             key_id = key["id"]
-            api_key = key["key_value"]
             key_provider = key["provider"]  # Use actual provider from key
             
             # Calculate actual attempt number (including user key attempt if it happened)
@@ -527,48 +1189,69 @@ class ModelRouterService:
                 f"(provider: {key_provider}, priority: {key['priority']}, health: {key.get('health_score', 1.0):.2f})"
             )
             
-            start_time = time.time()
+            # Don't start an attempt the request no longer has time for
+            if not has_budget_for_attempt():
+                logger.warning(f"Request deadline reached before attempt {actual_attempt}, not trying key {key_id}")
+                return self._deadline_exceeded_result(attempts=actual_attempt - 1)
             
-            try:
-                # Route to appropriate provider
-                if key_provider == "huggingface":
-                    # Use HuggingFace provider directly
-                    from services.providers.huggingface import get_huggingface_provider
-                    provider_instance = get_huggingface_provider()
-                    
-                    # Call HuggingFace with DB key
-                    result = await provider_instance.call_huggingface(
-                        api_key=api_key,
-                        feature=feature,
-                        prompt=prompt,
-                        system_prompt=system_prompt,
-                        max_tokens=4096,
-                        temperature=0.9,
-                        image_data=image_data
+            # Queue briefly for a slot on this key; a key that stays busy or
+            # parked after a 429 (or whose recovery probe is taken) is skipped
+            # without counting as a failure
+            if not await self._acquire_key(key_id):
+                logger.info(f"Key {key_id} has no free slot, skipping to the next key")
+                
+                if attempt == max_attempts - 1:
+                    logger.warning(
+                        f"No paid API key available for provider '{provider}', feature '{feature}'. "
+                        f"Trying Hugging Face fallback..."
                     )
-                else:
-                    # Use OpenRouter for all other providers
-                    from services.providers.openrouter import get_openrouter_provider
-                    provider_instance = get_openrouter_provider()
                     
-                    # Call OpenRouter
-                    result = await provider_instance.call_openrouter(
-                        api_key=api_key,
-                        provider=key_provider,  # Use actual provider
+                    return await self._try_huggingface_fallback(
                         feature=feature,
+                        on_token=on_token,
                         prompt=prompt,
                         system_prompt=system_prompt,
-                        image_data=image_data
+                        user_id=user_id,
+                        attempt_number=actual_attempt
                     )
                 
+                continue
+            
+            start_time = time.time()
+            
+            try:
+                result = None
+                try:
+                    # Route to appropriate provider
+                    if on_token is not None:
+                        result = await self._stream_key(
+                            key=key,
+                            feature=feature,
+                            prompt=prompt,
+                            system_prompt=system_prompt,
+                            image_data=image_data,
+                            on_token=on_token
+                        )
+                    else:
+                        result = await self._call_key(
+                            key=key,
+                            feature=feature,
+                            prompt=prompt,
+                            system_prompt=system_prompt,
+                            image_data=image_data
+                        )
+                finally:
+                    self._release_key(key_id, outcome_recorded=result is not None and not result.get("rate_limited"))
+                
                 response_time = int((time.time() - start_time) * 1000)
                 
-                # Update health tracking
-                await health_tracker.update_key_health(
-                    key_id=key_id,
-                    success=result["success"],
-                    response_time_ms=response_time
-                )
+                # Update health tracking (a 429 parks the key instead)
+                if not result.get("rate_limited"):
+                    await health_tracker.update_key_health(
+                        key_id=key_id,
+                        success=result["success"],
+                        response_time_ms=response_time
+                    )
                 
                 # Log the attempt
                 await usage_logger.log_model_call(
@@ -582,7 +1265,8 @@ class ModelRouterService:
                     key_id=key_id,
                     was_fallback=(attempt > 0 or user_key is not None),
                     attempt_number=actual_attempt,
-                    response_time_ms=response_time
+                    response_time_ms=response_time,
+                    time_to_first_token_ms=result.get("ttft_ms")
                 )
                 
                 if result["success"]:
@@ -591,6 +1275,9 @@ class ModelRouterService:
                         f"Tokens used: {result['tokens_used']}"
                     )
                     
+                    # Feed the feature's latency window (used for hedging thresholds)
+                    get_latency_tracker().record(feature, response_time)
+                    
                     # If we had to fallback (attempt > 0 or user_key was tried), send notification (Requirement 18.2)
                     if attempt > 0 or user_key:
                         try:
@@ -624,27 +1311,28 @@ class ModelRouterService:
                     is_token_limit = result.get("is_token_limit_error", False)
                     
                     # Clean up error message for logging - truncate HTML
-                    log_error_msg = error_msg
-                    if isinstance(error_msg, str) and (error_msg.startswith('<!DOCTYPE') or '<html' in error_msg[:100]):
-                        # Extract just the key info from HTML error
-                        if '504' in error_msg:
-                            log_error_msg = "Gateway Timeout (504)"
-                        elif '502' in error_msg:
-                            log_error_msg = "Bad Gateway (502)"
-                        elif '503' in error_msg:
-                            log_error_msg = "Service Unavailable (503)"
-                        else:
-                            log_error_msg = "API returned HTML error page"
-                    elif isinstance(error_msg, str) and len(error_msg) > 200:
-                        # Truncate long error messages
-                        log_error_msg = error_msg[:200] + "..."
+                    log_error_msg = self._summarize_error(error_msg)
                     
                     logger.warning(
                         f"Key {key_id} failed on attempt {actual_attempt}: {log_error_msg}"
                     )
                     
-                    # Record the failure (use truncated message)
-                    await self.record_failure(key_id, log_error_msg)
+                    # Record the failure (use truncated message); rate limited keys are
+                    # parked for their Retry-After period rather than degraded
+                    if result.get("rate_limited"):
+                        scheduler.park(key_id, result.get("retry_after"))
+                    else:
+                        await self.record_failure(key_id, log_error_msg)
+                    
+                    # Text already reached the client; another key can't continue it
+                    if result.get("stream_interrupted"):
+                        logger.warning(f"Stream from key {key_id} broke off after the first token, not falling back")
+                        result["key_id"] = key_id
+                        result["attempts"] = actual_attempt
+                        result["used_user_key"] = False
+                        result["used_fallback_model"] = False
+                        result["provider_used"] = key_provider
+                        return result
                     
                     # If this is a token limit error, skip remaining paid APIs and go straight to Hugging Face
                     if is_token_limit:
@@ -655,6 +1343,7 @@ class ModelRouterService:
                         
                         return await self._try_huggingface_fallback(
                             feature=feature,
+                            on_token=on_token,
                             prompt=prompt,
                             system_prompt=system_prompt,
                             user_id=user_id,
@@ -671,6 +1360,7 @@ class ModelRouterService:
                         
                         return await self._try_huggingface_fallback(
                             feature=feature,
+                            on_token=on_token,
                             prompt=prompt,
                             system_prompt=system_prompt,
                             user_id=user_id,
@@ -714,6 +1404,7 @@ class ModelRouterService:
                     
                     return await self._try_huggingface_fallback(
                         feature=feature,
+                        on_token=on_token,
                         prompt=prompt,
                         system_prompt=system_prompt,
                         user_id=user_id,
@@ -730,6 +1421,7 @@ class ModelRouterService:
                     
                     return await self._try_huggingface_fallback(
                         feature=feature,
+                        on_token=on_token,
                         prompt=prompt,
                         system_prompt=system_prompt,
                         user_id=user_id,
@@ -756,7 +1448,8 @@ class ModelRouterService:
         system_prompt: Optional[str],
         user_id: Optional[str],
         attempt_number: int,
-        reason: Optional[str] = None
+        reason: Optional[str] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         Try Hugging Face medical models as final fallback
@@ -768,18 +1461,23 @@ class ModelRouterService:
             user_id: User ID
             attempt_number: Current attempt number
             reason: Reason for fallback (e.g., "token_limit_exceeded")
+            on_token: Optional coroutine awaited with the answer (sent as one chunk)
             
         Returns:
             Result dict with success, content, etc.
         """
         from services.providers.huggingface import get_huggingface_provider
         from services.model_usage_logger import get_model_usage_logger
-        import time
         
         usage_logger = get_model_usage_logger(self.supabase)
         hf_provider = get_huggingface_provider()
         
         reason_msg = f" (reason: {reason})" if reason else ""
+        
+        if not has_budget_for_attempt():
+            logger.warning(f"Request deadline reached, skipping Hugging Face fallback for feature: {feature}{reason_msg}")
+            return self._deadline_exceeded_result(attempts=attempt_number)
+        
         logger.info(f"Attempting Hugging Face fallback for feature: {feature}{reason_msg}")
         
         # Get HuggingFace key from database
@@ -847,6 +1545,9 @@ class ModelRouterService:
                 result["key_id"] = "huggingface_fallback"
                 result["fallback_reason"] = reason
                 
+                if on_token is not None:
+                    await on_token(result["content"])
+                
                 return result
             else:
                 # Even Hugging Face failed - trigger maintenance
@@ -950,7 +1651,7 @@ def get_model_router_service(supabase_client: Optional[Client] = None) -> ModelR
     """
     global _model_router_service
     
-    if _model_router_service is None or supabase_client is not None:
+    if _model_router_service is None or (supabase_client is not None and supabase_client is not _model_router_service.supabase):
         _model_router_service = ModelRouterService(supabase_client)
     
     return _model_router_service
@@ -3,12 +3,14 @@ Model Usage Logger Service
 Logs all model API calls for monitoring and reporting
 Requirements: Admin visibility, cost tracking, fallback monitoring
 """
-import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 import logging
+from services.usage_log_writer import get_usage_log_writer
+from services.db_executor import run_query
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -27,11 +29,7 @@ class ModelUsageLogger:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def log_model_call(
         self,
@@ -45,11 +43,16 @@ class ModelUsageLogger:
         key_id: Optional[str] = None,
         was_fallback: bool = False,
         attempt_number: int = 1,
-        response_time_ms: Optional[int] = None
+        response_time_ms: Optional[int] = None,
+        time_to_first_token_ms: Optional[int] = None
     ) -> None:
         """
         Log a model API call
         
+        The row is handed to the usage log writer, which inserts it in the
+        background in bulk (see services/usage_log_writer.py); with
+        write-behind disabled it is inserted immediately.
+        
         Args:
             user_id: User who made the request (None for system calls)
             provider: Provider name (openrouter, huggingface, etc.)
@@ -62,6 +65,7 @@ class ModelUsageLogger:
             was_fallback: Whether this was a fallback attempt
             attempt_number: Attempt number (1 for first try)
             response_time_ms: Response time in milliseconds
+            time_to_first_token_ms: Time to the first streamed token (streaming calls only)
         """
         try:
             log_entry = {
@@ -78,8 +82,15 @@ class ModelUsageLogger:
                 "response_time_ms": response_time_ms,
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
+            if time_to_first_token_ms is not None:
+                log_entry["time_to_first_token_ms"] = time_to_first_token_ms
             
-            self.supabase.table("model_usage_logs").insert(log_entry).execute()
+            # Buffered and bulk-inserted in the background when write-behind is enabled
+            writer = get_usage_log_writer(self.supabase)
+            if writer is not None:
+                await writer.put(log_entry)
+            else:
+                await run_query(self.supabase.table("model_usage_logs").insert(log_entry))
             
             logger.info(
                 f"Logged model call: {provider}/{model} for {feature} "
@@ -126,7 +137,7 @@ class ModelUsageLogger:
             if user_id:
                 query = query.eq("user_id", user_id)
             
-            response = query.execute()
+            response = await run_query(query)
             logs = response.data if response.data else []
             
             # Calculate statistics
@@ -236,7 +247,7 @@ class ModelUsageLogger:
             if feature:
                 query = query.eq("feature", feature)
             
-            response = query.execute()
+            response = await run_query(query)
             return response.data if response.data else []
             
         except Exception as e:
@@ -268,7 +279,7 @@ class ModelUsageLogger:
             if end_date:
                 query = query.lte("timestamp", end_date)
             
-            response = query.execute()
+            response = await run_query(query)
             fallback_logs = response.data if response.data else []
             
             # Analyze fallbacks
@@ -313,7 +324,7 @@ def get_model_usage_logger(supabase_client: Optional[Client] = None) -> ModelUsa
     """Get or create singleton model usage logger instance"""
     global _model_usage_logger
     
-    if _model_usage_logger is None or supabase_client is not None:
+    if _model_usage_logger is None or (supabase_client is not None and supabase_client is not _model_usage_logger.supabase):
         _model_usage_logger = ModelUsageLogger(supabase_client)
     
     return _model_usage_logger
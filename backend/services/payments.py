@@ -6,10 +6,13 @@ Requirements: 24.1, 24.2, 24.3, 24.4, 24.6, 24.7
 import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone, timedelta
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
 import hmac
 import hashlib
+from services.db_executor import run_query
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +31,7 @@ class PaymentService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
         
         # Razorpay configuration
         self.razorpay_key_id = os.getenv("RAZORPAY_KEY_ID")
@@ -75,7 +74,7 @@ class PaymentService:
                 "current_period_end": period_end.isoformat()
             }
             
-            response = self.supabase.table("subscriptions").insert(subscription_data).execute()
+            response = await run_query(self.supabase.table("subscriptions").insert(subscription_data))
             
             if not response.data or len(response.data) == 0:
                 raise Exception("Failed to create subscription")
@@ -123,10 +122,11 @@ class PaymentService:
                 subscription_id = payment_entity.get("subscription_id")
                 
                 # Get subscription details
-                subscription_response = self.supabase.table("subscriptions")\
-                    .select("*")\
-                    .eq("razorpay_subscription_id", subscription_id)\
-                    .execute()
+                subscription_response = await run_query(
+                    self.supabase.table("subscriptions")
+                    .select("*")
+                    .eq("razorpay_subscription_id", subscription_id)
+                )
                 
                 if not subscription_response.data or len(subscription_response.data) == 0:
                     raise Exception("Subscription not found")
@@ -145,13 +145,15 @@ class PaymentService:
                     "status": "success"
                 }
                 
-                self.supabase.table("payments").insert(payment_data).execute()
+                await run_query(self.supabase.table("payments").insert(payment_data))
                 
                 # Update user plan (Requirement 24.3)
-                self.supabase.table("users")\
-                    .update({"plan": plan})\
-                    .eq("id", user_id)\
-                    .execute()
+                await run_query(
+                    self.supabase.table("users")
+                    .update({"plan": plan})
+                    .eq("id", user_id)
+                )
+                get_user_profiles(self.supabase).invalidate(user_id)
                 
                 return {
                     "success": True,
@@ -166,10 +168,11 @@ class PaymentService:
                 razorpay_subscription_id = subscription_entity.get("id")
                 
                 # Update subscription status
-                self.supabase.table("subscriptions")\
-                    .update({"status": "cancelled"})\
-                    .eq("razorpay_subscription_id", razorpay_subscription_id)\
-                    .execute()
+                await run_query(
+                    self.supabase.table("subscriptions")
+                    .update({"status": "cancelled"})
+                    .eq("razorpay_subscription_id", razorpay_subscription_id)
+                )
                 
                 return {
                     "success": True,
@@ -207,11 +210,12 @@ class PaymentService:
         """
         try:
             # Verify subscription belongs to user
-            subscription_response = self.supabase.table("subscriptions")\
-                .select("*")\
-                .eq("id", subscription_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            subscription_response = await run_query(
+                self.supabase.table("subscriptions")
+                .select("*")
+                .eq("id", subscription_id)
+                .eq("user_id", user_id)
+            )
             
             if not subscription_response.data or len(subscription_response.data) == 0:
                 raise Exception("Subscription not found or does not belong to user")
@@ -219,10 +223,11 @@ class PaymentService:
             subscription = subscription_response.data[0]
             
             # Update subscription status
-            self.supabase.table("subscriptions")\
-                .update({"status": "cancelled"})\
-                .eq("id", subscription_id)\
-                .execute()
+            await run_query(
+                self.supabase.table("subscriptions")
+                .update({"status": "cancelled"})
+                .eq("id", subscription_id)
+            )
             
             # Note: In production, you would also call Razorpay API to cancel the subscription
             # razorpay_client.subscription.cancel(subscription["razorpay_subscription_id"])
@@ -250,11 +255,12 @@ class PaymentService:
             now = datetime.now(timezone.utc).isoformat()
             
             # Get expired subscriptions
-            expired_response = self.supabase.table("subscriptions")\
-                .select("*")\
-                .eq("status", "active")\
-                .lt("current_period_end", now)\
-                .execute()
+            expired_response = await run_query(
+                self.supabase.table("subscriptions")
+                .select("*")
+                .eq("status", "active")
+                .lt("current_period_end", now)
+            )
             
             downgraded_users = []
             
@@ -263,16 +269,19 @@ class PaymentService:
                     user_id = subscription["user_id"]
                     
                     # Update subscription status
-                    self.supabase.table("subscriptions")\
-                        .update({"status": "expired"})\
-                        .eq("id", subscription["id"])\
-                        .execute()
+                    await run_query(
+                        self.supabase.table("subscriptions")
+                        .update({"status": "expired"})
+                        .eq("id", subscription["id"])
+                    )
                     
                     # Downgrade user to free plan (Requirement 24.4)
-                    self.supabase.table("users")\
-                        .update({"plan": "free"})\
-                        .eq("id", user_id)\
-                        .execute()
+                    await run_query(
+                        self.supabase.table("users")
+                        .update({"plan": "free"})
+                        .eq("id", user_id)
+                    )
+                    get_user_profiles(self.supabase).invalidate(user_id)
                     
                     downgraded_users.append({
                         "user_id": user_id,
@@ -333,6 +342,6 @@ def get_payment_service(supabase_client: Optional[Client] = None) -> PaymentServ
         PaymentService instance
     """
     global _payment_service_instance
-    if _payment_service_instance is None or supabase_client is not None:
+    if _payment_service_instance is None or (supabase_client is not None and supabase_client is not _payment_service_instance.supabase):
         _payment_service_instance = PaymentService(supabase_client)
     return _payment_service_instance
@@ -0,0 +1,271 @@
+"""
+Provider Scoring
+Latency-aware routing scores for API keys
+
+Every call outcome updates an exponentially weighted moving average (EWMA)
+of the key's latency and error rate. Candidate keys for a feature are
+ranked by a weighted score of priority, reliability, latency and provider
+cost. The weights are set per feature, so latency-critical features prefer
+fast keys and bulk features prefer cheap ones.
+"""
+import os
+import time
+import threading
+import weakref
+import logging
+from typing import Any, Dict, List, Optional
+from supabase import Client
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Weight of the newest sample in the moving averages
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+
+SCORE_COMPONENTS = ("priority", "reliability", "latency", "cost")
+
+# Per-feature weights; features not listed use "default".
+# Override with ROUTING_WEIGHTS_<FEATURE>=priority=0.3,latency=0.5,...
+DEFAULT_ROUTING_WEIGHTS: Dict[str, Dict[str, float]] = {
+    "default": {"priority": 0.5, "reliability": 0.3, "latency": 0.2, "cost": 0.0},
+    "chat": {"priority": 0.2, "reliability": 0.3, "latency": 0.5, "cost": 0.0},
+    "osce": {"priority": 0.2, "reliability": 0.3, "latency": 0.5, "cost": 0.0},
+    "flashcard": {"priority": 0.2, "reliability": 0.3, "latency": 0.0, "cost": 0.5},
+    "map": {"priority": 0.2, "reliability": 0.3, "latency": 0.0, "cost": 0.5},
+}
+
+# Relative cost per provider (0 = free, 1 = most expensive).
+# Override with ROUTING_PROVIDER_COSTS=openrouter=1.0,gemini=0.3
+DEFAULT_PROVIDER_COSTS: Dict[str, float] = {
+    "huggingface": 0.0,
+    "ollama": 0.0,
+    "gemini": 0.3,
+    "openrouter": 1.0,
+    "openai": 1.0,
+    "anthropic": 1.0,
+}
+
+
+def _parse_pairs(value: str) -> Dict[str, float]:
+    """Parse 'name=number,name=number' into a dict, skipping malformed entries"""
+    pairs = {}
+    for item in value.split(","):
+        name, _, number = item.partition("=")
+        try:
+            pairs[name.strip()] = float(number)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Ignoring malformed routing setting '{item.strip()}'")
+    return pairs
+
+
+def _load_weights() -> Dict[str, Dict[str, float]]:
+    weights = {feature: dict(w) for feature, w in DEFAULT_ROUTING_WEIGHTS.items()}
+    for name, value in os.environ.items():
+        if name.startswith("ROUTING_WEIGHTS_"):
+            feature = name[len("ROUTING_WEIGHTS_"):].lower()
+            override = {k: v for k, v in _parse_pairs(value).items() if k in SCORE_COMPONENTS}
+            weights[feature] = {**weights.get(feature, weights["default"]), **override}
+    return weights
+
+
+ROUTING_WEIGHTS = _load_weights()
+PROVIDER_COSTS = {**DEFAULT_PROVIDER_COSTS, **_parse_pairs(os.getenv("ROUTING_PROVIDER_COSTS", ""))}
+
+
+class KeyStats:
+    """Moving averages for one API key"""
+
+    __slots__ = ("latency_ms", "error_rate", "samples", "updated_at")
+
+    def __init__(self):
+        self.latency_ms: Optional[float] = None  # EWMA over successful calls
+        self.error_rate = 0.0                    # EWMA of failures (1) and successes (0)
+        self.samples = 0
+        self.updated_at = 0.0
+
+    def update(self, success: bool, response_time_ms: Optional[int], alpha: float) -> None:
+        outcome = 0.0 if success else 1.0
+        if self.samples == 0:
+            self.error_rate = outcome
+        else:
+            self.error_rate += alpha * (outcome - self.error_rate)
+
+        # Failures are often fast rejections (429, auth), so they don't count as latency
+        if success and response_time_ms is not None:
+            if self.latency_ms is None:
+                self.latency_ms = float(response_time_ms)
+            else:
+                self.latency_ms += alpha * (response_time_ms - self.latency_ms)
+
+        self.samples += 1
+        self.updated_at = time.time()
+
+
+class ProviderScorer:
+    """Ranks candidate keys by priority, EWMA reliability, EWMA latency and cost"""
+
+    def __init__(self, alpha: float = ROUTING_EWMA_ALPHA):
+        """
+        Initialize the scorer
+
+        Args:
+            alpha: Weight of the newest sample in the moving averages
+        """
+        self.alpha = alpha
+        self._stats: Dict[str, KeyStats] = {}
+        self._last_rankings: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key_id: str, success: bool, response_time_ms: Optional[int] = None) -> None:
+        """
+        Record a call outcome for a key
+
+        Args:
+            key_id: API key ID
+            success: Whether the call succeeded
+            response_time_ms: Response time in milliseconds
+        """
+        with self._lock:
+            stats = self._stats.get(key_id)
+            if stats is None:
+                stats = self._stats[key_id] = KeyStats()
+            stats.update(success, response_time_ms, self.alpha)
+
+    def get_weights(self, feature: str) -> Dict[str, float]:
+        """Scoring weights for a feature"""
+        return ROUTING_WEIGHTS.get(feature, ROUTING_WEIGHTS["default"])
+
+    def rank(self, keys: List[Dict[str, Any]], feature: str) -> List[Dict[str, Any]]:
+        """
+        Order candidate keys by routing score, best first
+
+        Keys without samples get full reliability and latency scores, so new
+        or recovered keys are tried. Ties keep the incoming (priority) order.
+
+        Args:
+            keys: Candidate key dicts with id, provider and priority
+            feature: Feature name (selects the weights)
+
+        Returns:
+            New list of key dicts with routing_score and score_inputs added
+        """
+        if not keys:
+            return []
+
+        weights = self.get_weights(feature)
+        total_weight = sum(weights.values()) or 1.0
+
+        with self._lock:
+            stats = {key["id"]: self._stats.get(key["id"]) for key in keys}
+
+        highest = max(key.get("priority") or 0 for key in keys)
+        latencies = [s.latency_ms for s in stats.values() if s and s.latency_ms]
+        fastest = min(latencies) if latencies else None
+
+        scored = []
+        for key in keys:
+            key_stats = stats[key["id"]]
+            latency_ms = key_stats.latency_ms if key_stats else None
+            error_rate = key_stats.error_rate if key_stats else 0.0
+
+            components = {
+                "priority": max(key.get("priority") or 0, 0) / highest if highest > 0 else 1.0,
+                "reliability": 1.0 - error_rate,
+                "latency": fastest / latency_ms if fastest and latency_ms else 1.0,
+                "cost": 1.0 - PROVIDER_COSTS.get(key.get("provider"), 1.0)
+            }
+            score = sum(weights.get(name, 0.0) * value for name, value in components.items()) / total_weight
+
+            scored.append({
+                **key,
+                "routing_score": round(score, 4),
+                "score_inputs": {
+                    "ewma_latency_ms": round(latency_ms) if latency_ms is not None else None,
+                    "ewma_error_rate": round(error_rate, 4),
+                    "samples": key_stats.samples if key_stats else 0,
+                    "components": {name: round(value, 4) for name, value in components.items()}
+                }
+            })
+
+        scored.sort(key=lambda k: k["routing_score"], reverse=True)
+
+        self._last_rankings[feature] = [
+            {
+                "id": k["id"],
+                "provider": k.get("provider"),
+                "priority": k.get("priority"),
+                "routing_score": k["routing_score"],
+                **k["score_inputs"]
+            }
+            for k in scored
+        ]
+
+        return scored
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """
+        Get the scoring inputs for admin visibility
+
+        Returns:
+            Dict with weights, provider costs, per-key averages and the most
+            recent ranking for each feature
+        """
+        with self._lock:
+            keys = {
+                key_id: {
+                    "ewma_latency_ms": round(s.latency_ms) if s.latency_ms is not None else None,
+                    "ewma_error_rate": round(s.error_rate, 4),
+                    "samples": s.samples
+                }
+                for key_id, s in self._stats.items()
+            }
+
+        return {
+            "ewma_alpha": self.alpha,
+            "weights": ROUTING_WEIGHTS,
+            "provider_costs": PROVIDER_COSTS,
+            "keys": keys,
+            "rankings": dict(self._last_rankings)
+        }
+
+    def reset(self, key_id: Optional[str] = None) -> None:
+        """
+        Discard averages
+
+        Args:
+            key_id: Key to reset, or None for all keys
+        """
+        with self._lock:
+            if key_id is None:
+                self._stats.clear()
+                self._last_rankings.clear()
+            else:
+                self._stats.pop(key_id, None)
+
+
+# One scorer per Supabase client (key IDs belong to that database)
+_provider_scorers: "weakref.WeakKeyDictionary[Client, ProviderScorer]" = weakref.WeakKeyDictionary()
+_provider_scorers_lock = threading.Lock()
+
+
+def get_provider_scorer(supabase_client: Client) -> ProviderScorer:
+    """
+    Get or create the provider scorer bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        ProviderScorer instance
+    """
+    scorer = _provider_scorers.get(supabase_client)
+    if scorer is None:
+        with _provider_scorers_lock:
+            scorer = _provider_scorers.get(supabase_client)
+            if scorer is None:
+                scorer = ProviderScorer()
+                _provider_scorers[supabase_client] = scorer
+    return scorer
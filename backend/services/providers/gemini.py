@@ -7,7 +7,9 @@ import httpx
 import logging
 from typing import Dict, Any, Optional, AsyncIterator
 import json
+import os
 from config.model_config import get_gemini_model
+from services.providers.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +22,13 @@ class GeminiProvider:
     - 21.6: Support Gemini Flash as the primary free-tier provider
     """
     
-    # Gemini API endpoint
-    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+    # Gemini API endpoint (override to point at a local stand-in, e.g. for benchmarks)
+    BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
     
-    def __init__(self):
-        """Initialize the Gemini provider"""
-        self.client = httpx.AsyncClient(timeout=30.0)
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client shared by all Gemini requests"""
+        return get_http_client("gemini", timeout=30.0)
     
     def format_request(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -0,0 +1,132 @@
+"""
+Shared HTTP Client Pool
+Long-lived, connection-pooled httpx clients for AI provider integrations
+
+Every provider gets one AsyncClient per process with the same pooling
+policy, so TCP+TLS connections are reused across requests instead of
+being re-established per call. Clients are closed on application shutdown.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Pooling policy shared by all providers
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+# Clients by provider name
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+class ProviderHTTPError(Exception):
+    """Non-200 response from a provider, raised where results can't be returned (streaming)"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def get_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Read the Retry-After header of a response
+
+    Args:
+        response: Provider response
+
+    Returns:
+        Seconds to wait (delta-seconds or HTTP-date form), or None if absent/invalid
+    """
+    try:
+        value = response.headers.get("retry-after")
+        if not isinstance(value, str) or not value.strip():
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+
+def create_http_client(timeout: float) -> httpx.AsyncClient:
+    """
+    Create an AsyncClient using the shared pooling policy
+
+    HTTP/2 is only enabled when HTTP2_ENABLED is set and the h2 package
+    is installed; otherwise the client falls back to HTTP/1.1.
+
+    Args:
+        timeout: Default request timeout in seconds
+
+    Returns:
+        Configured httpx.AsyncClient
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+    logger.info(
+        f"Creating pooled HTTP client (max_connections={HTTP_MAX_CONNECTIONS}, "
+        f"keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS}, http2={http2})"
+    )
+
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+def get_http_client(name: str, timeout: float) -> httpx.AsyncClient:
+    """
+    Get the pooled client for a provider, creating it on first use
+
+    A client that has been closed (e.g. by a previous shutdown) is replaced.
+
+    Args:
+        name: Provider name (openrouter, gemini, huggingface)
+        timeout: Default request timeout in seconds, used on creation
+
+    Returns:
+        Shared httpx.AsyncClient for the provider
+    """
+    client = _clients.get(name)
+
+    if client is None or client.is_closed:
+        client = create_http_client(timeout)
+        _clients[name] = client
+
+    return client
+
+
+async def close_http_clients() -> None:
+    """Close all pooled provider clients (called on application shutdown)"""
+    clients = list(_clients.items())
+    _clients.clear()
+
+    for name, client in clients:
+        try:
+            await client.aclose()
+            logger.info(f"Closed pooled HTTP client for '{name}'")
+        except Exception as e:
+            logger.warning(f"Failed to close HTTP client for '{name}': {str(e)}")
@@ -7,7 +7,10 @@ Requirements: Medical model fallback, cost optimization
 import os
 from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
+import httpx
 import logging
+from services.providers.http_client import get_http_client, get_retry_after
+from services.embedding_cache import get_embedding_cache
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -42,14 +45,19 @@ class HuggingFaceProvider:
     
     def __init__(self):
         """Initialize Hugging Face provider"""
-        # Router endpoint for chat models (OpenAI-compatible)
-        self.router_url = "https://router.huggingface.co/v1"
+        # Router endpoint for chat models (OpenAI-compatible); overridable for local stand-ins
+        self.router_url = os.getenv("HUGGINGFACE_ROUTER_URL", "https://router.huggingface.co/v1")
         # Inference API endpoint for embeddings
         self.inference_url = "https://api-inference.huggingface.co/models"
         
         # No default API key - will be passed per request from database
         logger.info("HuggingFace provider initialized (API keys from database)")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client shared by chat, embedding and health check requests"""
+        return get_http_client("huggingface", timeout=60.0)
+    
     async def call_huggingface(
         self,
         api_key: str,
@@ -87,8 +95,6 @@ class HuggingFaceProvider:
         logger.info(f"Calling Hugging Face model: {model} for feature: {feature} (has_image={image_data is not None})")
         
         try:
-            import httpx
-            
             messages = []
             if system_prompt:
                 messages.append({"role": "system", "content": system_prompt})
@@ -139,68 +145,70 @@ class HuggingFaceProvider:
                 timeout_seconds = 90.0  # Default 90s for other models
             
             logger.info(f"Using timeout: {timeout_seconds}s for model: {model}")
-            async with httpx.AsyncClient(timeout=timeout_seconds) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            response = await self.client.post(url, headers=headers, json=payload, timeout=timeout_seconds)
                 
-                # If 402 (payment required), return error
-                if response.status_code == 402:
-                    error_msg = "HuggingFace Router API credits depleted"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "content": "",
-                        "tokens_used": 0,
-                        "model": model,
-                        "provider": "huggingface"
-                    }
+            # If 402 (payment required), return error
+            if response.status_code == 402:
+                error_msg = "HuggingFace Router API credits depleted"
+                logger.error(error_msg)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "content": "",
+                    "tokens_used": 0,
+                    "model": model,
+                    "provider": "huggingface"
+                }
                 
-                if response.status_code == 200:
-                    result = response.json()
+            if response.status_code == 200:
+                result = response.json()
                     
-                    if "choices" in result and len(result["choices"]) > 0:
-                        generated_text = result["choices"][0]["message"]["content"]
-                        tokens_used = result.get("usage", {}).get("total_tokens", 0)
-                        if tokens_used == 0:
-                            tokens_used = len(prompt + generated_text) // 4
-                    else:
-                        generated_text = str(result)
+                if "choices" in result and len(result["choices"]) > 0:
+                    generated_text = result["choices"][0]["message"]["content"]
+                    tokens_used = result.get("usage", {}).get("total_tokens", 0)
+                    if tokens_used == 0:
                         tokens_used = len(prompt + generated_text) // 4
+                else:
+                    generated_text = str(result)
+                    tokens_used = len(prompt + generated_text) // 4
                     
-                    if feature == "clinical":
-                        logger.info(f"Full HF response length: {len(generated_text)} chars")
-                        logger.debug(f"Full HF response: {generated_text}")
+                if feature == "clinical":
+                    logger.info(f"Full HF response length: {len(generated_text)} chars")
+                    logger.debug(f"Full HF response: {generated_text}")
                     
-                    logger.info(f"Hugging Face Router call succeeded. Model: {model}, Tokens: ~{tokens_used}")
+                logger.info(f"Hugging Face Router call succeeded. Model: {model}, Tokens: ~{tokens_used}")
                     
-                    return {
-                        "success": True,
-                        "content": generated_text.strip(),
-                        "error": None,
-                        "tokens_used": tokens_used,
-                        "model": model,
-                        "provider": "huggingface"
-                    }
+                return {
+                    "success": True,
+                    "content": generated_text.strip(),
+                    "error": None,
+                    "tokens_used": tokens_used,
+                    "model": model,
+                    "provider": "huggingface"
+                }
+            else:
+                # Clean up error message - truncate HTML responses
+                error_text = response.text
+                if error_text.startswith('<!DOCTYPE') or error_text.startswith('<html'):
+                    # It's an HTML error page, extract just the status
+                    error_msg = f"Hugging Face Router API error: {response.status_code} Gateway Timeout"
+                    logger.error(f"Hugging Face API returned HTML error page (status {response.status_code})")
                 else:
-                    # Clean up error message - truncate HTML responses
-                    error_text = response.text
-                    if error_text.startswith('<!DOCTYPE') or error_text.startswith('<html'):
-                        # It's an HTML error page, extract just the status
-                        error_msg = f"Hugging Face Router API error: {response.status_code} Gateway Timeout"
-                        logger.error(f"Hugging Face API returned HTML error page (status {response.status_code})")
-                    else:
-                        # It's a JSON or text error, log it normally
-                        error_msg = f"Hugging Face Router API error: {response.status_code} - {error_text[:200]}"
-                        logger.error(error_msg)
+                    # It's a JSON or text error, log it normally
+                    error_msg = f"Hugging Face Router API error: {response.status_code} - {error_text[:200]}"
+                    logger.error(error_msg)
                     
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "content": "",
-                        "tokens_used": 0,
-                        "model": model,
-                        "provider": "huggingface"
-                    }
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "content": "",
+                    "tokens_used": 0,
+                    "model": model,
+                    "provider": "huggingface",
+                    "status_code": response.status_code,
+                    "rate_limited": response.status_code == 429,
+                    "retry_after": get_retry_after(response)
+                }
             
 
                     
@@ -291,6 +299,17 @@ class HuggingFaceProvider:
         
         model = self.MEDICAL_MODELS["embedding"]
         
+        cache = get_embedding_cache()
+        if cache:
+            cached = await cache.get(model, prepend_instruction, text)
+            if cached is not None:
+                return {
+                    "success": True,
+                    "embedding": cached,
+                    "error": None,
+                    "model": model
+                }
+        
         try:
             # For Qwen models, no special instruction needed
             # For BGE models, prepend instruction to queries for better retrieval
@@ -305,8 +324,6 @@ class HuggingFaceProvider:
             
             # Use Router API endpoint (required - old inference API is deprecated)
             # This requires credits or PRO subscription
-            import httpx
-            
             url = f"{self.router_url}/embeddings"
             headers = {
                 "Authorization": f"Bearer {api_key}",
@@ -317,67 +334,50 @@ class HuggingFaceProvider:
                 "input": text_to_embed
             }
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            response = await self.client.post(url, headers=headers, json=payload, timeout=60.0)
                 
-                if response.status_code == 402:
-                    logger.error("HuggingFace Router API credits depleted")
-                    return {
-                        "success": False,
-                        "error": "HuggingFace API credits depleted. Free tier exhausted. Add credits at https://huggingface.co/settings/billing or wait until Apr 1 for reset.",
-                        "embedding": None,
-                        "model": model
-                    }
+            if response.status_code == 402:
+                logger.error("HuggingFace Router API credits depleted")
+                return {
+                    "success": False,
+                    "error": "HuggingFace API credits depleted. Free tier exhausted. Add credits at https://huggingface.co/settings/billing or wait until Apr 1 for reset.",
+                    "embedding": None,
+                    "model": model
+                }
                 
-                if response.status_code == 503:
-                    logger.warning("Model is loading, this may take a moment")
-                    return {
-                        "success": False,
-                        "error": "Model is loading. Please try again in a moment.",
-                        "embedding": None,
-                        "model": model
-                    }
+            if response.status_code == 503:
+                logger.warning("Model is loading, this may take a moment")
+                return {
+                    "success": False,
+                    "error": "Model is loading. Please try again in a moment.",
+                    "embedding": None,
+                    "model": model
+                }
                 
-                if response.status_code != 200:
-                    error_msg = f"API error: {response.status_code} - {response.text[:200]}"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "error": error_msg,
-                        "embedding": None,
-                        "model": model
-                    }
+            if response.status_code != 200:
+                error_msg = f"API error: {response.status_code} - {response.text[:200]}"
+                logger.error(error_msg)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "embedding": None,
+                    "model": model
+                }
                 
-                result = response.json()
-                # Router API returns embeddings in OpenAI format
-                if "data" in result and len(result["data"]) > 0:
-                    embedding = result["data"][0]["embedding"]
-                else:
-                    embedding = result
-            
-            # Convert to list if it's a numpy array or tensor
-            if hasattr(embedding, 'tolist'):
-                embedding = embedding.tolist()
-            
-            # Handle nested lists - feature_extraction often returns [[...]]
-            while isinstance(embedding, list) and len(embedding) > 0 and isinstance(embedding[0], list):
-                embedding = embedding[0]
-            
-            # Validate it's a proper list
-            if not isinstance(embedding, list):
-                raise ValueError(f"Invalid embedding format: expected list, got {type(embedding)}")
-            
-            # Validate all elements are numbers
-            if len(embedding) == 0:
-                raise ValueError("Embedding is empty")
+            result = response.json()
+            # Router API returns embeddings in OpenAI format
+            if "data" in result and len(result["data"]) > 0:
+                embedding = result["data"][0]["embedding"]
+            else:
+                embedding = result
             
-            # Check first few elements to ensure they're numbers (avoid checking all 4096)
-            sample_size = min(10, len(embedding))
-            if not all(isinstance(embedding[i], (int, float)) for i in range(sample_size)):
-                raise ValueError(f"Invalid embedding values: expected numbers")
+            embedding = self._normalize_embedding(embedding)
             
             logger.info(f"Embedding generated successfully, dimension: {len(embedding)}")
             
+            if cache:
+                cache.put(model, prepend_instruction, text, embedding)
+            
             return {
                 "success": True,
                 "embedding": embedding,
@@ -394,6 +394,172 @@ class HuggingFaceProvider:
                 "embedding": None,
                 "model": model
             }
+    
+    async def generate_embeddings(self, texts: List[str], api_key: Optional[str] = None, prepend_instruction: bool = True) -> Dict[str, Any]:
+        """
+        Generate embeddings for several texts in a single Router API request
+        
+        The /embeddings endpoint accepts a list input and returns one entry per
+        text (OpenAI format); entries are mapped back to input order by index.
+        Texts already in the embedding cache are not sent.
+        
+        Args:
+            texts: Texts to embed
+            api_key: Optional HuggingFace API key (falls back to env if not provided)
+            prepend_instruction: Whether to prepend BGE instruction for queries (default: True)
+            
+        Returns:
+            Dict with success, embeddings (list aligned with texts), error, model
+        """
+        if not api_key:
+            api_key = os.getenv("HUGGINGFACE_API_KEY")
+        
+        if not api_key:
+            return {
+                "success": False,
+                "error": "Hugging Face API key not configured",
+                "embeddings": None
+            }
+        
+        model = self.MEDICAL_MODELS["embedding"]
+        
+        # Serve what we can from the cache and only request the rest
+        cache = get_embedding_cache()
+        embeddings: List[Optional[List[float]]] = (
+            await cache.get_many(model, prepend_instruction, texts) if cache else [None] * len(texts)
+        )
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if not missing:
+            return {
+                "success": True,
+                "embeddings": embeddings,
+                "error": None,
+                "model": model
+            }
+        
+        try:
+            texts_to_embed = [texts[i] for i in missing]
+            if prepend_instruction and "bge" in model.lower():
+                texts_to_embed = [f"Represent this sentence for searching relevant passages: {text}" for text in texts_to_embed]
+            
+            logger.info(f"Generating {len(texts_to_embed)} embeddings with model: {model} ({len(texts) - len(missing)} cached)")
+            
+            url = f"{self.router_url}/embeddings"
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+            payload = {
+                "model": model,
+                "input": texts_to_embed
+            }
+            
+            response = await self.client.post(url, headers=headers, json=payload, timeout=120.0)
+            
+            if response.status_code == 402:
+                logger.error("HuggingFace Router API credits depleted")
+                return {
+                    "success": False,
+                    "error": "HuggingFace API credits depleted. Free tier exhausted. Add credits at https://huggingface.co/settings/billing or wait until Apr 1 for reset.",
+                    "embeddings": None,
+                    "model": model
+                }
+            
+            if response.status_code == 503:
+                logger.warning("Model is loading, this may take a moment")
+                return {
+                    "success": False,
+                    "error": "Model is loading. Please try again in a moment.",
+                    "embeddings": None,
+                    "model": model
+                }
+            
+            if response.status_code != 200:
+                error_msg = f"API error: {response.status_code} - {response.text[:200]}"
+                logger.error(error_msg)
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "embeddings": None,
+                    "model": model
+                }
+            
+            result = response.json()
+            data = result.get("data") if isinstance(result, dict) else None
+            
+            if not data or len(data) != len(texts_to_embed):
+                raise ValueError(
+                    f"Expected {len(texts_to_embed)} embeddings, got {len(data) if data else 0}"
+                )
+            
+            # Entries carry their input index; don't rely on response ordering
+            fetched: List[Optional[List[float]]] = [None] * len(texts_to_embed)
+            for position, item in enumerate(data):
+                index = item.get("index", position)
+                fetched[index] = self._normalize_embedding(item["embedding"])
+            
+            if any(embedding is None for embedding in fetched):
+                raise ValueError("Embedding response is missing entries")
+            
+            for i, embedding in zip(missing, fetched):
+                embeddings[i] = embedding
+                if cache:
+                    cache.put(model, prepend_instruction, texts[i], embedding)
+            
+            logger.info(f"Generated {len(embeddings)} embeddings, dimension: {len(embeddings[0])}")
+            
+            return {
+                "success": True,
+                "embeddings": embeddings,
+                "error": None,
+                "model": model
+            }
+            
+        except Exception as e:
+            error_msg = f"Embedding API error: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "success": False,
+                "error": error_msg,
+                "embeddings": None,
+                "model": model
+            }
+    
+    @staticmethod
+    def _normalize_embedding(embedding: Any) -> List[float]:
+        """
+        Convert a raw embedding from the API into a validated flat list
+        
+        Args:
+            embedding: Embedding as returned by the API (list, nested list or array)
+            
+        Returns:
+            Flat list of numbers
+        """
+        # Convert to list if it's a numpy array or tensor
+        if hasattr(embedding, 'tolist'):
+            embedding = embedding.tolist()
+        
+        # Handle nested lists - feature_extraction often returns [[...]]
+        while isinstance(embedding, list) and len(embedding) > 0 and isinstance(embedding[0], list):
+            embedding = embedding[0]
+        
+        # Validate it's a proper list
+        if not isinstance(embedding, list):
+            raise ValueError(f"Invalid embedding format: expected list, got {type(embedding)}")
+        
+        # Validate all elements are numbers
+        if len(embedding) == 0:
+            raise ValueError("Embedding is empty")
+        
+        # Check first few elements to ensure they're numbers (avoid checking all 4096)
+        sample_size = min(10, len(embedding))
+        if not all(isinstance(embedding[i], (int, float)) for i in range(sample_size)):
+            raise ValueError(f"Invalid embedding values: expected numbers")
+        
+        return embedding
+    
     async def health_check(self, api_key: str, feature: str = "chat") -> Dict[str, Any]:
         """
         Perform a health check on Hugging Face models
@@ -418,7 +584,6 @@ class HuggingFaceProvider:
         logger.info(f"Performing health check on Hugging Face model: {model}")
         
         import time
-        import httpx
         start_time = time.time()
         
         try:
@@ -435,36 +600,35 @@ class HuggingFaceProvider:
                 "temperature": 0.7
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
-                response_time = int((time.time() - start_time) * 1000)
+            response = await self.client.post(url, headers=headers, json=payload, timeout=30.0)
+            response_time = int((time.time() - start_time) * 1000)
                 
-                if response.status_code == 200:
-                    logger.info(f"Hugging Face health check passed for {model} ({response_time}ms)")
-                    return {
-                        "success": True,
-                        "model": model,
-                        "response_time_ms": response_time,
-                        "error": None
-                    }
-                elif response.status_code == 503:
-                    logger.warning(f"Hugging Face model {model} is loading (cold start)")
-                    return {
-                        "success": False,
-                        "model": model,
-                        "response_time_ms": response_time,
-                        "error": "Model loading (cold start)",
-                        "is_loading": True
-                    }
-                else:
-                    error_msg = f"Health check failed: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    return {
-                        "success": False,
-                        "model": model,
-                        "response_time_ms": response_time,
-                        "error": error_msg
-                    }
+            if response.status_code == 200:
+                logger.info(f"Hugging Face health check passed for {model} ({response_time}ms)")
+                return {
+                    "success": True,
+                    "model": model,
+                    "response_time_ms": response_time,
+                    "error": None
+                }
+            elif response.status_code == 503:
+                logger.warning(f"Hugging Face model {model} is loading (cold start)")
+                return {
+                    "success": False,
+                    "model": model,
+                    "response_time_ms": response_time,
+                    "error": "Model loading (cold start)",
+                    "is_loading": True
+                }
+            else:
+                error_msg = f"Health check failed: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                return {
+                    "success": False,
+                    "model": model,
+                    "response_time_ms": response_time,
+                    "error": error_msg
+                }
                     
         except Exception as e:
             response_time = int((time.time() - start_time) * 1000)
@@ -7,6 +7,7 @@ import logging
 from typing import Dict, Any, Optional, AsyncIterator
 import json
 import os
+from services.providers.http_client import get_http_client, get_retry_after, ProviderHTTPError
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +18,18 @@ class OpenRouterProvider:
     Provides unified access to OpenAI, Anthropic, and Google models
     """
     
-    # OpenRouter API endpoint
-    BASE_URL = "https://openrouter.ai/api/v1"
+    # OpenRouter API endpoint (override to point at a local stand-in, e.g. for benchmarks)
+    BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
     
     def __init__(self):
         """Initialize the OpenRouter provider"""
-        self.client = httpx.AsyncClient(timeout=60.0)
         self._models_cache = None
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client shared by all OpenRouter requests"""
+        return get_http_client("openrouter", timeout=60.0)
+    
     def _load_models_config(self) -> Dict[str, Any]:
         """
         Load models configuration from models.json
@@ -232,7 +237,11 @@ class OpenRouterProvider:
                     "success": False,
                     "error": f"OpenRouter API error ({response.status_code}): {error_message}",
                     "tokens_used": 0,
-                    "is_token_limit_error": is_token_limit_error
+                    "is_token_limit_error": is_token_limit_error,
+                    "status_code": response.status_code,
+                    # Too many requests on this key: the caller parks it rather than failing it
+                    "rate_limited": response.status_code == 429,
+                    "retry_after": get_retry_after(response)
                 }
             
             # Parse response
@@ -304,7 +313,8 @@ class OpenRouterProvider:
         provider: str,
         feature: str,
         prompt: str,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        raise_errors: bool = False
     ) -> AsyncIterator[str]:
         """
         Call the OpenRouter API with streaming response
@@ -315,6 +325,8 @@ class OpenRouterProvider:
             feature: Feature name (chat, flashcard, mcq, etc.)
             prompt: User prompt/message
             system_prompt: Optional system prompt for context
+            raise_errors: Raise on errors instead of yielding an "Error: ..." chunk
+                (lets callers tell failures from content, e.g. to fall back)
             
         Yields:
             Text chunks as they arrive from the API
@@ -351,6 +363,17 @@ class OpenRouterProvider:
                 if response.status_code != 200:
                     error_detail = await response.aread()
                     logger.error(f"OpenRouter streaming API error: {response.status_code}")
+                    if raise_errors:
+                        try:
+                            error_message = json.loads(error_detail).get("error", {}).get("message", "")
+                        except Exception:
+                            error_message = ""
+                        raise ProviderHTTPError(
+                            f"OpenRouter API error ({response.status_code}): "
+                            f"{error_message or error_detail.decode(errors='replace')}",
+                            status_code=response.status_code,
+                            retry_after=get_retry_after(response)
+                        )
                     yield f"Error: OpenRouter API returned status {response.status_code}"
                     return
                 
@@ -387,12 +410,18 @@ class OpenRouterProvider:
                 
         except httpx.TimeoutException:
             logger.error("OpenRouter streaming API call timed out")
+            if raise_errors:
+                raise Exception("Request timed out")
             yield "Error: Request timed out"
         except httpx.RequestError as e:
             logger.error(f"OpenRouter streaming API request error: {str(e)}")
+            if raise_errors:
+                raise Exception(f"Network error: {str(e)}")
             yield f"Error: Network error - {str(e)}"
         except Exception as e:
             logger.error(f"Unexpected error in OpenRouter streaming: {str(e)}")
+            if raise_errors:
+                raise
             yield f"Error: {str(e)}"
     
     async def close(self):
@@ -3,11 +3,13 @@ Rate Limiter Service
 Handles rate limiting, usage tracking, and plan-based quota enforcement
 Requirements: 9.1, 9.2, 9.5, 9.6
 """
-import os
 from typing import Dict, Any, Optional
 from datetime import date, datetime
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
+from services.user_profiles import get_user_profiles
 
 # Load environment variables
 load_dotenv()
@@ -70,11 +72,7 @@ class RateLimiter:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def check_rate_limit(self, user_id: str, feature: str) -> bool:
         """
@@ -91,13 +89,17 @@ class RateLimiter:
         """
         try:
             # Get user plan and role (Requirement 9.5 - admin bypass)
-            user_response = self.supabase.table("users").select("plan, role").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_response.data or len(user_response.data) == 0:
+            if not profile:
                 return False
             
-            user_plan = user_response.data[0]["plan"]
-            user_role = user_response.data[0].get("role")
+            user_plan = profile["plan"]
+            user_role = profile.get("role")
+            
+            # Queue priority of this request's AI calls (see services/admission_queue.py)
+            from services.admission_queue import set_request_plan
+            set_request_plan("admin" if user_role in ["super_admin", "admin", "ops"] else user_plan)
             
             # Admin bypass logic (Requirement 9.5)
             if user_role in ["super_admin", "admin", "ops"]:
@@ -155,7 +157,7 @@ class RateLimiter:
             today = date.today()
             
             # Get or create usage counter for today
-            usage_response = self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)).execute()
+            usage_response = await run_query(self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)))
             
             if usage_response.data and len(usage_response.data) > 0:
                 # Update existing counter
@@ -177,7 +179,7 @@ class RateLimiter:
                 elif feature == "image":
                     update_data["images_used"] = current_usage["images_used"] + 1
                 
-                self.supabase.table("usage_counters").update(update_data).eq("id", counter_id).execute()
+                await run_query(self.supabase.table("usage_counters").update(update_data).eq("id", counter_id))
             else:
                 # Create new counter for today
                 insert_data = {
@@ -191,7 +193,7 @@ class RateLimiter:
                     "flashcards_generated": 1 if feature == "flashcard" else 0,
                 }
                 
-                self.supabase.table("usage_counters").insert(insert_data).execute()
+                await run_query(self.supabase.table("usage_counters").insert(insert_data))
                 
         except Exception as e:
             # Log error but don't fail the request
@@ -212,7 +214,7 @@ class RateLimiter:
         try:
             today = date.today()
             
-            usage_response = self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)).execute()
+            usage_response = await run_query(self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)))
             
             if usage_response.data and len(usage_response.data) > 0:
                 usage = usage_response.data[0]
@@ -260,20 +262,20 @@ class RateLimiter:
         """
         try:
             # Get user plan and role
-            user_response = self.supabase.table("users").select("plan, role").eq("id", user_id).execute()
+            profile = await get_user_profiles(self.supabase).get(user_id)
             
-            if not user_response.data:
+            if not profile:
                 return False
             
-            user_plan = user_response.data[0]["plan"]
-            user_role = user_response.data[0].get("role")
+            user_plan = profile["plan"]
+            user_role = profile.get("role")
             
             # Admin bypass
             if user_role in ["super_admin", "admin", "ops"]:
                 return True
             
             # Get limit from system_flags (admin-configurable) or use default
-            limit_response = self.supabase.table("system_flags").select("flag_value").eq("flag_name", limit_key).execute()
+            limit_response = await run_query(self.supabase.table("system_flags").select("flag_value").eq("flag_name", limit_key))
             
             if limit_response.data:
                 limit = int(limit_response.data[0]["flag_value"])
@@ -289,7 +291,7 @@ class RateLimiter:
             
             # Get current usage
             today = date.today()
-            usage_response = self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)).execute()
+            usage_response = await run_query(self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)))
             
             if usage_response.data:
                 # Check custom counter for this limit_key
@@ -314,7 +316,7 @@ class RateLimiter:
             today = date.today()
             
             # Get or create usage counter
-            usage_response = self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)).execute()
+            usage_response = await run_query(self.supabase.table("usage_counters").select("*").eq("user_id", user_id).eq("date", str(today)))
             
             if usage_response.data:
                 # Update existing
@@ -322,12 +324,12 @@ class RateLimiter:
                 counter_id = current_usage["id"]
                 current_count = current_usage.get(limit_key, 0)
                 
-                self.supabase.table("usage_counters").update({
+                await run_query(self.supabase.table("usage_counters").update({
                     limit_key: current_count + 1
-                }).eq("id", counter_id).execute()
+                }).eq("id", counter_id))
             else:
                 # Create new
-                self.supabase.table("usage_counters").insert({
+                await run_query(self.supabase.table("usage_counters").insert({
                     "user_id": user_id,
                     "date": str(today),
                     "tokens_used": 0,
@@ -337,7 +339,7 @@ class RateLimiter:
                     "images_used": 0,
                     "flashcards_generated": 0,
                     limit_key: 1
-                }).execute()
+                }))
                 
         except Exception as e:
             print(f"Feature usage increment error: {str(e)}")
@@ -358,6 +360,6 @@ def get_rate_limiter(supabase_client: Optional[Client] = None) -> RateLimiter:
         RateLimiter instance
     """
     global _rate_limiter_instance
-    if _rate_limiter_instance is None or supabase_client is not None:
+    if _rate_limiter_instance is None or (supabase_client is not None and supabase_client is not _rate_limiter_instance.supabase):
         _rate_limiter_instance = RateLimiter(supabase_client)
     return _rate_limiter_instance
@@ -0,0 +1,135 @@
+"""
+Request Coalescer
+Single-flight sharing of identical in-flight AI requests
+
+When many users ask for the same thing at the same moment (a class
+generating flashcards on the same topic), only the first request goes
+upstream; identical requests that arrive while it is in flight await the
+same call and receive a copy of its result. Rate limiting and usage
+accounting stay with the callers, so every user is still checked and
+charged for their request.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+ROUTER_COALESCE_REQUESTS = os.getenv("ROUTER_COALESCE_REQUESTS", "true").lower() == "true"
+
+
+def make_request_key(feature: str, model: str, system_prompt: Optional[str], prompt: str, *extra: Optional[str]) -> Tuple[str, ...]:
+    """
+    Build the coalescing key for a request
+
+    Args:
+        feature: Feature name
+        model: Provider/model the request targets
+        system_prompt: System prompt (hashed)
+        prompt: Prompt (hashed)
+        extra: Further inputs that change the answer (hashed), e.g. image data
+
+    Returns:
+        Hashable key
+    """
+    def digest(value: Optional[str]) -> str:
+        return hashlib.sha256(value.encode("utf-8")).hexdigest() if value else ""
+
+    return (feature, model or "", digest(system_prompt), digest(prompt)) + tuple(digest(v) for v in extra)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """Runs one upstream call per key at a time and shares its result"""
+
+    def __init__(self):
+        self._flights: Dict[Tuple[str, ...], _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: Tuple[str, ...], call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Run a call, or join an identical one already in flight
+
+        The call runs in its own task so a caller that goes away doesn't
+        cancel it for the others; it is cancelled only when every caller
+        has gone away.
+
+        Args:
+            key: Request key (see make_request_key)
+            call: Coroutine factory performing the upstream request
+
+        Returns:
+            The call's result; joined callers get a copy marked coalesced=True
+        """
+        flight = self._flights.get(key)
+        joined = flight is not None and not flight.task.done()
+
+        if joined:
+            self.coalesced += 1
+            logger.info(f"Coalesced identical in-flight request for feature '{key[0]}'")
+        else:
+            self.leaders += 1
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task, k=key, f=flight: self._finish(k, f))
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last caller gone: stop the call; new identical requests start afresh
+                self._finish(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+        if joined and isinstance(result, dict):
+            return {**result, "coalesced": True}
+        return result
+
+    def _finish(self, key: Tuple[str, ...], flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing counters
+
+        Returns:
+            Dict with upstream calls made, calls coalesced and calls in flight
+        """
+        return {
+            "enabled": ROUTER_COALESCE_REQUESTS,
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+            "in_flight": len(self._flights)
+        }
+
+
+# Singleton instance
+_request_coalescer: Optional[RequestCoalescer] = None
+
+
+def get_request_coalescer() -> RequestCoalescer:
+    """Get or create singleton request coalescer instance"""
+    global _request_coalescer
+
+    if _request_coalescer is None:
+        _request_coalescer = RequestCoalescer()
+
+    return _request_coalescer
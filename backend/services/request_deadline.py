@@ -0,0 +1,67 @@
+"""
+Request Deadline
+Request-level time budget shared by every AI attempt of a request
+
+The API sets a deadline per endpoint (see RequestDeadlineMiddleware) and
+the model router bounds the whole fallback chain (queueing, every key
+attempt and the Hugging Face fallback) by the remaining budget, instead
+of giving each attempt its own full timeout. Attempts are not started
+once too little budget is left, so abandoned requests stop spending
+upstream quota.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# Don't start an upstream attempt with less budget than this (seconds)
+REQUEST_DEADLINE_MIN_ATTEMPT_SECONDS = float(os.getenv("REQUEST_DEADLINE_MIN_ATTEMPT_SECONDS", "1"))
+
+# Monotonic time by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Give the code in this block a time budget
+
+    Nested budgets only ever tighten the deadline.
+
+    Args:
+        seconds: Budget in seconds, or None to keep the current deadline
+    """
+    current = _deadline.get()
+    deadline = current
+    if seconds is not None:
+        candidate = time.monotonic() + seconds
+        deadline = candidate if current is None else min(current, candidate)
+
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def get_remaining_budget() -> Optional[float]:
+    """Seconds left until the current request's deadline (None if it has none)"""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def bound_by_budget(seconds: float) -> float:
+    """Limit a wait or timeout to the remaining request budget"""
+    remaining = get_remaining_budget()
+    return seconds if remaining is None else min(seconds, remaining)
+
+
+def has_budget_for_attempt() -> bool:
+    """Whether enough budget is left to start another upstream attempt"""
+    remaining = get_remaining_budget()
+    return remaining is None or remaining >= REQUEST_DEADLINE_MIN_ATTEMPT_SECONDS
@@ -0,0 +1,210 @@
+"""
+Response Cache
+Opt-in cache of study-tool generations
+
+Flashcards, MCQs, high-yield summaries, explanations and concept maps for
+popular topics are generated over and over with identical prompts. When
+enabled, successful generations are cached by (tool, normalized topic,
+count, format, model, prompt version) in an in-memory LRU tier and an
+optional SQLite disk tier that survives restarts (see TwoTierCache).
+Entries expire after a TTL and can be purged by admins. Requests that
+carry document context are never cached, since their answers depend on
+the user's own documents.
+"""
+import os
+import json
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from services.two_tier_cache import TwoTierCache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Cache configuration
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "500"))
+# Persist responses across restarts in this SQLite file (empty = memory only)
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_topic(topic: str) -> str:
+    """Case-fold a topic and collapse whitespace and trailing punctuation"""
+    return " ".join((topic or "").lower().split()).strip(" .?!")
+
+
+class ResponseCache(TwoTierCache):
+    """Two-tier (LRU memory + SQLite disk) cache of generated study content with a TTL"""
+
+    table = "responses"
+    columns = (("tool", "TEXT"), ("value", "TEXT"), ("created_at", "REAL"))
+    label = "Response cache"
+
+    def __init__(
+        self,
+        memory_size: int = RESPONSE_CACHE_MEMORY_SIZE,
+        db_path: Optional[str] = RESPONSE_CACHE_PATH,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS
+    ):
+        """
+        Initialize the response cache
+
+        Args:
+            memory_size: Maximum responses kept in the memory tier
+            db_path: SQLite file for the disk tier, or None/empty to disable it
+            ttl_seconds: Seconds a response is served before it is regenerated
+        """
+        # Memory entries are (created_at, tool, value)
+        super().__init__(memory_size, db_path)
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(
+        tool: str,
+        topic: str,
+        count: Optional[int],
+        format: Optional[str],
+        model: str,
+        prompt_version: int
+    ) -> str:
+        """
+        Build the cache key for a generation
+
+        Args:
+            tool: Study tool (flashcard, mcq, highyield, explain, map)
+            topic: Requested topic (normalized here)
+            count: Number of items requested, if the tool takes one
+            format: Output format, if the tool takes one
+            model: Model the request is routed to
+            prompt_version: Version of the tool's prompts
+
+        Returns:
+            Cache key string
+        """
+        parts = [tool, normalize_topic(topic), str(count or ""), format or "", model or "", str(prompt_version)]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Cache key (see make_key)
+
+        Returns:
+            Cached response, or None on a miss or an expired entry
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[2]
+                del self._memory[key]
+
+        row = (await self._read_disk([key])).get(key)
+
+        with self._lock:
+            if row is not None and now - row[3] < self.ttl_seconds:
+                value = json.loads(row[2])
+                self._remember(key, (row[3], row[1], value))
+                self.disk_hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, tool: str, value: Dict[str, Any]) -> None:
+        """
+        Store a response in both tiers (the disk write is batched on the cache thread)
+
+        Args:
+            key: Cache key (see make_key)
+            tool: Study tool the response belongs to (used for purging)
+            value: JSON-serializable response
+        """
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, (now, tool, value))
+
+        if self._executor is not None:
+            self._queue_write((key, tool, json.dumps(value), now))
+
+    async def purge(self, tool: Optional[str] = None, expired_only: bool = False) -> int:
+        """
+        Remove cached responses
+
+        Args:
+            tool: Only purge this study tool's responses (None for all tools)
+            expired_only: Only purge entries older than the TTL
+
+        Returns:
+            Number of entries removed (disk tier count when it is enabled)
+        """
+        cutoff = time.time() - self.ttl_seconds if expired_only else float("inf")
+
+        with self._lock:
+            stale = [
+                key for key, (created_at, entry_tool, _) in self._memory.items()
+                if (tool is None or entry_tool == tool) and created_at < cutoff
+            ]
+            for key in stale:
+                del self._memory[key]
+        removed = len(stale)
+
+        where = "created_at < ?"
+        params: list = [cutoff]
+        if tool is not None:
+            where += " AND tool = ?"
+            params.append(tool)
+        disk_removed = await self._delete_disk(where, params)
+        if disk_removed is not None:
+            removed = disk_removed
+
+        logger.info(f"Purged {removed} cached responses" + (f" for {tool}" if tool else ""))
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters (blocking while the disk tier is counted; not for the event loop)
+
+        Returns:
+            Dict with hits (total, memory, disk), misses, hit_rate, sizes and TTL
+        """
+        stats = super().get_stats()
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+
+# Singleton instance
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Get or create singleton response cache (None unless RESPONSE_CACHE_ENABLED)"""
+    global _response_cache
+
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+
+    return _response_cache
+
+
+def shutdown_response_cache() -> None:
+    """Commit pending disk writes and stop the cache thread (called on application shutdown)"""
+    global _response_cache
+
+    cache, _response_cache = _response_cache, None
+    if cache is not None:
+        cache.close()
@@ -3,11 +3,12 @@ Scheduler Service
 Handles scheduled jobs like daily counter resets
 Requirements: 9.4
 """
-import os
 from typing import Optional
 from datetime import date, datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
 
 # Load environment variables
 load_dotenv()
@@ -26,11 +27,7 @@ class Scheduler:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def reset_daily_counters(self) -> dict:
         """
@@ -56,10 +53,11 @@ class Scheduler:
             # (to track how many users will get fresh counters today)
             yesterday = date.today().replace(day=date.today().day - 1) if date.today().day > 1 else date.today()
             
-            response = self.supabase.table("usage_counters")\
-                .select("user_id", count="exact")\
-                .lt("date", str(today))\
-                .execute()
+            response = await run_query(
+                self.supabase.table("usage_counters")
+                .select("user_id", count="exact")
+                .lt("date", str(today))
+            )
             
             previous_day_users = response.count if hasattr(response, 'count') else 0
             
@@ -95,6 +93,6 @@ def get_scheduler(supabase_client: Optional[Client] = None) -> Scheduler:
         Scheduler instance
     """
     global _scheduler_instance
-    if _scheduler_instance is None or supabase_client is not None:
+    if _scheduler_instance is None or (supabase_client is not None and supabase_client is not _scheduler_instance.supabase):
         _scheduler_instance = Scheduler(supabase_client)
     return _scheduler_instance
@@ -0,0 +1,196 @@
+"""
+Service Registry
+Process-wide Supabase client and service lifecycle
+
+The API process shares one Supabase client (one pooled PostgREST/HTTP
+session) and one instance of each service. Service factories such as
+get_chat_service() return the instance bound to the shared client on
+every call, so hot paths can call them freely; services created without
+a client use get_supabase_client() instead of opening their own.
+ServiceRegistry warms the services in FastAPI startup and stops their
+background work on shutdown, and endpoints receive services through
+Depends(provide(get_chat_service)).
+"""
+import os
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional, TypeVar
+from supabase import Client, create_client
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+# Shared client, created on first use
+_supabase_client: Optional[Client] = None
+_client_lock = threading.Lock()
+
+
+def get_supabase_client() -> Client:
+    """
+    Get or create the process-wide Supabase client
+
+    Returns:
+        Supabase client for SUPABASE_URL with the service key
+
+    Raises:
+        ValueError: If SUPABASE_URL or SUPABASE_SERVICE_KEY is not set
+    """
+    global _supabase_client
+
+    if _supabase_client is None:
+        with _client_lock:
+            if _supabase_client is None:
+                supabase_url = os.getenv("SUPABASE_URL")
+                supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+                if not supabase_url or not supabase_key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+                _supabase_client = create_client(supabase_url, supabase_key)
+                logger.info("Created shared Supabase client")
+
+    return _supabase_client
+
+
+def set_supabase_client(client: Optional[Client]) -> None:
+    """
+    Replace the shared Supabase client (scripts and tests)
+
+    Args:
+        client: Client to share, or None to create a new one on next use
+    """
+    global _supabase_client
+    with _client_lock:
+        _supabase_client = client
+
+
+# FastAPI dependency per service factory
+_dependencies: Dict[Callable[..., Any], Callable[[], Any]] = {}
+
+
+def provide(factory: Callable[[Client], T]) -> Callable[[], T]:
+    """
+    Build a FastAPI dependency for a service factory
+
+    Usage: `chat_service: ChatService = Depends(provide(get_chat_service))`
+    The same dependency is returned for the same factory, so tests can
+    replace a service with `app.dependency_overrides[provide(factory)]`.
+
+    Args:
+        factory: Service factory taking the Supabase client
+
+    Returns:
+        Dependency returning the service bound to the shared client
+    """
+    dependency = _dependencies.get(factory)
+    if dependency is None:
+        def dependency() -> T:
+            return factory(get_supabase_client())
+
+        dependency.__name__ = f"provide_{getattr(factory, '__name__', 'service')}"
+        _dependencies[factory] = dependency
+    return dependency
+
+
+class ServiceRegistry:
+    """Creates the shared services at startup and stops their background work at shutdown"""
+
+    def __init__(self, supabase_client: Optional[Client] = None):
+        """
+        Initialize the registry
+
+        Args:
+            supabase_client: Client to share (defaults to get_supabase_client())
+        """
+        if supabase_client is not None:
+            set_supabase_client(supabase_client)
+        self.supabase = get_supabase_client()
+        self.started = False
+
+    def _factories(self) -> list:
+        # Imported here: the services themselves import this module
+        from services.auth import get_auth_service
+        from services.chat import get_chat_service
+        from services.rate_limiter import get_rate_limiter
+        from services.admin import get_admin_service
+        from services.audit import get_audit_service
+        from services.model_router import get_model_router_service
+        from services.model_usage_logger import get_model_usage_logger
+        from services.health_tracker import get_health_tracker_service
+        from services.study_tools import get_study_tools_service
+        from services.documents import get_document_service
+        from services.enhanced_study_planner import get_enhanced_study_planner_service
+
+        return [
+            get_auth_service, get_chat_service, get_rate_limiter, get_admin_service,
+            get_audit_service, get_model_router_service, get_model_usage_logger,
+            get_health_tracker_service, get_study_tools_service, get_document_service,
+            get_enhanced_study_planner_service,
+        ]
+
+    def get(self, factory: Callable[[Client], T]) -> T:
+        """
+        Get a service bound to the shared client
+
+        Args:
+            factory: Service factory taking the Supabase client
+
+        Returns:
+            Service instance
+        """
+        return factory(self.supabase)
+
+    async def startup(self) -> None:
+        """Create the services and start background workers (FastAPI startup)"""
+        from services.ingestion_queue import get_ingestion_queue
+        from services.circuit_breaker import get_circuit_breaker_registry
+        from services.system_flags import get_system_flags
+
+        for factory in self._factories():
+            self.get(factory)
+
+        await get_ingestion_queue(self.supabase).start()
+        await get_circuit_breaker_registry(self.supabase).start()
+        await get_system_flags(self.supabase).start()
+        self.started = True
+        logger.info("Service registry started")
+
+    async def shutdown(self) -> None:
+        """Stop background workers and release pooled resources (FastAPI shutdown)"""
+        from services.ingestion_queue import get_ingestion_queue
+        from services.circuit_breaker import get_circuit_breaker_registry
+        from services.system_flags import get_system_flags
+        from services.usage_log_writer import get_usage_log_writer
+        from services.providers.http_client import close_http_clients
+        from services.document_extraction import shutdown_extraction_executor
+        from services.db_executor import shutdown_db_executor
+        from services.embedding_cache import shutdown_embedding_cache
+        from services.response_cache import shutdown_response_cache
+
+        await get_ingestion_queue(self.supabase).stop()
+        await get_circuit_breaker_registry(self.supabase).stop()
+        await get_system_flags(self.supabase).stop()
+        usage_log_writer = get_usage_log_writer(self.supabase)
+        if usage_log_writer is not None:
+            await usage_log_writer.stop()
+        await close_http_clients()
+        logger.info("Provider HTTP connection pools closed")
+        shutdown_extraction_executor()
+        shutdown_db_executor()
+        shutdown_embedding_cache()
+        shutdown_response_cache()
+        self.started = False
+
+
+# Singleton instance
+_service_registry: Optional[ServiceRegistry] = None
+
+
+def get_service_registry() -> ServiceRegistry:
+    """Get or create the service registry"""
+    global _service_registry
+    if _service_registry is None:
+        _service_registry = ServiceRegistry()
+    return _service_registry
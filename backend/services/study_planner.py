@@ -3,11 +3,12 @@ Study Planner Service
 Handles study session management and planning
 Requirements: 6.1, 6.2, 6.3, 6.4
 """
-import os
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
-from supabase import Client, create_client
+from supabase import Client
+from services.service_registry import get_supabase_client
 from dotenv import load_dotenv
+from services.db_executor import run_query
 
 # Load environment variables
 load_dotenv()
@@ -26,11 +27,7 @@ class StudyPlannerService:
         if supabase_client:
             self.supabase = supabase_client
         else:
-            supabase_url = os.getenv("SUPABASE_URL")
-            supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
-            if not supabase_url or not supabase_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self.supabase = create_client(supabase_url, supabase_key)
+            self.supabase = get_supabase_client()
     
     async def create_study_session(
         self,
@@ -69,7 +66,7 @@ class StudyPlannerService:
                 "completed_at": None
             }
             
-            response = self.supabase.table("study_sessions").insert(session_data).execute()
+            response = await run_query(self.supabase.table("study_sessions").insert(session_data))
             
             if not response.data or len(response.data) == 0:
                 raise Exception("Failed to create study session")
@@ -108,9 +105,10 @@ class StudyPlannerService:
             if status:
                 query = query.eq("status", status)
             
-            response = query.order("scheduled_date", desc=False)\
-                .limit(limit)\
-                .execute()
+            response = await run_query(
+                query.order("scheduled_date", desc=False)
+                .limit(limit)
+            )
             
             return response.data if response.data else []
         except Exception as e:
@@ -140,20 +138,22 @@ class StudyPlannerService:
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("study_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("study_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Study session not found or does not belong to user")
             
             # Update the session
-            response = self.supabase.table("study_sessions")\
-                .update(data)\
-                .eq("id", session_id)\
-                .execute()
+            response = await run_query(
+                self.supabase.table("study_sessions")
+                .update(data)
+                .eq("id", session_id)
+            )
             
             if not response.data or len(response.data) == 0:
                 raise Exception("Failed to update study session")
@@ -184,20 +184,22 @@ class StudyPlannerService:
         """
         try:
             # Verify session belongs to user
-            session_response = self.supabase.table("study_sessions")\
-                .select("id")\
-                .eq("id", session_id)\
-                .eq("user_id", user_id)\
-                .execute()
+            session_response = await run_query(
+                self.supabase.table("study_sessions")
+                .select("id")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_response.data or len(session_response.data) == 0:
                 raise Exception("Study session not found or does not belong to user")
             
             # Delete the session
-            response = self.supabase.table("study_sessions")\
-                .delete()\
-                .eq("id", session_id)\
-                .execute()
+            response = await run_query(
+                self.supabase.table("study_sessions")
+                .delete()
+                .eq("id", session_id)
+            )
             
             return {
                 "success": True,
@@ -253,6 +255,6 @@ def get_study_planner_service(supabase_client: Optional[Client] = None) -> Study
         StudyPlannerService instance
     """
     global _study_planner_instance
-    if _study_planner_instance is None or supabase_client is not None:
+    if _study_planner_instance is None or (supabase_client is not None and supabase_client is not _study_planner_instance.supabase):
         _study_planner_instance = StudyPlannerService(supabase_client)
     return _study_planner_instance
@@ -7,9 +7,15 @@ import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 import uuid
+from services.response_cache import get_response_cache
+from services.db_executor import run_query
 
 logger = logging.getLogger(__name__)
 
+# Part of the response cache key; bump when the generation prompts change
+# so responses produced with the old prompts are no longer served
+STUDY_TOOL_PROMPT_VERSION = 1
+
 
 class StudyToolsService:
     """Service for managing study tool sessions and content generation"""
@@ -27,6 +33,61 @@ class StudyToolsService:
         self.model_router = model_router
         self.rate_limiter = rate_limiter
     
+    async def _generate(
+        self,
+        tool: str,
+        feature: str,
+        topic: str,
+        prompt: str,
+        system_prompt: str,
+        count: Optional[int] = None,
+        format: Optional[str] = None,
+        document_context: Optional[str] = None
+    ) -> Any:
+        """
+        Generate content through the model router, serving repeats from the response cache
+        
+        Args:
+            tool: Study tool name (part of the cache key)
+            feature: Model router feature
+            topic: Requested topic
+            prompt: Full prompt
+            system_prompt: System prompt
+            count: Requested item count, if any
+            format: Requested output format, if any
+            document_context: RAG context; requests carrying it bypass the cache
+            
+        Returns:
+            Model router result (cached results carry cached=True)
+        """
+        cache = get_response_cache() if not document_context else None
+        
+        if cache is not None:
+            from services.providers.openrouter import get_openrouter_provider
+            
+            model = get_openrouter_provider().get_model_id("openrouter", feature)
+            cache_key = cache.make_key(tool, topic, count, format, model, STUDY_TOOL_PROMPT_VERSION)
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Serving cached {tool} for topic '{topic}'")
+                return {**cached, "success": True, "cached": True}
+        
+        provider = await self.model_router.select_provider(feature)
+        result = await self.model_router.execute_with_fallback(
+            provider=provider,
+            feature=feature,
+            prompt=prompt,
+            system_prompt=system_prompt
+        )
+        
+        if cache is not None and isinstance(result, dict) and result.get("success") and result.get("content"):
+            cache.put(cache_key, tool, {
+                "content": result["content"],
+                "tokens_used": result.get("tokens_used", 0)
+            })
+        
+        return result
+    
     async def create_session(self, user_id: str, feature: str, title: Optional[str] = None) -> Dict[str, Any]:
         """
         Create a new study tool session
@@ -52,7 +113,7 @@ class StudyToolsService:
                 "updated_at": now
             }
             
-            result = self.supabase.table("study_tool_sessions").insert(session_data).execute()
+            result = await run_query(self.supabase.table("study_tool_sessions").insert(session_data))
             
             if result.data:
                 return result.data[0]
@@ -83,7 +144,7 @@ class StudyToolsService:
             if feature:
                 query = query.eq("feature", feature)
             
-            result = query.execute()
+            result = await run_query(query)
             return result.data or []
             
         except Exception as e:
@@ -103,21 +164,23 @@ class StudyToolsService:
         """
         try:
             # Verify session belongs to user
-            session_result = self.supabase.table("study_tool_sessions") \
-                .select("*") \
-                .eq("id", session_id) \
-                .eq("user_id", user_id) \
-                .execute()
+            session_result = await run_query(
+                self.supabase.table("study_tool_sessions")
+                .select("*")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_result.data:
                 raise Exception("Session not found or access denied")
             
             # Get materials
-            materials_result = self.supabase.table("study_materials") \
-                .select("*") \
-                .eq("session_id", session_id) \
-                .order("created_at", desc=True) \
-                .execute()
+            materials_result = await run_query(
+                self.supabase.table("study_materials")
+                .select("*")
+                .eq("session_id", session_id)
+                .order("created_at", desc=True)
+            )
             
             return materials_result.data or []
             
@@ -138,31 +201,34 @@ class StudyToolsService:
         """
         try:
             # Verify session belongs to user
-            session_result = self.supabase.table("study_tool_sessions") \
-                .select("*") \
-                .eq("id", session_id) \
-                .eq("user_id", user_id) \
-                .execute()
+            session_result = await run_query(
+                self.supabase.table("study_tool_sessions")
+                .select("*")
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             if not session_result.data:
                 raise Exception("Session not found or access denied")
             
             # Delete materials first (foreign key constraint)
             try:
-                self.supabase.table("study_materials") \
-                    .delete() \
-                    .eq("session_id", session_id) \
-                    .execute()
+                await run_query(
+                    self.supabase.table("study_materials")
+                    .delete()
+                    .eq("session_id", session_id)
+                )
             except Exception as mat_error:
                 logger.warning(f"Error deleting materials for session {session_id}: {str(mat_error)}")
                 # Continue anyway to try deleting the session
             
             # Delete session
-            self.supabase.table("study_tool_sessions") \
-                .delete() \
-                .eq("id", session_id) \
-                .eq("user_id", user_id) \
-                .execute()
+            await run_query(
+                self.supabase.table("study_tool_sessions")
+                .delete()
+                .eq("id", session_id)
+                .eq("user_id", user_id)
+            )
             
             return {"message": "Session deleted successfully"}
             
@@ -194,10 +260,11 @@ class StudyToolsService:
             materials_deleted = 0
             for session_id in session_ids:
                 try:
-                    result = self.supabase.table("study_materials") \
-                        .delete() \
-                        .eq("session_id", session_id) \
-                        .execute()
+                    result = await run_query(
+                        self.supabase.table("study_materials")
+                        .delete()
+                        .eq("session_id", session_id)
+                    )
                     materials_deleted += len(result.data) if result.data else 0
                 except Exception as mat_error:
                     logger.warning(f"Error deleting materials for session {session_id}: {str(mat_error)}")
@@ -206,11 +273,12 @@ class StudyToolsService:
             deleted_count = 0
             for session_id in session_ids:
                 try:
-                    self.supabase.table("study_tool_sessions") \
-                        .delete() \
-                        .eq("id", session_id) \
-                        .eq("user_id", user_id) \
-                        .execute()
+                    await run_query(
+                        self.supabase.table("study_tool_sessions")
+                        .delete()
+                        .eq("id", session_id)
+                        .eq("user_id", user_id)
+                    )
                     deleted_count += 1
                 except Exception as sess_error:
                     logger.warning(f"Error deleting session {session_id}: {str(sess_error)}")
@@ -296,13 +364,16 @@ Base your flashcards on the provided context where relevant. Remember: {count} f
             else:
                 prompt = f"Create EXACTLY {count} medical flashcards about: {topic}. Remember: {count} flashcards, no more, no less."
             
-            # Get provider and generate content
-            provider = await self.model_router.select_provider("flashcard")
-            result = await self.model_router.execute_with_fallback(
-                provider=provider,
+            # Generate content (popular topics may be served from the response cache)
+            result = await self._generate(
+                tool="flashcard",
                 feature="flashcard",
+                topic=topic,
                 prompt=prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                count=count,
+                format=format,
+                document_context=document_context
             )
             
             # Extract content from result
@@ -460,7 +531,7 @@ Base your flashcards on the provided context where relevant. Remember: {count} f
                 "created_at": now
             }
             
-            self.supabase.table("study_materials").insert(material_data).execute()
+            await run_query(self.supabase.table("study_materials").insert(material_data))
             
             response_data = {
                 "id": material_id,
@@ -556,12 +627,15 @@ Base your questions on the provided context where relevant, but also include gen
             else:
                 prompt = f"Generate {count} multiple choice questions about: {topic}"
             
-            provider = await self.model_router.select_provider("mcq")
-            result = await self.model_router.execute_with_fallback(
-                provider=provider,
+            result = await self._generate(
+                tool="mcq",
                 feature="mcq",
+                topic=topic,
                 prompt=prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                count=count,
+                format=format,
+                document_context=document_context
             )
             
             # Extract content from result
@@ -583,7 +657,7 @@ Base your questions on the provided context where relevant, but also include gen
                 "created_at": now
             }
             
-            self.supabase.table("study_materials").insert(material_data).execute()
+            await run_query(self.supabase.table("study_materials").insert(material_data))
             
             return {
                 "id": material_id,
@@ -673,12 +747,13 @@ CONNECTION: Pulmonary Embolism -> Heparin"""
             
             prompt = f"Generate a clinical concept map for: {topic}"
             
-            provider = await self.model_router.select_provider("map")
-            result = await self.model_router.execute_with_fallback(
-                provider=provider,
+            result = await self._generate(
+                tool="map",
                 feature="map",
+                topic=topic,
                 prompt=prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                format=format
             )
             
             # Extract the actual content from the result
@@ -699,7 +774,7 @@ CONNECTION: Pulmonary Embolism -> Heparin"""
                 "created_at": now
             }
             
-            self.supabase.table("study_materials").insert(material_data).execute()
+            await run_query(self.supabase.table("study_materials").insert(material_data))
             
             return {
                 "id": material_id,
@@ -749,10 +824,10 @@ Format with clear headers and bullet points."""
             
             prompt = f"Generate high-yield summary points for: {topic}"
             
-            provider = await self.model_router.select_provider("chat")
-            result = await self.model_router.execute_with_fallback(
-                provider=provider,
+            result = await self._generate(
+                tool="highyield",
                 feature="chat",
+                topic=topic,
                 prompt=prompt,
                 system_prompt=system_prompt
             )
@@ -776,7 +851,7 @@ Format with clear headers and bullet points."""
                 "created_at": now
             }
             
-            self.supabase.table("study_materials").insert(material_data).execute()
+            await run_query(self.supabase.table("study_materials").insert(material_data))
             
             return {
                 "id": material_id,
@@ -837,12 +912,13 @@ Base your explanation on the provided context where relevant, but also include g
             else:
                 prompt = f"Explain in detail: {topic}"
             
-            provider = await self.model_router.select_provider("chat")
-            result = await self.model_router.execute_with_fallback(
-                provider=provider,
+            result = await self._generate(
+                tool="explain",
                 feature="chat",
+                topic=topic,
                 prompt=prompt,
-                system_prompt=system_prompt
+                system_prompt=system_prompt,
+                document_context=document_context
             )
             
             # Extract content from result
@@ -864,7 +940,7 @@ Base your explanation on the provided context where relevant, but also include g
                 "created_at": now
             }
             
-            self.supabase.table("study_materials").insert(material_data).execute()
+            await run_query(self.supabase.table("study_materials").insert(material_data))
             
             return {
                 "id": material_id,
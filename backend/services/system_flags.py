@@ -0,0 +1,253 @@
+"""
+System Flags Snapshot
+Process-local copy of the system_flags table for per-request checks
+
+Feature toggles and maintenance mode are read on every gated request but
+change a few times a day. Flags are kept in an in-memory snapshot that
+request paths read without locks or database queries. A background poll
+fetches only rows whose updated_at moved past the newest one seen (with
+a periodic full reload to catch clock skew); AdminService and
+MaintenanceService push their own writes into the snapshot immediately.
+A value is never served older than SYSTEM_FLAGS_MAX_STALENESS_SECONDS:
+if the poll isn't running or falls behind, the flag is re-read on use.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from services.db_executor import run_query
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Longest a flag value is served without being confirmed by the database
+SYSTEM_FLAGS_MAX_STALENESS_SECONDS = float(os.getenv("SYSTEM_FLAGS_MAX_STALENESS_SECONDS", "5"))
+# Reload the whole table every this many seconds (catches rows written with a lagging clock)
+SYSTEM_FLAGS_FULL_REFRESH_SECONDS = float(os.getenv("SYSTEM_FLAGS_FULL_REFRESH_SECONDS", "60"))
+
+
+class FlagEntry:
+    """A flag value (None if the flag doesn't exist) and its parsed forms"""
+
+    __slots__ = ("value", "checked_at", "parsed")
+
+    def __init__(self, value: Optional[str], checked_at: float):
+        self.value = value
+        self.checked_at = checked_at
+        # parser -> parsed value, filled on first use
+        self.parsed: Dict[Callable[[Optional[str]], Any], Any] = {}
+
+
+class SystemFlags:
+    """In-memory snapshot of system_flags refreshed by updated_at polling and admin pushes"""
+
+    def __init__(self, supabase_client: Client, max_staleness_seconds: float = SYSTEM_FLAGS_MAX_STALENESS_SECONDS):
+        """
+        Initialize the snapshot
+
+        Args:
+            supabase_client: Supabase client instance
+            max_staleness_seconds: Longest a value is served without being confirmed
+        """
+        self.supabase = supabase_client
+        self.max_staleness_seconds = max_staleness_seconds
+
+        # Replaced (never mutated) on updates, so readers need no lock
+        self._flags: Dict[str, FlagEntry] = {}
+        self._write_lock = threading.Lock()
+        # Newest updated_at seen by the poll
+        self._version: Optional[str] = None
+        # When the poll last confirmed the snapshot; _complete once every row has been loaded
+        self._confirmed_at = float("-inf")
+        self._full_refresh_at = float("-inf")
+        self._complete = False
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.loads = 0
+        self.polls = 0
+
+    def _is_fresh(self, entry: Optional[FlagEntry], now: float) -> bool:
+        confirmed_at = self._confirmed_at if (entry is not None or self._complete) else float("-inf")
+        if entry is not None:
+            confirmed_at = max(confirmed_at, entry.checked_at)
+        return now - confirmed_at <= self.max_staleness_seconds
+
+    async def _entry(self, flag_name: str) -> FlagEntry:
+        entry = self._flags.get(flag_name)
+        if self._is_fresh(entry, time.monotonic()):
+            return entry if entry is not None else FlagEntry(None, self._confirmed_at)
+
+        # One database read per flag however many requests are waiting for it
+        pending = self._pending.get(flag_name)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load(flag_name, entry))
+            self._pending[flag_name] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(flag_name, None))
+        return await asyncio.shield(pending)
+
+    async def get_value(self, flag_name: str) -> Optional[str]:
+        """
+        Get a flag's value
+
+        Args:
+            flag_name: Flag name
+
+        Returns:
+            The flag's value, or None if the flag doesn't exist
+        """
+        return (await self._entry(flag_name)).value
+
+    async def get_parsed(self, flag_name: str, parse: Callable[[Optional[str]], Any]) -> Any:
+        """
+        Get a flag's value parsed once per change
+
+        Args:
+            flag_name: Flag name
+            parse: Parser for the raw value (receives None if the flag doesn't exist)
+
+        Returns:
+            The parser's result, cached until the flag changes
+        """
+        entry = await self._entry(flag_name)
+        if parse not in entry.parsed:
+            entry.parsed[parse] = parse(entry.value)
+        return entry.parsed[parse]
+
+    async def _load(self, flag_name: str, previous: Optional[FlagEntry]) -> FlagEntry:
+        self.loads += 1
+        try:
+            result = await run_query(
+                self.supabase.table("system_flags")
+                .select("flag_value, updated_at")
+                .eq("flag_name", flag_name)
+            )
+            value = result.data[0]["flag_value"] if result.data else None
+        except Exception as e:
+            # Keep serving the last known value; retry after the staleness window
+            logger.error(f"Failed to load system flag {flag_name}: {str(e)}")
+            value = previous.value if previous is not None else None
+
+        entry = FlagEntry(value, time.monotonic())
+        if previous is not None and previous.value == value:
+            entry.parsed = previous.parsed
+        self._set_entries({flag_name: entry})
+        return entry
+
+    def _set_entries(self, entries: Dict[str, FlagEntry], replace: bool = False) -> None:
+        with self._write_lock:
+            flags = {} if replace else dict(self._flags)
+            flags.update(entries)
+            self._flags = flags
+
+    def set_flag(self, flag_name: str, flag_value: Optional[str]) -> None:
+        """
+        Apply a flag change made by this process (visible to the next request)
+
+        Args:
+            flag_name: Flag name
+            flag_value: New value, or None if the flag was deleted
+        """
+        self._set_entries({flag_name: FlagEntry(flag_value, time.monotonic())})
+
+    async def refresh(self) -> int:
+        """
+        Fetch flags changed since the last poll (or the whole table when due)
+
+        Returns:
+            Number of rows fetched
+        """
+        now = time.monotonic()
+        full = self._version is None or now - self._full_refresh_at >= SYSTEM_FLAGS_FULL_REFRESH_SECONDS
+
+        query = self.supabase.table("system_flags").select("flag_name, flag_value, updated_at")
+        if not full:
+            query = query.gt("updated_at", self._version)
+        result = await run_query(query)
+        rows = result.data or []
+
+        entries = {}
+        for row in rows:
+            previous = self._flags.get(row["flag_name"])
+            entry = FlagEntry(row["flag_value"], now)
+            if previous is not None and previous.value == entry.value:
+                entry.parsed = previous.parsed
+            entries[row["flag_name"]] = entry
+            updated_at = row.get("updated_at")
+            if updated_at and (self._version is None or updated_at > self._version):
+                self._version = updated_at
+
+        self._set_entries(entries, replace=full)
+        if full:
+            self._full_refresh_at = now
+            self._complete = True
+        self._confirmed_at = now
+        self.polls += 1
+        return len(rows)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"System flags poll failed: {str(e)}")
+            # Twice per staleness window so request paths never have to read
+            await asyncio.sleep(max(0.1, self.max_staleness_seconds / 2))
+
+    async def start(self) -> None:
+        """Start polling for flag changes"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        """Stop polling"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get snapshot counters
+
+        Returns:
+            Dict with cached flags, version, polls and on-demand loads
+        """
+        return {
+            "flags": len(self._flags),
+            "version": self._version,
+            "polls": self.polls,
+            "loads": self.loads,
+            "polling": self._task is not None and not self._task.done()
+        }
+
+
+# One snapshot per Supabase client, released together with the client
+_system_flags: "weakref.WeakKeyDictionary[Client, SystemFlags]" = weakref.WeakKeyDictionary()
+_system_flags_lock = threading.Lock()
+
+
+def get_system_flags(supabase_client: Client) -> SystemFlags:
+    """
+    Get or create the flag snapshot bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        SystemFlags instance
+    """
+    system_flags = _system_flags.get(supabase_client)
+    if system_flags is None:
+        with _system_flags_lock:
+            system_flags = _system_flags.get(supabase_client)
+            if system_flags is None:
+                system_flags = SystemFlags(supabase_client)
+                _system_flags[supabase_client] = system_flags
+    return system_flags
@@ -0,0 +1,278 @@
+"""
+Token Verifier
+Local verification of Supabase access tokens
+
+Supabase access tokens are JWTs signed with the project's JWT secret
+(HS256) or its asymmetric signing keys (RS256/ES256, published as JWKS).
+Checking the signature and expiry locally replaces a Supabase Auth round
+trip per request. Verified claims are kept in a bounded LRU keyed by the
+token's sha256 until the token expires, so repeat requests skip even the
+signature check. Tokens that can't be checked locally (no secret
+configured, JWKS unreachable, unknown key) fall back to
+supabase.auth.get_user(); AUTH_REMOTE_RECHECK_SECONDS additionally
+re-checks cached tokens remotely so revoked sessions are noticed.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import jwt
+from supabase import Client
+from dotenv import load_dotenv
+from services.db_executor import run_sync
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Verify tokens locally when a secret or JWKS is available (false = always ask Supabase Auth)
+AUTH_LOCAL_VERIFY = os.getenv("AUTH_LOCAL_VERIFY", "true").lower() == "true"
+# Project JWT secret (Settings > API) for HS256 tokens
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+# Signing keys for RS256/ES256 tokens (defaults to the project's JWKS endpoint)
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "")
+AUTH_JWKS_CACHE_SECONDS = float(os.getenv("AUTH_JWKS_CACHE_SECONDS", "600"))
+AUTH_JWT_AUDIENCE = os.getenv("AUTH_JWT_AUDIENCE", "authenticated")
+AUTH_JWT_LEEWAY_SECONDS = float(os.getenv("AUTH_JWT_LEEWAY_SECONDS", "5"))
+# Verified tokens kept in memory
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Re-check cached tokens with Supabase Auth this often to catch revoked sessions (0 = never)
+AUTH_REMOTE_RECHECK_SECONDS = float(os.getenv("AUTH_REMOTE_RECHECK_SECONDS", "0"))
+
+SYMMETRIC_ALGORITHMS = {"HS256"}
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+# Don't refetch JWKS for an unknown key id more often than this
+JWKS_MIN_REFRESH_SECONDS = 30
+
+
+def _default_jwks_url() -> str:
+    supabase_url = os.getenv("SUPABASE_URL", "")
+    return f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json" if supabase_url else ""
+
+
+class TokenVerifier:
+    """Verifies access tokens locally with an LRU of verified claims"""
+
+    def __init__(
+        self,
+        supabase_client: Optional[Client] = None,
+        jwt_secret: Optional[str] = None,
+        jwks_url: Optional[str] = None,
+        cache_size: int = AUTH_TOKEN_CACHE_SIZE,
+        remote_recheck_seconds: float = AUTH_REMOTE_RECHECK_SECONDS,
+        local_verify: bool = AUTH_LOCAL_VERIFY
+    ):
+        """
+        Initialize the token verifier
+
+        Args:
+            supabase_client: Client for remote verification (defaults to the shared client)
+            jwt_secret: Project JWT secret for HS256 tokens
+            jwks_url: JWKS endpoint for RS256/ES256 tokens
+            cache_size: Maximum verified tokens kept in memory
+            remote_recheck_seconds: Remote re-check interval for cached tokens (0 = never)
+            local_verify: Verify signatures locally (False = always ask Supabase Auth)
+        """
+        if supabase_client is None:
+            from services.service_registry import get_supabase_client
+            supabase_client = get_supabase_client()
+
+        self.supabase = supabase_client
+        self.jwt_secret = SUPABASE_JWT_SECRET if jwt_secret is None else jwt_secret
+        self.jwks_url = (AUTH_JWKS_URL or _default_jwks_url()) if jwks_url is None else jwks_url
+        self.cache_size = cache_size
+        self.remote_recheck_seconds = remote_recheck_seconds
+        self.local_verify = local_verify
+
+        # sha256(token) -> (user, expires_at, checked_remotely_at)
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # key id -> signing key
+        self._jwks: Dict[str, Any] = {}
+        self._jwks_fetched_at = 0.0
+
+        self.cache_hits = 0
+        self.local_verifications = 0
+        self.remote_verifications = 0
+
+    async def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Verify an access token
+
+        Args:
+            token: Bearer token from the Authorization header
+
+        Returns:
+            Dict with user id and email, or None if Supabase Auth rejects the token
+
+        Raises:
+            jwt.InvalidTokenError: If the token is malformed, expired or badly signed
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+
+        cached = self._get_cached(key, now)
+        if cached is not None:
+            user, _, checked_at = cached
+            if not self.remote_recheck_seconds or now - checked_at < self.remote_recheck_seconds:
+                self.cache_hits += 1
+                return user
+            # Due for a revocation check
+            user = await self._verify_remotely(token)
+            if user is None:
+                self._evict(key)
+                return None
+            self._store(key, user, cached[1], now)
+            return user
+
+        claims = await self._verify_locally(token) if self.local_verify else None
+        if claims is not None:
+            self.local_verifications += 1
+            user = {"id": claims["sub"], "email": claims.get("email")}
+            # A locally verified token counts as checked now
+            self._store(key, user, float(claims["exp"]), now)
+            return user
+
+        user = await self._verify_remotely(token)
+        if user is None:
+            return None
+        expires_at = self._unverified_expiry(token)
+        if expires_at is not None and self.local_verify:
+            self._store(key, user, expires_at, now)
+        return user
+
+    def _get_cached(self, key: str, now: float) -> Optional[Tuple[Dict[str, Any], float, float]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            if cached[1] <= now:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return cached
+
+    def _store(self, key: str, user: Dict[str, Any], expires_at: float, checked_at: float) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (user, expires_at, checked_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _evict(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    async def _verify_locally(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Check signature, expiry and audience
+
+        Returns:
+            Verified claims, or None if no key is available to check the token
+
+        Raises:
+            jwt.InvalidTokenError: If the token fails verification
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+
+        if algorithm in SYMMETRIC_ALGORITHMS:
+            if not self.jwt_secret:
+                return None
+            signing_key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            signing_key = await self._get_signing_key(header.get("kid"))
+            if signing_key is None:
+                return None
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+
+        return jwt.decode(
+            token,
+            signing_key,
+            algorithms=[algorithm],
+            audience=AUTH_JWT_AUDIENCE or None,
+            leeway=AUTH_JWT_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"], "verify_aud": bool(AUTH_JWT_AUDIENCE)}
+        )
+
+    async def _get_signing_key(self, key_id: Optional[str]) -> Optional[Any]:
+        """Get a JWKS signing key by id, fetching the key set when stale or the id is new"""
+        if not self.jwks_url or not key_id:
+            return None
+
+        age = time.time() - self._jwks_fetched_at
+        stale = age >= AUTH_JWKS_CACHE_SECONDS
+        unknown = key_id not in self._jwks and age >= JWKS_MIN_REFRESH_SECONDS
+        if stale or unknown:
+            try:
+                self._jwks = await run_sync(self._fetch_jwks)
+            except Exception as e:
+                logger.warning(f"Failed to fetch JWKS from {self.jwks_url}: {str(e)}")
+            # Failed fetches also wait for the refresh interval
+            self._jwks_fetched_at = time.time()
+
+        return self._jwks.get(key_id)
+
+    def _fetch_jwks(self) -> Dict[str, Any]:
+        jwk_set = jwt.PyJWKClient(self.jwks_url, cache_jwk_set=False, cache_keys=False).get_jwk_set()
+        return {jwk.key_id: jwk.key for jwk in jwk_set.keys if jwk.key_id}
+
+    async def _verify_remotely(self, token: str) -> Optional[Dict[str, Any]]:
+        """Ask Supabase Auth about the token (also catches revoked sessions)"""
+        self.remote_verifications += 1
+        user_response = await run_sync(self.supabase.auth.get_user, token)
+        if not user_response or not user_response.user:
+            return None
+        return {"id": user_response.user.id, "email": user_response.user.email}
+
+    @staticmethod
+    def _unverified_expiry(token: str) -> Optional[float]:
+        try:
+            expires_at = jwt.decode(token, options={"verify_signature": False}).get("exp")
+            return float(expires_at) if expires_at is not None else None
+        except (jwt.InvalidTokenError, TypeError, ValueError):
+            return None
+
+    def invalidate(self, token: str) -> None:
+        """Forget a cached token (e.g. after sign-out)"""
+        self._evict(hashlib.sha256(token.encode()).hexdigest())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get verification counters
+
+        Returns:
+            Dict with cache size, cache hits and local/remote verification counts
+        """
+        return {
+            "cached_tokens": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "local_verifications": self.local_verifications,
+            "remote_verifications": self.remote_verifications
+        }
+
+
+# Singleton instance
+_token_verifier: Optional[TokenVerifier] = None
+
+
+def get_token_verifier(supabase_client: Optional[Client] = None) -> TokenVerifier:
+    """
+    Get or create the token verifier
+
+    Args:
+        supabase_client: Optional Supabase client
+
+    Returns:
+        TokenVerifier instance
+    """
+    global _token_verifier
+    if _token_verifier is None or (supabase_client is not None and supabase_client is not _token_verifier.supabase):
+        _token_verifier = TokenVerifier(supabase_client)
+    return _token_verifier
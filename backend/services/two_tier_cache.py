@@ -0,0 +1,264 @@
+"""
+Two-Tier Cache
+Shared LRU memory tier and SQLite disk tier for the embedding and response caches
+
+The memory tier is an OrderedDict guarded by a lock. The optional disk tier
+is owned by a single cache thread: reads are awaited from there, and writes
+are queued and committed in batches, so SQLite never blocks the event loop.
+Subclasses define the disk table and how entries are looked up.
+"""
+import os
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TwoTierCache:
+    """Base for caches with an LRU memory tier and an optional SQLite disk tier"""
+
+    # Disk table and its (name, SQL type) columns after the TEXT key
+    table = ""
+    columns: Tuple[Tuple[str, str], ...] = ()
+    # Used in log messages and the cache thread's name
+    label = "Cache"
+
+    def __init__(self, memory_size: int, db_path: Optional[str], mmap_bytes: int = 0):
+        """
+        Initialize the cache
+
+        Args:
+            memory_size: Maximum entries kept in the memory tier
+            db_path: SQLite file for the disk tier, or None/empty to disable it
+            mmap_bytes: SQLite mmap_size for disk reads (0 = SQLite default)
+        """
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        # The disk tier is only touched from this thread
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # key -> row written by the next flush; one commit covers all of them
+        self._pending_writes: Dict[str, Tuple[Any, ...]] = {}
+        self._flush_scheduled = False
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_commits = 0
+
+        if db_path:
+            thread_name = self.label.lower().replace(" ", "-")
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name)
+            self._executor.submit(self._open_db, db_path, mmap_bytes)
+
+    def _open_db(self, db_path: str, mmap_bytes: int) -> None:
+        """Open (and create if needed) the SQLite disk tier (cache thread)"""
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            if mmap_bytes:
+                db.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+            definitions = ", ".join(f"{name} {sql_type} NOT NULL" for name, sql_type in self.columns)
+            db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, {definitions})")
+            db.commit()
+            self._db = db
+            logger.info(f"{self.label} disk tier at {db_path}")
+        except Exception as e:
+            logger.warning(f"{self.label} disk tier disabled ({db_path}): {str(e)}")
+            self._db = None
+
+    def _remember(self, key: str, entry: Any) -> None:
+        """Insert into the memory tier, evicting the least recently used entry (lock held)"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def _read_disk(self, keys: List[str]) -> Dict[str, Tuple[Any, ...]]:
+        """
+        Read disk rows on the cache thread
+
+        Args:
+            keys: Keys to look up
+
+        Returns:
+            Dict of key -> (key, *columns) for the keys found
+        """
+        if self._executor is None or not keys:
+            return {}
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._select, keys)
+        except Exception as e:
+            logger.warning(f"{self.label} disk read failed: {str(e)}")
+            return {}
+
+    def _select(self, keys: List[str]) -> Dict[str, Tuple[Any, ...]]:
+        """Read rows for keys, including writes not yet flushed (cache thread)"""
+        with self._lock:
+            rows = {key: self._pending_writes[key] for key in keys if key in self._pending_writes}
+        keys = [key for key in keys if key not in rows]
+        if self._db is None or not keys:
+            return rows
+
+        names = ", ".join(["key"] + [name for name, _ in self.columns])
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            result = self._db.execute(f"SELECT {names} FROM {self.table} WHERE key IN ({placeholders})", chunk)
+            rows.update((row[0], tuple(row)) for row in result.fetchall())
+        return rows
+
+    def _queue_write(self, row: Tuple[Any, ...]) -> None:
+        """
+        Queue a disk write, committed with others by the cache thread
+
+        Args:
+            row: (key, *columns)
+        """
+        if self._executor is None:
+            return
+
+        with self._lock:
+            self._pending_writes[row[0]] = row
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+
+        try:
+            self._executor.submit(self._flush)
+        except RuntimeError:
+            # Shut down; the entry stays in the memory tier only
+            with self._lock:
+                self._flush_scheduled = False
+
+    def _flush(self) -> None:
+        """Write all pending rows in one transaction (cache thread)"""
+        with self._lock:
+            rows = list(self._pending_writes.values())
+            self._flush_scheduled = False
+        if not rows:
+            return
+
+        try:
+            if self._db is not None:
+                placeholders = ", ".join("?" for _ in range(len(self.columns) + 1))
+                self._db.executemany(f"INSERT OR REPLACE INTO {self.table} VALUES ({placeholders})", rows)
+                self._db.commit()
+                self.disk_commits += 1
+        except Exception as e:
+            logger.warning(f"{self.label} disk write failed: {str(e)}")
+        finally:
+            with self._lock:
+                # Rows re-written during the flush are kept for the next one
+                for row in rows:
+                    if self._pending_writes.get(row[0]) is row:
+                        del self._pending_writes[row[0]]
+
+    def flush(self) -> None:
+        """Wait until pending disk writes are committed (blocking; not for the event loop)"""
+        if self._executor is not None:
+            self._executor.submit(self._flush).result()
+
+    async def _delete_disk(self, where: str, params: Sequence[Any]) -> Optional[int]:
+        """
+        Delete disk rows on the cache thread, after committing pending writes
+
+        Args:
+            where: SQL condition
+            params: Condition parameters
+
+        Returns:
+            Number of rows deleted, or None if the disk tier is disabled or failed
+        """
+        if self._executor is None:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._delete, where, params)
+
+    def _delete(self, where: str, params: Sequence[Any]) -> Optional[int]:
+        """Delete rows matching a condition (cache thread)"""
+        self._flush()
+        if self._db is None:
+            return None
+        try:
+            removed = self._db.execute(f"DELETE FROM {self.table} WHERE {where}", list(params)).rowcount
+            self._db.commit()
+            return removed
+        except Exception as e:
+            logger.warning(f"{self.label} disk delete failed: {str(e)}")
+            return None
+
+    def clear(self) -> None:
+        """Drop all cached entries and reset counters"""
+        with self._lock:
+            self._memory.clear()
+            self._pending_writes.clear()
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+        if self._executor is not None:
+            self._executor.submit(self._delete, "1", ())
+
+    def _count_disk_entries(self) -> Optional[int]:
+        """Count rows in the disk tier (cache thread)"""
+        if self._db is None:
+            return None
+        try:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        except Exception:
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters (blocking while the disk tier is counted; not for the event loop)
+
+        Returns:
+            Dict with hits (total, memory, disk), misses, hit_rate, sizes and disk commits
+        """
+        disk_entries = None
+        if self._executor is not None:
+            try:
+                disk_entries = self._executor.submit(self._count_disk_entries).result()
+            except RuntimeError:
+                disk_entries = None
+
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "pending_writes": len(self._pending_writes),
+                "disk_commits": self.disk_commits
+            }
+
+    def close(self) -> None:
+        """Commit pending writes and stop the cache thread (blocking)"""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.submit(self._flush)
+        executor.shutdown(wait=True)
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,242 @@
+"""
+Usage Log Writer
+Write-behind buffer for model_usage_logs rows
+
+Every AI call attempt is logged. Instead of inserting each row on the
+request's critical path, ModelUsageLogger hands rows to this buffer and a
+background flusher bulk-inserts them when a batch fills up or the flush
+interval passes. The buffer is bounded; when it is full the configured
+policy drops the oldest row, drops the new row, or makes the caller wait
+briefly for the flusher (backpressure). Remaining rows are flushed on
+shutdown.
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from supabase import Client
+from dotenv import load_dotenv
+from services.db_executor import run_query
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Write-behind configuration
+USAGE_LOG_WRITE_BEHIND = os.getenv("USAGE_LOG_WRITE_BEHIND", "true").lower() == "true"
+USAGE_LOG_QUEUE_SIZE = int(os.getenv("USAGE_LOG_QUEUE_SIZE", "10000"))
+USAGE_LOG_BATCH_SIZE = int(os.getenv("USAGE_LOG_BATCH_SIZE", "200"))
+USAGE_LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("USAGE_LOG_FLUSH_INTERVAL_SECONDS", "2"))
+# What to do when the buffer is full: drop_oldest, drop_newest or block
+USAGE_LOG_DROP_POLICY = os.getenv("USAGE_LOG_DROP_POLICY", "drop_oldest")
+# Longest a caller waits for space under the block policy before the row is dropped
+USAGE_LOG_BLOCK_TIMEOUT_SECONDS = float(os.getenv("USAGE_LOG_BLOCK_TIMEOUT_SECONDS", "0.05"))
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class UsageLogWriter:
+    """Bounded in-process buffer that bulk-inserts usage log rows in the background"""
+
+    def __init__(
+        self,
+        supabase_client: Client,
+        max_size: int = USAGE_LOG_QUEUE_SIZE,
+        batch_size: int = USAGE_LOG_BATCH_SIZE,
+        flush_interval: float = USAGE_LOG_FLUSH_INTERVAL_SECONDS,
+        drop_policy: str = USAGE_LOG_DROP_POLICY
+    ):
+        """
+        Initialize the writer
+
+        Args:
+            supabase_client: Supabase client used for inserts
+            max_size: Maximum rows buffered
+            batch_size: Rows per insert; a full batch triggers a flush
+            flush_interval: Seconds between flushes of partial batches
+            drop_policy: drop_oldest, drop_newest or block
+        """
+        if drop_policy not in DROP_POLICIES:
+            logger.warning(f"Unknown usage log drop policy '{drop_policy}', using drop_oldest")
+            drop_policy = "drop_oldest"
+
+        self.supabase = supabase_client
+        self.max_size = max(1, max_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+
+        self._rows: Deque[Dict[str, Any]] = deque()
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    async def put(self, row: Dict[str, Any]) -> bool:
+        """
+        Buffer a row for insertion
+
+        Args:
+            row: model_usage_logs row
+
+        Returns:
+            True if the row was buffered, False if it was dropped
+        """
+        self._ensure_flusher()
+
+        if len(self._rows) >= self.max_size:
+            if self.drop_policy == "drop_oldest":
+                self._rows.popleft()
+                self.dropped += 1
+            elif self.drop_policy == "drop_newest":
+                self.dropped += 1
+                return False
+            else:
+                # Backpressure: give the flusher a moment to make room
+                self._wakeup.set()
+                self._space.clear()
+                try:
+                    await asyncio.wait_for(self._space.wait(), timeout=USAGE_LOG_BLOCK_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                if len(self._rows) >= self.max_size:
+                    self.dropped += 1
+                    return False
+
+        self._rows.append(row)
+        self.enqueued += 1
+
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+    async def flush(self) -> int:
+        """
+        Insert all buffered rows in batches
+
+        Returns:
+            Number of rows inserted
+        """
+        self._ensure_loop_state()
+        inserted = 0
+
+        async with self._flush_lock:
+            while self._rows:
+                batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                self._space.set()
+
+                try:
+                    await run_query(self.supabase.table("model_usage_logs").insert(batch))
+                except Exception as e:
+                    self.failed += len(batch)
+                    logger.error(f"Failed to flush {len(batch)} model usage log rows: {str(e)}")
+                    continue
+
+                self.flushed += len(batch)
+                self.flushes += 1
+                inserted += len(batch)
+
+        return inserted
+
+    def _ensure_loop_state(self) -> None:
+        """Create the event-loop bound primitives for the running loop"""
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            # First use, or a new event loop: the old flusher can't be reused
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flusher = None
+
+    def _ensure_flusher(self) -> None:
+        """Start the background flusher on the running event loop if needed"""
+        self._ensure_loop_state()
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = self._loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """Flush when a batch fills up or the interval passes"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage log flusher error: {str(e)}")
+
+    async def stop(self) -> None:
+        """Stop the flusher and insert everything still buffered"""
+        self._ensure_loop_state()
+
+        # Let an in-progress flush finish before stopping the flusher
+        async with self._flush_lock:
+            if self._flusher is not None and not self._flusher.done():
+                self._flusher.cancel()
+                await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+
+        await self.flush()
+
+        logger.info(f"Usage log writer stopped ({self.flushed} rows flushed, {self.dropped} dropped)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get writer counters
+
+        Returns:
+            Dict with enqueued, flushed, dropped and failed row counts, flushes and pending rows
+        """
+        return {
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "pending": len(self._rows),
+            "drop_policy": self.drop_policy
+        }
+
+
+# Singleton instance
+_usage_log_writer: Optional[UsageLogWriter] = None
+
+
+def get_usage_log_writer(supabase_client: Optional[Client] = None) -> Optional[UsageLogWriter]:
+    """
+    Get or create the singleton usage log writer
+
+    Args:
+        supabase_client: Supabase client; replaces the client used for future flushes
+
+    Returns:
+        UsageLogWriter instance, or None if write-behind is disabled (or never configured)
+    """
+    global _usage_log_writer
+
+    if not USAGE_LOG_WRITE_BEHIND:
+        return None
+
+    if _usage_log_writer is None:
+        if supabase_client is None:
+            return None
+        _usage_log_writer = UsageLogWriter(supabase_client)
+    elif supabase_client is not None:
+        _usage_log_writer.supabase = supabase_client
+
+    return _usage_log_writer
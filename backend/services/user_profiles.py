@@ -0,0 +1,186 @@
+"""
+User Profiles
+Cached users rows (plan, role, disabled) for per-request checks
+
+Rate limiting, plan lookups and admin checks each need the caller's users
+row; a single chat request used to select it several times. Profiles are
+cached at two levels: a request scope (started in get_current_user) that
+loads each profile at most once per request, and a process-wide LRU with
+a short TTL. AdminService plan/disable changes and PaymentService plan
+changes invalidate the entry in this process; other processes pick the
+change up within USER_PROFILE_CACHE_TTL_SECONDS.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+from supabase import Client
+from dotenv import load_dotenv
+from services.db_executor import run_query
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+# Seconds a profile is reused across requests (0 = request scope only)
+USER_PROFILE_CACHE_TTL_SECONDS = float(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", "30"))
+USER_PROFILE_CACHE_SIZE = int(os.getenv("USER_PROFILE_CACHE_SIZE", "10000"))
+
+PROFILE_COLUMNS = "id, email, plan, role, disabled"
+
+# user_id -> profile (None if the user doesn't exist) for the current request
+_request_profiles: ContextVar[Optional[Dict[str, Optional[Dict[str, Any]]]]] = ContextVar(
+    "request_profiles", default=None
+)
+
+
+def start_request_scope() -> None:
+    """Start caching profiles for the current request (called once per authenticated request)"""
+    _request_profiles.set({})
+
+
+class UserProfileCache:
+    """Request-scoped and process-wide TTL cache of users rows"""
+
+    def __init__(
+        self,
+        supabase_client: Client,
+        ttl_seconds: float = USER_PROFILE_CACHE_TTL_SECONDS,
+        max_size: int = USER_PROFILE_CACHE_SIZE
+    ):
+        """
+        Initialize the profile cache
+
+        Args:
+            supabase_client: Supabase client instance
+            ttl_seconds: Seconds a profile is reused across requests (0 = request scope only)
+            max_size: Maximum profiles kept across requests
+        """
+        self.supabase = supabase_client
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+
+        # user_id -> (expires_at, profile)
+        self._profiles: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.loads = 0
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's profile
+
+        Args:
+            user_id: User's unique identifier
+
+        Returns:
+            Dict with id, email, plan, role and disabled, or None if the user doesn't exist
+
+        Raises:
+            Exception: If the users row can't be read
+        """
+        scope = _request_profiles.get()
+        if scope is not None and user_id in scope:
+            self.hits += 1
+            return scope[user_id]
+
+        profile = self._get_cached(user_id)
+        if profile is not None:
+            self.hits += 1
+        else:
+            # One read per user however many requests are waiting for it
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = asyncio.ensure_future(self._load(user_id))
+                self._pending[user_id] = pending
+                pending.add_done_callback(lambda _: self._pending.pop(user_id, None))
+            profile = await asyncio.shield(pending)
+
+        if scope is not None:
+            scope[user_id] = profile
+        return profile
+
+    def _get_cached(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._profiles.get(user_id)
+            if cached is None:
+                return None
+            if cached[0] <= time.monotonic():
+                del self._profiles[user_id]
+                return None
+            self._profiles.move_to_end(user_id)
+            return cached[1]
+
+    async def _load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        self.loads += 1
+        response = await run_query(self.supabase.table("users").select(PROFILE_COLUMNS).eq("id", user_id))
+        if not response.data:
+            # Not cached across requests: the row may be created right after sign-up
+            return None
+
+        profile = response.data[0]
+        if self.ttl_seconds > 0 and self.max_size > 0:
+            with self._lock:
+                self._profiles[user_id] = (time.monotonic() + self.ttl_seconds, profile)
+                self._profiles.move_to_end(user_id)
+                while len(self._profiles) > self.max_size:
+                    self._profiles.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id: str) -> None:
+        """
+        Forget a user's cached profile after their plan, role or status changed
+
+        Args:
+            user_id: User's unique identifier
+        """
+        with self._lock:
+            self._profiles.pop(user_id, None)
+        scope = _request_profiles.get()
+        if scope is not None:
+            scope.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache counters
+
+        Returns:
+            Dict with cached profiles, hits and database loads
+        """
+        return {
+            "cached_profiles": len(self._profiles),
+            "hits": self.hits,
+            "loads": self.loads
+        }
+
+
+# One cache per Supabase client, released together with the client
+_profile_caches: "weakref.WeakKeyDictionary[Client, UserProfileCache]" = weakref.WeakKeyDictionary()
+_profile_caches_lock = threading.Lock()
+
+
+def get_user_profiles(supabase_client: Client) -> UserProfileCache:
+    """
+    Get or create the profile cache bound to a Supabase client
+
+    Args:
+        supabase_client: Supabase client instance
+
+    Returns:
+        UserProfileCache instance
+    """
+    cache = _profile_caches.get(supabase_client)
+    if cache is None:
+        with _profile_caches_lock:
+            cache = _profile_caches.get(supabase_client)
+            if cache is None:
+                cache = UserProfileCache(supabase_client)
+                _profile_caches[supabase_client] = cache
+    return cache
@@ -3,7 +3,7 @@ Pytest configuration and fixtures for the Medical AI Platform tests
 """
 import pytest
 import os
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock, patch
 from supabase import create_client, Client
 
 
@@ -83,3 +83,57 @@ def sample_usage_data():
         'images_used': 0,
         'flashcards_generated': 3
     }
+
+
+@pytest.fixture
+def router_keys():
+    """
+    Build active chat API keys for model router tests, highest priority first
+
+    Call with the number of keys; key N has id "key-N" and key_value "kN"
+    """
+    def make(count=2):
+        return [
+            {
+                'id': f'key-{n}',
+                'provider': 'openrouter',
+                'feature': 'chat',
+                'key_value': f'k{n}',
+                'priority': 10 * (count - n + 1),
+                'status': 'active'
+            }
+            for n in range(1, count + 1)
+        ]
+    return make
+
+
+@pytest.fixture
+def router_dependencies():
+    """
+    Patch the health tracker and usage logger the model router looks up per call
+
+    Call with the keys to report as healthy; returns the (health_tracker,
+    usage_logger) mocks. The patches end with the test.
+    """
+    patchers = []
+
+    def install(keys):
+        health_tracker = MagicMock()
+        health_tracker.get_all_healthy_keys_for_feature = AsyncMock(return_value=keys)
+        health_tracker.select_best_provider = AsyncMock(return_value=keys[0])
+        health_tracker.update_key_health = AsyncMock()
+
+        usage_logger = MagicMock()
+        usage_logger.log_model_call = AsyncMock()
+
+        patchers.extend([
+            patch('services.health_tracker.get_health_tracker_service', return_value=health_tracker),
+            patch('services.model_usage_logger.get_model_usage_logger', return_value=usage_logger)
+        ])
+        for patcher in patchers[-2:]:
+            patcher.start()
+        return health_tracker, usage_logger
+
+    yield install
+    for patcher in reversed(patchers):
+        patcher.stop()
@@ -9,6 +9,7 @@ from unittest.mock import Mock, AsyncMock, patch
 from fastapi import Request
 from fastapi.exceptions import HTTPException
 from middleware.feature_toggle import get_feature_toggle_middleware
+from services.system_flags import get_system_flags
 
 
 # Feature: medical-ai-platform, Property 49: Disabled features reject requests
@@ -297,11 +298,12 @@ async def test_property_feature_toggle_affects_requests_immediately(feature, ini
         assert exc_info.value.status_code == 403, \
             "Initially disabled feature should return 403"
     
-    # Change status
+    # Change status (AdminService.toggle_feature writes the row and updates the flag snapshot)
     new_enabled = not initial_enabled
     mock_eq.execute.return_value = Mock(
         data=[{"flag_value": str(new_enabled)}]
     )
+    get_system_flags(mock_supabase).set_flag(f"feature_{feature}_enabled", str(new_enabled))
     
     # Property: Status change should immediately affect requests
     if new_enabled:
@@ -15,6 +15,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 from services.model_router import ModelRouterService
 from services.encryption import encrypt_key
+from services.circuit_breaker import get_circuit_breaker_registry
 
 
 # Custom strategies for generating valid test data
@@ -769,8 +770,9 @@ async def test_property_failure_count_incremented(feature, encryption_key):
         # Create model router service with mock client
         router = ModelRouterService(supabase_client=mock_supabase)
         
-        # Record a failure
+        # Record a failure; the increment is written by the breaker registry's persistence
         await router.record_failure("key-1", "Test error")
+        await get_circuit_breaker_registry(mock_supabase).persist()
         
         # Property: Update should have been called with incremented failure count
         assert update_called[0], "Update should have been called"
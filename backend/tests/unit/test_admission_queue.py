@@ -0,0 +1,144 @@
+"""
+Unit tests for plan-aware admission control
+Tests priority ordering, bounded depth, wait budgets and 503 translation
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from services.admission_queue import (
+    AdmissionQueue,
+    AdmissionRejected,
+    note_request_rejection
+)
+from services.model_router import ModelRouterService
+from middleware.admission import AdmissionRejectionMiddleware
+
+
+def test_classes_rank_plan_then_interactive_features():
+    """Paid plans outrank free ones; within a plan chat outranks bulk generation"""
+    queue = AdmissionQueue(max_concurrent=1)
+    pro_chat = queue.classify("pro", "chat")
+    pro_cards = queue.classify("pro", "flashcard")
+    free_chat = queue.classify("free", "chat")
+
+    assert pro_chat.name == "interactive:pro"
+    assert pro_chat.priority < pro_cards.priority < free_chat.priority
+    assert queue.classify("premium", "osce").priority == queue.classify("pro", "osce").priority
+    assert queue.classify(None, "chat").name == "interactive:free"
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_by_priority():
+    """A freed slot goes to the highest-priority waiter, not the oldest"""
+    queue = AdmissionQueue(max_concurrent=1, max_waits={})
+    await queue.acquire(queue.classify("pro", "chat"))
+    order = []
+
+    async def request(plan, feature):
+        await queue.acquire(queue.classify(plan, feature))
+        order.append(f"{plan}:{feature}")
+        queue.release(0.01)
+
+    tasks = [
+        asyncio.create_task(request("free", "flashcard")),
+        asyncio.create_task(request("free", "chat")),
+        asyncio.create_task(request("pro", "chat"))
+    ]
+    await asyncio.sleep(0.01)
+    assert queue.get_stats()["queue_depth"] == 3
+
+    queue.release(0.01)
+    await asyncio.gather(*tasks)
+
+    assert order == ["pro:chat", "free:chat", "free:flashcard"]
+    stats = queue.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["in_flight"] == 0
+    assert stats["classes"]["interactive:pro"]["admitted"] == 2
+
+
+@pytest.mark.asyncio
+async def test_full_queue_displaces_lower_priority_waiter():
+    """When the queue is full a paying user's request displaces a free bulk request"""
+    queue = AdmissionQueue(max_concurrent=1, max_depth=1, max_waits={})
+    await queue.acquire(queue.classify("pro", "chat"))
+
+    free = asyncio.create_task(queue.acquire(queue.classify("free", "mcq")))
+    await asyncio.sleep(0.01)
+
+    # Same or lower priority than the queued request: rejected right away
+    with pytest.raises(AdmissionRejected):
+        await queue.acquire(queue.classify("free", "map"))
+
+    paid = asyncio.create_task(queue.acquire(queue.classify("student", "chat")))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(AdmissionRejected) as displaced:
+        await free
+    assert displaced.value.retry_after >= 1
+
+    queue.release(0.01)
+    await paid
+    assert queue.get_stats()["classes"]["bulk:free"]["rejected"] == 2
+
+
+@pytest.mark.asyncio
+async def test_wait_budget_rejects_fast_or_on_timeout():
+    """A request is shed when its expected wait or actual wait exceeds its class budget"""
+    queue = AdmissionQueue(max_concurrent=1, max_waits={"bulk:free": 0.05, "interactive:free": 0.5})
+    await queue.acquire(queue.classify("pro", "chat"))
+
+    # Expected wait (one slow request ahead) is already over the budget
+    queue._service_seconds = 1.0
+    with pytest.raises(AdmissionRejected) as fast:
+        await queue.acquire(queue.classify("free", "flashcard"))
+    assert fast.value.reason == "expected wait exceeds budget"
+
+    # Expected wait fits, but the slot is never freed in time
+    queue._service_seconds = 0.1
+    with pytest.raises(AdmissionRejected) as slow:
+        await queue.acquire(queue.classify("free", "chat"))
+    assert slow.value.reason == "timed out in queue"
+    assert queue.get_stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_router_returns_overloaded_result_when_shed():
+    """execute_with_fallback reports a shed request instead of calling upstream"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.get_user_api_key = AsyncMock(return_value=None)
+    router._execute_with_fallback = AsyncMock()
+    queue = AdmissionQueue(max_concurrent=1, max_waits={"interactive:free": 0})
+    await queue.acquire(queue.classify("pro", "chat"))
+
+    with patch("services.model_router.get_admission_queue", return_value=queue):
+        result = await router.execute_with_fallback(provider="openrouter", feature="chat", prompt="hi")
+
+    assert result["success"] is False
+    assert result["overloaded"] is True
+    assert result["retry_after"] >= 1
+    router._execute_with_fallback.assert_not_called()
+
+
+def test_middleware_turns_shed_request_error_into_503():
+    """An error response for a shed request becomes 503 with Retry-After"""
+    app = FastAPI()
+    app.add_middleware(AdmissionRejectionMiddleware)
+
+    @app.get("/shed")
+    async def shed():
+        note_request_rejection(7.2)
+        raise HTTPException(status_code=500, detail="AI response generation failed")
+
+    @app.get("/broken")
+    async def broken():
+        raise HTTPException(status_code=500, detail="database down")
+
+    client = TestClient(app)
+    response = client.get("/shed")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "8"
+
+    assert client.get("/broken").status_code == 500
@@ -0,0 +1,187 @@
+"""
+Unit tests for streamed chat responses
+Tests fallback before the first token, broken streams, persistence and the SSE endpoint
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from fastapi.testclient import TestClient
+from services.model_router import ModelRouterService
+from services.chat import ChatService, get_chat_service
+from services.rate_limiter import get_rate_limiter
+from services.service_registry import provide
+
+
+def _stream_patches(streams):
+    """Patch the streaming provider; streams maps an API key to the chunks (or exception) it yields"""
+    async def fake_stream(api_key, provider, feature, prompt, system_prompt=None, raise_errors=False):
+        for item in streams[api_key]:
+            if isinstance(item, Exception):
+                raise item
+            await asyncio.sleep(0)
+            yield item
+
+    openrouter = MagicMock()
+    openrouter.get_model_id.return_value = "test/model"
+    openrouter.call_openrouter_streaming = fake_stream
+
+    return [
+        patch("services.providers.openrouter.get_openrouter_provider", return_value=openrouter),
+        patch("services.model_router.get_notification_service", return_value=MagicMock(notify_fallback=AsyncMock()))
+    ]
+
+
+async def _run(router, patches, tokens):
+    async def on_token(text):
+        tokens.append(text)
+
+    for p in patches:
+        p.start()
+    try:
+        return await router.execute_with_fallback(provider="openai", feature="chat", prompt="hi", on_token=on_token)
+    finally:
+        for p in patches:
+            p.stop()
+
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_before_first_token(router_keys, router_dependencies):
+    """A key that fails before sending text is replaced by the next key"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.record_failure = AsyncMock()
+    _, usage_logger = router_dependencies(router_keys(2))
+    patches = _stream_patches({
+        "k1": [Exception("OpenRouter API error (503): overloaded")],
+        "k2": ["Beta ", "blockers"]
+    })
+    tokens = []
+
+    result = await _run(router, patches, tokens)
+
+    assert result["success"] is True
+    assert result["content"] == "Beta blockers"
+    assert result["key_id"] == "key-2"
+    assert result["ttft_ms"] is not None
+    assert tokens == ["Beta ", "blockers"]
+    router.record_failure.assert_awaited_once()
+    assert usage_logger.log_model_call.await_args.kwargs["time_to_first_token_ms"] == result["ttft_ms"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broken_after_first_token_does_not_fall_back(router_keys, router_dependencies):
+    """Once text reached the caller, a failure ends the request instead of switching keys"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.record_failure = AsyncMock()
+    router._try_huggingface_fallback = AsyncMock()
+    router_dependencies(router_keys(2))
+    patches = _stream_patches({
+        "k1": ["Partial ", Exception("connection reset")],
+        "k2": ["never used"]
+    })
+    tokens = []
+
+    result = await _run(router, patches, tokens)
+
+    assert result["success"] is False
+    assert result["stream_interrupted"] is True
+    assert result["key_id"] == "key-1"
+    assert tokens == ["Partial "]
+    router._try_huggingface_fallback.assert_not_called()
+
+
+def _chat_supabase():
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.return_value.data = [{"id": "session-1"}]
+    supabase.table.return_value.insert.return_value.execute.side_effect = lambda: MagicMock(
+        data=[dict(supabase.table.return_value.insert.call_args.args[0], id="msg")]
+    )
+    return supabase
+
+
+@pytest.mark.asyncio
+async def test_stream_message_persists_assembled_answer_and_citations():
+    """Tokens are forwarded as events and the joined answer is stored with its citations"""
+    supabase = _chat_supabase()
+    service = ChatService(supabase_client=supabase)
+    citations = {"sources": [{"source_number": 1, "document_id": "doc-1"}]}
+
+    async def fake_execute(provider, feature, prompt, system_prompt=None, on_token=None, **kwargs):
+        for text in ["Hypertension ", "is ", "defined..."]:
+            await on_token(text)
+        return {"success": True, "content": "Hypertension is defined...", "tokens_used": 12}
+
+    router = MagicMock()
+    router.select_provider = AsyncMock(return_value="openai")
+    router.execute_with_fallback = AsyncMock(side_effect=fake_execute)
+    rate_limiter = MagicMock()
+    rate_limiter.increment_usage = AsyncMock()
+
+    with patch("services.model_router.get_model_router_service", return_value=router), \
+            patch("services.chat.get_rate_limiter", return_value=rate_limiter), \
+            patch.object(service, "_build_prompt", new=AsyncMock(return_value=("prompt with context", citations))):
+        events = [event async for event in service.stream_message("user-1", "session-1", "What is hypertension?")]
+
+    assert [event["event"] for event in events] == ["message", "token", "token", "token", "done"]
+    assistant = events[-1]["data"]["message"]
+    assert assistant["content"] == "Hypertension is defined..."
+    assert assistant["citations"] == citations
+    assert events[-1]["data"]["ttft_ms"] is not None
+    rate_limiter.increment_usage.assert_awaited_once_with(user_id="user-1", tokens=12, feature="chat")
+
+
+@pytest.mark.asyncio
+async def test_closing_stream_cancels_model_request():
+    """A client that goes away cancels the in-flight model request"""
+    service = ChatService(supabase_client=_chat_supabase())
+    cancelled = asyncio.Event()
+
+    async def fake_execute(on_token=None, **kwargs):
+        await on_token("First")
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    router = MagicMock()
+    router.select_provider = AsyncMock(return_value="openai")
+    router.execute_with_fallback = AsyncMock(side_effect=fake_execute)
+
+    with patch("services.model_router.get_model_router_service", return_value=router), \
+            patch.object(service, "_build_prompt", new=AsyncMock(return_value=("prompt", None))):
+        events = service.stream_message("user-1", "session-1", "hi")
+        assert (await events.__anext__())["event"] == "message"
+        assert (await events.__anext__())["data"] == {"content": "First"}
+        await events.aclose()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+def test_stream_endpoint_sends_server_sent_events():
+    """The endpoint returns text/event-stream with one SSE event per chat event"""
+    import main
+
+    async def fake_stream(user_id, session_id, message):
+        yield {"event": "message", "data": {"id": "user-msg"}}
+        yield {"event": "token", "data": {"content": "Hi"}}
+        yield {"event": "done", "data": {"message": {"id": "ai-msg"}, "ttft_ms": 5}}
+
+    chat_service = MagicMock()
+    chat_service.stream_message = fake_stream
+    rate_limiter = MagicMock()
+    rate_limiter.check_rate_limit = AsyncMock(return_value=True)
+
+    main.app.dependency_overrides[main.get_current_user] = lambda: {"id": "user-1234567890"}
+    main.app.dependency_overrides[provide(get_chat_service)] = lambda: chat_service
+    main.app.dependency_overrides[provide(get_rate_limiter)] = lambda: rate_limiter
+    try:
+        response = TestClient(main.app).post("/api/chat/sessions/session-123456/messages/stream", json={"message": "hello"})
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.split("\n\n")[:3] == [
+        'event: message\ndata: {"id": "user-msg"}',
+        'event: token\ndata: {"content": "Hi"}',
+        'event: done\ndata: {"message": {"id": "ai-msg"}, "ttft_ms": 5}'
+    ]
@@ -0,0 +1,55 @@
+"""
+Unit tests for the incremental text chunker
+Tests equivalence with whole-text chunking, bounded buffering and overlap across pages
+"""
+import random
+from services.chunking import TextChunker
+
+
+def _chunk_all(text, **kwargs):
+    chunker = TextChunker(**kwargs)
+    return chunker.feed(text) + chunker.finish()
+
+
+def _chunk_pieces(pieces, **kwargs):
+    chunker = TextChunker(**kwargs)
+    chunks = []
+    for piece in pieces:
+        chunks.extend(chunker.feed(piece))
+    return chunks + chunker.finish()
+
+
+def test_piecewise_feeding_matches_whole_text():
+    """Splitting the input anywhere never changes the chunks"""
+    rng = random.Random(7)
+    words = ["Aortic", "stenosis.", "Murmur\n", "radiates", "to", "carotids.", "  ", "\n\n", "ECG"]
+
+    for _ in range(50):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 800)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 20))))
+        pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+        assert _chunk_pieces(pieces) == _chunk_all(text.strip())
+
+
+def test_buffer_stays_bounded():
+    """Only the unconsumed tail is kept while a long document streams through"""
+    chunker = TextChunker(chunk_size=1000, overlap=200)
+    emitted = 0
+
+    for page in range(200):
+        emitted += len(chunker.feed(f"Page {page}. " + "Renal clearance is reduced. " * 40 + "\n\n"))
+        assert len(chunker._buffer) < 2 * chunker.chunk_size + 1200
+
+    assert emitted > 150
+
+
+def test_overlap_spans_page_boundaries():
+    """The chunk crossing a page break carries text from both pages"""
+    first_page = "Hepatic portal hypertension causes varices. " * 20
+    second_page = "Splenomegaly and ascites are common findings. " * 20
+
+    chunks = _chunk_pieces([first_page, "\n\n", second_page])
+
+    assert any("varices" in chunk and "Splenomegaly" in chunk for chunk in chunks)
+    assert chunks == _chunk_all((first_page + "\n\n" + second_page).strip())
@@ -0,0 +1,183 @@
+"""
+Unit tests for per-key circuit breakers
+Tests state transitions, the sliding window, recovery probes, persistence and routing
+"""
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from services import circuit_breaker
+from services.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CLOSED, OPEN, HALF_OPEN
+from services.health_tracker import HealthTrackerService
+
+
+def _fail(breaker, times):
+    for _ in range(times):
+        breaker.record(False)
+
+
+def test_breaker_opens_when_failure_rate_crosses_threshold():
+    """The breaker stays closed until min calls, then opens above the failure rate"""
+    breaker = CircuitBreaker("key-1", window_size=10)
+
+    _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS - 1)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request() is True
+
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.allow_request() is False
+    assert breaker.health_status() == "degraded"
+
+
+def test_window_forgets_old_outcomes():
+    """Only the most recent window_size outcomes count"""
+    breaker = CircuitBreaker("key-1", window_size=4)
+
+    with patch.object(circuit_breaker, "CIRCUIT_MIN_CALLS", 100):
+        _fail(breaker, 4)
+        for _ in range(3):
+            breaker.record(True)
+
+    assert breaker.calls == 4
+    assert breaker.failures == 1
+    assert breaker.health_score() == 0.75
+
+
+def test_half_open_allows_single_probe_and_closes_on_success():
+    """After the cool-down one probe goes through; success closes the breaker"""
+    breaker = CircuitBreaker("key-1")
+    _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS)
+    breaker.opened_at = time.monotonic() - circuit_breaker.CIRCUIT_OPEN_SECONDS - 1
+
+    assert breaker.allow_request() is True
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() is False  # Probe still outstanding
+
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.calls == 0
+    assert breaker.allow_request() is True
+
+
+def test_failed_probe_reopens_breaker():
+    """A failed probe starts a new cool-down"""
+    breaker = CircuitBreaker("key-1")
+    _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS)
+    breaker.opened_at = time.monotonic() - circuit_breaker.CIRCUIT_OPEN_SECONDS - 1
+
+    assert breaker.allow_request() is True
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    assert breaker.allow_request() is False
+
+
+def test_seed_restores_open_circuit_from_row():
+    """Persisted open circuits and legacy degraded stats start open"""
+    persisted = CircuitBreaker("key-1")
+    persisted.seed({"circuit_state": "open", "circuit_opened_at": circuit_breaker._utc_now()})
+    assert persisted.allow_request() is False
+
+    legacy = CircuitBreaker("key-2")
+    legacy.seed({"recent_attempts": 10, "recent_failures": 8})
+    assert legacy.state == OPEN
+
+    healthy = CircuitBreaker("key-3")
+    healthy.seed({"recent_attempts": 10, "recent_failures": 1})
+    assert healthy.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_outcomes_are_persisted_in_the_background_not_per_call():
+    """Recording touches no table; persist writes one update per changed key"""
+    supabase = MagicMock()
+    supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+        {"failure_count": 4}
+    ]
+    registry = CircuitBreakerRegistry(supabase)
+
+    registry.record("key-1", False)
+    registry.record_failure("key-1")
+    registry.record_failure("key-1")
+    registry.record("key-2", True)
+    supabase.table.assert_not_called()
+
+    assert await registry.persist() == 2
+    updates = [call.args[0] for call in supabase.table.return_value.update.call_args_list]
+    assert [u.get("failure_count") for u in updates] == [6, None]
+    assert updates[0]["circuit_state"] == CLOSED
+    assert updates[0]["recent_failures"] == 1
+    assert updates[1]["recent_successes"] == 1
+
+    # Nothing changed since the last round
+    supabase.table.reset_mock()
+    assert await registry.persist() == 0
+    supabase.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_routing_skips_open_circuits_without_trying_them():
+    """Keys with an open breaker are left out of the healthy key list"""
+    supabase = MagicMock()
+    tracker = HealthTrackerService(supabase)
+    keys = [
+        {"id": "k1", "provider": "openrouter", "feature": "chat", "key_value": "a", "priority": 2, "status": "active"},
+        {"id": "k2", "provider": "gemini", "feature": "chat", "key_value": "b", "priority": 1, "status": "active"}
+    ]
+    registry = MagicMock()
+    registry.get_active_keys.return_value = keys
+
+    with patch("services.health_tracker.get_key_registry", return_value=registry):
+        for _ in range(circuit_breaker.CIRCUIT_MIN_CALLS):
+            await tracker.update_key_health("k1", success=False)
+
+        healthy = await tracker.get_all_healthy_keys_for_feature("chat")
+
+    assert [k["id"] for k in healthy] == ["k2"]
+    assert healthy[0]["circuit_state"] == CLOSED
+    supabase.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_listing_keys_does_not_take_the_recovery_probe():
+    """A half-open key stays probeable until the router actually tries it"""
+    supabase = MagicMock()
+    tracker = HealthTrackerService(supabase)
+    keys = [
+        {"id": "k1", "provider": "openrouter", "feature": "chat", "key_value": "a", "priority": 2, "status": "active"},
+        {"id": "k2", "provider": "gemini", "feature": "chat", "key_value": "b", "priority": 1, "status": "active"}
+    ]
+    registry = MagicMock()
+    registry.get_active_keys.return_value = keys
+
+    with patch("services.health_tracker.get_key_registry", return_value=registry):
+        for _ in range(circuit_breaker.CIRCUIT_MIN_CALLS):
+            await tracker.update_key_health("k2", success=False)
+        breaker = circuit_breaker.get_circuit_breaker_registry(supabase).get("k2")
+        breaker.opened_at = time.monotonic() - circuit_breaker.CIRCUIT_OPEN_SECONDS - 1
+
+        for _ in range(3):
+            assert "k2" in [k["id"] for k in await tracker.get_all_healthy_keys_for_feature("chat")]
+
+    assert breaker.probe_started == 0.0
+    assert breaker.allow_request() is True
+
+
+@pytest.mark.asyncio
+async def test_router_hands_back_probes_it_does_not_use():
+    """A probe claimed for an attempt that is cancelled or rate limited is returned"""
+    from services.model_router import ModelRouterService
+
+    supabase = MagicMock()
+    router = ModelRouterService(supabase_client=supabase)
+    breaker = circuit_breaker.get_circuit_breaker_registry(supabase).get("k1")
+    _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS)
+    breaker.opened_at = time.monotonic() - circuit_breaker.CIRCUIT_OPEN_SECONDS - 1
+
+    assert await router._acquire_key("k1") is True
+    assert await router._acquire_key("k1") is False  # Probe outstanding
+
+    router._release_key("k1", outcome_recorded=False)
+
+    assert breaker.is_available() is True
+    assert await router._acquire_key("k1") is True
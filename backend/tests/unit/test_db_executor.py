@@ -0,0 +1,63 @@
+"""
+Unit tests for the database executor
+Tests that blocking Supabase calls run off the event loop
+"""
+import time
+import asyncio
+import contextvars
+import pytest
+from unittest.mock import MagicMock
+from services.db_executor import run_query, run_sync, get_db_executor_stats
+
+
+@pytest.mark.asyncio
+async def test_slow_query_does_not_block_other_tasks():
+    """The event loop keeps serving other work while a query blocks its thread"""
+    query = MagicMock()
+    query.execute.side_effect = lambda: time.sleep(0.2) or MagicMock(data=[{"id": "u1"}])
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    started = time.monotonic()
+    result, _ = await asyncio.gather(run_query(query), ticker())
+
+    assert result.data == [{"id": "u1"}]
+    assert len(ticks) == 5
+    assert ticks[-1] - started < 0.15  # The ticker finished while the query was still running
+
+
+@pytest.mark.asyncio
+async def test_run_sync_passes_arguments_context_and_errors():
+    """Calls see the caller's context variables and raise their own exceptions"""
+    request_id = contextvars.ContextVar("request_id", default=None)
+    request_id.set("req-1")
+
+    assert await run_sync(lambda prefix, suffix="": prefix + request_id.get() + suffix, "id=", suffix="!") == "id=req-1!"
+
+    def failing():
+        raise ValueError("connection reset")
+
+    with pytest.raises(ValueError, match="connection reset"):
+        await run_sync(failing)
+
+
+@pytest.mark.asyncio
+async def test_in_flight_count_returns_to_zero():
+    """Finished and cancelled calls are no longer counted as in flight"""
+    query = MagicMock()
+    query.execute.side_effect = lambda: time.sleep(0.05)
+
+    task = asyncio.create_task(run_query(query))
+    await asyncio.sleep(0)
+    assert get_db_executor_stats()["in_flight"] == 1
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0.1)
+
+    assert get_db_executor_stats()["in_flight"] == 0
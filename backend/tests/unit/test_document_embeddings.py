@@ -0,0 +1,253 @@
+"""
+Unit tests for batched embedding generation during document ingestion
+Tests the Hugging Face batch API and the concurrent ingestion pipeline
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services import documents
+from services.documents import DocumentService
+from services.providers.huggingface import HuggingFaceProvider
+
+
+@pytest.fixture(autouse=True)
+def no_embedding_cache():
+    """Every provider call in these tests reaches the (mocked) API"""
+    with patch("services.providers.huggingface.get_embedding_cache", return_value=None):
+        yield
+
+
+def _vector(value: float, dim: int = 4096):
+    return [value] * dim
+
+
+def _service(hf_provider):
+    supabase = MagicMock()
+    with patch("services.providers.huggingface.get_huggingface_provider", return_value=hf_provider):
+        service = DocumentService(supabase)
+    return service, supabase
+
+
+async def _segments(texts):
+    for i, text in enumerate(texts):
+        yield text, (i + 1) / len(texts)
+
+
+def _inserted_rows(supabase):
+    table = supabase.table.return_value
+    return [row for call in table.insert.call_args_list for row in call.args[0]]
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_sends_list_and_restores_order():
+    """One request carries all texts and results are mapped back by index"""
+    provider = HuggingFaceProvider()
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"data": [
+        {"index": 1, "embedding": [0.2, 0.2]},
+        {"index": 0, "embedding": [0.1, 0.1]}
+    ]}
+
+    with patch.object(provider.client, "post", new=AsyncMock(return_value=mock_response)) as mock_post:
+        result = await provider.generate_embeddings(["first", "second"], api_key="hf_test", prepend_instruction=False)
+
+    assert result["success"] is True
+    assert result["embeddings"] == [[0.1, 0.1], [0.2, 0.2]]
+    assert mock_post.await_count == 1
+    assert mock_post.await_args.kwargs["json"]["input"] == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_rejects_short_response():
+    """A response with fewer embeddings than inputs is treated as a failure"""
+    provider = HuggingFaceProvider()
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"data": [{"index": 0, "embedding": [0.1]}]}
+
+    with patch.object(provider.client, "post", new=AsyncMock(return_value=mock_response)):
+        result = await provider.generate_embeddings(["a", "b"], api_key="hf_test")
+
+    assert result["success"] is False
+    assert result["embeddings"] is None
+
+
+@pytest.mark.asyncio
+async def test_ingestion_batches_chunks_with_bounded_concurrency():
+    """Chunks are embedded in batches with a limited number in flight"""
+    in_flight = 0
+    peak = 0
+    batch_sizes = []
+
+    async def fake_batch(texts, api_key=None, prepend_instruction=True):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        batch_sizes.append(len(texts))
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"success": True, "embeddings": [_vector(0.5) for _ in texts], "error": None}
+
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(side_effect=fake_batch)
+    hf_provider.generate_embedding = AsyncMock()
+    service, supabase = _service(hf_provider)
+    chunks = [f"chunk {i}" for i in range(10)]
+
+    with patch.object(documents, "EMBEDDING_BATCH_SIZE", 3), \
+            patch.object(documents, "EMBEDDING_MAX_CONCURRENCY", 2):
+        await service._store_chunks_with_embeddings("doc-1", chunks)
+
+    assert batch_sizes == [3, 3, 3, 1]
+    assert peak == 2
+    hf_provider.generate_embedding.assert_not_called()
+
+    rows = _inserted_rows(supabase)
+    assert [row["chunk_index"] for row in rows] == list(range(10))
+    assert all(row["embedding"] is not None for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_slow_batch_holds_back_later_batches():
+    """Finished batches waiting behind a slow one keep their slot until collected"""
+    release_head = asyncio.Event()
+    started = []
+
+    async def fake_batch(texts, api_key=None, prepend_instruction=True):
+        started.append(texts[0])
+        if texts[0] == "chunk 0":
+            await release_head.wait()
+        return {"success": True, "embeddings": [_vector(0.5) for _ in texts], "error": None}
+
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(side_effect=fake_batch)
+    service, supabase = _service(hf_provider)
+
+    with patch.object(documents, "EMBEDDING_BATCH_SIZE", 1), \
+            patch.object(documents, "EMBEDDING_MAX_CONCURRENCY", 2):
+        store = asyncio.create_task(
+            service._store_chunks_with_embeddings("doc-1", [f"chunk {i}" for i in range(6)])
+        )
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert started == ["chunk 0", "chunk 1"]
+
+        release_head.set()
+        await store
+
+    assert len(started) == 6
+    assert [row["chunk_index"] for row in _inserted_rows(supabase)] == list(range(6))
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_to_single_chunks():
+    """A failed batch is retried per chunk and only the bad chunk loses its embedding"""
+    async def fake_single(text, api_key=None, prepend_instruction=True):
+        if text == "bad":
+            return {"success": False, "embedding": None, "error": "boom"}
+        return {"success": True, "embedding": _vector(0.1), "error": None}
+
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(return_value={"success": False, "embeddings": None, "error": "batch failed"})
+    hf_provider.generate_embedding = AsyncMock(side_effect=fake_single)
+    service, supabase = _service(hf_provider)
+
+    with patch.object(documents, "EMBEDDING_BATCH_SIZE", 8):
+        await service._store_chunks_with_embeddings("doc-1", ["good", "bad", "good again"])
+
+    assert hf_provider.generate_embedding.await_count == 3
+    rows = _inserted_rows(supabase)
+    assert [row["embedding"] is not None for row in rows] == [True, False, True]
+
+
+@pytest.mark.asyncio
+async def test_chunk_rows_are_inserted_in_batches():
+    """Rows go to document_chunks in CHUNK_INSERT_BATCH_SIZE inserts, in order"""
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(
+        side_effect=lambda texts, **kwargs: {"success": True, "embeddings": [_vector(0.3) for _ in texts]}
+    )
+    service, supabase = _service(hf_provider)
+
+    with patch.object(documents, "CHUNK_INSERT_BATCH_SIZE", 4):
+        await service._store_chunks_with_embeddings("doc-1", [f"chunk {i}" for i in range(10)])
+
+    inserts = supabase.table.return_value.insert.call_args_list
+    assert [len(call.args[0]) for call in inserts] == [4, 4, 2]
+    assert [row["chunk_index"] for row in _inserted_rows(supabase)] == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_progress_writes_are_throttled_by_time():
+    """Progress is written at most once per interval, plus the forced final update"""
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(
+        side_effect=lambda texts, **kwargs: {"success": True, "embeddings": [_vector(0.3) for _ in texts]}
+    )
+    service, supabase = _service(hf_provider)
+
+    with patch.object(documents, "EMBEDDING_BATCH_SIZE", 1), \
+            patch.object(documents, "CHUNK_INSERT_BATCH_SIZE", 1), \
+            patch.object(documents, "PROGRESS_UPDATE_INTERVAL_SECONDS", 3600):
+        await service._store_chunks_with_embeddings("doc-1", [f"chunk {i}" for i in range(20)])
+
+    stages = [
+        call.args[0]["processing_stage"]
+        for call in supabase.table.return_value.update.call_args_list
+        if "processing_stage" in call.args[0]
+    ]
+    assert stages == ["Generating embeddings (1/20)...", "Finalizing..."]
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_batch_marks_document_failed():
+    """An insert error propagates so processing marks the document failed"""
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(
+        side_effect=lambda texts, **kwargs: {"success": True, "embeddings": [_vector(0.3) for _ in texts]}
+    )
+    service, supabase = _service(hf_provider)
+    supabase.table.return_value.insert.return_value.execute.side_effect = Exception("insert rejected")
+
+    with patch.object(service, "_iter_document_text", return_value=_segments(["Cardiac output " * 200])):
+        await service._process_document_async("doc-1", b"%PDF", "application/pdf")
+
+    updates = [call.args[0] for call in supabase.table.return_value.update.call_args_list]
+    assert updates[-1]["processing_status"] == "failed"
+    assert "insert rejected" in updates[-1]["error_message"]
+
+
+@pytest.mark.asyncio
+async def test_pages_are_embedded_while_extraction_continues():
+    """Chunks from early pages are embedded before later pages are extracted"""
+    events = []
+
+    async def pages():
+        for page in range(1, 5):
+            events.append(f"page {page}")
+            yield f"Page {page} findings. " + "Mitral valve prolapse with regurgitation. " * 30 + "\n\n", page / 4
+            await asyncio.sleep(0.01)
+
+    async def fake_batch(texts, api_key=None, prepend_instruction=True):
+        events.append("embed")
+        return {"success": True, "embeddings": [_vector(0.5) for _ in texts], "error": None}
+
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(side_effect=fake_batch)
+    service, supabase = _service(hf_provider)
+
+    with patch.object(service, "_iter_document_text", return_value=pages()), \
+            patch.object(documents, "EMBEDDING_BATCH_SIZE", 1):
+        await service.process_document("doc-1", b"%PDF", "application/pdf")
+
+    assert events.index("embed") < events.index("page 4")
+
+    # Chunks are identical to chunking the whole document at once
+    full_text = "".join(f"Page {page} findings. " + "Mitral valve prolapse with regurgitation. " * 30 + "\n\n" for page in range(1, 5))
+    rows = _inserted_rows(supabase)
+    assert [row["content"] for row in rows] == service._chunk_text(full_text.strip())
+    assert [row["chunk_index"] for row in rows] == list(range(len(rows)))
+    assert supabase.table.return_value.update.call_args_list[-1].args[0]["processing_status"] == "completed"
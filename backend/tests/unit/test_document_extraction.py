@@ -0,0 +1,138 @@
+"""
+Unit tests for pooled document extraction
+Tests page limits, streamed parallel page ranges, prefetch bounds and cancellation
+"""
+import io
+import asyncio
+import pytest
+import PyPDF2
+from unittest.mock import MagicMock, patch
+from services import document_extraction
+from services.documents import DocumentService
+
+
+def _blank_pdf(pages: int) -> bytes:
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def extraction_pool():
+    """Run extraction in a real single-worker process pool"""
+    with patch.object(document_extraction, "EXTRACTION_MAX_WORKERS", 1):
+        yield
+        document_extraction.shutdown_extraction_executor()
+
+
+async def _collect(pages):
+    return [page async for page in pages]
+
+
+@pytest.mark.asyncio
+async def test_pdf_parsing_runs_in_pool_and_respects_page_limit(extraction_pool):
+    """Only the first max_pages pages are parsed, in page order"""
+    with patch.object(document_extraction, "PDF_PAGES_PER_TASK", 2):
+        pages = await _collect(document_extraction.iter_pdf_pages(_blank_pdf(5), max_pages=3))
+
+    assert pages == [(1, "", 3), (2, "", 3), (3, "", 3)]
+    assert document_extraction._executor is not None
+
+
+@pytest.mark.asyncio
+async def test_text_layer_is_not_limited_by_the_ocr_page_limit(extraction_pool):
+    """By default every text-layer page is parsed; EXTRACTION_MAX_PAGES only caps OCR"""
+    with patch.object(document_extraction, "PDF_PAGES_PER_TASK", 2), \
+            patch.object(document_extraction, "EXTRACTION_MAX_PAGES", 3):
+        pages = await _collect(document_extraction.iter_pdf_pages(_blank_pdf(5)))
+
+    assert [page[0] for page in pages] == [1, 2, 3, 4, 5]
+    assert pages[0][2] == 5
+
+
+@pytest.mark.asyncio
+async def test_ocr_streams_parallel_ranges_in_page_order():
+    """OCR is submitted as page ranges, capped by the page limit, and yielded in page order"""
+    submitted = []
+
+    async def fake_run(func, file_content, first, last, dpi):
+        submitted.append((first, last))
+        await asyncio.sleep(0.01 * (6 - first))  # later ranges finish first
+        return [f"page {n}" for n in range(first, last + 1)]
+
+    with patch.object(document_extraction, "run_extraction", side_effect=fake_run), \
+            patch.object(document_extraction, "OCR_PAGES_PER_TASK", 2), \
+            patch.object(document_extraction, "EXTRACTION_PREFETCH_TASKS", 3):
+        pages = await _collect(document_extraction.iter_ocr_pages(b"%PDF", total_pages=7, max_pages=5))
+
+    assert submitted == [(1, 2), (3, 4), (5, 5)]
+    assert pages == [(n, f"page {n}", 5) for n in range(1, 6)]
+
+
+@pytest.mark.asyncio
+async def test_prefetch_is_bounded_by_consumer():
+    """No more than EXTRACTION_PREFETCH_TASKS ranges run ahead of the consumer"""
+    submitted = []
+
+    async def fake_run(func, file_content, first, last, dpi):
+        submitted.append(first)
+        return [f"page {first}"]
+
+    with patch.object(document_extraction, "run_extraction", side_effect=fake_run), \
+            patch.object(document_extraction, "OCR_PAGES_PER_TASK", 1), \
+            patch.object(document_extraction, "EXTRACTION_PREFETCH_TASKS", 2):
+        pages = document_extraction.iter_ocr_pages(b"%PDF", total_pages=10)
+        first = await pages.__anext__()
+        await asyncio.sleep(0.01)
+        await pages.aclose()
+
+    assert first == (1, "page 1", 10)
+    assert submitted == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_cancelling_ocr_cancels_pending_ranges():
+    """Cancelling the consumer cancels page ranges that are still outstanding"""
+    cancelled = []
+
+    async def fake_run(func, file_content, first, last, dpi):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(first)
+            raise
+
+    with patch.object(document_extraction, "run_extraction", side_effect=fake_run), \
+            patch.object(document_extraction, "OCR_PAGES_PER_TASK", 1), \
+            patch.object(document_extraction, "EXTRACTION_PREFETCH_TASKS", 3):
+        task = asyncio.create_task(_collect(document_extraction.iter_ocr_pages(b"%PDF", total_pages=3)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert sorted(cancelled) == [1, 2, 3]
+
+
+async def _pages(pages):
+    for page in pages:
+        yield page
+
+
+@pytest.mark.asyncio
+async def test_image_based_pdf_falls_back_to_ocr():
+    """A PDF without a text layer is sent to OCR with its page count"""
+    with patch("services.providers.huggingface.get_huggingface_provider", return_value=MagicMock()):
+        service = DocumentService(MagicMock())
+
+    ocr_pages = [(1, "Left ventricular hypertrophy " * 3, 2), (2, "", 2)]
+    with patch.object(document_extraction, "iter_pdf_pages", return_value=_pages([(1, "", 2), (2, "", 2)])), \
+            patch.object(document_extraction, "iter_ocr_pages", return_value=_pages(ocr_pages)) as mock_ocr:
+        text = await service._extract_pdf_text(b"%PDF")
+
+    mock_ocr.assert_called_once_with(b"%PDF", 2)
+    assert text.startswith("--- Page 1 ---")
+    assert "Left ventricular hypertrophy" in text
@@ -0,0 +1,117 @@
+"""
+Unit tests for the content-hash embedding cache
+Tests the LRU memory tier, the SQLite disk tier and provider integration
+"""
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.embedding_cache import EmbeddingCache
+from services.providers.huggingface import HuggingFaceProvider
+
+
+MODEL = "Qwen/Qwen3-Embedding-8B"
+
+
+def test_key_depends_on_model_instruction_and_text():
+    """Different model, instruction flag or text never share an entry"""
+    base = EmbeddingCache.make_key(MODEL, False, "troponin")
+
+    assert base == EmbeddingCache.make_key(MODEL, False, "troponin")
+    assert base != EmbeddingCache.make_key(MODEL, True, "troponin")
+    assert base != EmbeddingCache.make_key("other-model", False, "troponin")
+    assert base != EmbeddingCache.make_key(MODEL, False, "troponin I")
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_evicts_least_recently_used():
+    """The memory tier keeps only the most recently used embeddings"""
+    cache = EmbeddingCache(memory_size=2, db_path=None)
+    cache.put(MODEL, False, "a", [1.0])
+    cache.put(MODEL, False, "b", [2.0])
+    await cache.get(MODEL, False, "a")
+    cache.put(MODEL, False, "c", [3.0])
+
+    assert await cache.get(MODEL, False, "b") is None
+    assert await cache.get(MODEL, False, "a") == [1.0]
+    assert await cache.get(MODEL, False, "c") == [3.0]
+
+    stats = cache.get_stats()
+    assert stats["memory_hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["memory_entries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart(tmp_path):
+    """Embeddings written to SQLite are served by a new cache instance"""
+    db_path = str(tmp_path / "cache" / "embeddings.sqlite3")
+    first = EmbeddingCache(memory_size=10, db_path=db_path)
+    first.put(MODEL, False, "sepsis", [0.5, -0.25])
+    first.close()
+
+    restarted = EmbeddingCache(memory_size=10, db_path=db_path)
+
+    assert await restarted.get(MODEL, False, "sepsis") == [0.5, -0.25]
+    assert await restarted.get(MODEL, False, "sepsis") == [0.5, -0.25]
+    stats = restarted.get_stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["disk_entries"] == 1
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_stays_off_the_event_loop(tmp_path):
+    """Disk reads run on the cache thread and queued writes share one commit"""
+    cache = EmbeddingCache(memory_size=1, db_path=str(tmp_path / "embeddings.sqlite3"))
+    loop_thread = threading.get_ident()
+    read_threads = []
+    select = cache._select
+
+    def record_read(keys):
+        read_threads.append(threading.get_ident())
+        return select(keys)
+
+    # Hold the cache thread so every put lands in the same batch
+    gate = threading.Event()
+    cache._executor.submit(gate.wait)
+    for i in range(5):
+        cache.put(MODEL, False, f"text {i}", [float(i)])
+    gate.set()
+    cache.flush()
+
+    with patch.object(cache, "_select", side_effect=record_read):
+        embeddings = await cache.get_many(MODEL, False, ["text 0", "text 3", "unknown"])
+
+    assert embeddings == [[0.0], [3.0], None]
+    assert len(read_threads) == 1 and read_threads[0] != loop_thread
+    stats = cache.get_stats()
+    assert stats["disk_commits"] == 1
+    assert stats["disk_entries"] == 5
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_provider_skips_api_for_cached_texts():
+    """Repeated and batched texts only reach the API once"""
+    provider = HuggingFaceProvider()
+    cache = EmbeddingCache(memory_size=10, db_path=None)
+
+    single = MagicMock(status_code=200)
+    single.json.return_value = {"data": [{"embedding": [0.1, 0.2]}]}
+    batch = MagicMock(status_code=200)
+    batch.json.return_value = {"data": [{"index": 0, "embedding": [0.3, 0.4]}]}
+
+    with patch("services.providers.huggingface.get_embedding_cache", return_value=cache), \
+            patch.object(provider.client, "post", new=AsyncMock(side_effect=[single, batch])) as mock_post:
+        first = await provider.generate_embedding("chest pain", api_key="hf_test", prepend_instruction=False)
+        second = await provider.generate_embedding("chest pain", api_key="hf_test", prepend_instruction=False)
+        combined = await provider.generate_embeddings(
+            ["chest pain", "dyspnea"], api_key="hf_test", prepend_instruction=False
+        )
+
+    assert first["embedding"] == second["embedding"] == [0.1, 0.2]
+    assert combined["embeddings"] == [[0.1, 0.2], [0.3, 0.4]]
+    assert mock_post.await_count == 2
+    # Only the uncached text is sent in the batch request
+    assert mock_post.await_args.kwargs["json"]["input"] == ["dyspnea"]
@@ -0,0 +1,38 @@
+"""
+Unit tests for pgvector embedding serialization
+Tests that vectors and their index parts are formatted consistently
+"""
+import numpy as np
+from services.embedding_format import format_vector, format_embedding_parts
+
+
+def _parse(literal):
+    assert literal.startswith('[') and literal.endswith(']')
+    return [float(x) for x in literal[1:-1].split(',')]
+
+
+def test_parts_are_slices_of_full_vector():
+    """The three parts cover 1-1365, 1366-2730 and 2731-4096 of the full vector"""
+    embedding = np.random.default_rng(0).uniform(-1, 1, 4096).tolist()
+
+    full, part1, part2, part3 = format_embedding_parts(embedding)
+
+    assert len(_parse(part1)) == 1365
+    assert len(_parse(part2)) == 1365
+    assert len(_parse(part3)) == 1366
+    assert _parse(full) == _parse(part1) + _parse(part2) + _parse(part3)
+    assert full == format_vector(embedding)
+
+
+def test_default_output_round_trips_as_float32():
+    """Default text parses back to the same float4 value pgvector stores"""
+    embedding = [0.1, -0.030894854603590788, 1e-08, 3.0]
+
+    values = _parse(format_vector(embedding, precision=None))
+
+    assert np.array_equal(np.asarray(values, dtype=np.float32), np.asarray(embedding, dtype=np.float32))
+
+
+def test_reduced_precision_output():
+    """Precision limits the significant digits written per value"""
+    assert format_vector([0.123456789, -2.5, 0.0], precision=3) == '[0.123,-2.5,0]'
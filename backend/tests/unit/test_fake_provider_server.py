@@ -0,0 +1,90 @@
+"""
+Unit tests for the fake provider server and the router load benchmark
+Tests the provider wire formats, injected failures and an end-to-end benchmark run
+"""
+import json
+import argparse
+import httpx
+import pytest
+from fake_provider_server import FakeProviderProfile, create_fake_provider_app
+from benchmark_router import run_benchmark, percentile, check_gates
+
+
+def _client(**profile):
+    app = create_fake_provider_app(FakeProviderProfile(latency_ms=0, chunk_delay_ms=0, **profile))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake")
+
+
+@pytest.mark.asyncio
+async def test_chat_completions_plain_and_streamed():
+    """OpenAI-style completions carry usage; streams end with [DONE]"""
+    async with _client(stream_chunks=3) as client:
+        response = await client.post("/openrouter/api/v1/chat/completions", json={
+            "model": "m", "messages": [{"role": "user", "content": "why is the sky blue"}]
+        })
+        assert response.status_code == 200
+        assert response.json()["choices"][0]["message"]["content"]
+        assert response.json()["usage"]["total_tokens"] > 0
+
+        response = await client.post("/huggingface/v1/chat/completions", json={
+            "model": "m", "stream": True, "messages": [{"role": "user", "content": "hi"}]
+        })
+        events = [line[6:] for line in response.text.splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        assert [json.loads(event)["choices"][0]["delta"]["content"] for event in events[:-1]] == ["hi "] * 3
+
+
+@pytest.mark.asyncio
+async def test_embeddings_have_configured_dimension_and_order():
+    """Each input gets its own deterministic embedding of the configured size"""
+    async with _client(embedding_dim=8) as client:
+        response = await client.post("/huggingface/v1/embeddings", json={"model": "e", "input": ["a", "b", "a"]})
+
+    data = response.json()["data"]
+    assert [item["index"] for item in data] == [0, 1, 2]
+    assert all(len(item["embedding"]) == 8 for item in data)
+    assert data[0]["embedding"] == data[2]["embedding"] != data[1]["embedding"]
+
+
+@pytest.mark.asyncio
+async def test_injected_rate_limits_and_errors():
+    """Rate limits answer 429 with Retry-After, errors answer 500"""
+    async with _client(rate_limit_rate=1.0, retry_after=7) as client:
+        response = await client.post("/gemini/v1beta/models/gemini:generateContent", json={"contents": []})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+
+    async with _client(error_rate=1.0) as client:
+        response = await client.post("/openrouter/api/v1/chat/completions", json={"messages": []})
+        assert response.status_code == 500
+        assert (await client.get("/stats")).json() == {"openrouter:error": 1}
+
+
+def test_percentiles_and_gates():
+    """Nearest-rank percentiles, and gates report each missed target"""
+    samples = [i / 100 for i in range(1, 101)]
+    assert percentile(samples, 50) == 0.5
+    assert percentile(samples, 99) == 0.99
+    assert percentile([], 50) is None
+
+    results = {"router": {"p95_ms": 300.0, "throughput_rps": 5.0}}
+    assert check_gates(results, max_p95_ms=500, min_rps=1) == []
+    assert len(check_gates(results, max_p95_ms=100, min_rps=10)) == 2
+
+
+@pytest.mark.asyncio
+async def test_benchmark_runs_all_paths_against_local_server():
+    """A small run drives the router, streamed chat and ingestion without network access"""
+    args = argparse.Namespace(
+        scenario=["router", "chat", "ingest"], requests=4, documents=2, chunks=4, concurrency=2,
+        keys=2, feature="chat", latency_ms=1, latency_sigma=0, error_rate=0.0, rate_limit_rate=0.0,
+        retry_after=1, stream_chunks=3, chunk_delay_ms=0, embedding_dim=4096, seed=1
+    )
+
+    results = await run_benchmark(args)
+
+    for scenario, requests in (("router", 4), ("chat", 4), ("ingest", 2)):
+        assert results[scenario]["requests"] == requests
+        assert results[scenario]["failures"] == 0
+        assert results[scenario]["p95_ms"] is not None
+    assert results["chat"]["ttft_p50_ms"] is not None
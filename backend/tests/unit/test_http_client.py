@@ -0,0 +1,91 @@
+"""
+Unit tests for the shared provider HTTP client pool
+Tests client reuse, pooling limits and shutdown handling
+"""
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.providers import http_client
+from services.providers.http_client import get_http_client, close_http_clients
+from services.providers.huggingface import HuggingFaceProvider
+from services.providers.openrouter import OpenRouterProvider
+
+
+@pytest.fixture(autouse=True)
+async def fresh_pool():
+    """Start and finish every test with an empty client pool"""
+    await close_http_clients()
+    with patch("services.providers.huggingface.get_embedding_cache", return_value=None):
+        yield
+    await close_http_clients()
+
+
+def test_same_client_is_reused_per_provider():
+    """Repeated lookups return one long-lived client per provider"""
+    first = get_http_client("huggingface", timeout=60.0)
+    second = get_http_client("huggingface", timeout=60.0)
+    other = get_http_client("openrouter", timeout=60.0)
+
+    assert first is second
+    assert first is not other
+
+
+def test_client_uses_shared_pool_limits():
+    """Clients are created with the configured connection limits"""
+    limits = {}
+    real_client = httpx.AsyncClient
+
+    def capture(**kwargs):
+        limits.update(kwargs)
+        return real_client(**kwargs)
+
+    with patch.object(http_client, "HTTP_MAX_CONNECTIONS", 7), \
+            patch.object(http_client, "HTTP_MAX_KEEPALIVE_CONNECTIONS", 3), \
+            patch.object(http_client.httpx, "AsyncClient", side_effect=capture):
+        get_http_client("gemini", timeout=30.0)
+
+    assert limits["limits"].max_connections == 7
+    assert limits["limits"].max_keepalive_connections == 3
+    assert limits["timeout"] == 30.0
+    assert limits["http2"] is False
+
+
+@pytest.mark.asyncio
+async def test_close_replaces_clients_on_next_use():
+    """Shutdown closes pooled clients and later lookups get a fresh one"""
+    client = get_http_client("openrouter", timeout=60.0)
+
+    await close_http_clients()
+
+    assert client.is_closed
+    assert get_http_client("openrouter", timeout=60.0) is not client
+
+
+@pytest.mark.asyncio
+async def test_embeddings_share_one_connection_pool():
+    """Consecutive embedding calls go through the same pooled client"""
+    provider = HuggingFaceProvider()
+    clients_used = set()
+
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"data": [{"embedding": [0.1, 0.2, 0.3]}]}
+
+    async def fake_post(*args, **kwargs):
+        clients_used.add(id(provider.client))
+        return mock_response
+
+    with patch.object(provider.client, "post", new=AsyncMock(side_effect=fake_post)) as mock_post:
+        for _ in range(3):
+            result = await provider.generate_embedding("heart failure", api_key="hf_test")
+            assert result["success"] is True
+
+    assert len(clients_used) == 1
+    assert mock_post.await_count == 3
+    assert mock_post.await_args.kwargs["timeout"] == 60.0
+
+
+def test_providers_share_pooling_policy():
+    """OpenRouter and Hugging Face both draw from the shared pool"""
+    assert OpenRouterProvider().client is get_http_client("openrouter", timeout=60.0)
+    assert HuggingFaceProvider().client is get_http_client("huggingface", timeout=60.0)
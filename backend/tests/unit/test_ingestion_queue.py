@@ -0,0 +1,245 @@
+"""
+Unit tests for the durable document ingestion queue
+Tests enqueueing, claiming, retry/backoff, resumption and the worker pool
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services import ingestion_queue
+from services.ingestion_queue import IngestionQueue
+from services.documents import DocumentService
+from services.user_profiles import get_user_profiles, start_request_scope
+
+
+def _supabase(tables):
+    """Supabase mock whose table() returns a dedicated mock per table name"""
+    supabase = MagicMock()
+    supabase.table.side_effect = lambda name: tables.setdefault(name, MagicMock())
+    return supabase
+
+
+def _updates(table):
+    return [call.args[0] for call in table.update.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_uses_plan_priority_and_marks_document_queued():
+    """Jobs get their priority from the uploader's plan and the document shows Queued"""
+    users, jobs, documents = MagicMock(), MagicMock(), MagicMock()
+    users.select.return_value.eq.return_value.execute.return_value.data = [{"plan": "pro", "role": None}]
+    jobs.insert.return_value.execute.return_value.data = [{"id": "job-1"}]
+    queue = IngestionQueue(_supabase({"users": users, "document_ingestion_jobs": jobs, "documents": documents}))
+
+    job = await queue.enqueue("doc-1", "user-1")
+
+    assert job == {"id": "job-1"}
+    inserted = jobs.insert.call_args.args[0]
+    assert inserted["priority"] == ingestion_queue.PLAN_PRIORITIES["pro"]
+    assert inserted["status"] == "queued"
+    assert _updates(documents)[-1]["processing_stage"] == "Queued"
+
+
+@pytest.mark.asyncio
+async def test_enqueue_reuses_the_request_profile():
+    """The priority lookup shares the users row already loaded for the upload request"""
+    users, jobs = MagicMock(), MagicMock()
+    users.select.return_value.eq.return_value.execute.return_value.data = [{"plan": "free", "role": "admin"}]
+    jobs.insert.return_value.execute.return_value.data = [{"id": "job-1"}]
+    supabase = _supabase({"users": users, "document_ingestion_jobs": jobs})
+
+    async def request():
+        start_request_scope()
+        await get_user_profiles(supabase).get("user-1")
+        await IngestionQueue(supabase).enqueue("doc-1", "user-1")
+
+    await asyncio.create_task(request())
+
+    assert users.select.return_value.eq.return_value.execute.call_count == 1
+    assert jobs.insert.call_args.args[0]["priority"] == ingestion_queue.ADMIN_PRIORITY
+
+
+@pytest.mark.asyncio
+async def test_upload_returns_without_processing_inline():
+    """upload_document enqueues the document instead of awaiting processing"""
+    tables = {}
+    supabase = _supabase(tables)
+    tables["documents"] = MagicMock()
+    tables["documents"].insert.return_value.execute.return_value.data = [{"id": "doc-1"}]
+
+    with patch("services.providers.huggingface.get_huggingface_provider", return_value=MagicMock()):
+        service = DocumentService(supabase)
+
+    queue = MagicMock()
+    queue.enqueue = AsyncMock()
+
+    with patch.object(service, "_get_retention_days_for_user", new=AsyncMock(return_value=7)), \
+            patch.object(service, "_process_document_async", new=AsyncMock()) as process, \
+            patch("services.ingestion_queue.get_ingestion_queue", return_value=queue):
+        document = await service.upload_document("user-1", b"%PDF", "notes.pdf", "application/pdf")
+
+    assert document["id"] == "doc-1"
+    queue.enqueue.assert_awaited_once_with("doc-1", "user-1")
+    process.assert_not_called()
+
+
+def test_claim_skips_jobs_taken_by_another_worker():
+    """A lost conditional update moves on to the next candidate"""
+    jobs = MagicMock()
+    select_chain = jobs.select.return_value.eq.return_value.lte.return_value.order.return_value.order.return_value.limit.return_value
+    select_chain.execute.return_value.data = [
+        {"id": "job-1", "attempts": 0},
+        {"id": "job-2", "attempts": 1}
+    ]
+    update_chain = jobs.update.return_value.eq.return_value.eq.return_value
+    update_chain.execute.side_effect = [MagicMock(data=[]), MagicMock(data=[{"id": "job-2", "attempts": 2}])]
+    queue = IngestionQueue(_supabase({"document_ingestion_jobs": jobs}))
+
+    job = queue.claim_next_job()
+
+    assert job["id"] == "job-2"
+    assert [call.args[0]["attempts"] for call in jobs.update.call_args_list] == [1, 2]
+    assert all(call.args[0]["status"] == "running" for call in jobs.update.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_with_backoff_then_failed():
+    """Failures back off exponentially and the last attempt fails the document"""
+    jobs, documents = MagicMock(), MagicMock()
+    queue = IngestionQueue(_supabase({"document_ingestion_jobs": jobs, "documents": documents}))
+    document_service = MagicMock()
+    document_service.process_stored_document = AsyncMock(side_effect=Exception("HF timeout"))
+
+    with patch("services.ingestion_queue.get_document_service", return_value=document_service), \
+            patch.object(ingestion_queue, "INGESTION_RETRY_BASE_SECONDS", 10):
+        assert queue.get_retry_delay(1) == 10
+        assert queue.get_retry_delay(3) == 40
+
+        await queue.process_job({"id": "job-1", "document_id": "doc-1", "attempts": 1, "max_attempts": 2})
+        retry = _updates(jobs)[-1]
+        assert retry["status"] == "queued"
+        assert retry["last_error"] == "HF timeout"
+        assert _updates(documents)[-1]["processing_stage"] == "Retrying (attempt 2/2)..."
+        document_service.mark_document_failed.assert_not_called()
+
+        await queue.process_job({"id": "job-1", "document_id": "doc-1", "attempts": 2, "max_attempts": 2})
+        assert _updates(jobs)[-1]["status"] == "failed"
+        document_service.mark_document_failed.assert_called_once_with("doc-1", "HF timeout")
+
+
+@pytest.mark.asyncio
+async def test_stored_document_resumes_after_last_chunk():
+    """Reprocessing only stores chunks after the highest stored chunk_index"""
+    tables = {}
+    supabase = _supabase(tables)
+    tables["documents"] = MagicMock()
+    tables["documents"].select.return_value.eq.return_value.execute.return_value.data = [
+        {"id": "doc-1", "storage_path": "user-1/doc.pdf", "file_type": "application/pdf"}
+    ]
+    chunks_table = tables["document_chunks"] = MagicMock()
+    chunks_table.select.return_value.eq.return_value.order.return_value.limit.return_value.execute.return_value.data = [
+        {"chunk_index": 2}
+    ]
+    supabase.storage.from_.return_value.download.return_value = b"%PDF"
+
+    hf_provider = MagicMock()
+    hf_provider.generate_embeddings = AsyncMock(
+        side_effect=lambda texts, **kwargs: {"success": True, "embeddings": [[0.1] * 4096 for _ in texts]}
+    )
+    with patch("services.providers.huggingface.get_huggingface_provider", return_value=hf_provider):
+        service = DocumentService(supabase)
+
+    async def chunks(segments):
+        for i in range(5):
+            yield f"chunk {i}", (i + 1) / 5
+
+    with patch.object(service, "_iter_chunks", side_effect=chunks), \
+            patch.object(service, "_count_embedded_chunks", return_value=3):
+        await service.process_stored_document("doc-1")
+
+    inserted = [row for call in chunks_table.insert.call_args_list for row in call.args[0]]
+    assert [row["chunk_index"] for row in inserted] == [3, 4]
+    assert [row["content"] for row in inserted] == ["chunk 3", "chunk 4"]
+    stats = [u for u in _updates(tables["documents"]) if "chunks_with_embeddings" in u][-1]
+    assert stats == {"total_chunks": 5, "chunks_with_embeddings": 5}
+    assert _updates(tables["documents"])[-1]["processing_status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_processes_queued_jobs():
+    """Started workers claim jobs and stop cleanly"""
+    queue = IngestionQueue(MagicMock(), worker_count=2)
+    pending = [{"id": "job-1", "document_id": "doc-1"}, {"id": "job-2", "document_id": "doc-2"}]
+    processed = []
+
+    async def fake_process(job):
+        processed.append(job["id"])
+        return True
+
+    with patch.object(queue, "claim_next_job", side_effect=lambda: pending.pop(0) if pending else None), \
+            patch.object(queue, "requeue_expired_jobs", return_value=0), \
+            patch.object(queue, "process_job", side_effect=fake_process), \
+            patch.object(ingestion_queue, "INGESTION_POLL_INTERVAL_SECONDS", 0.01):
+        await queue.start()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+
+    assert sorted(processed) == ["job-1", "job-2"]
+    assert queue.is_running is False
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_a_failed_status_update():
+    """A database error after processing doesn't stop the worker from taking the next job"""
+    jobs = MagicMock()
+    jobs.update.return_value.eq.return_value.execute.side_effect = [Exception("connection reset"), MagicMock()]
+    queue = IngestionQueue(_supabase({"document_ingestion_jobs": jobs}), worker_count=1)
+    pending = [{"id": "job-1", "document_id": "doc-1"}, {"id": "job-2", "document_id": "doc-2"}]
+    document_service = MagicMock(process_stored_document=AsyncMock())
+
+    with patch.object(queue, "claim_next_job", side_effect=lambda: pending.pop(0) if pending else None), \
+            patch.object(queue, "requeue_expired_jobs", return_value=0), \
+            patch.object(ingestion_queue, "get_document_service", return_value=document_service), \
+            patch.object(ingestion_queue, "INGESTION_POLL_INTERVAL_SECONDS", 0.01):
+        await queue.start()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+
+    processed = [call.args[0] for call in document_service.process_stored_document.await_args_list]
+    assert processed == ["doc-1", "doc-2"]
+    assert jobs.update.return_value.eq.return_value.execute.call_count == 2
+
+
+def test_expired_job_on_its_last_attempt_is_failed_not_requeued():
+    """A document that kills its worker every time stops being retried after max_attempts"""
+    jobs = MagicMock()
+    jobs.select.return_value.eq.return_value.lt.return_value.execute.return_value.data = [
+        {"id": "job-1", "document_id": "doc-1", "attempts": 3, "max_attempts": 3},
+        {"id": "job-2", "document_id": "doc-2", "attempts": 1, "max_attempts": 3}
+    ]
+    jobs.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [{"id": "job-1"}]
+    jobs.update.return_value.eq.return_value.eq.return_value.lt.return_value.execute.return_value.data = [{"id": "job-2"}]
+    queue = IngestionQueue(_supabase({"document_ingestion_jobs": jobs}))
+    document_service = MagicMock()
+
+    with patch("services.ingestion_queue.get_document_service", return_value=document_service):
+        assert queue.requeue_expired_jobs() == 1
+
+    assert [update["status"] for update in _updates(jobs)] == ["failed", "queued"]
+    document_service.mark_document_failed.assert_called_once()
+    assert document_service.mark_document_failed.call_args.args[0] == "doc-1"
+
+
+def test_claim_fails_jobs_that_used_up_their_attempts():
+    """Queued jobs with no attempts left are failed instead of claimed"""
+    jobs = MagicMock()
+    select_chain = jobs.select.return_value.eq.return_value.lte.return_value.order.return_value.order.return_value.limit.return_value
+    select_chain.execute.return_value.data = [{"id": "job-1", "document_id": "doc-1", "attempts": 3, "max_attempts": 3}]
+    jobs.update.return_value.eq.return_value.eq.return_value.execute.return_value.data = [{"id": "job-1"}]
+    queue = IngestionQueue(_supabase({"document_ingestion_jobs": jobs}))
+    document_service = MagicMock()
+
+    with patch("services.ingestion_queue.get_document_service", return_value=document_service):
+        assert queue.claim_next_job() is None
+
+    assert _updates(jobs)[0]["status"] == "failed"
+    document_service.mark_document_failed.assert_called_once()
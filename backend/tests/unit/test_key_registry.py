@@ -0,0 +1,141 @@
+"""
+Unit tests for the Key Registry
+Tests caching, TTL expiry, health updates and invalidation of routing keys
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from services.key_registry import KeyRegistry, get_key_registry, invalidate_key_registry
+from services.health_tracker import HealthTrackerService
+
+
+def _mock_supabase(rows):
+    """Build a Supabase mock whose api_keys query returns the given rows"""
+    mock_supabase = MagicMock()
+    mock_response = MagicMock()
+    mock_response.data = rows
+    mock_supabase.table.return_value.select.return_value.eq.return_value \
+        .eq.return_value.order.return_value.execute.return_value = mock_response
+    return mock_supabase
+
+
+def _row(key_id, provider="openai", priority=10, **extra):
+    return {
+        "id": key_id,
+        "provider": provider,
+        "feature": "chat",
+        "key_value": f"encrypted-{key_id}",
+        "priority": priority,
+        "status": "active",
+        **extra
+    }
+
+
+def _fake_decrypt(value):
+    return value.replace("encrypted-", "plain-")
+
+
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+def test_keys_are_loaded_once_and_decrypted(mock_decrypt):
+    """Repeated lookups within the TTL hit memory, not the database"""
+    mock_supabase = _mock_supabase([_row("k1", priority=20), _row("k2")])
+    registry = KeyRegistry(mock_supabase, ttl_seconds=60)
+
+    first = registry.get_active_keys("chat")
+    second = registry.get_active_keys("chat")
+
+    assert [k["key_value"] for k in first] == ["plain-k1", "plain-k2"]
+    assert first == second
+    assert mock_supabase.table.call_count == 1
+    assert mock_decrypt.call_count == 2
+
+
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+def test_expired_entries_are_reloaded(mock_decrypt):
+    """Entries older than the TTL trigger a fresh query"""
+    mock_supabase = _mock_supabase([_row("k1")])
+    registry = KeyRegistry(mock_supabase, ttl_seconds=0)
+
+    registry.get_active_keys("chat")
+    registry.get_active_keys("chat")
+
+    assert mock_supabase.table.call_count == 2
+
+
+def test_undecryptable_keys_are_skipped():
+    """A key that fails to decrypt is left out instead of failing the feature"""
+    def decrypt(value):
+        if value == "encrypted-bad":
+            raise ValueError("Decryption failed")
+        return _fake_decrypt(value)
+
+    with patch("services.key_registry.decrypt_key", side_effect=decrypt):
+        registry = KeyRegistry(_mock_supabase([_row("bad"), _row("good")]), ttl_seconds=60)
+        keys = registry.get_active_keys("chat")
+
+    assert [k["id"] for k in keys] == ["good"]
+
+
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+def test_load_errors_are_not_cached(mock_decrypt):
+    """A failed load propagates and the next lookup retries the database"""
+    mock_supabase = _mock_supabase([_row("k1")])
+    chain = mock_supabase.table.return_value.select.return_value.eq.return_value.eq.return_value.order.return_value
+    good_response = chain.execute.return_value
+    chain.execute.side_effect = [Exception("connection reset"), good_response]
+    registry = KeyRegistry(mock_supabase, ttl_seconds=60)
+
+    with pytest.raises(Exception):
+        registry.get_active_keys("chat")
+
+    assert [k["id"] for k in registry.get_active_keys("chat")] == ["k1"]
+
+
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+def test_invalidate_key_registry_forces_reload(mock_decrypt):
+    """Admin writes invalidate every registry so new keys are seen immediately"""
+    mock_supabase = _mock_supabase([_row("k1")])
+    registry = get_key_registry(mock_supabase)
+
+    registry.get_active_keys("chat")
+    invalidate_key_registry("chat")
+    registry.get_active_keys("chat")
+
+    assert get_key_registry(mock_supabase) is registry
+    assert mock_supabase.table.call_count == 2
+
+
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+def test_record_health_updates_cached_copy(mock_decrypt):
+    """Health written by the tracker is reflected without reloading"""
+    registry = KeyRegistry(_mock_supabase([_row("k1")]), ttl_seconds=60)
+    before = registry.get_active_keys("chat")
+
+    registry.record_health("k1", {"recent_attempts": 10, "recent_failures": 9, "status": "disabled"})
+    after = registry.get_active_keys("chat")
+
+    assert after[0]["recent_attempts"] == 10
+    assert after[0]["recent_failures"] == 9
+    # Only health columns are applied, and earlier snapshots are untouched
+    assert after[0]["status"] == "active"
+    assert "recent_attempts" not in before[0]
+
+
+@pytest.mark.asyncio
+@patch("services.key_registry.decrypt_key", side_effect=_fake_decrypt)
+async def test_health_tracker_routes_without_database_round_trips(mock_decrypt):
+    """Once warm, selecting keys for a feature performs no api_keys queries"""
+    mock_supabase = _mock_supabase([
+        _row("k1", priority=20),
+        _row("k2", provider="anthropic", recent_attempts=10, recent_failures=8)
+    ])
+    tracker = HealthTrackerService(mock_supabase)
+
+    await tracker.get_all_healthy_keys_for_feature("chat")
+    mock_supabase.table.reset_mock()
+
+    healthy = await tracker.get_all_healthy_keys_for_feature("chat")
+    best = await tracker.select_best_provider("chat", healthy_keys=healthy)
+
+    assert [k["id"] for k in healthy] == ["k1"]
+    assert best["key_value"] == "plain-k1"
+    mock_supabase.table.assert_not_called()
@@ -0,0 +1,161 @@
+"""
+Unit tests for per-key scheduling
+Tests concurrency slots, token buckets, Retry-After parking and ModelRouterService integration
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services.key_scheduler import KeyScheduler, get_key_scheduler
+from services.model_router import ModelRouterService
+from services.providers.http_client import get_retry_after
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_queues_in_order():
+    """Requests beyond the limit wait for a slot and get it first come, first served"""
+    scheduler = KeyScheduler(max_concurrency=2, rate_per_second=0, queue_timeout=1)
+    assert await scheduler.acquire("k1")
+    assert await scheduler.acquire("k1")
+
+    order = []
+
+    async def queued(name):
+        assert await scheduler.acquire("k1")
+        order.append(name)
+
+    waiters = [asyncio.create_task(queued("a")), asyncio.create_task(queued("b"))]
+    await asyncio.sleep(0.01)
+    assert scheduler.get_stats()["keys"]["k1"]["waiting"] == 2
+
+    scheduler.release("k1")
+    scheduler.release("k1")
+    await asyncio.gather(*waiters)
+
+    assert order == ["a", "b"]
+    assert scheduler.get_stats()["keys"]["k1"]["active"] == 2
+
+
+@pytest.mark.asyncio
+async def test_busy_key_times_out_and_frees_queue_position():
+    """A request that cannot get a slot in time gives up without holding one"""
+    scheduler = KeyScheduler(max_concurrency=1, rate_per_second=0)
+    assert await scheduler.acquire("k1")
+
+    assert await scheduler.acquire("k1", timeout=0.02) is False
+    assert scheduler.get_stats()["rejected"] == 1
+
+    scheduler.release("k1")
+    assert await scheduler.acquire("k1", timeout=0)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_requests_after_burst():
+    """After the burst is spent, requests wait for the bucket to refill"""
+    scheduler = KeyScheduler(max_concurrency=10, rate_per_second=50, burst=2)
+    start = time.monotonic()
+    for _ in range(3):
+        assert await scheduler.acquire("k1", timeout=1)
+        scheduler.release("k1")
+
+    assert time.monotonic() - start >= 0.015
+
+    slow = KeyScheduler(max_concurrency=10, rate_per_second=1, burst=1)
+    assert await slow.acquire("k1")
+    assert await slow.acquire("k1", timeout=0.05) is False
+
+
+@pytest.mark.asyncio
+async def test_parked_key_is_skipped_until_retry_after():
+    """A parked key is refused while parked and usable once the period ends"""
+    scheduler = KeyScheduler(rate_per_second=0)
+    assert scheduler.park("k1", retry_after=0.05) == 0.05
+
+    assert await scheduler.acquire("k1", timeout=0) is False
+    assert scheduler.get_stats()["keys"]["k1"]["parked_for_seconds"] >= 0
+    assert await scheduler.acquire("k1", timeout=0.2)
+
+
+def test_retry_after_header_parsing():
+    """Retry-After is read as delta-seconds or an HTTP date"""
+    response = MagicMock()
+    response.headers = {"retry-after": "7"}
+    assert get_retry_after(response) == 7.0
+
+    response.headers = {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert get_retry_after(response) == 0.0
+
+    response.headers = {}
+    assert get_retry_after(response) is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_key_is_parked_not_failed():
+    """A 429 parks the key and moves on without recording a failure or degrading health"""
+    keys = [
+        {"id": "busy-key", "provider": "openrouter", "feature": "chat", "key_value": "k1", "priority": 20, "status": "active"},
+        {"id": "spare-key", "provider": "openrouter", "feature": "chat", "key_value": "k2", "priority": 10, "status": "active"}
+    ]
+    supabase = MagicMock()
+    router = ModelRouterService(supabase_client=supabase)
+    router.get_user_api_key = AsyncMock(return_value=None)
+    router.record_failure = AsyncMock()
+
+    health_tracker = MagicMock()
+    health_tracker.get_all_healthy_keys_for_feature = AsyncMock(return_value=keys)
+    health_tracker.select_best_provider = AsyncMock(return_value=keys[0])
+    health_tracker.update_key_health = AsyncMock()
+    usage_logger = MagicMock()
+    usage_logger.log_model_call = AsyncMock()
+
+    async def fake_call(key, feature, prompt, system_prompt=None, image_data=None):
+        if key["id"] == "busy-key":
+            return {"success": False, "error": "Rate limited", "tokens_used": 0, "rate_limited": True, "retry_after": 30.0}
+        return {"success": True, "content": "ok", "tokens_used": 5}
+
+    with patch("services.health_tracker.get_health_tracker_service", return_value=health_tracker), \
+            patch("services.model_usage_logger.get_model_usage_logger", return_value=usage_logger), \
+            patch.object(router, "_call_key", side_effect=fake_call):
+        result = await router.execute_with_fallback(provider="openrouter", feature="chat", prompt="hi", hedge=False)
+        # The parked key is not tried again while parked
+        await router.execute_with_fallback(provider="openrouter", feature="chat", prompt="hi again", hedge=False)
+
+    assert result["success"] is True
+    assert result["key_id"] == "spare-key"
+    router.record_failure.assert_not_called()
+    assert all(call.kwargs["key_id"] == "spare-key" for call in health_tracker.update_key_health.await_args_list)
+    assert usage_logger.log_model_call.await_count == 3
+
+    stats = get_key_scheduler(supabase).get_stats()
+    assert stats["parked"] == 1
+    assert 25 < stats["keys"]["busy-key"]["parked_for_seconds"] <= 30
+    assert stats["keys"]["busy-key"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_while_waiting_for_token_frees_the_slot():
+    """A request cancelled during the bucket wait (deadline, disconnect, hedge loser) returns its slot and token"""
+    scheduler = KeyScheduler(max_concurrency=1, rate_per_second=1, burst=1)
+    assert await scheduler.acquire("k")
+    scheduler.release("k")
+
+    task = asyncio.create_task(scheduler.acquire("k", timeout=5))
+    await asyncio.sleep(0.01)
+    assert scheduler._keys["k"].active == 1
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert scheduler._keys["k"].active == 0
+    # The reservation was handed back, so the bucket isn't left in debt
+    assert scheduler._keys["k"].tokens > -0.5
+
+
+@pytest.mark.asyncio
+async def test_defaults_do_not_throttle_keys():
+    """Without configured limits, parallel requests on one key start immediately"""
+    scheduler = KeyScheduler()
+
+    assert all(await asyncio.gather(*(scheduler.acquire("k", timeout=0) for _ in range(20))))
+    assert scheduler.get_stats()["keys"]["k"]["active"] == 20
@@ -0,0 +1,140 @@
+"""
+Unit tests for hedged requests in ModelRouterService.execute_with_fallback
+Tests that a slow first key is raced against the next healthy key
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services.model_router import ModelRouterService
+from services.latency_tracker import LatencyTracker
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled(router_keys, router_dependencies):
+    """The backup key answers first, its result wins and the slow call is cancelled"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.record_failure = AsyncMock()
+    cancelled = []
+
+    async def fake_call(key, feature, prompt, system_prompt=None, image_data=None):
+        if key["id"] == "key-1":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(key["id"])
+                raise
+        return {"success": True, "content": f"from {key['id']}", "tokens_used": 5}
+
+    health_tracker, usage_logger = router_dependencies(router_keys(2))
+    with patch.object(router, "_call_key", side_effect=fake_call), \
+            patch.object(router, "get_hedge_delay_ms", return_value=20):
+        result = await router.execute_with_fallback(
+            provider="openai", feature="chat", prompt="hi", hedge=True
+        )
+
+    assert result["success"] is True
+    assert result["key_id"] == "key-2"
+    assert result["hedged"] is True
+    assert result["attempts"] == 2
+    assert cancelled == ["key-1"]
+    # Only the completed attempt is logged; the cancelled one is not a failure
+    assert usage_logger.log_model_call.await_count == 1
+    router.record_failure.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_attempts_finishing_together_are_all_accounted(router_keys, router_dependencies):
+    """When both hedged attempts complete at once, each is logged and fed to health tracking"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    release = asyncio.Event()
+
+    async def fake_call(key, feature, prompt, system_prompt=None, image_data=None):
+        if key["id"] == "key-2":
+            release.set()
+        await release.wait()
+        return {"success": True, "content": f"from {key['id']}", "tokens_used": 5}
+
+    health_tracker, usage_logger = router_dependencies(router_keys(2))
+    with patch.object(router, "_call_key", side_effect=fake_call), \
+            patch.object(router, "get_hedge_delay_ms", return_value=20):
+        result = await router.execute_with_fallback(
+            provider="openai", feature="chat", prompt="hi", hedge=True
+        )
+
+    assert result["success"] is True
+    assert result["hedged"] is True
+    assert usage_logger.log_model_call.await_count == 2
+    assert health_tracker.update_key_health.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_does_not_start_hedge(router_keys, router_dependencies):
+    """A primary that answers within the threshold never touches the backup key"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    calls = []
+
+    async def fake_call(key, feature, prompt, system_prompt=None, image_data=None):
+        calls.append(key["id"])
+        return {"success": True, "content": "ok", "tokens_used": 5}
+
+    router_dependencies(router_keys(2))
+    with patch.object(router, "_call_key", side_effect=fake_call), \
+            patch.object(router, "get_hedge_delay_ms", return_value=1000):
+        result = await router.execute_with_fallback(
+            provider="openai", feature="chat", prompt="hi", hedge=True
+        )
+
+    assert result["key_id"] == "key-1"
+    assert result["hedged"] is False
+    assert calls == ["key-1"]
+
+
+@pytest.mark.asyncio
+async def test_hedged_pair_failure_continues_to_huggingface_fallback(router_keys, router_dependencies):
+    """When both hedged keys fail the router falls through to the usual fallback"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.record_failure = AsyncMock()
+    router._try_huggingface_fallback = AsyncMock(return_value={"success": False, "error": "no hf"})
+
+    async def fake_call(key, feature, prompt, system_prompt=None, image_data=None):
+        if key["id"] == "key-1":
+            await asyncio.sleep(0.05)
+        return {"success": False, "error": "upstream error", "tokens_used": 0}
+
+    router_dependencies(router_keys(2))
+    with patch.object(router, "_call_key", side_effect=fake_call), \
+            patch.object(router, "get_hedge_delay_ms", return_value=10):
+        await router.execute_with_fallback(
+            provider="openai", feature="chat", prompt="hi", hedge=True
+        )
+
+    assert router.record_failure.await_count == 2
+    router._try_huggingface_fallback.assert_awaited_once()
+    assert router._try_huggingface_fallback.await_args.kwargs["attempt_number"] == 2
+
+
+def test_hedging_is_opt_in():
+    """Features are only hedged when configured or explicitly requested"""
+    router = ModelRouterService(supabase_client=MagicMock())
+
+    with patch("services.model_router.HEDGE_FEATURES", {"chat"}):
+        assert router.should_hedge("chat") is True
+        assert router.should_hedge("flashcard") is False
+        assert router.should_hedge("chat", hedge=False) is False
+
+
+def test_hedge_delay_uses_observed_percentile():
+    """The threshold follows observed latency once enough samples exist"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    tracker = LatencyTracker()
+
+    with patch("services.model_router.get_latency_tracker", return_value=tracker), \
+            patch("services.model_router.HEDGE_DEFAULT_DELAY_MS", 8000), \
+            patch("services.model_router.HEDGE_MIN_DELAY_MS", 500):
+        assert router.get_hedge_delay_ms("chat") == 8000
+
+        for ms in range(1, 101):
+            tracker.record("chat", ms * 30)
+
+        assert router.get_hedge_delay_ms("chat") == 2850
+        assert tracker.percentile("chat", 50) == 1500
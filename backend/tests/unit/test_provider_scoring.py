@@ -0,0 +1,88 @@
+"""
+Unit tests for latency-aware provider scoring
+Tests EWMA tracking, per-feature weights and ranking
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from services.provider_scoring import ProviderScorer
+from services.health_tracker import HealthTrackerService
+
+
+def _keys():
+    return [
+        {"id": "slow", "provider": "openrouter", "priority": 10},
+        {"id": "fast", "provider": "gemini", "priority": 5}
+    ]
+
+
+def test_ewma_tracks_latency_of_successes_and_error_rate():
+    """Latency averages only successful calls; the error rate averages every outcome"""
+    scorer = ProviderScorer(alpha=0.5)
+
+    scorer.record("k1", True, 1000)
+    scorer.record("k1", True, 3000)
+    scorer.record("k1", False, 10)
+
+    stats = scorer.get_snapshot()["keys"]["k1"]
+    assert stats["ewma_latency_ms"] == 2000
+    assert stats["ewma_error_rate"] == 0.5
+    assert stats["samples"] == 3
+
+
+def test_without_samples_priority_order_is_kept():
+    """New keys score on priority alone, so the configured order is unchanged"""
+    scorer = ProviderScorer()
+
+    ranked = scorer.rank(_keys(), "explain")
+
+    assert [k["id"] for k in ranked] == ["slow", "fast"]
+    assert ranked[0]["score_inputs"]["samples"] == 0
+
+
+def test_latency_critical_feature_prefers_fast_key():
+    """A key that answers in 2s outranks one that answers in 25s for chat"""
+    scorer = ProviderScorer()
+    for _ in range(3):
+        scorer.record("slow", True, 25000)
+        scorer.record("fast", True, 2000)
+
+    ranked = scorer.rank(_keys(), "chat")
+
+    assert [k["id"] for k in ranked] == ["fast", "slow"]
+    assert ranked[0]["score_inputs"]["components"]["latency"] == 1.0
+    assert scorer.get_snapshot()["rankings"]["chat"][0]["id"] == "fast"
+
+
+def test_bulk_feature_prefers_cheap_provider():
+    """Cost outweighs priority for flashcards"""
+    scorer = ProviderScorer()
+
+    assert [k["id"] for k in scorer.rank(_keys(), "flashcard")] == ["fast", "slow"]
+
+
+def test_unreliable_key_drops_behind():
+    """A high error rate outweighs a priority lead"""
+    scorer = ProviderScorer()
+    for _ in range(5):
+        scorer.record("slow", False, 100)
+        scorer.record("fast", True, 100)
+
+    assert [k["id"] for k in scorer.rank(_keys(), "explain")] == ["fast", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_health_tracker_feeds_and_uses_scores():
+    """Outcomes recorded through the health tracker change the routing order"""
+    tracker = HealthTrackerService(MagicMock())
+    registry = MagicMock()
+    registry.get_active_keys.return_value = [
+        {**k, "feature": "chat", "key_value": "x", "status": "active"} for k in _keys()
+    ]
+
+    with patch("services.health_tracker.get_key_registry", return_value=registry):
+        await tracker.update_key_health("slow", True, response_time_ms=25000)
+        await tracker.update_key_health("fast", True, response_time_ms=2000)
+        healthy = await tracker.get_all_healthy_keys_for_feature("chat")
+
+    assert [k["id"] for k in healthy] == ["fast", "slow"]
+    assert healthy[0]["routing_score"] > healthy[1]["routing_score"]
@@ -0,0 +1,114 @@
+"""
+Unit tests for single-flight request coalescing
+Tests sharing of identical in-flight requests in ModelRouterService.execute_with_fallback
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services.model_router import ModelRouterService
+from services.request_coalescer import RequestCoalescer, make_request_key
+
+
+def _router_with_upstream(delay=0.05):
+    """Router whose fallback chain is replaced by a slow counting fake"""
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.get_user_api_key = AsyncMock(return_value=None)
+    calls = []
+
+    async def upstream(**kwargs):
+        calls.append(kwargs["prompt"])
+        await asyncio.sleep(delay)
+        return {"success": True, "content": f"answer to {kwargs['prompt']}", "tokens_used": 42}
+
+    router._execute_with_fallback = upstream
+    return router, calls
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_upstream_call():
+    """N identical in-flight requests make one call and all get its result"""
+    router, calls = _router_with_upstream()
+    coalescer = RequestCoalescer()
+
+    with patch("services.model_router.get_request_coalescer", return_value=coalescer):
+        results = await asyncio.gather(*[
+            router.execute_with_fallback(
+                provider="openrouter", feature="flashcard",
+                prompt="Cardiac cycle", system_prompt="flashcards", user_id=f"user-{i}"
+            )
+            for i in range(5)
+        ])
+
+    assert calls == ["Cardiac cycle"]
+    assert all(r["content"] == "answer to Cardiac cycle" for r in results)
+    assert all(r["tokens_used"] == 42 for r in results)
+    assert sum(1 for r in results if r.get("coalesced")) == 4
+    assert coalescer.get_stats()["coalesced_calls"] == 4
+    assert coalescer.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_different_or_streamed_requests_are_not_shared():
+    """Different prompts and streamed requests each go upstream"""
+    router, calls = _router_with_upstream()
+    coalescer = RequestCoalescer()
+
+    with patch("services.model_router.get_request_coalescer", return_value=coalescer):
+        await asyncio.gather(
+            router.execute_with_fallback(provider="openrouter", feature="flashcard", prompt="A"),
+            router.execute_with_fallback(provider="openrouter", feature="flashcard", prompt="B"),
+            router.execute_with_fallback(provider="openrouter", feature="chat", prompt="A", on_token=AsyncMock()),
+            router.execute_with_fallback(provider="openrouter", feature="chat", prompt="A", on_token=AsyncMock())
+        )
+
+    assert sorted(calls) == ["A", "A", "A", "B"]
+    assert coalescer.get_stats()["coalesced_calls"] == 0
+
+
+@pytest.mark.asyncio
+async def test_personal_keys_are_not_shared_between_users():
+    """Requests using a personal API key only coalesce with the same user's requests"""
+    router, calls = _router_with_upstream()
+    router.get_user_api_key = AsyncMock(side_effect=lambda user_id: f"sk-{user_id}")
+
+    with patch("services.model_router.get_request_coalescer", return_value=RequestCoalescer()):
+        await asyncio.gather(
+            router.execute_with_fallback(provider="openrouter", feature="mcq", prompt="Q", user_id="u1"),
+            router.execute_with_fallback(provider="openrouter", feature="mcq", prompt="Q", user_id="u2"),
+            router.execute_with_fallback(provider="openrouter", feature="mcq", prompt="Q", user_id="u2")
+        )
+
+    assert calls == ["Q", "Q"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call():
+    """The call keeps running for the remaining callers and stops when all are gone"""
+    coalescer = RequestCoalescer()
+    started, finished = asyncio.Event(), []
+
+    async def call():
+        started.set()
+        await asyncio.sleep(0.05)
+        finished.append(True)
+        return {"success": True}
+
+    key = make_request_key("chat", "openrouter", None, "hi")
+    first = asyncio.create_task(coalescer.run(key, call))
+    await started.wait()
+    second = asyncio.create_task(coalescer.run(key, call))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    assert (await second)["coalesced"] is True
+    assert finished == [True]
+
+    # Every caller gone: the upstream call is cancelled
+    started.clear()
+    only = asyncio.create_task(coalescer.run(key, call))
+    await started.wait()
+    only.cancel()
+    await asyncio.gather(only, return_exceptions=True)
+    await asyncio.sleep(0.06)
+    assert finished == [True]
+    assert coalescer.get_stats()["in_flight"] == 0
@@ -0,0 +1,124 @@
+"""
+Unit tests for request deadlines
+Tests budget propagation through the fallback chain and disconnect cancellation
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services.request_deadline import request_deadline, get_remaining_budget, has_budget_for_attempt
+from services.model_router import ModelRouterService
+from middleware.request_deadline import RequestDeadlineMiddleware
+
+
+def test_nested_budgets_only_tighten_and_are_restored():
+    """An inner budget can shorten but not extend the deadline, and ends with its block"""
+    assert get_remaining_budget() is None
+
+    with request_deadline(10):
+        with request_deadline(60):
+            assert get_remaining_budget() <= 10
+        with request_deadline(0.5):
+            assert get_remaining_budget() <= 0.5
+            assert has_budget_for_attempt() is False
+        assert 9 < get_remaining_budget() <= 10
+
+    assert get_remaining_budget() is None
+
+
+def _router():
+    router = ModelRouterService(supabase_client=MagicMock())
+    router.get_user_api_key = AsyncMock(return_value=None)
+    router.record_failure = AsyncMock()
+    return router
+
+
+@pytest.mark.asyncio
+async def test_slow_attempt_is_cut_off_at_the_deadline(router_keys, router_dependencies):
+    """The attempt in progress is cancelled when the budget runs out and no other key or HF is tried"""
+    router = _router()
+    router_dependencies(router_keys(3))
+    calls, cancelled = [], []
+
+    async def slow_call(key, feature, prompt, system_prompt=None, image_data=None):
+        calls.append(key["id"])
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(key["id"])
+            raise
+
+    router._try_huggingface_fallback = AsyncMock()
+    with patch("services.request_deadline.REQUEST_DEADLINE_MIN_ATTEMPT_SECONDS", 0.01), \
+            patch.object(router, "_call_key", side_effect=slow_call):
+        result = await asyncio.wait_for(
+            router.execute_with_fallback(provider="openrouter", feature="chat", prompt="hi", hedge=False, timeout=0.1),
+            timeout=1
+        )
+
+    assert result["success"] is False
+    assert result["deadline_exceeded"] is True
+    assert calls == ["key-1"]
+    assert cancelled == ["key-1"]
+    router.record_failure.assert_not_called()
+    router._try_huggingface_fallback.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_no_attempt_or_fallback_starts_without_budget(router_keys, router_dependencies):
+    """Once the remaining budget is below the minimum, later keys and the HF fallback are skipped"""
+    router = _router()
+    router_dependencies(router_keys(3))
+    calls = []
+
+    async def failing_call(key, feature, prompt, system_prompt=None, image_data=None):
+        calls.append(key["id"])
+        await asyncio.sleep(0.05)
+        return {"success": False, "error": "Provider error", "tokens_used": 0}
+
+    with patch("services.request_deadline.REQUEST_DEADLINE_MIN_ATTEMPT_SECONDS", 0.08), \
+            patch.object(router, "_call_key", side_effect=failing_call), \
+            patch.object(router, "get_active_key", AsyncMock(return_value={"key_value": "hf"})) as get_hf_key:
+        result = await router.execute_with_fallback(
+            provider="openrouter", feature="chat", prompt="hi", hedge=False, timeout=0.12
+        )
+
+    assert calls == ["key-1"]
+    assert result["deadline_exceeded"] is True
+    assert result["attempts"] == 1
+    get_hf_key.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_middleware_sets_route_deadline_and_cancels_on_disconnect():
+    """The handler sees its route's budget and is cancelled when the client goes away"""
+    seen, cancelled = [], []
+
+    async def app(scope, receive, send):
+        seen.append(get_remaining_budget())
+        await receive()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(scope["path"])
+            raise
+
+    messages = [{"type": "http.request", "body": b"{}", "more_body": False}]
+    disconnect = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    middleware = RequestDeadlineMiddleware(app, deadlines={"/api/chat": 30, "/api/chat/sessions": 45})
+    scope = {"type": "http", "method": "POST", "path": "/api/chat/sessions/s1/messages"}
+    request = asyncio.create_task(middleware(scope, receive, AsyncMock()))
+
+    await asyncio.sleep(0.02)
+    disconnect.set()
+    await asyncio.wait_for(request, timeout=1)
+
+    assert 44 < seen[0] <= 45
+    assert cancelled == ["/api/chat/sessions/s1/messages"]
+    assert middleware.get_deadline("/api/admin/users") is None
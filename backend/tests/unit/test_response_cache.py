@@ -0,0 +1,135 @@
+"""
+Unit tests for the study-tool response cache
+Tests keys, the LRU and SQLite tiers, TTL, purging and StudyToolsService integration
+"""
+import time
+import threading
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.response_cache import ResponseCache
+from services.study_tools import StudyToolsService
+
+
+MODEL = "anthropic/claude-sonnet-4.5"
+
+
+def _key(topic="Cardiac cycle", count=5, format="interactive", model=MODEL, version=1):
+    return ResponseCache.make_key("flashcard", topic, count, format, model, version)
+
+
+def test_key_normalizes_topic_and_separates_other_inputs():
+    """Topic case/spacing doesn't matter; count, format, model and prompt version do"""
+    assert _key("Cardiac cycle") == _key("  cardiac   CYCLE? ")
+    assert _key() != _key(count=10)
+    assert _key() != _key(format="static")
+    assert _key() != _key(model="other-model")
+    assert _key() != _key(version=2)
+    assert _key() != ResponseCache.make_key("mcq", "Cardiac cycle", 5, "interactive", MODEL, 1)
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_evicts_least_recently_used_and_expires():
+    """The memory tier is an LRU and entries older than the TTL are misses"""
+    cache = ResponseCache(memory_size=2, db_path=None, ttl_seconds=60)
+    cache.put("a", "flashcard", {"content": "A"})
+    cache.put("b", "flashcard", {"content": "B"})
+    await cache.get("a")
+    cache.put("c", "flashcard", {"content": "C"})
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == {"content": "A"}
+
+    with patch("services.response_cache.time.time", return_value=time.time() + 61):
+        assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart_and_purges_by_tool(tmp_path):
+    """Responses written to SQLite are served after a restart and purged per tool"""
+    db_path = str(tmp_path / "cache" / "responses.sqlite3")
+    cache = ResponseCache(memory_size=10, db_path=db_path)
+    cache.put("k1", "flashcard", {"content": "cards", "tokens_used": 300})
+    cache.put("k2", "mcq", {"content": "questions", "tokens_used": 400})
+    cache.close()
+
+    restarted = ResponseCache(memory_size=10, db_path=db_path)
+    assert await restarted.get("k1") == {"content": "cards", "tokens_used": 300}
+    assert restarted.get_stats()["disk_hits"] == 1
+
+    assert await restarted.purge(tool="flashcard") == 1
+    assert await restarted.get("k1") is None
+    assert await restarted.get("k2") == {"content": "questions", "tokens_used": 400}
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_stays_off_the_event_loop(tmp_path):
+    """Disk reads run on the cache thread and queued writes share one commit"""
+    cache = ResponseCache(memory_size=1, db_path=str(tmp_path / "responses.sqlite3"))
+    read_threads = []
+    select = cache._select
+
+    def record_read(keys):
+        read_threads.append(threading.get_ident())
+        return select(keys)
+
+    # Hold the cache thread so every put lands in the same batch
+    gate = threading.Event()
+    cache._executor.submit(gate.wait)
+    for i in range(3):
+        cache.put(f"k{i}", "mcq", {"content": f"questions {i}"})
+    gate.set()
+    cache.flush()
+
+    with patch.object(cache, "_select", side_effect=record_read):
+        assert await cache.get("k0") == {"content": "questions 0"}
+
+    assert read_threads and read_threads[0] != threading.get_ident()
+    assert cache.get_stats()["disk_commits"] == 1
+    cache.close()
+
+
+def _service():
+    router = MagicMock()
+    router.select_provider = AsyncMock(return_value="openrouter")
+    router.execute_with_fallback = AsyncMock(
+        return_value={"success": True, "content": "Summary of the cardiac cycle", "tokens_used": 250}
+    )
+    rate_limiter = MagicMock()
+    rate_limiter.check_rate_limit = AsyncMock(return_value=True)
+    rate_limiter.increment_usage = AsyncMock()
+
+    service = StudyToolsService(MagicMock(), router, rate_limiter)
+    service.create_session = AsyncMock(return_value={"id": "session-1"})
+    return service, router, rate_limiter
+
+
+@pytest.mark.asyncio
+async def test_repeated_topic_is_served_from_cache():
+    """The second request for a topic skips the model router but is still rate limited and counted"""
+    service, router, rate_limiter = _service()
+    cache = ResponseCache(memory_size=10, db_path=None)
+
+    with patch("services.study_tools.get_response_cache", return_value=cache):
+        first = await service.generate_highyield("user-1", "Cardiac cycle")
+        second = await service.generate_highyield("user-2", "cardiac cycle")
+
+    assert router.execute_with_fallback.await_count == 1
+    assert second["content"] == first["content"]
+    assert rate_limiter.check_rate_limit.await_count == 2
+    assert rate_limiter.increment_usage.await_count == 2
+    assert cache.get_stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_document_context_bypasses_cache():
+    """Requests grounded in a user's documents are never cached or served from cache"""
+    service, router, _ = _service()
+    cache = ResponseCache(memory_size=10, db_path=None)
+
+    with patch("services.study_tools.get_response_cache", return_value=cache):
+        await service.generate_explanation("user-1", "Cardiac cycle", document_context="lecture notes")
+        await service.generate_explanation("user-1", "Cardiac cycle", document_context="lecture notes")
+
+    assert router.execute_with_fallback.await_count == 2
+    assert cache.get_stats()["memory_entries"] == 0
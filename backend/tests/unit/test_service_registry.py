@@ -0,0 +1,62 @@
+"""
+Unit tests for the service registry
+Tests that requests and hot paths reuse the shared client and services
+"""
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from fastapi.testclient import TestClient
+from services.chat import ChatService, get_chat_service
+from services.rate_limiter import get_rate_limiter
+from services.model_router import get_model_router_service
+from services.model_usage_logger import get_model_usage_logger
+from services.health_tracker import get_health_tracker_service
+from services.documents import get_document_service
+from services.service_registry import get_supabase_client, provide
+
+
+@pytest.mark.parametrize("factory", [
+    get_chat_service, get_rate_limiter, get_model_router_service,
+    get_model_usage_logger, get_health_tracker_service, get_document_service
+])
+def test_factories_reuse_the_instance_for_the_same_client(factory):
+    """Hot paths calling a factory with the shared client get the existing instance"""
+    client, other_client = MagicMock(), MagicMock()
+
+    first = factory(client)
+
+    assert factory(client) is first
+    assert factory(other_client) is not first
+    assert factory(other_client).supabase is other_client
+
+
+def test_services_without_client_use_the_shared_client():
+    """A service created without a client doesn't open its own connection"""
+    shared = get_supabase_client()
+
+    with patch("services.service_registry.create_client") as create_client:
+        service = ChatService()
+
+    assert service.supabase is shared
+    create_client.assert_not_called()
+
+
+def test_requests_construct_no_clients_or_services():
+    """Serving requests builds no Supabase clients and no service objects"""
+    import main
+
+    main.app.dependency_overrides[main.get_current_user] = lambda: {"id": "user-1", "plan": "free"}
+    try:
+        client = TestClient(main.app)
+        with patch.object(ChatService, "get_user_sessions", AsyncMock(return_value=[])):
+            assert client.get("/api/chat/sessions").status_code == 200  # Warm up
+
+            with patch("services.service_registry.create_client") as create_client, \
+                    patch.object(ChatService, "__init__", autospec=True, side_effect=ChatService.__init__) as construct:
+                for _ in range(3):
+                    assert client.get("/api/chat/sessions").status_code == 200
+
+        create_client.assert_not_called()
+        assert construct.call_count == 0
+        assert provide(get_chat_service)() is get_chat_service(get_supabase_client())
+    finally:
+        main.app.dependency_overrides.clear()
@@ -0,0 +1,124 @@
+"""
+Unit tests for the system flags snapshot
+Tests that flag checks avoid per-request queries and staleness stays bounded
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+from middleware.feature_toggle import FeatureToggleMiddleware
+from middleware.maintenance import MaintenanceMiddleware
+from services.system_flags import SystemFlags, get_system_flags
+
+
+def _supabase(rows):
+    """Client whose system_flags queries answer from rows (flag_name -> flag_value)"""
+    supabase = MagicMock()
+    table = supabase.table.return_value
+    table.select.return_value.eq.side_effect = lambda _, name: MagicMock(execute=lambda: MagicMock(
+        data=[{"flag_value": rows[name], "updated_at": "2026-01-01T00:00:00"}] if name in rows else []
+    ))
+    table.select.return_value.execute.side_effect = lambda: MagicMock(data=[
+        {"flag_name": name, "flag_value": value, "updated_at": "2026-01-01T00:00:00"} for name, value in rows.items()
+    ])
+    return supabase
+
+
+def _request(path):
+    request = MagicMock()
+    request.url.path = path
+    return request
+
+
+@pytest.mark.asyncio
+async def test_flag_checks_query_once_per_staleness_window():
+    """Repeated checks are served from memory until the value may be stale"""
+    rows = {"feature_chat_enabled": "false"}
+    supabase = _supabase(rows)
+    middleware = FeatureToggleMiddleware(supabase)
+    flags = get_system_flags(supabase)
+
+    with patch("services.system_flags.time.monotonic", return_value=1000.0):
+        for _ in range(20):
+            with pytest.raises(HTTPException):
+                await middleware.check_feature_enabled(_request("/api/chat/sessions"))
+    assert flags.loads == 1
+
+    rows["feature_chat_enabled"] = "true"
+    with patch("services.system_flags.time.monotonic", return_value=1000.0 + flags.max_staleness_seconds):
+        assert await middleware.get_feature_status("chat") is False  # Still within the bound
+    with patch("services.system_flags.time.monotonic", return_value=1000.1 + flags.max_staleness_seconds):
+        assert await middleware.get_feature_status("chat") is True  # Re-read once the bound passed
+    assert flags.loads == 2
+
+
+@pytest.mark.asyncio
+async def test_polled_snapshot_serves_all_flags_without_queries():
+    """After a poll, present and missing flags are answered from memory"""
+    supabase = _supabase({"feature_pdf_enabled": "false"})
+    flags = SystemFlags(supabase)
+
+    assert await flags.refresh() == 1
+    supabase.table.return_value.select.return_value.eq.reset_mock()
+
+    assert await flags.get_value("feature_pdf_enabled") == "false"
+    assert await flags.get_value("feature_chat_enabled") is None
+    supabase.table.return_value.select.return_value.eq.assert_not_called()
+    assert flags.loads == 0
+
+
+@pytest.mark.asyncio
+async def test_poll_fetches_only_rows_changed_since_the_last_version():
+    """Later polls filter on updated_at and apply the changed rows"""
+    supabase = _supabase({"feature_mcq_enabled": "true"})
+    flags = SystemFlags(supabase)
+    await flags.refresh()
+
+    delta = supabase.table.return_value.select.return_value.gt
+    delta.return_value.execute.return_value = MagicMock(data=[
+        {"flag_name": "feature_mcq_enabled", "flag_value": "false", "updated_at": "2026-01-02T00:00:00"}
+    ])
+    await flags.refresh()
+
+    delta.assert_called_once_with("updated_at", "2026-01-01T00:00:00")
+    assert await flags.get_value("feature_mcq_enabled") == "false"
+    assert flags.get_stats()["version"] == "2026-01-02T00:00:00"
+
+
+@pytest.mark.asyncio
+async def test_pushed_changes_apply_immediately():
+    """Admin writes are visible to the next request without waiting for the poll"""
+    supabase = _supabase({"feature_map_enabled": "true"})
+    middleware = FeatureToggleMiddleware(supabase)
+    assert await middleware.get_feature_status("map") is True
+
+    get_system_flags(supabase).set_flag("feature_map_enabled", "False")
+
+    assert await middleware.get_feature_status("map") is False
+
+
+@pytest.mark.asyncio
+async def test_maintenance_flag_is_parsed_once_per_change():
+    """The maintenance dict literal isn't re-parsed on every request"""
+    supabase = _supabase({"maintenance_mode": str({"is_active": True, "level": "soft", "reason": "Upgrade"})})
+    middleware = MaintenanceMiddleware(supabase)
+
+    with patch("middleware.maintenance.ast.literal_eval", wraps=__import__("ast").literal_eval) as literal_eval:
+        for _ in range(10):
+            status = await middleware.get_maintenance_status()
+        get_system_flags(supabase).set_flag("maintenance_mode", str({"is_active": False}))
+        assert (await middleware.get_maintenance_status())["in_maintenance"] is False
+
+    assert status == {"in_maintenance": True, "level": "soft", "reason": "Upgrade"}
+    assert literal_eval.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_reload_keeps_the_last_value():
+    """A database error while re-reading a stale flag serves the last known value"""
+    supabase = _supabase({"feature_image_enabled": "false"})
+    flags = SystemFlags(supabase, max_staleness_seconds=0)
+    assert await flags.get_value("feature_image_enabled") == "false"
+
+    supabase.table.return_value.select.return_value.eq.side_effect = Exception("connection reset")
+
+    assert await flags.get_value("feature_image_enabled") == "false"
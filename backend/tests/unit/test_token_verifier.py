@@ -0,0 +1,127 @@
+"""
+Unit tests for the token verifier
+Tests local JWT verification, the verified-token cache and the remote fallback
+"""
+import time
+import jwt
+import pytest
+from unittest.mock import MagicMock, patch
+from cryptography.hazmat.primitives.asymmetric import ec
+from services.token_verifier import TokenVerifier
+
+SECRET = "test-jwt-secret-with-enough-length-for-hs256"
+
+
+def _token(key=SECRET, algorithm="HS256", expires_in=3600, headers=None, **claims):
+    payload = {"sub": "user-1", "email": "a@example.com", "aud": "authenticated",
+               "exp": int(time.time()) + expires_in, **claims}
+    return jwt.encode(payload, key, algorithm=algorithm, headers=headers)
+
+
+def _supabase(user_id="user-1"):
+    supabase = MagicMock()
+    supabase.auth.get_user.return_value = MagicMock(user=MagicMock(id=user_id, email="a@example.com"))
+    return supabase
+
+
+@pytest.mark.asyncio
+async def test_hs256_token_is_verified_locally_and_cached():
+    """Valid tokens never reach Supabase Auth; repeats skip the signature check"""
+    supabase = _supabase()
+    verifier = TokenVerifier(supabase, jwt_secret=SECRET, jwks_url="")
+    token = _token()
+
+    assert await verifier.verify(token) == {"id": "user-1", "email": "a@example.com"}
+    with patch("services.token_verifier.jwt.decode") as decode:
+        assert await verifier.verify(token) == {"id": "user-1", "email": "a@example.com"}
+
+    decode.assert_not_called()
+    supabase.auth.get_user.assert_not_called()
+    assert verifier.get_stats()["cache_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_and_forged_tokens_are_rejected():
+    """Expiry, signature and audience are enforced without a remote call"""
+    supabase = _supabase()
+    verifier = TokenVerifier(supabase, jwt_secret=SECRET, jwks_url="")
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        await verifier.verify(_token(expires_in=-60))
+    with pytest.raises(jwt.InvalidSignatureError):
+        await verifier.verify(_token(key="another-secret-that-is-also-long-enough"))
+    with pytest.raises(jwt.InvalidAudienceError):
+        await verifier.verify(_token(aud="anon"))
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        await verifier.verify(_token(algorithm="HS512"))
+
+    supabase.auth.get_user.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_es256_token_is_verified_with_cached_jwks():
+    """Asymmetric tokens are checked against the JWKS, fetched once"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    verifier = TokenVerifier(_supabase(), jwt_secret="", jwks_url="https://project/jwks.json")
+
+    with patch.object(verifier, "_fetch_jwks", return_value={"kid-1": private_key.public_key()}) as fetch:
+        for _ in range(2):
+            token = _token(key=private_key, algorithm="ES256", headers={"kid": "kid-1"}, jti=str(time.time_ns()))
+            assert (await verifier.verify(token))["id"] == "user-1"
+
+    fetch.assert_called_once()
+    assert verifier.get_stats()["local_verifications"] == 2
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_supabase_auth_without_a_local_key():
+    """Without a secret the token is verified remotely, then cached"""
+    supabase = _supabase()
+    verifier = TokenVerifier(supabase, jwt_secret="", jwks_url="")
+    token = _token()
+
+    assert (await verifier.verify(token))["id"] == "user-1"
+    assert (await verifier.verify(token))["id"] == "user-1"
+
+    supabase.auth.get_user.assert_called_once_with(token)
+
+
+@pytest.mark.asyncio
+async def test_remote_recheck_drops_revoked_sessions():
+    """Cached tokens due for a re-check are rejected once Supabase revokes them"""
+    supabase = _supabase()
+    verifier = TokenVerifier(supabase, jwt_secret=SECRET, jwks_url="", remote_recheck_seconds=60)
+    token = _token()
+    assert await verifier.verify(token) is not None
+
+    supabase.auth.get_user.return_value = MagicMock(user=None)
+    with patch("services.token_verifier.time.time", return_value=time.time() + 120):
+        assert await verifier.verify(token) is None
+
+    assert verifier.get_stats()["cached_tokens"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded():
+    """The least recently used tokens are evicted first"""
+    verifier = TokenVerifier(_supabase(), jwt_secret=SECRET, jwks_url="", cache_size=2)
+
+    for index in range(3):
+        await verifier.verify(_token(jti=str(index)))
+
+    assert verifier.get_stats()["cached_tokens"] == 2
+
+
+def test_get_current_user_returns_401_for_expired_token():
+    """The dependency maps verification errors to 401"""
+    import main
+    from fastapi.testclient import TestClient
+
+    verifier = TokenVerifier(_supabase(), jwt_secret=SECRET, jwks_url="")
+    with patch("main.get_token_verifier", return_value=verifier):
+        response = TestClient(main.app).get(
+            "/api/chat/sessions", headers={"Authorization": f"Bearer {_token(expires_in=-60)}"}
+        )
+
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid or expired token"
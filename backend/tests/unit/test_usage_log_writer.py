@@ -0,0 +1,119 @@
+"""
+Unit tests for the write-behind usage log writer
+Tests batching, interval flushes, drop policies, shutdown flush and logger integration
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+from services import usage_log_writer
+from services.usage_log_writer import UsageLogWriter
+from services.model_usage_logger import ModelUsageLogger
+
+
+def _inserts(supabase):
+    return [call.args[0] for call in supabase.table.return_value.insert.call_args_list]
+
+
+def _row(n):
+    return {"feature": "chat", "attempt_number": n}
+
+
+async def _wait_until_flushed(writer, count, timeout=2.0):
+    """Wait for the background flusher (inserts run on the database pool)"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while writer.get_stats()["flushed"] < count and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_bulk_inserted():
+    """Rows are inserted together once a batch fills up"""
+    supabase = MagicMock()
+    writer = UsageLogWriter(supabase, batch_size=3, flush_interval=60)
+
+    for n in range(3):
+        await writer.put(_row(n))
+    await _wait_until_flushed(writer, 3)
+
+    assert _inserts(supabase) == [[_row(0), _row(1), _row(2)]]
+    assert writer.get_stats()["flushed"] == 3
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_after_interval():
+    """A partial batch doesn't wait for more rows than the flush interval"""
+    supabase = MagicMock()
+    writer = UsageLogWriter(supabase, batch_size=100, flush_interval=0.02)
+
+    await writer.put(_row(1))
+    assert _inserts(supabase) == []
+    await _wait_until_flushed(writer, 1)
+
+    assert _inserts(supabase) == [[_row(1)]]
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_drop_policies_when_full():
+    """drop_oldest keeps the newest rows, drop_newest rejects new rows"""
+    oldest = UsageLogWriter(MagicMock(), max_size=2, batch_size=100, flush_interval=60, drop_policy="drop_oldest")
+    newest = UsageLogWriter(MagicMock(), max_size=2, batch_size=100, flush_interval=60, drop_policy="drop_newest")
+
+    for n in range(3):
+        await oldest.put(_row(n))
+        await newest.put(_row(n))
+
+    assert list(oldest._rows) == [_row(1), _row(2)]
+    assert list(newest._rows) == [_row(0), _row(1)]
+    assert oldest.get_stats()["dropped"] == 1
+    assert newest.get_stats()["dropped"] == 1
+    await oldest.stop()
+    await newest.stop()
+
+
+@pytest.mark.asyncio
+async def test_block_policy_waits_for_flusher():
+    """Under the block policy a full buffer triggers a flush instead of dropping"""
+    supabase = MagicMock()
+    writer = UsageLogWriter(supabase, max_size=2, batch_size=100, flush_interval=60, drop_policy="block")
+
+    with patch.object(usage_log_writer, "USAGE_LOG_BLOCK_TIMEOUT_SECONDS", 1):
+        for n in range(3):
+            assert await writer.put(_row(n)) is True
+
+    assert _inserts(supabase) == [[_row(0), _row(1)]]
+    assert writer.get_stats()["dropped"] == 0
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_remaining_rows_and_counts_failures():
+    """Shutdown inserts what is still buffered; failed inserts are counted"""
+    supabase = MagicMock()
+    supabase.table.return_value.insert.return_value.execute.side_effect = [Exception("db down"), MagicMock()]
+    writer = UsageLogWriter(supabase, batch_size=2, flush_interval=60)
+    writer._rows.extend([_row(1), _row(2), _row(3)])
+
+    await writer.stop()
+
+    stats = writer.get_stats()
+    assert stats["failed"] == 2
+    assert stats["flushed"] == 1
+    assert stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_log_model_call_does_not_insert_inline():
+    """log_model_call only buffers the row; the insert happens in the background"""
+    supabase = MagicMock()
+    writer = UsageLogWriter(supabase, batch_size=100, flush_interval=60)
+
+    with patch("services.model_usage_logger.get_usage_log_writer", return_value=writer):
+        await ModelUsageLogger(supabase).log_model_call(
+            user_id="user-1", provider="openai", model="m", feature="chat", success=True, tokens_used=10
+        )
+
+    supabase.table.return_value.insert.assert_not_called()
+    await writer.stop()
+    assert _inserts(supabase)[0][0]["feature"] == "chat"
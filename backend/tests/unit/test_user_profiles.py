@@ -0,0 +1,97 @@
+"""
+Unit tests for the user profile cache
+Tests that a request loads the users row once and that changes invalidate it
+"""
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock, patch
+from services.user_profiles import UserProfileCache, get_user_profiles, start_request_scope
+from services.rate_limiter import RateLimiter
+from services.auth import AuthService
+from services.admin import AdminService
+from middleware.maintenance import MaintenanceMiddleware
+
+
+def _supabase(profile):
+    """Client with a users table answering profile and an allowlist entry for its email"""
+    tables = {"users": MagicMock(), "admin_allowlist": MagicMock()}
+    users = tables["users"]
+    users.select.return_value.eq.return_value.execute.side_effect = lambda: MagicMock(data=[dict(profile)])
+    users.update.return_value.eq.return_value.execute.return_value = MagicMock(data=[dict(profile)])
+    tables["admin_allowlist"].select.return_value.eq.return_value.execute.return_value = MagicMock(
+        data=[{"role": "admin"}]
+    )
+
+    supabase = MagicMock()
+    supabase.table.side_effect = lambda name: tables.setdefault(name, MagicMock())
+    return supabase, users
+
+
+@pytest.mark.asyncio
+async def test_request_loads_the_profile_once():
+    """Rate limiting, plan lookup and admin checks in one request share one users read"""
+    supabase, users = _supabase({"id": "u1", "email": "a@example.com", "plan": "pro", "role": "admin", "disabled": False})
+    get_user_profiles(supabase).ttl_seconds = 0  # Request scope only
+
+    async def request():
+        start_request_scope()
+        assert await RateLimiter(supabase).check_rate_limit("u1", "chat") is True
+        assert await AuthService(supabase).get_user_plan("u1") == "pro"
+        assert await AuthService(supabase).verify_admin("u1") == "admin"
+        assert await MaintenanceMiddleware(supabase).is_admin_user("u1") is True
+
+    # Each task runs in its own copy of the context, like separate requests
+    await asyncio.create_task(request())
+    assert users.select.return_value.eq.return_value.execute.call_count == 1
+
+    await asyncio.create_task(request())
+    assert users.select.return_value.eq.return_value.execute.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_profiles_are_reused_across_requests_until_the_ttl():
+    """The process-wide tier answers later requests until the entry expires"""
+    supabase, users = _supabase({"id": "u1", "email": "a@example.com", "plan": "free", "role": None})
+    cache = UserProfileCache(supabase, ttl_seconds=30)
+    execute = users.select.return_value.eq.return_value.execute
+
+    with patch("services.user_profiles.time.monotonic", return_value=100.0):
+        assert (await cache.get("u1"))["plan"] == "free"
+        assert (await cache.get("u1"))["plan"] == "free"
+    assert execute.call_count == 1
+
+    with patch("services.user_profiles.time.monotonic", return_value=131.0):
+        await cache.get("u1")
+    assert execute.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_missing_users_are_not_cached_across_requests():
+    """A user row created right after sign-up is found by the next request"""
+    supabase, users = _supabase({})
+    users.select.return_value.eq.return_value.execute.side_effect = None
+    users.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[])
+    cache = UserProfileCache(supabase)
+
+    assert await cache.get("u1") is None
+    users.select.return_value.eq.return_value.execute.return_value = MagicMock(data=[{"id": "u1", "plan": "free"}])
+    assert (await cache.get("u1"))["plan"] == "free"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("change", [
+    lambda admin: admin.update_user_plan("admin-1", "u1", "student"),
+    lambda admin: admin.disable_user("admin-1", "u1", True),
+])
+async def test_admin_changes_invalidate_the_cached_profile(change):
+    """Plan and status changes made through the admin panel apply to the next request"""
+    supabase, users = _supabase({"id": "u1", "email": "a@example.com", "plan": "free", "disabled": False})
+    profiles = get_user_profiles(supabase)
+    await profiles.get("u1")
+    assert profiles.get_stats()["cached_profiles"] == 1
+
+    admin = AdminService(supabase)
+    admin.audit_service = MagicMock(log_admin_action=AsyncMock())
+    await change(admin)
+
+    assert profiles.get_stats()["cached_profiles"] == 0